@@ -2,6 +2,22 @@ from flask import Flask
 from .config import Config, TestingConfig
 from .extensions import db, migrate, login_manager, csrf, ckeditor
 from . import models
+from .models.utils.ids import set_uuid_version
+from .utils.instrumentation import init_instrumentation
+from .utils.routing import init_replica_routing
+from .utils.softdelete import init_soft_delete
+from .utils.pagination import attach_keyset_indexes
+from .utils.jobs import init_jobs
+from .utils.outbox import init_outbox
+from .utils.cache import init_cache
+from .utils.http_cache import init_http_cache
+from .utils.ledger import init_ledger
+from .utils.idempotency import init_idempotency
+from .utils.inventory import init_inventory
+from .utils.rates import init_rates
+from .utils.statements import init_statements
+from .utils.rewards import init_rewards
+from .utils.auth import init_auth
 
 
 def create_app(config_class=Config, testing=False):
@@ -13,16 +29,36 @@ def create_app(config_class=Config, testing=False):
     else:
         app.config.from_object(config_class)
 
+    set_uuid_version(app.config.get("MODEL_ID_VERSION", 7))
+
     # Initialize Flask extensions
+    init_instrumentation(app)
     db.init_app(app)
+    init_replica_routing(app)
+    init_soft_delete(app)
+    attach_keyset_indexes(db.metadata)
+    init_jobs(app)
+    init_outbox(app)
+    init_cache(app)
+    init_http_cache(app)
+    init_ledger(app)
+    init_idempotency(app)
+    init_inventory(app)
+    init_rates(app)
+    init_statements(app)
+    init_rewards(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    init_auth(app)
     csrf.init_app(app)
     ckeditor.init_app(app)
 
     # Import and register blueprints
     from .blueprints.auth import auth_bp
     from .blueprints.library import library_bp
+    from .blueprints.metrics import metrics_bp
+    from .blueprints.jobs import jobs_bp
+    from .blueprints.commerce import commerce_bp
     # from .blueprints.scrolls import scrolls_bp
     # from .blueprints.player import player_bp
     # from .blueprints.curator import curator_bp
@@ -30,11 +66,13 @@ def create_app(config_class=Config, testing=False):
     # from .blueprints.community import community_bp
     # from .blueprints.home import home_bp
     # from .blueprints.api import api_bp
-    # from .blueprints.commerce import commerce_bg
 
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(library_bp, url_prefix="/library")
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(commerce_bp, url_prefix="/commerce")
     # app.register_blueprint(scrolls_bp, url_prefix="/scrolls")
     # app.register_blueprint(player_bp, url_prefix="/player")
     # app.register_blueprint(curator_bp, url_prefix="/curator")
@@ -43,6 +81,10 @@ def create_app(config_class=Config, testing=False):
     # app.register_blueprint(home_bp, url_prefix="/")
     # app.register_blueprint(home_bp, url_prefix="/home")
     # app.register_blueprint(api_bp, url_prefix="/api")
-    # app.register_blueprint(commerce_bg, url_prefix="/commerce")
+
+    # JSON APIs are called by clients without a form to carry a CSRF token. Their routes require a login, and
+    # api_login_required checks the CSRF token of requests authenticated by a session cookie.
+    csrf.exempt(jobs_bp)
+    csrf.exempt(commerce_bp)
 
     return app
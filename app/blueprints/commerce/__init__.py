@@ -1,5 +1,5 @@
 from flask import Blueprint
 
-auth_bp = Blueprint("auth", __name__)
+commerce_bp = Blueprint("commerce", __name__)
 
 from . import routes
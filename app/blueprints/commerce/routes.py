@@ -0,0 +1,224 @@
+import uuid
+from datetime import date, timedelta
+
+from flask import abort, jsonify, request
+from sqlalchemy import select
+
+from . import commerce_bp
+from ...extensions import db
+from ...models.commerce import Listing
+from ...models.inventory import InventoryReservation
+from ...utils.auth import api_login_required, caller_owns_fund, caller_portfolio_id
+from ...utils.idempotency import IdempotencyError
+from ...utils.inventory import SoldOut, release_reservation, reserve
+from ...utils.orderbook import (
+    BUY, SELL, BookContention, Trader, UnknownBook, book_depth, cancel_order, from_ticks, submit_order,
+)
+from ...utils.orders import OrderRequest, place_order
+from ...utils.pagination import InvalidCursor, paginate
+from ...utils.pricing import effective_prices
+from ...utils.rates import AMBERTOKENS, RateUnavailable, rate_table
+from ...utils.statements import balance_series, statement
+
+
+def _caller_portfolio(requested) -> uuid.UUID:
+    # The portfolio a request acts for is always one of the caller's; a request may only choose among them.
+    try:
+        requested = uuid.UUID(str(requested)) if requested else None
+    except ValueError:
+        abort(400)
+    return caller_portfolio_id(requested) or abort(404)
+
+
+@commerce_bp.route("/orders", methods=["POST"])
+@api_login_required
+def create_order():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    data["buyer_portfolio_id"] = str(_caller_portfolio(data.get("buyer_portfolio_id")))
+    try:
+        order_request = OrderRequest.from_json(data)
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    try:
+        response = place_order(order_request, request.headers.get("Idempotency-Key", ""))
+    except IdempotencyError as exc:
+        return jsonify({"error": str(exc)}), exc.status
+    headers = {"Idempotent-Replayed": "true"} if response.replayed else {}
+    return jsonify(response.body), response.status, headers
+
+
+@commerce_bp.route("/listings/<uuid:listing_id>/reservations", methods=["POST"])
+@api_login_required
+def create_reservation(listing_id):
+    data = request.get_json(silent=True) or {}
+    holder = _caller_portfolio(data.get("buyer_portfolio_id"))
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        abort(400)
+    if quantity < 1:
+        abort(400)
+    listing = db.session.get(Listing, listing_id) or abort(404)
+    try:
+        reservation = reserve("merchandise", listing.merchandise_id, quantity, str(holder))
+    except SoldOut:
+        return jsonify({"error": "Sold out"}), 409
+    db.session.commit()
+    return jsonify({
+        "id": str(reservation.id), "listing_id": str(listing_id), "quantity": quantity,
+        "expires_at": reservation.expires_at.isoformat(),
+    }), 201
+
+
+@commerce_bp.route("/reservations/<uuid:reservation_id>", methods=["DELETE"])
+@api_login_required
+def cancel_reservation(reservation_id):
+    reservation = db.session.get(InventoryReservation, reservation_id) or abort(404)
+    try:
+        holder = uuid.UUID(reservation.holder or "")
+    except ValueError:
+        abort(404)
+    if caller_portfolio_id(holder) is None or not release_reservation(reservation_id):
+        abort(404)
+    db.session.commit()
+    return "", 204
+
+
+@commerce_bp.route("/markets/<uuid:market_id>/listings")
+def market_listings(market_id):
+    # Listing prices are in AmberTokens. The page is priced from the discount schedule and converted with one copy
+    # of the rates, whose version, with the time the first price on the page changes, tells clients and caches
+    # when the shown prices go stale.
+    currency = request.args.get("currency", AMBERTOKENS)
+    rates = rate_table()
+    try:
+        page = paginate(
+            select(Listing).where(Listing.market_id == market_id), Listing,
+            limit=request.args.get("limit", 20, type=int), cursor=request.args.get("cursor"),
+        )
+        priced = effective_prices(page.items)
+        amounts = [
+            amount for price in priced.values()
+            for amount in (price.price, price.effective, *(change.price for change in price.changes))
+        ]
+        converted = iter(rates.convert_many(amounts, AMBERTOKENS, currency))
+    except (InvalidCursor, RateUnavailable):
+        abort(400)
+    shown = {}
+    for listing_id, price in priced.items():
+        shown[listing_id] = {
+            "price": str(next(converted)), "effective_price": str(next(converted)),
+            "discount": str(price.percentage),
+            "price_changes": [
+                {"at": change.at.isoformat(), "discount": str(change.percentage), "price": str(next(converted))}
+                for change in price.changes
+            ],
+        }
+    body = page.to_dict(lambda listing: {
+        "id": str(listing.id), "merchandise_id": str(listing.merchandise_id), **shown[listing.id],
+    })
+    changes = [price.valid_until for price in priced.values() if price.valid_until is not None]
+    return jsonify({
+        **body, "currency": currency, "rates_version": rates.version,
+        "valid_until": min(changes).isoformat() if changes else None,
+    })
+
+
+@commerce_bp.route("/tokens/<uuid:token_id>/orders", methods=["POST"])
+@api_login_required
+def create_book_order(token_id):
+    data = request.get_json(silent=True) or {}
+    portfolio_id = _caller_portfolio(data.get("portfolio_id"))
+    try:
+        trader = Trader(portfolio_id, uuid.UUID(data["fund_id"]), uuid.UUID(data["token_fund_id"]))
+        side, price, quantity = data["side"], data["price"], int(data["quantity"])
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+    if side not in (BUY, SELL) or quantity < 1:
+        abort(400)
+    try:
+        order_id, fills, orders, resting = submit_order(token_id, trader, side, price, quantity)
+    except UnknownBook:
+        abort(404)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 422
+    except BookContention:
+        return jsonify({"error": "The order book is busy"}), 503
+    return jsonify({
+        "id": order_id,
+        "fills": [
+            {"order_id": str(order.id), "maker_id": fill.maker_id, "price": str(from_ticks(fill.price)),
+             "quantity": fill.quantity, "status": order.status.value}
+            for fill, order in zip(fills, orders)
+        ],
+        "resting": resting,
+    }), 201
+
+
+@commerce_bp.route("/tokens/<uuid:token_id>/orders/<int:order_id>", methods=["DELETE"])
+@api_login_required
+def cancel_book_order(token_id, order_id):
+    portfolio_id = _caller_portfolio(request.args.get("portfolio_id"))
+    try:
+        if not cancel_order(token_id, order_id, portfolio_id):
+            abort(404)
+    except UnknownBook:
+        abort(404)
+    except BookContention:
+        return jsonify({"error": "The order book is busy"}), 503
+    return "", 204
+
+
+@commerce_bp.route("/tokens/<uuid:token_id>/book")
+def order_book(token_id):
+    depth = book_depth(token_id, min(request.args.get("levels", 10, type=int), 100))
+    return jsonify({
+        "seq": depth["seq"],
+        **{side: [{"price": str(price), "quantity": quantity} for price, quantity in depth[side]]
+           for side in ("bids", "asks")},
+    })
+
+
+def _day_arg(name: str, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+
+@commerce_bp.route("/funds/<uuid:fund_id>/statement")
+@api_login_required
+def fund_statement(fund_id):
+    if not caller_owns_fund(fund_id):
+        abort(404)
+    try:
+        page = statement(
+            fund_id, limit=request.args.get("limit", 20, type=int), cursor=request.args.get("cursor"),
+            since=_day_arg("since"), until=_day_arg("until"),
+        )
+    except InvalidCursor:
+        abort(400)
+    return jsonify(page.to_dict(lambda row: {
+        "day": row.day.isoformat(), "opening": str(row.opening), "credits": str(row.credits),
+        "debits": str(row.debits), "fees": str(row.fees), "closing": str(row.closing), "postings": row.postings,
+    }))
+
+
+@commerce_bp.route("/funds/<uuid:fund_id>/balances")
+@api_login_required
+def fund_balances(fund_id):
+    if not caller_owns_fund(fund_id):
+        abort(404)
+    until = _day_arg("until", date.today())
+    since = _day_arg("since", until - timedelta(days=29))
+    if not timedelta(0) <= until - since < timedelta(days=366):
+        abort(400)
+    return jsonify({
+        "balances": [{"day": day.isoformat(), "balance": str(balance)}
+                     for day, balance in balance_series(fund_id, since, until)],
+    })
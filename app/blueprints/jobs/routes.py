@@ -0,0 +1,30 @@
+from flask import abort, jsonify
+
+from . import jobs_bp
+from ...extensions import db
+from ...utils.auth import api_login_required, caller_owns_library
+from ...utils.jobs import cancel_job, get_job
+
+
+def _caller_job(job_id):
+    # Jobs are visible to the owner of the library they run for.
+    job = get_job(job_id)
+    if job is None or not caller_owns_library(job.payload.get("library_id")):
+        abort(404)
+    return job
+
+
+@jobs_bp.route("/jobs/<uuid:job_id>")
+@api_login_required
+def status(job_id):
+    return jsonify(_caller_job(job_id).to_dict())
+
+
+@jobs_bp.route("/jobs/<uuid:job_id>/cancel", methods=["POST"])
+@api_login_required
+def cancel(job_id):
+    _caller_job(job_id)
+    if not cancel_job(job_id):
+        abort(409)
+    db.session.commit()
+    return jsonify(get_job(job_id).to_dict())
@@ -1,5 +1,132 @@
+from flask import render_template, abort, request, jsonify, Response, stream_with_context, send_file, url_for
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
 from . import library_bp
+from ...extensions import db, csrf
+from ...models.library import Film, Person
+from ...utils.auth import api_login_required, caller_owns_library
+from ...utils.loading import LOADING_PROFILES, loading_profile, apply_profile
+from ...utils.pagination import paginate, InvalidCursor
+from ...utils.export import EXPORT_JOB, FORMATS, iter_sections, iter_jsonl_gzip, start_export_job
+from ...utils.importing import IMPORT_JOB, start_import_job
+from ...utils.jobs import get_job
+from ...utils.http_cache import conditional_view, entity_versions
+from ...utils.cache import film_card, genre, person_header, tag
+from ...models.jobs import JOB_DONE
 
 @library_bp.route("/library")
 def library():
     return "Library"
+
+
+@library_bp.route("/films")
+def films():
+    # The page only reads the keys it is ordered by; the cards come from the cache.
+    try:
+        page = paginate(
+            select(Film).options(load_only(Film.id, Film.created_at)), Film,
+            limit=request.args.get("limit", 20, type=int), cursor=request.args.get("cursor"),
+        )
+    except InvalidCursor:
+        abort(400)
+    return jsonify(page.to_dict(lambda film: {**(film_card(film.id) or {}), "id": str(film.id)}))
+
+
+@library_bp.route("/films/<uuid:film_id>")
+@conditional_view(lambda film_id: entity_versions(Film, film_id, LOADING_PROFILES["film_detail"].load))
+@loading_profile("film_detail")
+def film_detail(film_id):
+    film = db.session.scalars(apply_profile(select(Film).where(Film.id == film_id))).first() or abort(404)
+    return render_template("film/film.html", movie=film)
+
+
+@library_bp.route("/people/<uuid:person_id>")
+@conditional_view(lambda person_id: entity_versions(Person, person_id, LOADING_PROFILES["person_filmography"].load))
+@loading_profile("person_filmography")
+def person_filmography(person_id):
+    header = person_header(person_id) or abort(404)
+    person = db.session.scalars(apply_profile(select(Person).where(Person.id == person_id))).first() or abort(404)
+    return render_template("person/person.html", person=person, header=header)
+
+
+@library_bp.route("/genres/<uuid:genre_id>")
+def genre_detail(genre_id):
+    return jsonify(genre(genre_id) or abort(404))
+
+
+@library_bp.route("/tags/<uuid:tag_id>")
+def tag_detail(tag_id):
+    return jsonify(tag(tag_id) or abort(404))
+
+
+def _caller_job(job_id, kind: str):
+    # Export and import jobs are visible to the owner of their library only.
+    job = get_job(job_id, kind)
+    if job is None or not caller_owns_library(job.payload.get("library_id")):
+        abort(404)
+    return job
+
+
+@library_bp.route("/libraries/<uuid:library_id>/export.jsonl.gz")
+@api_login_required
+def export_library(library_id):
+    if not caller_owns_library(library_id):
+        abort(404)
+    return Response(
+        stream_with_context(iter_jsonl_gzip(iter_sections(library_id))),
+        mimetype="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="library-{library_id}.jsonl.gz"'},
+    )
+
+
+@library_bp.route("/libraries/<uuid:library_id>/exports", methods=["POST"])
+@csrf.exempt
+@api_login_required
+def start_library_export(library_id):
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in FORMATS:
+        abort(400)
+    if not caller_owns_library(library_id):
+        abort(404)
+    job = start_export_job(library_id, fmt)
+    db.session.commit()
+    return jsonify(job.to_dict()), 202, {"Location": url_for(".export_status", job_id=job.id)}
+
+
+@library_bp.route("/exports/<uuid:job_id>")
+@api_login_required
+def export_status(job_id):
+    job = _caller_job(job_id, EXPORT_JOB)
+    download = url_for(".export_download", job_id=job.id) if job.status == JOB_DONE else None
+    return jsonify(job.to_dict() | {"download": download})
+
+
+@library_bp.route("/exports/<uuid:job_id>/download")
+@api_login_required
+def export_download(job_id):
+    job = _caller_job(job_id, EXPORT_JOB)
+    if job.status != JOB_DONE:
+        abort(409)
+    return send_file(job.result["path"], as_attachment=True)
+
+
+@library_bp.route("/libraries/<uuid:library_id>/imports", methods=["POST"])
+@csrf.exempt
+@api_login_required
+def start_library_import(library_id):
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        abort(400)
+    if not caller_owns_library(library_id):
+        abort(404)
+    job = start_import_job(library_id, upload)
+    db.session.commit()
+    return jsonify(job.to_dict()), 202, {"Location": url_for(".import_status", job_id=job.id)}
+
+
+@library_bp.route("/imports/<uuid:job_id>")
+@api_login_required
+def import_status(job_id):
+    job = _caller_job(job_id, IMPORT_JOB)
+    return jsonify(job.to_dict())
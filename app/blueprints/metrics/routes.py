@@ -0,0 +1,11 @@
+from flask import Response
+
+from . import metrics_bp
+from ...extensions import db
+from ...utils.instrumentation import metrics
+from ...utils.cache import cache
+
+
+@metrics_bp.route("/metrics")
+def export():
+    return Response(metrics.render(db.engines) + cache.render_metrics(), mimetype="text/plain; version=0.0.4")
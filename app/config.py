@@ -1,9 +1,11 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 basedir = os.path.abspath(os.path.dirname(__file__))
+replica_urls = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
 
 class Config:
     """
@@ -25,10 +27,128 @@ class Config:
     :type SQLALCHEMY_POOL_TIMEOUT: int
     :ivar SECRET_KEY: Secret key used for security-related operations like session signing.
     :type SECRET_KEY: str
+    :ivar FILM_MATCH_THRESHOLD: Minimum confidence score for the film matcher to auto-link a file to a film.
+    :type FILM_MATCH_THRESHOLD: float
+    :ivar FILM_MATCH_MIN_MARGIN: Minimum lead the best film candidate needs over the runner-up to be auto-linked.
+    :type FILM_MATCH_MIN_MARGIN: float
+    :ivar PERSON_DEDUPE_THRESHOLD: Minimum similarity for the de-duplication job to treat two people as one.
+    :type PERSON_DEDUPE_THRESHOLD: float
+    :ivar COLLABORATION_GRAPH_SNAPSHOT: Optional path of a saved collaboration graph to load instead of the database.
+    :type COLLABORATION_GRAPH_SNAPSHOT: str
+    :ivar LOADING_PROFILES_STRICT: Whether relationships outside a view's loading profile raise instead of lazy loading.
+    :type LOADING_PROFILES_STRICT: bool
+    :ivar QUERY_BUDGET_ENFORCED: Whether profiled views fail when they exceed their query budget.
+    :type QUERY_BUDGET_ENFORCED: bool
+    :ivar DB_INSTRUMENTATION_SAMPLE_RATE: Fraction of requests whose database activity is recorded for `/metrics`.
+    :type DB_INSTRUMENTATION_SAMPLE_RATE: float
+    :ivar DB_INSTRUMENTATION_DEBUG_HEADER: Whether sampled responses carry query count and timing headers.
+    :type DB_INSTRUMENTATION_DEBUG_HEADER: bool
+    :ivar SQLALCHEMY_BINDS: Additional engines by bind key, including one ``replica_<n>`` bind per read replica.
+    :type SQLALCHEMY_BINDS: dict
+    :ivar DB_REPLICA_BINDS: Bind keys of the read replicas, taken from the comma-separated `DATABASE_REPLICA_URLS`.
+    :type DB_REPLICA_BINDS: list[str]
+    :ivar DB_REPLICA_MAX_LAG: Maximum replication lag, in seconds, for a replica to keep serving reads.
+    :type DB_REPLICA_MAX_LAG: float
+    :ivar DB_REPLICA_LAG_CHECK_INTERVAL: Seconds between replication lag probes of a replica.
+    :type DB_REPLICA_LAG_CHECK_INTERVAL: float
+    :ivar DB_READ_YOUR_WRITES_SECONDS: How long a session reads from the primary after committing a write.
+    :type DB_READ_YOUR_WRITES_SECONDS: float
+    :ivar DB_BLUEPRINT_ROUTING: Routing policy (``"replica"`` or ``"primary"``) for reads by blueprint name.
+    :type DB_BLUEPRINT_ROUTING: dict[str, str]
+    :ivar DB_DEFAULT_ROUTING: Routing policy for reads outside the blueprints listed in `DB_BLUEPRINT_ROUTING`.
+    :type DB_DEFAULT_ROUTING: str
+    :ivar SOFT_DELETE_RETENTION_DAYS: Days a soft deleted row is kept before the purge job archives it.
+    :type SOFT_DELETE_RETENTION_DAYS: int
+    :ivar SOFT_DELETE_PURGE_BATCH_SIZE: Rows the purge job moves to the archive tables per transaction.
+    :type SOFT_DELETE_PURGE_BATCH_SIZE: int
+    :ivar MODEL_ID_VERSION: UUID version of generated primary keys: 7 (time-ordered) or 4 (random).
+    :type MODEL_ID_VERSION: int
+    :ivar EXPORT_DIRECTORY: Directory background library exports are written to.
+    :type EXPORT_DIRECTORY: str
+    :ivar EXPORT_BATCH_SIZE: Rows library exports fetch per round trip from the server-side cursor.
+    :type EXPORT_BATCH_SIZE: int
+    :ivar IMPORT_DIRECTORY: Directory uploaded watch history exports are kept in until their import job ran.
+    :type IMPORT_DIRECTORY: str
+    :ivar IMPORT_BATCH_SIZE: Rows of an uploaded export resolved to films together.
+    :type IMPORT_BATCH_SIZE: int
+    :ivar JOB_WORKER_THREADS: Worker threads per ``flask jobs worker`` process.
+    :type JOB_WORKER_THREADS: int
+    :ivar JOB_POLL_INTERVAL: Seconds an idle worker waits before looking for jobs again.
+    :type JOB_POLL_INTERVAL: float
+    :ivar JOB_CONCURRENCY: Maximum number of running jobs by job type, overriding the handlers' own limits.
+    :type JOB_CONCURRENCY: dict[str, int]
+    :ivar JOB_STALE_AFTER: Seconds without a heartbeat after which a running job is considered abandoned.
+    :type JOB_STALE_AFTER: float
+    :ivar JOB_PROGRESS_INTERVAL: Minimum seconds between two progress writes of a job.
+    :type JOB_PROGRESS_INTERVAL: float
+    :ivar JOB_RETRY_BACKOFF: Delay in seconds before the first retry of a failed job; it doubles per attempt.
+    :type JOB_RETRY_BACKOFF: float
+    :ivar JOB_RETRY_BACKOFF_MAX: Maximum delay in seconds between retries.
+    :type JOB_RETRY_BACKOFF_MAX: float
+    :ivar OUTBOX_ENABLED: Whether changes to tracked models are recorded as outbox events.
+    :type OUTBOX_ENABLED: bool
+    :ivar OUTBOX_BATCH_SIZE: Maximum events delivered to a subscriber at once.
+    :type OUTBOX_BATCH_SIZE: int
+    :ivar OUTBOX_POLL_INTERVAL: Seconds the relay waits between polls of an idle outbox.
+    :type OUTBOX_POLL_INTERVAL: float
+    :ivar OUTBOX_GAP_TIMEOUT: Seconds the relay waits for a missing event id before skipping it; it should
+        exceed the longest write transaction.
+    :type OUTBOX_GAP_TIMEOUT: float
+    :ivar OUTBOX_RETENTION_DAYS: Days acknowledged events are kept.
+    :type OUTBOX_RETENTION_DAYS: int
+    :ivar CACHE_ENABLED: Whether entity reads go through the cache, see :mod:`app.utils.cache`.
+    :type CACHE_ENABLED: bool
+    :ivar CACHE_SHARED_URL: URL of the cache tier shared by all processes, e.g. ``sqlite:////var/cache/amber.db``;
+        without one every process only has its own tier, and changes relayed by ``flask outbox relay`` only evict
+        the relay's entries, so other processes serve theirs until their ``local_ttl`` ends.
+    :type CACHE_SHARED_URL: Optional[str]
+    :ivar CACHE_LOCK_TIMEOUT: Seconds a read waits for a concurrent load of the same key before loading it too.
+    :type CACHE_LOCK_TIMEOUT: float
+    :ivar CACHE_SYNC_INTERVAL: Seconds between two checks for invalidations published by other processes.
+    :type CACHE_SYNC_INTERVAL: float
+    :ivar HTTP_CACHE_MAX_AGE: Seconds browsers may reuse a response of a conditional view without revalidating.
+    :type HTTP_CACHE_MAX_AGE: int
+    :ivar HTTP_CACHE_SHARED_MAX_AGE: Seconds a CDN may reuse a public response of a conditional view.
+    :type HTTP_CACHE_SHARED_MAX_AGE: int
+    :ivar HTTP_CACHE_ETAG_SALT: Mixed into every ETag; set it to the release so deploys changing templates
+        invalidate cached responses.
+    :type HTTP_CACHE_ETAG_SALT: str
+    :ivar HTTP_CACHE_BLUEPRINTS: Blueprints whose ``GET`` responses get an ETag hashed from their body when
+        their view did not set one.
+    :type HTTP_CACHE_BLUEPRINTS: tuple[str, ...]
+    :ivar LEDGER_SETTLE_SECONDS: Seconds after which a ledger posting is considered committed or rolled back and
+        may be folded into snapshots and running totals; it should exceed the longest write transaction.
+    :type LEDGER_SETTLE_SECONDS: float
+    :ivar LEDGER_FUND_SHARDS: Default number of shards of a hot fund, designated with ``flask ledger shard``.
+    :type LEDGER_FUND_SHARDS: int
+    :ivar IDEMPOTENCY_TTL_SECONDS: Seconds the response of a request is kept for retries with the same key.
+    :type IDEMPOTENCY_TTL_SECONDS: float
+    :ivar IDEMPOTENCY_LEASE_SECONDS: Seconds a request may hold its key without responding before a retry takes
+        over; it must exceed the longest idempotent operation.
+    :type IDEMPOTENCY_LEASE_SECONDS: float
+    :ivar INVENTORY_RESERVATION_SECONDS: Seconds reserved items are held before they return to stock.
+    :type INVENTORY_RESERVATION_SECONDS: float
+    :ivar INVENTORY_GATE_SECONDS: Seconds a process turns away requests for items it saw sold out.
+    :type INVENTORY_GATE_SECONDS: float
+    :ivar PRICING_HORIZON_SECONDS: Seconds ahead the discount schedule knows the upcoming price changes for.
+    :type PRICING_HORIZON_SECONDS: float
+    :ivar ORDER_BOOK_SNAPSHOT_INTERVAL: Operations on an order book between snapshots, which prune its log.
+    :type ORDER_BOOK_SNAPSHOT_INTERVAL: int
+    :ivar STATEMENTS_BATCH_SIZE: Postings rolled up into daily fund rollups per transaction.
+    :type STATEMENTS_BATCH_SIZE: int
+    :ivar CONTRIBUTION_REWARD_WEIGHTS: Tables of contributions mapped to the points a change earns, either a
+        number for inserts and updates or a mapping of ``insert``, ``update`` and ``delete`` to points.
+    :type CONTRIBUTION_REWARD_WEIGHTS: dict
+    :ivar CONTRIBUTION_REWARD_RATE: AmberTokens paid per point.
+    :type CONTRIBUTION_REWARD_RATE: str
+    :ivar CONTRIBUTION_REWARD_FUND_ID: The AmberToken fund rewards are paid from.
+    :type CONTRIBUTION_REWARD_FUND_ID: Optional[str]
+    :ivar CONTRIBUTION_REWARD_BATCH_SIZE: Most contribution events rewarded in one accrual run.
+    :type CONTRIBUTION_REWARD_BATCH_SIZE: int
     """
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = os.environ.get("SQLALCHEMY_ECHO", "false").lower() in ("1", "true", "yes")
     SQLALCHEMY_ENGINE_OPTIONS = {
         "pool_pre_ping": True,
         "pool_recycle": 3600,
@@ -37,6 +157,78 @@ class Config:
     }
     SQLALCHEMY_POOL_TIMEOUT = 20
     SECRET_KEY = os.environ.get("SECRET_KEY")
+    FILM_MATCH_THRESHOLD = 0.85
+    FILM_MATCH_MIN_MARGIN = 0.05
+    PERSON_DEDUPE_THRESHOLD = 0.92
+    COLLABORATION_GRAPH_SNAPSHOT = os.environ.get("COLLABORATION_GRAPH_SNAPSHOT")
+    LOADING_PROFILES_STRICT = False
+    QUERY_BUDGET_ENFORCED = False
+    DB_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get("DB_INSTRUMENTATION_SAMPLE_RATE", "0.1"))
+    DB_INSTRUMENTATION_DEBUG_HEADER = os.environ.get("DB_INSTRUMENTATION_DEBUG_HEADER", "false").lower() in ("1", "true", "yes")
+    SQLALCHEMY_BINDS = {f"replica_{i + 1}": url for i, url in enumerate(replica_urls)}
+    DB_REPLICA_BINDS = list(SQLALCHEMY_BINDS)
+    DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+    DB_REPLICA_LAG_CHECK_INTERVAL = 2.0
+    DB_READ_YOUR_WRITES_SECONDS = 5.0
+    DB_BLUEPRINT_ROUTING = {
+        "library": "replica",
+        "scrolls": "replica",
+        "journal": "replica",
+        "curator": "replica",
+        "community": "replica",
+        "commerce": "primary",
+        "player": "primary",
+        "auth": "primary",
+    }
+    DB_DEFAULT_ROUTING = "primary"
+    SOFT_DELETE_RETENTION_DAYS = 90
+    SOFT_DELETE_PURGE_BATCH_SIZE = 1000
+    MODEL_ID_VERSION = int(os.environ.get("MODEL_ID_VERSION", "7"))
+    EXPORT_DIRECTORY = os.environ.get("EXPORT_DIRECTORY", os.path.join(tempfile.gettempdir(), "library-exports"))
+    EXPORT_BATCH_SIZE = 1000
+    IMPORT_DIRECTORY = os.environ.get("IMPORT_DIRECTORY", os.path.join(tempfile.gettempdir(), "library-imports"))
+    IMPORT_BATCH_SIZE = 5000
+    JOB_WORKER_THREADS = int(os.environ.get("JOB_WORKER_THREADS", "4"))
+    JOB_POLL_INTERVAL = 1.0
+    JOB_CONCURRENCY = {}
+    JOB_STALE_AFTER = 300.0
+    JOB_PROGRESS_INTERVAL = 1.0
+    JOB_RETRY_BACKOFF = 10.0
+    JOB_RETRY_BACKOFF_MAX = 3600.0
+    OUTBOX_ENABLED = True
+    OUTBOX_BATCH_SIZE = 500
+    OUTBOX_POLL_INTERVAL = 0.5
+    OUTBOX_GAP_TIMEOUT = 10.0
+    OUTBOX_RETENTION_DAYS = 7
+    CACHE_ENABLED = True
+    CACHE_SHARED_URL = os.environ.get("CACHE_SHARED_URL")
+    CACHE_LOCK_TIMEOUT = 5.0
+    CACHE_SYNC_INTERVAL = 1.0
+    HTTP_CACHE_MAX_AGE = 0
+    HTTP_CACHE_SHARED_MAX_AGE = 60
+    HTTP_CACHE_ETAG_SALT = os.environ.get("RELEASE", "")
+    HTTP_CACHE_BLUEPRINTS = ("library", "scrolls", "curator", "journal")
+    LEDGER_SETTLE_SECONDS = 10.0
+    LEDGER_FUND_SHARDS = 16
+    IDEMPOTENCY_TTL_SECONDS = 86400.0
+    IDEMPOTENCY_LEASE_SECONDS = 30.0
+    INVENTORY_RESERVATION_SECONDS = 600.0
+    INVENTORY_GATE_SECONDS = 1.0
+    PRICING_HORIZON_SECONDS = 86400.0
+    ORDER_BOOK_SNAPSHOT_INTERVAL = 10000
+    STATEMENTS_BATCH_SIZE = 10000
+    CONTRIBUTION_REWARD_WEIGHTS = {
+        "films": {"insert": 10, "update": 2},
+        "people": {"insert": 5, "update": 1},
+        "scrolls": {"insert": 3, "update": 1},
+        "scroll_entries": 1,
+        "genres": 2,
+        "tags": 1,
+        "keywords": 1,
+    }
+    CONTRIBUTION_REWARD_RATE = os.environ.get("CONTRIBUTION_REWARD_RATE", "0.1")
+    CONTRIBUTION_REWARD_FUND_ID = os.environ.get("CONTRIBUTION_REWARD_FUND_ID")
+    CONTRIBUTION_REWARD_BATCH_SIZE = 50000
     # Add any other general configurations here
 
 
@@ -59,10 +251,22 @@ class TestingConfig(Config):
     :ivar SQLALCHEMY_TRACK_MODIFICATIONS: Boolean flag indicating whether to track
         modifications to objects in SQLAlchemy.
     :type SQLALCHEMY_TRACK_MODIFICATIONS: bool
+    :ivar LOADING_PROFILES_STRICT: Boolean flag making lazy loads outside a view's loading profile raise.
+    :type LOADING_PROFILES_STRICT: bool
+    :ivar QUERY_BUDGET_ENFORCED: Boolean flag failing profiled views that exceed their query budget.
+    :type QUERY_BUDGET_ENFORCED: bool
+    :ivar SQLALCHEMY_BINDS: Additional engines by bind key; read replicas are not used in tests by default.
+    :type SQLALCHEMY_BINDS: dict
+    :ivar DB_REPLICA_BINDS: Bind keys of the read replicas.
+    :type DB_REPLICA_BINDS: list[str]
     """
     SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URL")  # Use test database URI
     TESTING = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    LOADING_PROFILES_STRICT = True
+    QUERY_BUDGET_ENFORCED = True
+    SQLALCHEMY_BINDS = {}
+    DB_REPLICA_BINDS = []
     SQLALCHEMY_ENGINE_OPTIONS = {
         "pool_pre_ping": True,
         "pool_recycle": 3600,
@@ -4,11 +4,12 @@ from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from flask_ckeditor import CKEditor
 from sqlalchemy.orm import DeclarativeBase
+from .utils.routing import RoutingSession
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
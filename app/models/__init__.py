@@ -9,3 +9,11 @@ from .common import *
 from .commerce import *
 from .calendar import *
 from .associations import *
+from .jobs import *
+from .events import *
+from .ledger import *
+from .idempotency import *
+from .inventory import *
+from .orderbook import *
+from .statements import *
+from .rewards import *
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Integer, String, DateTime, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+EVENT_INSERT = "insert"
+EVENT_UPDATE = "update"
+EVENT_DELETE = "delete"
+
+# SQLite only autoincrements INTEGER PRIMARY KEY columns.
+EventId = BigInteger().with_variant(Integer(), "sqlite")
+EventData = JSON().with_variant(JSONB(), "postgresql")
+
+
+class OutboxEvent(db.Model):
+    """
+    A change to a tracked model, written in the same transaction as the change itself, see
+    :mod:`app.utils.outbox`.
+
+    Events are ordered by their sequential ``id``, which is also the position subscribers acknowledge.
+
+    :ivar id: Position of the event in the stream.
+    :type id: int
+    :ivar created_at: When the change was flushed.
+    :type created_at: datetime
+    :ivar entity: Table name of the changed model, e.g. ``"films"``.
+    :type entity: str
+    :ivar entity_id: Primary key of the changed row.
+    :type entity_id: str
+    :ivar operation: ``insert``, ``update`` or ``delete``; soft deletes are reported as ``delete``.
+    :type operation: str
+    :ivar data: The tracked fields of the row after the change, and for updates the names of the changed
+        columns under ``"changed"``.
+    :type data: dict
+    """
+    __tablename__ = "outbox_events"
+    id: Mapped[int] = mapped_column(EventId, primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    entity: Mapped[str] = mapped_column(String(64), nullable=False)
+    entity_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    operation: Mapped[str] = mapped_column(String(16), nullable=False)
+    data: Mapped[dict] = mapped_column(EventData, nullable=False, default=dict)
+
+
+class OutboxCursor(db.Model):
+    """
+    How far a subscriber has consumed the outbox.
+
+    :ivar subscriber: Name of the subscriber.
+    :type subscriber: str
+    :ivar position: Id of the last event the subscriber acknowledged.
+    :type position: int
+    :ivar updated_at: When the subscriber last acknowledged events.
+    :type updated_at: datetime
+    """
+    __tablename__ = "outbox_cursors"
+    subscriber: Mapped[str] = mapped_column(String(64), primary_key=True)
+    position: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
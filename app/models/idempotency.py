@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, SmallInteger, LargeBinary, DateTime, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+ResponseData = JSON().with_variant(JSONB(), "postgresql")
+
+
+class IdempotencyKey(db.Model):
+    """
+    A client supplied key under which the outcome of a request is stored, see :mod:`app.utils.idempotency`.
+
+    Rows are keyed by the client's scope and key alone and hold a 16 byte fingerprint of the request rather than
+    the request itself, so the table stays small and lookups are primary key reads. Expired rows are purged in
+    the background.
+
+    :ivar scope: Namespace of the key, e.g. the operation and the client that sent it.
+    :type scope: str
+    :ivar key: The key the client sent.
+    :type key: str
+    :ivar fingerprint: Digest of the request the key was first used with.
+    :type fingerprint: bytes
+    :ivar status: HTTP status of the stored response, ``None`` while the request is being processed.
+    :type status: Optional[int]
+    :ivar response: Body of the stored response.
+    :type response: Optional[dict]
+    :ivar locked_until: Until when the request holding the key may take to respond before another may take over.
+    :type locked_until: datetime
+    :ivar expires_at: When the key may be reused and its row purged.
+    :type expires_at: datetime
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    fingerprint: Mapped[bytes] = mapped_column(LargeBinary(16), nullable=False)
+    status: Mapped[Optional[int]] = mapped_column(SmallInteger)
+    response: Mapped[Optional[dict]] = mapped_column(ResponseData)
+    locked_until: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
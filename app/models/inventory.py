@@ -0,0 +1,51 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+from .utils.ids import new_uuid
+
+
+RESERVATION_HELD = "held"
+RESERVATION_CONFIRMED = "confirmed"
+RESERVATION_RELEASED = "released"
+
+
+class InventoryReservation(db.Model):
+    """
+    Items taken from stock for a buyer for a limited time, see :mod:`app.utils.inventory`.
+
+    Reserving decrements the stock right away; a reservation that is neither confirmed nor released before it
+    expires is released by the expiry sweep, which puts its items back.
+
+    :ivar id: Unique identifier of the reservation.
+    :type id: uuid.UUID
+    :ivar kind: The kind of stock, e.g. ``"merchandise"`` or ``"ticket"``.
+    :type kind: str
+    :ivar item_id: The merchandise, ticket or other item reserved.
+    :type item_id: uuid.UUID
+    :ivar quantity: Number of items reserved.
+    :type quantity: int
+    :ivar status: One of ``held``, ``confirmed`` or ``released``.
+    :type status: str
+    :ivar holder: Who holds the reservation, e.g. the buyer's portfolio.
+    :type holder: Optional[str]
+    :ivar expires_at: When a held reservation is released.
+    :type expires_at: datetime
+    :ivar created_at: When the items were reserved.
+    :type created_at: datetime
+    """
+    __tablename__ = "inventory_reservations"
+    __table_args__ = (Index("ix_inventory_reservations_status_expires_at", "status", "expires_at"),)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=new_uuid)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default=RESERVATION_HELD)
+    holder: Mapped[Optional[str]] = mapped_column(String(64))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,128 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, DateTime, Text, JSON, Index, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+from .utils.ids import new_uuid
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_ACTIVE = (JOB_QUEUED, JOB_RUNNING)
+#: Result keys that stay on the server, such as the path of a file a job wrote; clients download it by URL.
+SERVER_RESULT_KEYS = frozenset({"path"})
+
+JobData = JSON().with_variant(JSONB(), "postgresql")
+
+
+class Job(db.Model):
+    """
+    A unit of background work in the job queue, see :mod:`app.utils.jobs`.
+
+    Jobs are plain queue rows rather than entities: they carry no authorship or soft delete columns and are
+    claimed by workers with ``SELECT ... FOR UPDATE SKIP LOCKED``. The row doubles as the progress record the UI
+    polls.
+
+    :ivar id: Unique identifier of the job.
+    :type id: uuid.UUID
+    :ivar kind: Name of the handler that runs the job, e.g. ``"library_export"``.
+    :type kind: str
+    :ivar payload: Keyword arguments passed to the handler.
+    :type payload: dict
+    :ivar status: One of ``queued``, ``running``, ``done``, ``failed`` or ``cancelled``.
+    :type status: str
+    :ivar priority: Jobs with a higher priority are claimed first.
+    :type priority: int
+    :ivar dedupe_key: Optional key; only one queued or running job may hold a given key.
+    :type dedupe_key: Optional[str]
+    :ivar attempts: Number of times a worker has started the job.
+    :type attempts: int
+    :ivar max_attempts: Number of attempts after which a failing job is given up.
+    :type max_attempts: int
+    :ivar run_at: Earliest time the job may be claimed; pushed back between retries.
+    :type run_at: datetime
+    :ivar locked_by: Identifier of the worker running the job.
+    :type locked_by: Optional[str]
+    :ivar heartbeat_at: Last sign of life of the worker running the job.
+    :type heartbeat_at: Optional[datetime]
+    :ivar progress: Units of work done so far.
+    :type progress: int
+    :ivar total: Units of work in total, if known.
+    :type total: Optional[int]
+    :ivar message: Short human readable progress note.
+    :type message: Optional[str]
+    :ivar result: The handler's return value once the job is done.
+    :type result: Optional[dict]
+    :ivar error: The error of the last failed attempt.
+    :type error: Optional[str]
+    :ivar created_at: When the job was enqueued.
+    :type created_at: datetime
+    :ivar started_at: When the current or last attempt started.
+    :type started_at: Optional[datetime]
+    :ivar finished_at: When the job reached a final status.
+    :type finished_at: Optional[datetime]
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index(
+            "ix_jobs_claim", "priority", "run_at",
+            postgresql_where=text("status = 'queued'"), sqlite_where=text("status = 'queued'"),
+        ),
+        Index("ix_jobs_kind_status", "kind", "status"),
+        Index(
+            "uq_jobs_dedupe_key_active", "dedupe_key", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=new_uuid)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[dict] = mapped_column(JobData, nullable=False, default=dict)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default=JOB_QUEUED)
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    dedupe_key: Mapped[Optional[str]] = mapped_column(String(255))
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=3)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    locked_by: Mapped[Optional[str]] = mapped_column(String(128))
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    progress: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[Optional[int]] = mapped_column(Integer)
+    message: Mapped[Optional[str]] = mapped_column(String(255))
+    result: Mapped[Optional[dict]] = mapped_column(JobData)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the job's status and progress for polling clients, without the result keys in
+        :data:`SERVER_RESULT_KEYS`.
+
+        :return: The job status.
+        :rtype: dict
+        """
+        return {
+            "id": str(self.id),
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": None if self.result is None else {
+                key: value for key, value in self.result.items() if key not in SERVER_RESULT_KEYS
+            },
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
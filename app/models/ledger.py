@@ -0,0 +1,108 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import BigInteger, Integer, SmallInteger, DateTime, Numeric, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+# SQLite only autoincrements INTEGER PRIMARY KEY columns.
+PostingId = BigInteger().with_variant(Integer(), "sqlite")
+Amount = Numeric(20, 4)
+
+
+class Posting(db.Model):
+    """
+    One leg of a ledger entry: an immutable credit or debit of a fund, see :mod:`app.utils.ledger`.
+
+    Postings are only ever inserted. The legs of an entry share its ``entry_id`` and sum to zero, and a fund's
+    balance is the sum of its postings, read from the latest :class:`BalanceSnapshot` plus the postings after
+    it. Writers therefore never update, or lock, a shared balance row, except one :class:`FundShard` of a hot fund.
+
+    :ivar id: Position of the posting; postings with a lower id were inserted earlier.
+    :type id: int
+    :ivar entry_id: Identifier shared by the legs of one entry.
+    :type entry_id: uuid.UUID
+    :ivar ledger_id: The ledger the entry is booked in.
+    :type ledger_id: uuid.UUID
+    :ivar fund_id: The fund credited or debited.
+    :type fund_id: uuid.UUID
+    :ivar transaction_id: The transaction the entry records, if any.
+    :type transaction_id: Optional[uuid.UUID]
+    :ivar amount: Positive for credits, negative for debits.
+    :type amount: Decimal
+    :ivar fee: The part of a debit paid as a fee to a toll fund, ``None`` for postings without one.
+    :type fee: Optional[Decimal]
+    :ivar shard: The :class:`FundShard` of a hot fund the posting was applied to, ``None`` for other funds.
+    :type shard: Optional[int]
+    :ivar created_at: When the posting was inserted.
+    :type created_at: datetime
+    """
+    __tablename__ = "ledger_postings"
+    __table_args__ = (
+        Index("ix_ledger_postings_fund_id_id", "fund_id", "id"),
+        Index("ix_ledger_postings_fund_id_shard_id", "fund_id", "shard", "id"),
+        Index("ix_ledger_postings_entry_id", "entry_id"),
+    )
+    id: Mapped[int] = mapped_column(PostingId, primary_key=True, autoincrement=True)
+    entry_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    ledger_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("ledgers.id"), nullable=False)
+    fund_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("funds.id"), nullable=False)
+    transaction_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("transactions.id"))
+    amount: Mapped[Decimal] = mapped_column(Amount, nullable=False)
+    fee: Mapped[Optional[Decimal]] = mapped_column(Amount)
+    shard: Mapped[Optional[int]] = mapped_column(SmallInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+
+
+class BalanceSnapshot(db.Model):
+    """
+    A fund's balance over all its postings up to and including ``posting_id``.
+
+    :ivar fund_id: The fund.
+    :type fund_id: uuid.UUID
+    :ivar posting_id: Id of the last posting included.
+    :type posting_id: int
+    :ivar balance: Sum of the fund's postings up to ``posting_id``.
+    :type balance: Decimal
+    :ivar created_at: When the snapshot was taken.
+    :type created_at: datetime
+    """
+    __tablename__ = "balance_snapshots"
+    fund_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("funds.id"), primary_key=True)
+    posting_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(Amount, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+
+
+class FundShard(db.Model):
+    """
+    A spendable sub-balance of a hot fund, such as the treasury or a fee collector, that every order writes.
+
+    A hot fund has a fixed number of shards. Each write locks and updates one shard, chosen by hashing the
+    entry, rather than the fund row, so up to that many transactions write the fund at once. Together the
+    shards hold the fund's balance: the postings applied to them plus the unsharded postings, written by
+    processes that did not know the fund was hot yet, up to ``folded_through``, which compaction folds in.
+
+    :ivar fund_id: The hot fund.
+    :type fund_id: uuid.UUID
+    :ivar shard: Number of the shard, from zero.
+    :type shard: int
+    :ivar balance: The shard's sub-balance.
+    :type balance: Decimal
+    :ivar folded_through: Id of the last unsharded posting of the fund folded into the shards; the same on
+        every shard of a fund.
+    :type folded_through: int
+    :ivar updated_at: When the shard was last compacted.
+    :type updated_at: datetime
+    """
+    __tablename__ = "fund_shards"
+    fund_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("funds.id"), primary_key=True)
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    folded_through: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -56,6 +56,8 @@ class Library(db.Model, ModelMixin, EntityMixin):
     :ivar local_libraries: Represents the relationship to other local libraries
         within this Library entity.
     :type local_libraries: list[Library]
+    :ivar owner_id: The user owning this library, who acts for it through the API.
+    :type owner_id: UUID | None
     :ivar owner: Represents the owner of this library.
     :type owner: LibraryMixin
     :ivar wallet: Represents the wallet associated with the library.
@@ -92,6 +94,7 @@ class Library(db.Model, ModelMixin, EntityMixin):
     :type memberships: list[Member]
     """
     __tablename__ = 'libraries'
+    owner_id: Mapped[Optional[UUID]] = mapped_column(UUID(as_uuid=True), db.ForeignKey("users.id"), index=True)
     local_libraries: Mapped[List["Library"]] = relationship("Library", back_populates="library", cascade="all, delete-orphan")
     owner: Mapped["LibraryMixin"] = relationship("LibraryMixin", back_populates="libraries", uselist=False)
     wallet: Mapped["Wallet"] = relationship("Wallet", back_populates="library", uselist=False, cascade="all, delete-orphan")
@@ -513,6 +516,8 @@ class Gig(db.Model, ModelMixin, PeriodMixin):
 
     :ivar career_id: Foreign key linking the gig to a specific career.
     :type career_id: UUID
+    :ivar film_id: Foreign key linking the gig to the film it was credited on.
+    :type film_id: UUID
     :ivar crew_type: The type of crew role associated with the gig.
     :type crew_type: CrewTypeEnum
     :ivar episodes: List of UUIDs representing episodes associated with the gig,
@@ -530,6 +535,7 @@ class Gig(db.Model, ModelMixin, PeriodMixin):
     """
     __tablename__ = "gigs"
     career_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), db.ForeignKey("careers.id"), nullable=False)
+    film_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), db.ForeignKey("films.id"), nullable=True)
     crew_type: Mapped[CrewTypeEnum] = mapped_column(SQLAlchemyEnum(CrewTypeEnum), nullable=False)
     episodes: Mapped[List["Film"] | None] = mapped_column(ARRAY(UUID(as_uuid=True)), default=list)
     notes: Mapped[str | None] = mapped_column(db.Text, nullable=True)
@@ -550,6 +556,8 @@ class Character(db.Model, ModelMixin, EntityMixin, PeriodMixin):
     :type aliases: list[str]
     :ivar career_id: The unique identifier of the associated career.
     :type career_id: UUID.
+    :ivar film_id: The unique identifier of the film the character appears in.
+    :type film_id: UUID
     :ivar start_date: The date when the character's career or activity started.
     :type start_date: datetime or None
     :ivar end_date: The date when the character's career or activity ended.
@@ -566,6 +574,7 @@ class Character(db.Model, ModelMixin, EntityMixin, PeriodMixin):
     __tablename__ = "characters"
     aliases: Mapped[list[str]] = mapped_column(ARRAY(db.String), default=list)
     career_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), db.ForeignKey("careers.id"), nullable=False)
+    film_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), db.ForeignKey("films.id"), nullable=True)
     start_date: Mapped[datetime | None] = mapped_column(db.Date, nullable=True)
     end_date: Mapped[datetime | None] = mapped_column(db.Date, nullable=True)
     episodes: Mapped[List["Film"] | None] = mapped_column(ARRAY(UUID(as_uuid=True)), default=list)
@@ -620,6 +629,8 @@ class Shop(db.Model, ModelMixin, EntityMixin, HiveMixin):
     The shop is a key part in the data structure, integrating various
     application functionalities and dependencies.
 
+    :ivar library_id: The unique identifier of the library running the shop.
+    :type library_id: UUID | None
     :ivar library: Represents the library associated with the shop. A shop has
         a one-to-one or one-to-many relationship with a `Library`.
     :type library: Mapped[Library]
@@ -629,6 +640,7 @@ class Shop(db.Model, ModelMixin, EntityMixin, HiveMixin):
     :type merchandise: Mapped[List[Merchandise]]
     """
     __tablename__ = "shops"
+    library_id: Mapped[Optional[UUID]] = mapped_column(UUID(as_uuid=True), db.ForeignKey("libraries.id"))
     library: Mapped["Library"] = relationship("Library", back_populates="shops")
     merchandise: Mapped[List["Merchandise"]] = relationship("Merchandise", back_populates="shop")
 
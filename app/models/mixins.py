@@ -8,6 +8,7 @@ from sqlalchemy.sql.schema import Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship, Mapped, mapped_column, declared_attr, backref
 
 from ..extensions import db
+from .utils.ids import new_uuid
 from utils.config import (
     ContentTypeEnum, CliqueTypeEnum, VisibilityEnum, ArticleReportStatusEnum, HiveTypeEnum, SubmissionStatusEnum
 )
@@ -30,13 +31,15 @@ def generate_uuid():
     """
     Generate a universally unique identifier (UUID).
 
-    This function generates and returns a string representation of a new UUID
-    (version 4). It creates a randomly generated identifier guaranteed to be unique.
+    This function generates and returns a string representation of a new UUID.
+    By default it is a time-ordered version 7 UUID, which keeps primary key
+    inserts clustered at the end of the index; the `MODEL_ID_VERSION` setting
+    switches back to random version 4 UUIDs.
 
     :return: A string representation of the generated UUID.
     :rtype: str
     """
-    return str(uuid.uuid4())
+    return str(new_uuid())
 
 
 class ModelMixin:
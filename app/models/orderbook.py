@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, JSON, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+BookData = JSON().with_variant(JSONB(), "postgresql")
+
+
+class OrderBookEntry(db.Model):
+    """
+    One operation on the order book of a token, see :mod:`app.utils.orderbook`. The log of a book is the source
+    of truth: replaying it from a snapshot rebuilds the book, and a process appending an entry whose position
+    another process took first learns that its copy of the book is stale.
+
+    :ivar token_id: The token traded.
+    :type token_id: uuid.UUID
+    :ivar seq: Position of the operation in the book's log, from one.
+    :type seq: int
+    :ivar operation: The operation, as :meth:`~app.utils.orderbook.OrderBook.apply` takes it.
+    :type operation: list
+    :ivar created_at: When the operation was logged.
+    :type created_at: datetime
+    """
+    __tablename__ = "order_book_log"
+    token_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("tokens.id"), primary_key=True)
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    operation: Mapped[list] = mapped_column(BookData, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+
+
+class OrderBookSnapshot(db.Model):
+    """
+    The resting orders of a token's order book after an operation of its log; the log before it may be pruned.
+
+    :ivar token_id: The token traded.
+    :type token_id: uuid.UUID
+    :ivar seq: Position of the last operation the snapshot includes.
+    :type seq: int
+    :ivar state: The book, as :meth:`~app.utils.orderbook.OrderBook.snapshot` returns it.
+    :type state: dict
+    :ivar created_at: When the snapshot was taken.
+    :type created_at: datetime
+    """
+    __tablename__ = "order_book_snapshots"
+    token_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("tokens.id"), primary_key=True)
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    state: Mapped[dict] = mapped_column(BookData, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import BigInteger, Integer, DateTime, Numeric, JSON
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+# SQLite only autoincrements INTEGER PRIMARY KEY columns.
+AccrualId = BigInteger().with_variant(Integer(), "sqlite")
+AccrualData = JSON().with_variant(JSONB(), "postgresql")
+
+
+class RewardAccrual(db.Model):
+    """
+    One run of the contribution reward accrual, see :mod:`app.utils.rewards`. A run rewards the contributions
+    recorded in the outbox after ``after_position`` up to ``through_position``, and the latest run's
+    ``through_position`` is where the next one starts. ``after_position`` is unique, so of two runs starting from
+    the same position only one can commit, together with its ledger entry.
+
+    :ivar id: Identifier.
+    :type id: int
+    :ivar after_position: Id of the outbox event the run started after.
+    :type after_position: int
+    :ivar through_position: Id of the last outbox event the run included.
+    :type through_position: int
+    :ivar entry_id: The ledger entry crediting the rewards, ``None`` if the run had none to pay.
+    :type entry_id: Optional[uuid.UUID]
+    :ivar events: Number of contribution events rewarded.
+    :type events: int
+    :ivar points: Library ids mapped to the points they earned in the run, as strings.
+    :type points: dict
+    :ivar amount: AmberTokens credited in total.
+    :type amount: Decimal
+    :ivar unpaid: Library ids mapped to points not paid because the library has no AmberToken fund.
+    :type unpaid: dict
+    :ivar created_at: When the run committed.
+    :type created_at: datetime
+    """
+    __tablename__ = "reward_accruals"
+    id: Mapped[int] = mapped_column(AccrualId, primary_key=True, autoincrement=True)
+    after_position: Mapped[int] = mapped_column(BigInteger, nullable=False, unique=True)
+    through_position: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    entry_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True))
+    events: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    points: Mapped[dict] = mapped_column(AccrualData, nullable=False, default=dict)
+    amount: Mapped[Decimal] = mapped_column(Numeric(20, 4), nullable=False, default=Decimal(0))
+    unpaid: Mapped[dict] = mapped_column(AccrualData, nullable=False, default=dict)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,71 @@
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import BigInteger, Integer, String, Date, DateTime, Numeric, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..extensions import db
+
+
+# SQLite only autoincrements INTEGER PRIMARY KEY columns.
+RollupId = BigInteger().with_variant(Integer(), "sqlite")
+Amount = Numeric(20, 4)
+
+
+class FundDayRollup(db.Model):
+    """
+    A fund's ledger activity on one day, see :mod:`app.utils.statements`. Rollups are derived from the postings
+    and can be rebuilt from them at any time; statements and balance charts read them instead of the postings.
+
+    ``closing`` is ``opening + credits - debits - fees``, and the closing of one day is the opening of the fund's
+    next day with activity.
+
+    :ivar id: Identifier, the tie breaker of paginated statements.
+    :type id: int
+    :ivar fund_id: The fund.
+    :type fund_id: uuid.UUID
+    :ivar day: The day, by the time postings were inserted.
+    :type day: date
+    :ivar opening: Balance at the start of the day.
+    :type opening: Decimal
+    :ivar credits: Sum of the day's credits.
+    :type credits: Decimal
+    :ivar debits: Sum of the day's debits, without fees, as a positive amount.
+    :type debits: Decimal
+    :ivar fees: Sum of the fees paid on the day.
+    :type fees: Decimal
+    :ivar closing: Balance at the end of the day.
+    :type closing: Decimal
+    :ivar postings: Number of postings on the day.
+    :type postings: int
+    """
+    __tablename__ = "fund_day_rollups"
+    __table_args__ = (Index("ix_fund_day_rollups_fund_id_day", "fund_id", "day", unique=True),)
+    id: Mapped[int] = mapped_column(RollupId, primary_key=True, autoincrement=True)
+    fund_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("funds.id"), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    opening: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    credits: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    debits: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    fees: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    closing: Mapped[Decimal] = mapped_column(Amount, nullable=False, default=Decimal(0))
+    postings: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class RollupCursor(db.Model):
+    """
+    How far the rollups have consumed the postings.
+
+    :ivar name: Name of the rollup.
+    :type name: str
+    :ivar position: Id of the last posting rolled up.
+    :type position: int
+    :ivar updated_at: When postings were last rolled up.
+    :type updated_at: datetime
+    """
+    __tablename__ = "rollup_cursors"
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    position: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+_COUNTER_BITS = 42
+_RANDOM_BITS = 32
+_COUNTER_MAX = (1 << _COUNTER_BITS) - 1
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+_version = 7
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generates a time-ordered UUID (version 7, RFC 9562).
+
+    The first 48 bits hold the Unix time in milliseconds, so consecutive ids land next to each other in a B-tree
+    index instead of on random pages. The next 42 bits are a counter seeded randomly every millisecond and
+    incremented within it, which keeps ids generated by this process strictly increasing even within the same
+    millisecond; the remaining 32 bits are random.
+
+    :return: The new UUID.
+    :rtype: uuid.UUID
+    """
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Seed with the top bit clear to leave room for increments within the millisecond.
+            _counter = int.from_bytes(os.urandom(6), "big") >> (48 - _COUNTER_BITS + 1)
+        else:
+            _counter += 1
+            if _counter > _COUNTER_MAX:
+                # Counter exhausted, or the clock moved backwards: borrow the next millisecond.
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+    random_bits = int.from_bytes(os.urandom(4), "big")
+    value = (timestamp & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76
+    value |= (counter >> 30) << 64
+    value |= 0b10 << 62
+    value |= (counter & 0x3FFF_FFFF) << _RANDOM_BITS
+    value |= random_bits
+    return uuid.UUID(int=value)
+
+
+def uuid7_datetime(value) -> datetime:
+    """
+    Extracts the creation time embedded in a version 7 UUID.
+
+    :param value: The UUID, as `uuid.UUID` or string.
+    :return: The creation time, timezone aware in UTC, with millisecond precision.
+    :rtype: datetime
+    :raises ValueError: If the value is not a version 7 UUID.
+    """
+    value = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    if value.version != 7:
+        raise ValueError(f"{value} is a version {value.version} UUID, not version 7")
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def uuid7_floor(moment: datetime) -> uuid.UUID:
+    """
+    Returns the smallest version 7 UUID that can be generated at ``moment``, so that time ranges can be
+    queried through the primary key, e.g. ``Model.id >= uuid7_floor(since)``.
+
+    :param moment: The moment; naive datetimes are taken as local time.
+    :type moment: datetime
+    :return: The lower bound UUID.
+    :rtype: uuid.UUID
+    """
+    timestamp = int(moment.timestamp() * 1000)
+    return uuid.UUID(int=((timestamp & 0xFFFF_FFFF_FFFF) << 80) | (0x7 << 76) | (0b10 << 62))
+
+
+def set_uuid_version(version) -> None:
+    """
+    Selects the UUID version :func:`new_uuid` produces.
+
+    :param version: ``7`` for time-ordered ids or ``4`` for random ids.
+    :raises ValueError: For any other version.
+    """
+    global _version
+    version = int(version)
+    if version not in (4, 7):
+        raise ValueError(f"Unsupported UUID version {version}; use 4 or 7")
+    _version = version
+
+
+def new_uuid() -> uuid.UUID:
+    """
+    Generates a primary key with the configured UUID version.
+
+    :return: The new UUID.
+    :rtype: uuid.UUID
+    """
+    return uuid7() if _version == 7 else uuid.uuid4()
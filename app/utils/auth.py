@@ -0,0 +1,135 @@
+import uuid
+from functools import wraps
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import Flask, current_app, g, jsonify
+from flask_login import current_user
+
+from ..extensions import csrf, db, login_manager
+from ..models.commerce import Fund
+from ..models.library import Library, Portfolio, Wallet
+from ..models.user import User
+
+
+def load_user(user_id: str) -> Optional[User]:
+    """
+    Loads the user of a login session.
+
+    :param user_id: The id stored in the session.
+    :type user_id: str
+    :return: The user, or ``None`` if the id is malformed or unknown.
+    :rtype: Optional[User]
+    """
+    try:
+        return db.session.get(User, uuid.UUID(user_id))
+    except ValueError:
+        return None
+
+
+def load_user_from_request(request) -> Optional[User]:
+    """
+    Loads the user whose API key a request carries as ``Authorization: Bearer <key>``. Such requests are marked
+    as token authenticated, which exempts them from the CSRF check of :func:`api_login_required`.
+
+    :param request: The request.
+    :return: The user, or ``None`` without a known key.
+    :rtype: Optional[User]
+    """
+    scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not key.strip():
+        return None
+    user = db.session.scalar(sa.select(User).where(User.api_key == key.strip(), User.deleted_at.is_(None)))
+    if user is not None:
+        g.api_token_authenticated = True
+    return user
+
+
+def api_login_required(view):
+    """
+    Decorator answering 401 to requests of JSON routes without an authenticated user.
+
+    The routes are exempt from the application-wide CSRF check so that API clients, which authenticate with a
+    key and send no CSRF token, can call them. Requests authenticated by a login session cookie are checked
+    here instead, so a browser session never acts without a CSRF token.
+
+    :param view: The view.
+    :return: The guarded view.
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify({"error": "Authentication required"}), 401, {"WWW-Authenticate": "Bearer"}
+        if not g.get("api_token_authenticated") and current_app.config.get("WTF_CSRF_ENABLED", True):
+            csrf.protect()
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def caller_libraries() -> sa.Select:
+    """
+    Returns a select of the ids of the libraries the authenticated user owns.
+
+    :return: The select.
+    :rtype: sqlalchemy.Select
+    """
+    return sa.select(Library.id).where(Library.owner_id == current_user.id, Library.deleted_at.is_(None))
+
+
+def caller_owns_library(library_id) -> bool:
+    """
+    Returns whether the authenticated user owns a library.
+
+    :param library_id: The library, e.g. as stored in a job's payload.
+    :return: Whether it is one of the user's libraries.
+    :rtype: bool
+    """
+    try:
+        library_id = uuid.UUID(str(library_id))
+    except ValueError:
+        return False
+    return db.session.scalar(caller_libraries().where(Library.id == library_id)) is not None
+
+
+def caller_portfolio_id(portfolio_id=None) -> Optional[uuid.UUID]:
+    """
+    Returns the portfolio the authenticated user acts for: the given one if it belongs to one of the user's
+    libraries, or the portfolio of the user's oldest library when none is given.
+
+    :param portfolio_id: The portfolio the request names, if any.
+    :return: The portfolio, or ``None`` if the user has no such portfolio.
+    :rtype: Optional[uuid.UUID]
+    """
+    query = (
+        sa.select(Portfolio.id).join(Library, Library.id == Portfolio.library_id)
+        .where(Portfolio.library_id.in_(caller_libraries().scalar_subquery()), Portfolio.deleted_at.is_(None))
+        .order_by(Library.created_at).limit(1)
+    )
+    if portfolio_id is not None:
+        query = query.where(Portfolio.id == portfolio_id)
+    return db.session.scalar(query)
+
+
+def caller_owns_fund(fund_id) -> bool:
+    """
+    Returns whether a fund is in the wallet of one of the authenticated user's libraries.
+
+    :param fund_id: The fund.
+    :return: Whether the user may act on the fund.
+    :rtype: bool
+    """
+    return db.session.scalar(
+        sa.select(Fund.id).join(Wallet, Wallet.id == Fund.wallet_id)
+        .where(Fund.id == fund_id, Wallet.library_id.in_(caller_libraries().scalar_subquery()))
+    ) is not None
+
+
+def init_auth(app: Flask) -> None:
+    """
+    Lets requests authenticate with a login session or, for API clients, with a user's API key.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    login_manager.user_loader(load_user)
+    login_manager.request_loader(load_user_from_request)
@@ -0,0 +1,708 @@
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, Iterable, Mapping, Optional
+from urllib.parse import urlsplit
+
+import sqlalchemy as sa
+from flask import Flask
+
+from ..extensions import db
+from ..models.library import Film, Person
+from ..models.common import Genre, Tag
+from .outbox import ChangeEvent, outbox_subscriber
+
+
+logger = logging.getLogger(__name__)
+_unshared_warned = False
+
+#: Invalidation modes of :attr:`CacheNamespace.entities`: evict the entry keyed by the changed row's id, or
+#: the whole namespace.
+BY_KEY = "key"
+ALL = "all"
+
+
+@dataclass(frozen=True)
+class CacheNamespace:
+    """
+    A family of cached values sharing their expiry, size limit and invalidation rules.
+
+    :ivar name: Name of the namespace, also the prefix of its keys in the shared tier.
+    :type name: str
+    :ivar ttl: Seconds values live in the shared tier.
+    :type ttl: float
+    :ivar local_ttl: Seconds values live in the per-process tier. Without a shared tier this also bounds how
+        long other processes serve a value after it changed.
+    :type local_ttl: float
+    :ivar local_size: Entries kept in the per-process tier before the least recently used are evicted.
+    :type local_size: int
+    :ivar entities: Table names whose change events invalidate the namespace, mapped to :data:`BY_KEY` or
+        :data:`ALL`.
+    :type entities: Mapping[str, str]
+    :ivar version: Bumped when the shape of cached values changes, so old entries in the shared tier are
+        ignored.
+    :type version: int
+    """
+    name: str
+    ttl: float = 3600.0
+    local_ttl: float = 60.0
+    local_size: int = 10000
+    entities: Mapping[str, str] = field(default_factory=dict)
+    version: int = 1
+
+
+CACHE_NAMESPACES: dict[str, CacheNamespace] = {}
+
+
+def cache_namespace(name: str, **options) -> CacheNamespace:
+    """
+    Registers a cache namespace.
+
+    :param name: Unique name of the namespace.
+    :type name: str
+    :param options: Further :class:`CacheNamespace` fields.
+    :return: The namespace.
+    :rtype: CacheNamespace
+    """
+    namespace = CACHE_NAMESPACES[name] = CacheNamespace(name, **options)
+    return namespace
+
+
+class LocalTier:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after a fixed time.
+
+    :ivar maxsize: Maximum number of entries.
+    :type maxsize: int
+    :ivar ttl: Seconds an entry lives.
+    :type ttl: float
+    :ivar evictions: Entries dropped to make room, not counting expired or invalidated ones.
+    :type evictions: int
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> tuple[bool, object]:
+        """
+        Looks up a key, refreshing its recency.
+
+        :param key: The key.
+        :return: Whether a live entry was found, and its value.
+        :rtype: tuple[bool, object]
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= self._clock():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: Hashable, value) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTier:
+    """
+    Interface of a cache store shared by all processes, holding pickled values under string keys.
+
+    Besides values, a shared tier carries the stream of invalidations, so every process can evict its local
+    copies of a value that changed, and short-lived locks used to load a missing value only once across
+    processes.
+    """
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """
+        Stores a value only if the key has no live value.
+
+        :return: Whether the value was stored.
+        :rtype: bool
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        raise NotImplementedError
+
+    def publish(self, invalidations: Iterable[tuple[str, Optional[str]]]) -> None:
+        """
+        Appends invalidations to the stream.
+
+        :param invalidations: Pairs of namespace and key; a key of ``None`` invalidates the whole namespace.
+        """
+        raise NotImplementedError
+
+    def invalidations(self, after: Optional[int]) -> tuple[int, list[tuple[str, Optional[str]]]]:
+        """
+        Reads the invalidations published after a position.
+
+        :param after: The last position read, or ``None`` to start from the current end of the stream.
+        :type after: Optional[int]
+        :return: The new position and the invalidations.
+        :rtype: tuple[int, list[tuple[str, Optional[str]]]]
+        """
+        raise NotImplementedError
+
+
+class SQLiteTier(SharedTier):
+    """
+    Shared tier in a SQLite file, for single-host deployments, development and tests. Processes on the same
+    host share it through the file; WAL mode lets readers proceed while a writer holds the lock.
+
+    :ivar path: Path of the database file.
+    :type path: str
+    """
+
+    #: Seconds published invalidations are kept; processes that fall further behind only rely on local TTLs.
+    INVALIDATION_RETENTION = 3600.0
+    #: Writes between two sweeps of expired entries.
+    SWEEP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS invalidations "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, key TEXT, created_at REAL)"
+        )
+
+    @classmethod
+    def from_url(cls, url: str) -> "SQLiteTier":
+        # Like SQLAlchemy URLs: sqlite:///relative/path.db or sqlite:////absolute/path.db
+        return cls(urlsplit(url).path[1:])
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        return conn
+
+    def _written(self) -> None:
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            now = time.time()
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM invalidations WHERE created_at < ?", (now - self.INVALIDATION_RETENTION,))
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+        )
+        self._written()
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO entries (key, value, expires_at) VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE "
+            "SET value = excluded.value, expires_at = excluded.expires_at WHERE entries.expires_at <= ?",
+            (key, value, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, keys: Iterable[str]) -> None:
+        self._connection().executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def delete_prefix(self, prefix: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def publish(self, invalidations: Iterable[tuple[str, Optional[str]]]) -> None:
+        now = time.time()
+        self._connection().executemany(
+            "INSERT INTO invalidations (namespace, key, created_at) VALUES (?, ?, ?)",
+            [(namespace, key, now) for namespace, key in invalidations],
+        )
+        self._written()
+
+    def invalidations(self, after: Optional[int]) -> tuple[int, list[tuple[str, Optional[str]]]]:
+        conn = self._connection()
+        if after is None:
+            return conn.execute("SELECT coalesce(max(id), 0) FROM invalidations").fetchone()[0], []
+        rows = conn.execute(
+            "SELECT id, namespace, key FROM invalidations WHERE id > ? ORDER BY id", (after,)
+        ).fetchall()
+        return (rows[-1][0] if rows else after), [(namespace, key) for _, namespace, key in rows]
+
+
+#: Shared tier implementations by URL scheme, each a callable taking the URL.
+SHARED_TIERS: dict[str, Callable[[str], SharedTier]] = {"sqlite": SQLiteTier.from_url}
+
+
+def open_shared_tier(url: Optional[str]) -> Optional[SharedTier]:
+    """
+    Opens the shared tier a URL such as ``sqlite:////var/cache/amber.db`` points to.
+
+    :param url: The URL, or ``None`` for no shared tier.
+    :type url: Optional[str]
+    :return: The shared tier.
+    :rtype: Optional[SharedTier]
+    """
+    if not url:
+        return None
+    scheme = urlsplit(url).scheme
+    if scheme not in SHARED_TIERS:
+        raise ValueError(f"No shared cache tier for {scheme!r} URLs")
+    return SHARED_TIERS[scheme](url)
+
+
+@dataclass
+class CacheStats:
+    """
+    Counters of one namespace.
+
+    :ivar local_hits: Reads answered by the per-process tier.
+    :ivar shared_hits: Reads answered by the shared tier.
+    :ivar misses: Reads that ran the loader.
+    :ivar coalesced: Reads that waited for another caller loading the same key instead of loading it.
+    :ivar load_errors: Loader calls that raised.
+    :ivar load_seconds: Time spent in loaders.
+    :ivar invalidations: Keys, or whole namespaces, invalidated.
+    """
+    local_hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    load_errors: int = 0
+    load_seconds: float = 0.0
+    invalidations: int = 0
+
+
+class _Flight:
+    """A load in progress, awaited by concurrent callers of the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.stale = False
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+_NOT_FOUND = object()
+
+
+class Cache:
+    """
+    Two-tier read-through cache: a per-process LRU/TTL tier in front of an optional shared tier.
+
+    A missing key is loaded once however many callers ask for it at the same time: callers in the same
+    process wait for the first one, and with a shared tier processes take a short lock in it and the losers
+    poll for the winner's value. Invalidations evict the shared entry and are published to every process,
+    which drop their local copies on their next read after ``sync_interval``. A value loaded while its key was
+    invalidated is returned but not stored, since it may predate the change.
+
+    Failures of the shared tier are logged and the cache falls back to the loader.
+
+    :ivar shared: The shared tier.
+    :type shared: Optional[SharedTier]
+    :ivar enabled: When off, every read runs the loader.
+    :type enabled: bool
+    :ivar lock_timeout: Seconds a caller waits for another one loading the same key before loading it itself.
+    :type lock_timeout: float
+    :ivar sync_interval: Minimum seconds between two reads of the shared invalidation stream.
+    :type sync_interval: float
+    """
+
+    LOCK_POLL_INTERVAL = 0.02
+
+    def __init__(self, shared: Optional[SharedTier] = None, enabled: bool = True, lock_timeout: float = 5.0,
+                 sync_interval: float = 1.0, namespaces: Optional[dict[str, CacheNamespace]] = None):
+        self.namespaces = CACHE_NAMESPACES if namespaces is None else namespaces
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.configure(shared, enabled, lock_timeout, sync_interval)
+
+    def configure(self, shared: Optional[SharedTier] = None, enabled: bool = True, lock_timeout: float = 5.0,
+                  sync_interval: float = 1.0) -> None:
+        """
+        Replaces the shared tier and settings, dropping local entries and counters.
+        """
+        with self._lock:
+            self.shared = shared
+            self.enabled = enabled
+            self.lock_timeout = lock_timeout
+            self.sync_interval = sync_interval
+            self._tiers: dict[str, LocalTier] = {}
+            self._stats: dict[str, CacheStats] = {}
+            self._flights: dict[tuple[str, str], _Flight] = {}
+            self._position: Optional[int] = None
+            self._synced_at = float("-inf")
+
+    def _namespace(self, name: str) -> tuple[CacheNamespace, LocalTier, CacheStats]:
+        namespace = self.namespaces[name]
+        tier = self._tiers.get(name)
+        if tier is None:
+            with self._lock:
+                self._stats.setdefault(name, CacheStats())
+                tier = self._tiers.setdefault(name, LocalTier(namespace.local_size, namespace.local_ttl))
+        return namespace, tier, self._stats[name]
+
+    def _count(self, stats: CacheStats, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            setattr(stats, counter, getattr(stats, counter) + amount)
+
+    def _shared(self, method: str, *args, default=None):
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception:
+            logger.warning("Shared cache tier %s failed", method, exc_info=True)
+            return default
+
+    @staticmethod
+    def _shared_key(namespace: CacheNamespace, key: Optional[str] = None) -> str:
+        return f"{namespace.name}:" + ("" if key is None else f"v{namespace.version}:{key}")
+
+    def stats(self, name: str) -> CacheStats:
+        return self._namespace(name)[2]
+
+    def get_or_load(self, name: str, key: Hashable, loader: Callable[[], object]):
+        """
+        Returns the cached value of a key, loading and storing it on a miss.
+
+        :param name: The namespace.
+        :type name: str
+        :param key: The key; keys are compared by their string form, which is also how change events name rows.
+        :param loader: Computes the value; it must be picklable when a shared tier is configured.
+        :return: The value.
+        """
+        if not self.enabled:
+            return loader()
+        namespace, tier, stats = self._namespace(name)
+        key = str(key)
+        self.sync()
+        found, value = tier.get(key)
+        if found:
+            self._count(stats, "local_hits")
+            return value
+
+        with self._lock:
+            flight = self._flights.get((name, key))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(name, key)] = _Flight()
+        if not leader:
+            self._count(stats, "coalesced")
+            if flight.done.wait(self.lock_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            return self._load(namespace, key, loader, stats, _Flight())
+
+        try:
+            flight.value = value = self._load(namespace, key, loader, stats, flight)
+            if not flight.stale:
+                tier.set(key, value)
+            return value
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop((name, key), None)
+            flight.done.set()
+
+    def _load(self, namespace: CacheNamespace, key: str, loader: Callable, stats: CacheStats, flight: _Flight):
+        shared_key = lock_key = None
+        if self.shared is not None:
+            shared_key = self._shared_key(namespace, key)
+            raw = self._shared("get", shared_key)
+            if raw is not None:
+                self._count(stats, "shared_hits")
+                return pickle.loads(raw)
+            lock_key = f"{shared_key}#lock"
+            if not self._shared("add", lock_key, b"", self.lock_timeout, default=True):
+                self._count(stats, "coalesced")
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(self.LOCK_POLL_INTERVAL)
+                    raw = self._shared("get", shared_key)
+                    if raw is not None:
+                        self._count(stats, "shared_hits")
+                        return pickle.loads(raw)
+                lock_key = None
+
+        self._count(stats, "misses")
+        started = time.perf_counter()
+        try:
+            try:
+                value = loader()
+            except BaseException:
+                self._count(stats, "load_errors")
+                raise
+            finally:
+                self._count(stats, "load_seconds", time.perf_counter() - started)
+            if shared_key is not None and not flight.stale:
+                self._shared("set", shared_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), namespace.ttl)
+            return value
+        finally:
+            if lock_key is not None:
+                self._shared("delete", [lock_key])
+
+    def _evict(self, name: str, keys: Optional[Iterable[str]]) -> None:
+        if name not in self.namespaces:
+            return
+        _, tier, _ = self._namespace(name)
+        with self._lock:
+            for (flight_name, flight_key), flight in self._flights.items():
+                if flight_name == name and (keys is None or flight_key in keys):
+                    flight.stale = True
+        if keys is None:
+            tier.clear()
+        else:
+            for key in keys:
+                tier.delete(key)
+
+    def invalidate(self, name: str, keys: Optional[Iterable[Hashable]] = None) -> None:
+        """
+        Drops keys of a namespace, or the whole namespace, from both tiers and tells other processes to drop
+        their local copies.
+
+        :param name: The namespace.
+        :type name: str
+        :param keys: The keys, or ``None`` for all of them.
+        """
+        namespace, _, stats = self._namespace(name)
+        keys = None if keys is None else {str(key) for key in keys}
+        self._evict(name, keys)
+        self._count(stats, "invalidations", 1 if keys is None else len(keys))
+        if self.shared is None:
+            return
+        if keys is None:
+            self._shared("delete_prefix", self._shared_key(namespace))
+            self._shared("publish", [(name, None)])
+        else:
+            self._shared("delete", [self._shared_key(namespace, key) for key in keys])
+            self._shared("publish", [(name, key) for key in keys])
+
+    def sync(self, force: bool = False) -> None:
+        """
+        Applies invalidations other processes published, at most every ``sync_interval`` seconds.
+
+        :param force: Read the stream regardless of the interval.
+        :type force: bool
+        """
+        if self.shared is None or (not force and time.monotonic() - self._synced_at < self.sync_interval):
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced_at = time.monotonic()
+            result = self._shared("invalidations", self._position)
+            if result is None:
+                return
+            started, (self._position, entries) = self._position is not None, result
+            if not started:
+                return
+            everything = {name for name, key in entries if key is None}
+            keys: dict[str, set] = {}
+            for name, key in entries:
+                if name not in everything:
+                    keys.setdefault(name, set()).add(key)
+            for name in everything:
+                self._evict(name, None)
+            for name, evicted in keys.items():
+                self._evict(name, evicted)
+        finally:
+            self._sync_lock.release()
+
+    def apply_events(self, events: Iterable[ChangeEvent]) -> None:
+        """
+        Invalidates what change events make stale, per the namespaces' :attr:`CacheNamespace.entities`.
+
+        :param events: The change events.
+        """
+        everything, keys = set(), {}
+        for change in events:
+            for namespace in self.namespaces.values():
+                mode = namespace.entities.get(change.entity)
+                if mode == ALL:
+                    everything.add(namespace.name)
+                elif mode == BY_KEY:
+                    keys.setdefault(namespace.name, set()).add(change.entity_id)
+        for name in everything:
+            self.invalidate(name)
+        for name, entity_ids in keys.items():
+            if name not in everything:
+                self.invalidate(name, entity_ids)
+
+    def render_metrics(self) -> str:
+        """
+        Renders the per-namespace counters in the Prometheus text exposition format.
+
+        :return: The exposition text.
+        :rtype: str
+        """
+        with self._lock:
+            stats = sorted((name, CacheStats(**vars(s))) for name, s in self._stats.items())
+            sizes = {name: len(tier) for name, tier in self._tiers.items()}
+            evictions = {name: tier.evictions for name, tier in self._tiers.items()}
+        lines = []
+        for metric, kind, help_text, value in (
+            ("amber_cache_local_hits_total", "counter", "Reads answered by the process tier.", lambda n, s: s.local_hits),
+            ("amber_cache_shared_hits_total", "counter", "Reads answered by the shared tier.", lambda n, s: s.shared_hits),
+            ("amber_cache_misses_total", "counter", "Reads that ran the loader.", lambda n, s: s.misses),
+            ("amber_cache_coalesced_total", "counter", "Reads that waited for a concurrent load of the same key.",
+             lambda n, s: s.coalesced),
+            ("amber_cache_load_errors_total", "counter", "Loader calls that raised.", lambda n, s: s.load_errors),
+            ("amber_cache_load_seconds_total", "counter", "Time spent in loaders.", lambda n, s: round(s.load_seconds, 6)),
+            ("amber_cache_invalidations_total", "counter", "Keys or namespaces invalidated.",
+             lambda n, s: s.invalidations),
+            ("amber_cache_evictions_total", "counter", "Process tier entries evicted for room.",
+             lambda n, s: evictions.get(n, 0)),
+            ("amber_cache_entries", "gauge", "Entries in the process tier.", lambda n, s: sizes.get(n, 0)),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{namespace="{name}"}} {value(name, s)}' for name, s in stats)
+        return "\n".join(lines) + "\n"
+
+
+cache = Cache()
+
+
+def cached(name: str):
+    """
+    Decorator caching a function in a namespace, keyed by its positional arguments. Functions without
+    arguments are cached under the key ``"all"``.
+
+    The undecorated function stays available as ``uncached``.
+
+    :param name: The namespace.
+    :type name: str
+    :return: The decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapped(*args):
+            key = ":".join(str(arg) for arg in args) or "all"
+            return cache.get_or_load(name, key, lambda: function(*args))
+        wrapped.uncached = function
+        return wrapped
+    return decorator
+
+
+cache_namespace("film_card", entities={"films": BY_KEY}, local_size=20000)
+cache_namespace("person_header", entities={"people": BY_KEY})
+cache_namespace("genre", entities={"genres": BY_KEY}, ttl=86400.0, local_ttl=300.0, local_size=1000)
+cache_namespace("tag", entities={"tags": BY_KEY}, ttl=86400.0, local_ttl=300.0, local_size=5000)
+
+FILM_CARD_FIELDS = ("id", "title", "release_year", "imdb_rating", "popularity_score", "runtime", "tagline")
+PERSON_HEADER_FIELDS = (
+    "id", "first_name", "last_name", "full_name", "profession_summary", "date_of_birth", "date_of_death",
+)
+
+
+def _row(model, entity_id, fields: Optional[tuple] = None) -> Optional[dict]:
+    if fields is None:
+        fields = tuple(c.key for c in sa.inspect(model).column_attrs if c.key != "confidence_score_report")
+    row = db.session.execute(
+        sa.select(*(getattr(model, name) for name in fields)).where(model.id == entity_id)
+    ).first()
+    return None if row is None else dict(zip(fields, row))
+
+
+@cached("film_card")
+def film_card(film_id) -> Optional[dict]:
+    """
+    The fields film lists and cards show, or ``None`` for a missing or deleted film.
+    """
+    return _row(Film, film_id, FILM_CARD_FIELDS)
+
+
+@cached("person_header")
+def person_header(person_id) -> Optional[dict]:
+    """
+    The fields shown at the top of a person's pages, or ``None`` for a missing or deleted person.
+    """
+    return _row(Person, person_id, PERSON_HEADER_FIELDS)
+
+
+@cached("genre")
+def genre(genre_id) -> Optional[dict]:
+    return _row(Genre, genre_id)
+
+
+@cached("tag")
+def tag(tag_id) -> Optional[dict]:
+    return _row(Tag, tag_id)
+
+
+def invalidate_cached_entities(events: list[ChangeEvent]) -> None:
+    global _unshared_warned
+    if cache.shared is None and not _unshared_warned:
+        _unshared_warned = True
+        logger.warning(
+            "Relaying cache invalidations without CACHE_SHARED_URL only evicts this process's entries; other "
+            "processes serve theirs until their local_ttl ends"
+        )
+    cache.apply_events(events)
+
+
+def init_cache(app: Flask) -> None:
+    """
+    Configures :data:`cache` from ``CACHE_ENABLED``, ``CACHE_SHARED_URL``, ``CACHE_LOCK_TIMEOUT`` and
+    ``CACHE_SYNC_INTERVAL``.
+
+    Changes are invalidated by the ``cache`` outbox subscriber, which runs in the ``flask outbox relay``
+    process and reaches the other processes through the shared tier. Without ``CACHE_SHARED_URL`` the other
+    processes keep serving entries until their namespace's ``local_ttl`` ends.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    # Subscribed here rather than on import, once every module has declared its namespaces.
+    tables = {table for namespace in CACHE_NAMESPACES.values() for table in namespace.entities}
+    outbox_subscriber("cache", tables)(invalidate_cached_entities)
+    config = app.config
+    cache.configure(
+        shared=open_shared_tier(config.get("CACHE_SHARED_URL")),
+        enabled=config.get("CACHE_ENABLED", True),
+        lock_timeout=config.get("CACHE_LOCK_TIMEOUT", 5.0),
+        sync_interval=config.get("CACHE_SYNC_INTERVAL", 1.0),
+    )
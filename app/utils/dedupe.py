@@ -0,0 +1,477 @@
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, func
+
+from ..extensions import db
+from ..models.library import Person, Career, Gig, Character, Relationship, Win, Nomination
+
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+UNKNOWN_YEAR = "?"
+
+
+def fold_name(name: Optional[str]) -> str:
+    """
+    Folds a person name to lower-case ASCII letters and single spaces.
+
+    :param name: The raw name.
+    :type name: Optional[str]
+    :return: The folded name, possibly empty.
+    :rtype: str
+    """
+    if not name:
+        return ""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join("".join(ch if ch.isalpha() else " " for ch in text).split())
+
+
+def soundex(word: str) -> str:
+    """
+    Computes the American Soundex code of a word, used as the phonetic half of a blocking key.
+
+    :param word: A folded, lower-case word.
+    :type word: str
+    :return: A four character Soundex code, or an empty string for empty input.
+    :rtype: str
+    """
+    if not word:
+        return ""
+    code = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], "")
+    for ch in word[1:]:
+        digit = SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def jaro_winkler(left: str, right: str) -> float:
+    """
+    Computes the Jaro-Winkler similarity of two strings.
+
+    :param left: The first string.
+    :type left: str
+    :param right: The second string.
+    :type right: str
+    :return: A similarity between 0 and 1.
+    :rtype: float
+    """
+    if left == right:
+        return 1.0 if left else 0.0
+    if not left or not right:
+        return 0.0
+    window = max(max(len(left), len(right)) // 2 - 1, 0)
+    left_flags = [False] * len(left)
+    right_flags = [False] * len(right)
+    matches = 0
+    for i, ch in enumerate(left):
+        for j in range(max(0, i - window), min(i + window + 1, len(right))):
+            if not right_flags[j] and right[j] == ch:
+                left_flags[i] = right_flags[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions, j = 0, 0
+    for i, ch in enumerate(left):
+        if left_flags[i]:
+            while not right_flags[j]:
+                j += 1
+            if ch != right[j]:
+                transpositions += 1
+            j += 1
+    jaro = (matches / len(left) + matches / len(right) + (matches - transpositions / 2) / matches) / 3
+    prefix = 0
+    for a, b in zip(left[:4], right[:4]):
+        if a != b:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+@dataclass
+class PersonRecord:
+    """
+    A compact, column-only view of a `Person` row used by the de-duplication job.
+
+    :ivar person_id: The identifier of the person.
+    :type person_id: uuid.UUID
+    :ivar names: Folded name variants: the full name, "first last" and every alias.
+    :type names: tuple[str, ...]
+    :ivar date_of_birth: The date of birth, if known.
+    :type date_of_birth: Optional[datetime]
+    """
+    person_id: object
+    names: tuple
+    date_of_birth: Optional[object] = None
+
+    @classmethod
+    def from_row(cls, person_id, first_name, last_name, full_name, aliases, date_of_birth) -> "PersonRecord":
+        """
+        Builds a record from the columns selected by :func:`find_duplicate_people`.
+
+        :return: The record.
+        :rtype: PersonRecord
+        """
+        variants = [full_name, f"{first_name or ''} {last_name or ''}", *(aliases or [])]
+        names = tuple(dict.fromkeys(name for name in map(fold_name, variants) if name))
+        return cls(person_id=person_id, names=names, date_of_birth=date_of_birth)
+
+    @property
+    def birth_year(self):
+        """
+        The birth year used in blocking keys, or ``UNKNOWN_YEAR`` without a date of birth.
+        """
+        return self.date_of_birth.year if self.date_of_birth else UNKNOWN_YEAR
+
+    def blocking_keys(self) -> set:
+        """
+        Builds the blocking keys of the record: the Soundex code of the last name token and the first initial
+        of every name variant, combined with the birth year. Every record is also placed in the year-less
+        block of each name so that people with and without a known birth date can still meet.
+
+        :return: The set of blocking keys.
+        :rtype: set[tuple]
+        """
+        keys = set()
+        for name in self.names:
+            tokens = name.split()
+            phonetic = (soundex(tokens[-1]), tokens[0][0])
+            keys.add((*phonetic, UNKNOWN_YEAR))
+            if self.birth_year != UNKNOWN_YEAR:
+                keys.add((*phonetic, self.birth_year))
+        return keys
+
+
+@dataclass
+class MergePlan:
+    """
+    A plan to merge a cluster of duplicate `Person` rows into one surviving row.
+
+    :ivar survivor_id: The person that keeps all credits.
+    :type survivor_id: uuid.UUID
+    :ivar duplicate_ids: The people merged into the survivor and soft-deleted.
+    :type duplicate_ids: list[uuid.UUID]
+    :ivar score: The weakest pairwise similarity that joined the cluster.
+    :type score: float
+    :ivar aliases: Every name variant of the cluster, stored as the survivor's aliases.
+    :type aliases: list[str]
+    """
+    survivor_id: object
+    duplicate_ids: list
+    score: float
+    aliases: list = field(default_factory=list)
+
+
+class _DisjointSet:
+    """
+    Minimal union-find structure used to cluster matched pairs.
+    """
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, left: int, right: int) -> None:
+        left, right = self.find(left), self.find(right)
+        if left != right:
+            self.parent[max(left, right)] = min(left, right)
+
+
+@dataclass
+class PersonDeduper:
+    """
+    Offline de-duplication engine for `Person` rows.
+
+    Records are grouped into blocks by phonetic name and birth year, and pairwise similarities are only
+    computed inside a block. Blocks larger than ``max_block_size`` are compared with a sorted-neighbourhood
+    window of ``window`` records instead of all pairs, so the work grows linearly with the number of people
+    rather than quadratically. Matching pairs are clustered with union-find.
+
+    :ivar threshold: Minimum similarity for two records to be considered the same person.
+    :type threshold: float
+    :ivar max_block_size: Largest block compared exhaustively.
+    :type max_block_size: int
+    :ivar window: Neighbourhood size used for blocks above ``max_block_size``.
+    :type window: int
+    """
+    threshold: float = 0.92
+    max_block_size: int = 200
+    window: int = 20
+
+    @classmethod
+    def from_config(cls) -> "PersonDeduper":
+        """
+        Creates a deduper using ``PERSON_DEDUPE_THRESHOLD`` from the application config, falling back to the
+        default outside an application context.
+
+        :return: A configured deduper.
+        :rtype: PersonDeduper
+        """
+        if not has_app_context():
+            return cls()
+        return cls(threshold=current_app.config.get("PERSON_DEDUPE_THRESHOLD", cls.threshold))
+
+    def similarity(self, left: PersonRecord, right: PersonRecord) -> float:
+        """
+        Scores two records. Conflicting birth years veto the match; an identical date of birth adds
+        confidence; a missing date is neutral.
+
+        :param left: The first record.
+        :type left: PersonRecord
+        :param right: The second record.
+        :type right: PersonRecord
+        :return: A similarity between 0 and 1.
+        :rtype: float
+        """
+        if UNKNOWN_YEAR not in (left.birth_year, right.birth_year) and left.birth_year != right.birth_year:
+            return 0.0
+        name_score = max(jaro_winkler(a, b) for a in left.names for b in right.names)
+        if left.date_of_birth and left.date_of_birth == right.date_of_birth:
+            date_score = 1.0
+        elif left.date_of_birth and right.date_of_birth:
+            date_score = 0.6
+        else:
+            date_score = 0.8
+        return 0.85 * name_score + 0.15 * date_score
+
+    def _block_pairs(self, key: tuple, members: list, records: list) -> Iterable[tuple]:
+        """
+        Yields the index pairs to compare inside one block.
+
+        Year blocks compare every pair. Year-less blocks only compare pairs involving a record without a birth
+        year, since two dated records either share a year block already or are vetoed by their years.
+
+        :param key: The blocking key of the block.
+        :param members: Record indices in the block.
+        :param records: All records.
+        :return: Pairs of record indices.
+        """
+        undated_block = key[-1] == UNKNOWN_YEAR
+        if len(members) <= self.max_block_size:
+            candidates = (
+                (left, right) for offset, left in enumerate(members) for right in members[offset + 1:]
+            )
+        else:
+            ordered = sorted(members, key=lambda index: records[index].names[0])
+            candidates = (
+                (left, right) for offset, left in enumerate(ordered)
+                for right in ordered[offset + 1:offset + 1 + self.window]
+            )
+        for left, right in candidates:
+            if undated_block and UNKNOWN_YEAR not in (records[left].birth_year, records[right].birth_year):
+                continue
+            yield left, right
+
+    def plan(self, records: list[PersonRecord], rank: Optional[dict] = None) -> list[MergePlan]:
+        """
+        Clusters duplicate records and returns one `MergePlan` per cluster.
+
+        :param records: The records to de-duplicate.
+        :type records: list[PersonRecord]
+        :param rank: Optional mapping of person id to a sortable survivor rank; the highest ranked member of
+            a cluster survives. Without it the first record of the cluster survives.
+        :type rank: Optional[dict]
+        :return: The merge plans, one per cluster of two or more records.
+        :rtype: list[MergePlan]
+        """
+        blocks: dict = {}
+        for index, record in enumerate(records):
+            for key in record.blocking_keys():
+                blocks.setdefault(key, []).append(index)
+
+        clusters = _DisjointSet(len(records))
+        accepted = []
+        for key, members in blocks.items():
+            if len(members) < 2:
+                continue
+            for left, right in self._block_pairs(key, members, records):
+                if clusters.find(left) == clusters.find(right):
+                    continue
+                score = self.similarity(records[left], records[right])
+                if score >= self.threshold:
+                    clusters.union(left, right)
+                    accepted.append((left, score))
+
+        weakest: dict = {}
+        for index, score in accepted:
+            root = clusters.find(index)
+            weakest[root] = min(score, weakest.get(root, 1.0))
+
+        grouped: dict = {}
+        for index in range(len(records)):
+            grouped.setdefault(clusters.find(index), []).append(index)
+
+        plans = []
+        for root, members in grouped.items():
+            if len(members) < 2:
+                continue
+            people = [records[index] for index in members]
+            if rank:
+                people.sort(key=lambda record: rank.get(record.person_id, ()), reverse=True)
+            survivor, *duplicates = people
+            aliases = list(dict.fromkeys(name for record in people for name in record.names))
+            plans.append(MergePlan(
+                survivor_id=survivor.person_id,
+                duplicate_ids=[record.person_id for record in duplicates],
+                score=weakest.get(root, self.threshold),
+                aliases=aliases,
+            ))
+        return plans
+
+
+def find_duplicate_people(session=None, deduper: Optional[PersonDeduper] = None, chunk_size: int = 10000) -> list[MergePlan]:
+    """
+    Streams every live `Person` through the deduper and returns the resulting merge plans.
+
+    People are read column-only with a server-side cursor. The survivor of each cluster is the verified or
+    claimed person with the most careers, falling back to the oldest row.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param deduper: The deduper to use. Defaults to :meth:`PersonDeduper.from_config`.
+    :type deduper: Optional[PersonDeduper]
+    :param chunk_size: Number of rows fetched per round trip.
+    :type chunk_size: int
+    :return: The merge plans.
+    :rtype: list[MergePlan]
+    """
+    session = session or db.session
+    deduper = deduper or PersonDeduper.from_config()
+    rows = session.execute(
+        select(
+            Person.id, Person.first_name, Person.last_name, Person.full_name, Person.aliases, Person.date_of_birth
+        ).where(Person.deleted_at.is_(None)).execution_options(yield_per=chunk_size)
+    )
+    records = [PersonRecord.from_row(*row) for row in rows]
+    plans = deduper.plan(records)
+    if not plans:
+        return plans
+
+    candidate_ids = [person_id for plan in plans for person_id in (plan.survivor_id, *plan.duplicate_ids)]
+    career_counts = (
+        select(Career.person_id, func.count(Career.id).label("careers"))
+        .where(Career.deleted_at.is_(None)).group_by(Career.person_id).subquery()
+    )
+    rank = {
+        person_id: (
+            bool(is_verified), claimed_by_id is not None, careers or 0, -(created_at.timestamp() if created_at else 0)
+        )
+        for person_id, is_verified, claimed_by_id, careers, created_at in session.execute(
+            select(Person.id, Person.is_verified, Person.claimed_by_id, career_counts.c.careers, Person.created_at)
+            .outerjoin(career_counts, career_counts.c.person_id == Person.id)
+            .where(Person.id.in_(candidate_ids))
+        )
+    }
+    for plan in plans:
+        members = sorted([plan.survivor_id, *plan.duplicate_ids], key=lambda person_id: rank.get(person_id, ()), reverse=True)
+        plan.survivor_id, plan.duplicate_ids = members[0], members[1:]
+    return plans
+
+
+def apply_merge_plan(plan: MergePlan, session=None, merged_by=None) -> None:
+    """
+    Applies one merge plan in a single transaction.
+
+    Credits of the duplicates are moved onto the survivor: when the survivor already has a career, the
+    duplicates' `Gig` and `Character` rows are moved onto it and their careers are soft-deleted; otherwise
+    the careers themselves are reassigned. `Relationship`, `Win` and `Nomination` rows are repointed, except
+    relationships between members of the cluster, which are soft-deleted. The survivor inherits every name
+    variant as an alias, and the duplicates are soft-deleted with a report pointing at the survivor.
+
+    :param plan: The plan to apply.
+    :type plan: MergePlan
+    :param session: The session to use. Defaults to ``db.session``.
+    :param merged_by: The user recorded in ``deleted_by`` of the merged rows.
+    :raises Exception: Re-raises any database error after rolling the cluster back.
+    """
+    session = session or db.session
+    survivor, duplicates = plan.survivor_id, plan.duplicate_ids
+    now = datetime.now()
+    try:
+        survivor_career = session.scalar(
+            select(Career.id).where(Career.person_id == survivor, Career.deleted_at.is_(None))
+            .order_by(Career.created_at).limit(1)
+        )
+        duplicate_careers = select(Career.id).where(Career.person_id.in_(duplicates)).scalar_subquery()
+        if survivor_career is None:
+            session.execute(update(Career).where(Career.person_id.in_(duplicates)).values(person_id=survivor))
+        else:
+            session.execute(update(Gig).where(Gig.career_id.in_(duplicate_careers)).values(career_id=survivor_career))
+            session.execute(
+                update(Character).where(Character.career_id.in_(duplicate_careers)).values(career_id=survivor_career)
+            )
+            session.execute(
+                update(Career).where(Career.person_id.in_(duplicates))
+                .values(deleted_at=now, deleted_by=merged_by, is_deleted=True)
+            )
+        # Relationships within the cluster would relate the survivor to itself.
+        cluster = [survivor, *duplicates]
+        session.execute(
+            update(Relationship)
+            .where(Relationship.person_id.in_(cluster), Relationship.related_person_id.in_(cluster))
+            .values(deleted_at=now, deleted_by=merged_by)
+        )
+        session.execute(
+            update(Relationship)
+            .where(Relationship.person_id.in_(duplicates), Relationship.related_person_id.not_in(cluster))
+            .values(person_id=survivor)
+        )
+        session.execute(
+            update(Relationship)
+            .where(Relationship.related_person_id.in_(duplicates), Relationship.person_id.not_in(cluster))
+            .values(related_person_id=survivor)
+        )
+        session.execute(update(Win).where(Win.person_id.in_(duplicates)).values(person_id=survivor))
+        session.execute(update(Nomination).where(Nomination.person_id.in_(duplicates)).values(person_id=survivor))
+        session.execute(update(Person).where(Person.id == survivor).values(aliases=plan.aliases))
+        session.execute(
+            update(Person).where(Person.id.in_(duplicates)).values(
+                deleted_at=now, deleted_by=merged_by, is_deleted=True,
+                confidence_score=plan.score,
+                confidence_score_report={"merged_into": str(survivor), "score": round(plan.score, 4)},
+            )
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def merge_people(plans: list[MergePlan], session=None, merged_by=None) -> dict:
+    """
+    Applies merge plans one cluster per transaction, so a failing cluster does not undo the others.
+
+    :param plans: The plans to apply.
+    :type plans: list[MergePlan]
+    :param session: The session to use. Defaults to ``db.session``.
+    :param merged_by: The user recorded in ``deleted_by`` of the merged rows.
+    :return: A summary with the number of clusters merged, people removed and clusters that failed.
+    :rtype: dict
+    """
+    summary = {"clusters": 0, "merged": 0, "failed": 0}
+    for plan in plans:
+        try:
+            apply_merge_plan(plan, session=session, merged_by=merged_by)
+        except Exception:
+            current_app.logger.exception("Failed to merge people into %s", plan.survivor_id)
+            summary["failed"] += 1
+            continue
+        summary["clusters"] += 1
+        summary["merged"] += len(plan.duplicate_ids)
+    return summary
@@ -0,0 +1,267 @@
+import json
+import os
+import tempfile
+import uuid
+import zipfile
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Callable, Iterable, Iterator, Optional
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context
+
+from ..extensions import db
+from ..models.library import Library, Collection, WatchHistory, Portfolio, Wallet
+from ..models.scrolls import Scroll, ScrollEntry
+from ..models.commerce import Fund
+from ..models.jobs import Job
+from .jobs import JobContext, enqueue, job_handler
+
+
+JSONL = "jsonl"
+PARQUET = "parquet"
+FORMATS = (JSONL, PARQUET)
+EXPORT_JOB = "library_export"
+
+
+def _live(table: sa.Table, statement: sa.Select) -> sa.Select:
+    return statement.where(table.c.deleted_at.is_(None)) if "deleted_at" in table.c else statement
+
+
+def _owned(model, column_name: str) -> Callable[[uuid.UUID], sa.Select]:
+    table = model.__table__
+    return lambda library_id: _live(table, sa.select(*table.c).where(table.c[column_name] == library_id))
+
+
+def _through(model, parent, link: str, parent_column: str) -> Callable[[uuid.UUID], sa.Select]:
+    table, parent_table = model.__table__, parent.__table__
+    return lambda library_id: _live(table, _live(parent_table, (
+        sa.select(*table.c)
+        .join(parent_table, table.c[link] == parent_table.c.id)
+        .where(parent_table.c[parent_column] == library_id)
+    )))
+
+
+#: Export sections in output order: name, the table whose columns the rows carry, and the statement selecting a
+#: library's rows.
+EXPORT_SECTIONS = (
+    ("library", Library.__table__, _owned(Library, "id")),
+    ("collections", Collection.__table__, _owned(Collection, "library_id")),
+    ("watch_history", WatchHistory.__table__, _owned(WatchHistory, "library_id")),
+    ("scrolls", Scroll.__table__, _owned(Scroll, "reviewer_id")),
+    ("scroll_entries", ScrollEntry.__table__, _through(ScrollEntry, Scroll, "scroll_id", "reviewer_id")),
+    ("portfolio", Portfolio.__table__, _owned(Portfolio, "library_id")),
+    ("wallet", Wallet.__table__, _owned(Wallet, "library_id")),
+    ("funds", Fund.__table__, _through(Fund, Wallet, "wallet_id", "library_id")),
+)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Cannot export value of type {type(value).__name__}")
+
+
+def iter_sections(
+    library_id, session=None, batch_size: Optional[int] = None, sections=EXPORT_SECTIONS
+) -> Iterator[tuple]:
+    """
+    Streams the rows of every export section of a library.
+
+    Rows are read through server-side cursors in batches of ``batch_size`` (``yield_per``), so only one batch is
+    held in memory at a time regardless of the library's size.
+
+    :param library_id: The library to export.
+    :param session: The session to read with. Defaults to ``db.session``.
+    :param batch_size: Rows fetched per round trip. Defaults to ``EXPORT_BATCH_SIZE``.
+    :type batch_size: Optional[int]
+    :param sections: The sections to export.
+    :return: ``(section, table, rows)`` triples, where ``rows`` is an iterator of row mappings.
+    :rtype: Iterator[tuple]
+    """
+    session = session or db.session
+    batch_size = batch_size or (current_app.config.get("EXPORT_BATCH_SIZE", 1000) if has_app_context() else 1000)
+    for name, table, build in sections:
+        result = session.execute(build(library_id), execution_options={"yield_per": batch_size})
+        yield name, table, (row._mapping for row in result)
+
+
+def iter_jsonl_gzip(sections: Iterable[tuple], chunk_size: int = 64 * 1024, level: int = 6) -> Iterator[bytes]:
+    """
+    Serializes export sections to gzip compressed JSON Lines, one ``{"section": ..., "data": ...}`` object per
+    row, yielding compressed chunks of roughly ``chunk_size`` bytes as soon as they are ready.
+
+    :param sections: Sections as produced by :func:`iter_sections`.
+    :param chunk_size: Uncompressed bytes buffered before compressing.
+    :type chunk_size: int
+    :param level: The gzip compression level.
+    :type level: int
+    :return: The gzip stream in chunks.
+    :rtype: Iterator[bytes]
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    buffer, buffered = [], 0
+    encode = json.JSONEncoder(default=_json_default, separators=(",", ":"), ensure_ascii=False).encode
+    for name, _, rows in sections:
+        for row in rows:
+            line = (encode({"section": name, "data": dict(row)}) + "\n").encode()
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= chunk_size:
+                chunk = compressor.compress(b"".join(buffer))
+                buffer, buffered = [], 0
+                if chunk:
+                    yield chunk
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
+
+
+def _arrow_type(column: sa.Column):
+    import pyarrow as pa
+
+    column_type = column.type
+    if isinstance(column_type, sa.Boolean):
+        return pa.bool_()
+    if isinstance(column_type, sa.Integer):
+        return pa.int64()
+    if isinstance(column_type, sa.Float):
+        return pa.float64()
+    if isinstance(column_type, sa.Numeric):
+        return pa.decimal128(column_type.precision or 38, column_type.scale or 0)
+    if isinstance(column_type, sa.DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, sa.Date):
+        return pa.date32()
+    return pa.string()
+
+
+def _arrow_value(value, arrow_type):
+    import pyarrow as pa
+
+    if value is None or not pa.types.is_string(arrow_type) or isinstance(value, str):
+        return value
+    if isinstance(value, Enum):
+        return str(value.value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    return str(value)
+
+
+def write_parquet_archive(sections: Iterable[tuple], path: str, batch_size: int = 10000) -> None:
+    """
+    Writes export sections to a zip archive holding one Parquet file per section. Each section is written in
+    row groups of ``batch_size`` rows with a schema derived from its table, so memory use is bounded by one
+    row group.
+
+    :param sections: Sections as produced by :func:`iter_sections`.
+    :param path: The archive path.
+    :type path: str
+    :param batch_size: Rows per Parquet row group.
+    :type batch_size: int
+    :raises RuntimeError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow") from error
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, table, rows in sections:
+            schema = pa.schema([pa.field(column.name, _arrow_type(column)) for column in table.c])
+            with tempfile.NamedTemporaryFile(suffix=".parquet") as part:
+                with pq.ParquetWriter(part.name, schema, compression="zstd") as writer:
+                    batch = []
+                    for row in rows:
+                        batch.append(row)
+                        if len(batch) >= batch_size:
+                            writer.write_batch(_record_batch(batch, schema))
+                            batch = []
+                    if batch:
+                        writer.write_batch(_record_batch(batch, schema))
+                archive.write(part.name, f"{name}.parquet")
+
+
+def _record_batch(rows: list, schema):
+    import pyarrow as pa
+
+    return pa.record_batch(
+        [pa.array([_arrow_value(row[f.name], f.type) for row in rows], type=f.type) for f in schema],
+        schema=schema,
+    )
+
+
+def export_library(library_id, path: str, fmt: str = JSONL, session=None) -> str:
+    """
+    Exports a library to a file.
+
+    :param library_id: The library to export.
+    :param path: The output path.
+    :type path: str
+    :param fmt: ``"jsonl"`` for gzip JSON Lines or ``"parquet"`` for a zip of Parquet files.
+    :type fmt: str
+    :param session: The session to read with. Defaults to ``db.session``.
+    :return: The output path.
+    :rtype: str
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    sections = iter_sections(library_id, session)
+    if fmt == PARQUET:
+        write_parquet_archive(sections, path)
+    else:
+        with open(path, "wb") as output:
+            for chunk in iter_jsonl_gzip(sections):
+                output.write(chunk)
+    return path
+
+
+@job_handler(EXPORT_JOB, concurrency=2)
+def run_export_job(context: JobContext, library_id: str, format: str, path: str) -> dict:
+    """
+    Job handler writing a library export to ``path``. Partial output of a failed attempt is removed.
+
+    :return: The export's path.
+    :rtype: dict
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    context.report(0, len(EXPORT_SECTIONS), force=True)
+    try:
+        export_library(uuid.UUID(library_id), path, format)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    context.report(len(EXPORT_SECTIONS), force=True)
+    return {"path": path}
+
+
+def start_export_job(library_id, fmt: str = JSONL) -> Job:
+    """
+    Queues an export of a library to a file in ``EXPORT_DIRECTORY``. An export of the same library in the same
+    format that is still queued or running is reused. The job becomes visible to workers when the session
+    commits; its result holds the path of the export, which :meth:`~app.models.jobs.Job.to_dict` keeps from
+    clients.
+
+    :param library_id: The library to export.
+    :param fmt: The export format.
+    :type fmt: str
+    :return: The job.
+    :rtype: Job
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    directory = current_app.config.get("EXPORT_DIRECTORY") or tempfile.gettempdir()
+    extension = "jsonl.gz" if fmt == JSONL else "parquet.zip"
+    path = os.path.join(directory, f"library-{library_id}-{uuid.uuid4().hex}.{extension}")
+    return enqueue(
+        EXPORT_JOB, {"library_id": str(library_id), "format": fmt, "path": path},
+        dedupe_key=f"{EXPORT_JOB}:{library_id}:{fmt}",
+    )
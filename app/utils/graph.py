@@ -0,0 +1,568 @@
+import os
+import threading
+import uuid
+from typing import Iterable, Optional
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, inspect, select, literal
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models.library import Career, Gig, Character, Relationship
+from ..models.utils.config import RelationshipTypeEnum
+
+
+CAST_ROLE = "Cast"
+RELATIONSHIP_TYPES = list(RelationshipTypeEnum)
+
+
+def _build_csr(sources: np.ndarray, targets: np.ndarray, labels: np.ndarray, size: int) -> tuple:
+    """
+    Builds CSR adjacency arrays from an edge list.
+
+    :param sources: Source node index per edge.
+    :param targets: Target node index per edge.
+    :param labels: Edge label per edge.
+    :param size: Number of source nodes.
+    :return: ``(indptr, indices, labels)`` with neighbours sorted by target within each row.
+    :rtype: tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+    """
+    order = np.lexsort((targets, sources))
+    counts = np.bincount(sources, minlength=size) if len(sources) else np.zeros(size, dtype=np.int64)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, targets[order].astype(np.int32), labels[order].astype(np.int16)
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray) -> tuple:
+    """
+    Gathers the neighbours of many nodes from CSR arrays in one vectorized pass.
+
+    Nodes created after the CSR arrays were built simply have no base neighbours.
+
+    :param indptr: CSR row pointers.
+    :param indices: CSR column indices.
+    :param nodes: The node indices to expand.
+    :return: Aligned ``(sources, targets)`` arrays, one entry per edge.
+    :rtype: tuple[numpy.ndarray, numpy.ndarray]
+    """
+    nodes = nodes[nodes < len(indptr) - 1]
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.repeat(nodes, lengths), indices[offsets].astype(np.int64)
+
+
+class CollaborationGraph:
+    """
+    In-memory collaboration graph over people and films.
+
+    People and films are nodes; every `Gig` and `Character` credit is an edge between a person and a film,
+    labelled with its crew type, and every `Relationship` is a typed person-to-person edge. A person credited
+    on a film more than once, e.g. as director and as a character, has one edge counting its credits, which
+    stays until the last of them is removed. Edges are held in
+    compressed sparse row (CSR) arrays in both directions, so expanding thousands of nodes is a handful of
+    numpy operations. Credit changes are applied to a small overlay of added and removed edges which is folded
+    back into the CSR arrays by :meth:`compact`.
+
+    :ivar person_ids: Person identifiers by node index.
+    :type person_ids: list
+    :ivar film_ids: Film identifiers by node index.
+    :type film_ids: list
+    :ivar roles: Credit role labels by role code.
+    :type roles: list[str]
+    :ivar compact_threshold: Overlay size at which patches trigger a compaction.
+    :type compact_threshold: int
+    """
+
+    def __init__(self, compact_threshold: int = 10000):
+        self.person_ids: list = []
+        self.film_ids: list = []
+        self.roles: list = [CAST_ROLE]
+        self.compact_threshold = compact_threshold
+        self._person_index: dict = {}
+        self._film_index: dict = {}
+        self._role_index: dict = {CAST_ROLE: 0}
+        self._lock = threading.RLock()
+        self._credits: dict = {}
+        self._credit_counts: dict = {}
+        self._relationships: dict = {}
+        self._added: set = set()
+        self._removed: set = set()
+        self._set_arrays(*(np.zeros(0, dtype=np.int64),) * 3, *(np.zeros(0, dtype=np.int64),) * 3)
+
+    # Construction -------------------------------------------------------------------------------------------
+
+    def _person(self, person_id) -> int:
+        index = self._person_index.get(person_id)
+        if index is None:
+            index = self._person_index[person_id] = len(self.person_ids)
+            self.person_ids.append(person_id)
+        return index
+
+    def _film(self, film_id) -> int:
+        index = self._film_index.get(film_id)
+        if index is None:
+            index = self._film_index[film_id] = len(self.film_ids)
+            self.film_ids.append(film_id)
+        return index
+
+    def _role(self, role) -> int:
+        role = getattr(role, "value", role) or CAST_ROLE
+        index = self._role_index.get(role)
+        if index is None:
+            index = self._role_index[role] = len(self.roles)
+            self.roles.append(role)
+        return index
+
+    def _set_arrays(self, credit_people, credit_films, credit_roles, rel_people, rel_related, rel_types) -> None:
+        """
+        Rebuilds every CSR structure from edge arrays.
+        """
+        people, films = len(self.person_ids), len(self.film_ids)
+        self._pf = _build_csr(credit_people, credit_films, credit_roles, people)
+        self._fp = _build_csr(credit_films, credit_people, credit_roles, films)
+        self._pp = _build_csr(rel_people, rel_related, rel_types, people)
+
+    @classmethod
+    def from_edges(cls, credits: Iterable[tuple], relationships: Iterable[tuple] = (), **kwargs) -> "CollaborationGraph":
+        """
+        Builds a graph from raw edges.
+
+        :param credits: Tuples of ``(person_id, film_id, role)``.
+        :type credits: Iterable[tuple]
+        :param relationships: Tuples of ``(person_id, related_person_id, relationship_type)``.
+        :type relationships: Iterable[tuple]
+        :return: The graph.
+        :rtype: CollaborationGraph
+        """
+        graph = cls(**kwargs)
+        credit_edges, credit_counts = {}, {}
+        for person_id, film_id, role in credits:
+            if person_id is None or film_id is None:
+                continue
+            key = (graph._person(person_id), graph._film(film_id))
+            credit_edges.setdefault(key, graph._role(role))
+            credit_counts[key] = credit_counts.get(key, 0) + 1
+        relationship_edges = {}
+        for person_id, related_id, relationship_type in relationships:
+            key = (graph._person(person_id), graph._person(related_id))
+            relationship_edges[key] = RELATIONSHIP_TYPES.index(RelationshipTypeEnum(relationship_type))
+        graph._load(credit_edges, relationship_edges, credit_counts)
+        return graph
+
+    def _load(self, credit_edges: dict, relationship_edges: dict, credit_counts: Optional[dict] = None) -> None:
+        credit_keys = np.asarray(list(credit_edges) or np.zeros((0, 2)), dtype=np.int64).reshape(-1, 2)
+        rel_keys = np.asarray(list(relationship_edges) or np.zeros((0, 2)), dtype=np.int64).reshape(-1, 2)
+        with self._lock:
+            self._credits = credit_edges
+            self._credit_counts = credit_counts if credit_counts is not None else dict.fromkeys(credit_edges, 1)
+            self._relationships = relationship_edges
+            self._added, self._removed = set(), set()
+            self._set_arrays(
+                credit_keys[:, 0], credit_keys[:, 1], np.asarray(list(credit_edges.values()), dtype=np.int64),
+                rel_keys[:, 0], rel_keys[:, 1], np.asarray(list(relationship_edges.values()), dtype=np.int64),
+            )
+
+    @classmethod
+    def from_database(cls, session=None, **kwargs) -> "CollaborationGraph":
+        """
+        Loads the graph with three column-only queries over gigs, characters and relationships.
+
+        :param session: The session to use. Defaults to ``db.session``.
+        :return: The graph.
+        :rtype: CollaborationGraph
+        """
+        session = session or db.session
+        gigs = select(Career.person_id, Gig.film_id, Gig.crew_type).join(Career, Gig.career_id == Career.id).where(
+            Gig.deleted_at.is_(None), Career.deleted_at.is_(None)
+        )
+        characters = select(Career.person_id, Character.film_id, literal(CAST_ROLE)).join(
+            Career, Character.career_id == Career.id
+        ).where(Character.deleted_at.is_(None), Career.deleted_at.is_(None))
+        relationships = select(
+            Relationship.person_id, Relationship.related_person_id, Relationship.relationship_type
+        ).where(Relationship.deleted_at.is_(None))
+        credits = [*session.execute(gigs), *session.execute(characters)]
+        return cls.from_edges(credits, session.execute(relationships), **kwargs)
+
+    def save(self, path: str) -> None:
+        """
+        Writes a compressed snapshot of the graph, overlay included, to ``path``.
+
+        :param path: The snapshot file path (``.npz``).
+        :type path: str
+        """
+        with self._lock:
+            credits = np.asarray(
+                [(*key, role, self._credit_counts[key]) for key, role in self._credits.items()] or np.zeros((0, 4)),
+                dtype=np.int64,
+            )
+            relationships = np.asarray(
+                [(*key, kind) for key, kind in self._relationships.items()] or np.zeros((0, 3)), dtype=np.int64
+            )
+            np.savez_compressed(
+                path,
+                person_ids=np.asarray([str(i) for i in self.person_ids]),
+                film_ids=np.asarray([str(i) for i in self.film_ids]),
+                roles=np.asarray(self.roles),
+                credits=credits.reshape(-1, 4),
+                relationships=relationships.reshape(-1, 3),
+            )
+
+    @classmethod
+    def load(cls, path: str, id_type=str, **kwargs) -> "CollaborationGraph":
+        """
+        Loads a graph from a snapshot written by :meth:`save`.
+
+        :param path: The snapshot file path.
+        :type path: str
+        :param id_type: Callable converting stored identifiers back, e.g. ``uuid.UUID``.
+        :return: The graph.
+        :rtype: CollaborationGraph
+        """
+        graph = cls(**kwargs)
+        with np.load(path) as snapshot:
+            graph.person_ids = [id_type(i) for i in snapshot["person_ids"].tolist()]
+            graph.film_ids = [id_type(i) for i in snapshot["film_ids"].tolist()]
+            graph.roles = snapshot["roles"].tolist()
+            credits, relationships = snapshot["credits"], snapshot["relationships"]
+        graph._person_index = {person_id: i for i, person_id in enumerate(graph.person_ids)}
+        graph._film_index = {film_id: i for i, film_id in enumerate(graph.film_ids)}
+        graph._role_index = {role: i for i, role in enumerate(graph.roles)}
+        # Snapshots written before credits were counted hold one credit per edge.
+        counts = credits[:, 3] if credits.shape[1] > 3 else np.ones(len(credits), dtype=np.int64)
+        graph._load(
+            {(int(p), int(f)): int(r) for p, f, r in credits[:, :3]},
+            {(int(p), int(q)): int(t) for p, q, t in relationships},
+            {(int(p), int(f)): int(c) for (p, f), c in zip(credits[:, :2], counts)},
+        )
+        return graph
+
+    # Incremental patches ------------------------------------------------------------------------------------
+
+    def add_credit(self, person_id, film_id, role=None) -> None:
+        """
+        Adds a person-film credit to the overlay. A further credit of the person on the film only counts
+        towards the existing edge.
+
+        :param person_id: The credited person.
+        :param film_id: The film.
+        :param role: The crew type, or ``None`` for a cast credit.
+        """
+        with self._lock:
+            key = (self._person(person_id), self._film(film_id))
+            self._credit_counts[key] = self._credit_counts.get(key, 0) + 1
+            if key in self._credits:
+                return
+            self._credits[key] = self._role(role)
+            if key in self._removed:
+                self._removed.discard(key)
+            else:
+                self._added.add(key)
+            self._maybe_compact()
+
+    def remove_credit(self, person_id, film_id) -> None:
+        """
+        Removes a person-film credit through the overlay. The edge goes with the person's last credit on the
+        film.
+
+        :param person_id: The credited person.
+        :param film_id: The film.
+        """
+        with self._lock:
+            key = (self._person_index.get(person_id), self._film_index.get(film_id))
+            if key not in self._credits:
+                return
+            self._credit_counts[key] -= 1
+            if self._credit_counts[key] > 0:
+                return
+            del self._credit_counts[key]
+            del self._credits[key]
+            if key in self._added:
+                self._added.discard(key)
+            else:
+                self._removed.add(key)
+            self._maybe_compact()
+
+    def set_relationship(self, person_id, related_person_id, relationship_type=None) -> None:
+        """
+        Adds, updates or (with ``relationship_type=None``) removes a typed relationship edge. Relationships are
+        rare enough that they are applied by rebuilding the person-to-person arrays directly.
+
+        :param person_id: The first person.
+        :param related_person_id: The related person.
+        :param relationship_type: The `RelationshipTypeEnum` value, or ``None`` to remove the edge.
+        """
+        with self._lock:
+            key = (self._person(person_id), self._person(related_person_id))
+            if relationship_type is None:
+                self._relationships.pop(key, None)
+            else:
+                self._relationships[key] = RELATIONSHIP_TYPES.index(RelationshipTypeEnum(relationship_type))
+            self.compact()
+
+    def _maybe_compact(self) -> None:
+        if len(self._added) + len(self._removed) >= self.compact_threshold:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Folds the overlay into freshly built CSR arrays.
+        """
+        with self._lock:
+            self._load(self._credits, self._relationships, self._credit_counts)
+
+    # Queries ------------------------------------------------------------------------------------------------
+
+    def _expand(self, csr: tuple, nodes: np.ndarray, people_to_films: bool) -> tuple:
+        """
+        Expands nodes into their credit neighbours, base arrays and overlay combined.
+        """
+        sources, targets = _gather(csr[0], csr[1], nodes)
+        if self._removed:
+            pairs = zip(sources.tolist(), targets.tolist())
+            keep = np.fromiter(
+                (((s, t) if people_to_films else (t, s)) not in self._removed for s, t in pairs),
+                dtype=bool, count=len(sources),
+            )
+            sources, targets = sources[keep], targets[keep]
+        if self._added:
+            wanted = set(nodes.tolist())
+            extra = [(p, f) if people_to_films else (f, p) for p, f in self._added if (p if people_to_films else f) in wanted]
+            if extra:
+                extra = np.asarray(extra, dtype=np.int64)
+                sources, targets = np.concatenate([sources, extra[:, 0]]), np.concatenate([targets, extra[:, 1]])
+        return sources, targets
+
+    def films_of(self, person_id) -> list:
+        """
+        :return: The identifiers of every film the person is credited on.
+        :rtype: list
+        """
+        index = self._person_index.get(person_id)
+        if index is None:
+            return []
+        with self._lock:
+            _, films = self._expand(self._pf, np.asarray([index]), True)
+        return [self.film_ids[f] for f in np.unique(films).tolist()]
+
+    def co_credit_count(self, person_id, other_person_id) -> int:
+        """
+        Counts the films both people are credited on.
+
+        :return: The number of shared films.
+        :rtype: int
+        """
+        left, right = self._person_index.get(person_id), self._person_index.get(other_person_id)
+        if left is None or right is None:
+            return 0
+        with self._lock:
+            _, left_films = self._expand(self._pf, np.asarray([left]), True)
+            _, right_films = self._expand(self._pf, np.asarray([right]), True)
+        return int(len(np.intersect1d(left_films, right_films)))
+
+    def top_collaborators(self, person_id, limit: int = 10) -> list[tuple]:
+        """
+        Ranks the people who share the most films with a person.
+
+        :param person_id: The person.
+        :param limit: Number of collaborators to return.
+        :type limit: int
+        :return: ``(person_id, shared_film_count)`` tuples, most frequent first.
+        :rtype: list[tuple]
+        """
+        index = self._person_index.get(person_id)
+        if index is None:
+            return []
+        with self._lock:
+            _, films = self._expand(self._pf, np.asarray([index]), True)
+            _, people = self._expand(self._fp, np.unique(films), False)
+        people = people[people != index]
+        if not len(people):
+            return []
+        counts = np.bincount(people)
+        candidates = np.flatnonzero(counts)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-counts[candidates], limit - 1)[:limit]]
+        ranked = sorted(candidates.tolist(), key=lambda p: (-counts[p], p))
+        return [(self.person_ids[p], int(counts[p])) for p in ranked]
+
+    def relationships_of(self, person_id, relationship_type=None) -> list[tuple]:
+        """
+        Lists the typed relationships recorded from a person to others.
+
+        :param person_id: The person.
+        :param relationship_type: Optional `RelationshipTypeEnum` to filter by.
+        :return: ``(related_person_id, RelationshipTypeEnum)`` tuples.
+        :rtype: list[tuple]
+        """
+        index = self._person_index.get(person_id)
+        if index is None:
+            return []
+        indptr, indices, labels = self._pp
+        if index >= len(indptr) - 1:
+            return []
+        start, end = indptr[index], indptr[index + 1]
+        related = [(self.person_ids[p], RELATIONSHIP_TYPES[t]) for p, t in zip(indices[start:end].tolist(), labels[start:end].tolist())]
+        if relationship_type is not None:
+            related = [pair for pair in related if pair[1] == RelationshipTypeEnum(relationship_type)]
+        return related
+
+    def collaboration_path(self, person_id, other_person_id, max_degrees: int = 6) -> Optional[list]:
+        """
+        Finds a shortest collaboration path between two people ("degrees of separation") with a bidirectional
+        breadth-first search that expands whole frontiers at once.
+
+        :param person_id: The starting person.
+        :param other_person_id: The target person.
+        :param max_degrees: Maximum number of shared-film hops to search.
+        :type max_degrees: int
+        :return: Alternating person and film identifiers from start to target, or ``None`` if the people are
+            not connected within ``max_degrees``.
+        :rtype: Optional[list]
+        """
+        start, goal = self._person_index.get(person_id), self._person_index.get(other_person_id)
+        if start is None or goal is None:
+            return None
+        if start == goal:
+            return [person_id]
+        with self._lock:
+            people, films = len(self.person_ids), len(self.film_ids)
+            # Per side: the film through which each person was reached, and the person through which each film was.
+            person_via = [np.full(people, -2, dtype=np.int64) for _ in range(2)]
+            film_via = [np.full(films, -2, dtype=np.int64) for _ in range(2)]
+            person_via[0][start], person_via[1][goal] = -1, -1
+            frontiers = [np.asarray([start]), np.asarray([goal])]
+            for _ in range(max_degrees):
+                side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+                sources, reached_films = self._expand(self._pf, frontiers[side], True)
+                fresh = film_via[side][reached_films] == -2
+                reached_films, first = np.unique(reached_films[fresh], return_index=True)
+                film_via[side][reached_films] = sources[fresh][first]
+                film_sources, reached_people = self._expand(self._fp, reached_films, False)
+                fresh = person_via[side][reached_people] == -2
+                reached_people, first = np.unique(reached_people[fresh], return_index=True)
+                person_via[side][reached_people] = film_sources[fresh][first]
+                meeting = reached_people[person_via[1 - side][reached_people] != -2]
+                if len(meeting):
+                    return self._path(int(meeting[0]), person_via, film_via)
+                if not len(reached_people):
+                    return None
+                frontiers[side] = reached_people
+        return None
+
+    def _path(self, meeting: int, person_via: list, film_via: list) -> list:
+        """
+        Reconstructs the path through the person where both searches met.
+        """
+        halves = []
+        for side in (0, 1):
+            half, person = [], meeting
+            while person_via[side][person] != -1:
+                film = int(person_via[side][person])
+                half.append(("film", film))
+                person = int(film_via[side][film])
+                half.append(("person", person))
+            halves.append(half)
+        ordered = list(reversed(halves[0])) + [("person", meeting)] + halves[1]
+        return [self.person_ids[i] if kind == "person" else self.film_ids[i] for kind, i in ordered]
+
+
+def _person_of_career(session, career_id):
+    return session.execute(select(Career.person_id).where(Career.id == career_id)).scalar()
+
+
+def _committed(instance, key):
+    # The value the database held before the flush; history is still available in after_flush.
+    history = inspect(instance).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(instance, key)
+
+
+def _credit_states(instance, created: bool, deleted: bool) -> tuple:
+    """
+    Returns a credit row's ``(career_id, film_id, role)`` before and after the flush, ``None`` where it was or
+    is not a live credit.
+    """
+    role_key = "crew_type" if isinstance(instance, Gig) else None
+    before = None
+    if not created and _committed(instance, "deleted_at") is None:
+        before = (_committed(instance, "career_id"), _committed(instance, "film_id"),
+                  _committed(instance, role_key) if role_key else None)
+    after = None
+    if not deleted and instance.deleted_at is None:
+        after = (instance.career_id, instance.film_id, getattr(instance, role_key) if role_key else None)
+    return before, after
+
+
+def install_graph_patching(graph: CollaborationGraph) -> None:
+    """
+    Keeps a graph in sync with credit changes by listening to session flushes and applying the collected
+    patches once the transaction commits. A credit moved to another film or person, or soft deleted, removes
+    its old edge. Rolled back changes are discarded.
+
+    :param graph: The graph to patch.
+    :type graph: CollaborationGraph
+    """
+
+    @event.listens_for(Session, "after_flush")
+    def collect_credit_changes(session, flush_context):
+        patches = session.info.setdefault("collaboration_graph_patches", [])
+        for instance in session.new | session.dirty | session.deleted:
+            if isinstance(instance, (Gig, Character)):
+                before, after = _credit_states(instance, instance in session.new, instance in session.deleted)
+                if before == after:
+                    continue
+                if before is not None:
+                    career_id, film_id, _ = before
+                    patches.append(("remove", _person_of_career(session, career_id), film_id, None))
+                if after is not None:
+                    career_id, film_id, role = after
+                    patches.append(("add", _person_of_career(session, career_id), film_id, role))
+            elif isinstance(instance, Relationship) and instance not in session.deleted:
+                kind = None if instance.deleted_at is not None else instance.relationship_type
+                patches.append(("relationship", instance.person_id, instance.related_person_id, kind))
+        for instance in session.deleted:
+            if isinstance(instance, Relationship):
+                patches.append(("relationship", instance.person_id, instance.related_person_id, None))
+
+    @event.listens_for(Session, "after_commit")
+    def apply_credit_changes(session):
+        for operation, left, right, extra in session.info.pop("collaboration_graph_patches", []):
+            if left is None or right is None:
+                continue
+            if operation == "add":
+                graph.add_credit(left, right, extra)
+            elif operation == "remove":
+                graph.remove_credit(left, right)
+            else:
+                graph.set_relationship(left, right, extra)
+
+    @event.listens_for(Session, "after_rollback")
+    def discard_credit_changes(session):
+        session.info.pop("collaboration_graph_patches", None)
+
+
+def get_collaboration_graph() -> CollaborationGraph:
+    """
+    Returns the application's collaboration graph, loading it on first use from the snapshot configured in
+    ``COLLABORATION_GRAPH_SNAPSHOT`` when present, otherwise from the database, and wiring up patching.
+
+    :return: The shared graph.
+    :rtype: CollaborationGraph
+    """
+    extensions = current_app.extensions
+    graph = extensions.get("collaboration_graph")
+    if graph is None:
+        snapshot = current_app.config.get("COLLABORATION_GRAPH_SNAPSHOT")
+        if snapshot:
+            graph = CollaborationGraph.load(snapshot, id_type=uuid.UUID) if os.path.exists(snapshot) else None
+        if graph is None:
+            graph = CollaborationGraph.from_database()
+        install_graph_patching(graph)
+        graph = extensions.setdefault("collaboration_graph", graph)
+    return graph
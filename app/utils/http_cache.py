@@ -0,0 +1,171 @@
+import hashlib
+from functools import wraps
+from typing import Callable, Iterable, Optional
+
+import sqlalchemy as sa
+from flask import Flask, Response, current_app, render_template, request
+from markupsafe import Markup
+
+from ..extensions import db
+from .cache import cache, cache_namespace
+
+
+#: Rendered fragments, keyed by template and entity versions so they never need invalidating.
+cache_namespace("fragment", ttl=86400.0, local_ttl=300.0, local_size=2000)
+
+
+def entity_version(model, entity_id):
+    """
+    Returns the ``updated_at`` of a row, reading only that column, or ``None`` when the row is missing or
+    deleted.
+
+    :param model: The model, which must have ``id`` and ``updated_at`` columns.
+    :param entity_id: Primary key of the row.
+    :return: The version.
+    """
+    return db.session.scalar(sa.select(model.updated_at).where(model.id == entity_id))
+
+
+def entity_versions(model, entity_id, relationships: Iterable[str] = ()) -> list:
+    """
+    Returns the versions of a row and of the rows rendered with it, read in one query: the row's ``updated_at``
+    and, per relationship path, the newest ``updated_at`` of the related rows and their number, which also
+    changes when rows are linked or unlinked without being updated.
+
+    :param model: The model, which must have ``id`` and ``updated_at`` columns.
+    :param entity_id: Primary key of the row.
+    :param relationships: Dotted relationship paths from the model, e.g. ``"gigs.career.person"``, such as the
+        ``load`` of the loading profile the view renders with.
+    :type relationships: Iterable[str]
+    :return: The row's version, ``None`` when the row is missing, and the versions of its related rows.
+    :rtype: list
+    """
+    columns = [sa.select(model.updated_at).where(model.id == entity_id).scalar_subquery()]
+    for path in relationships:
+        query, target = sa.select(model.id).where(model.id == entity_id), model
+        for name in path.split("."):
+            attribute = getattr(target, name)
+            query, target = query.join(attribute), attribute.property.mapper.class_
+        newest = sa.func.max(target.updated_at) if hasattr(target, "updated_at") else sa.null()
+        columns.append(query.with_only_columns(newest).scalar_subquery())
+        columns.append(query.with_only_columns(sa.func.count()).scalar_subquery())
+    version, *related = db.session.execute(sa.select(*columns)).one()
+    return [version, tuple(related)]
+
+
+def etag_for(versions: Iterable) -> str:
+    """
+    Hashes versions, together with ``HTTP_CACHE_ETAG_SALT`` so a deploy that changes templates changes every
+    ETag, into an opaque ETag value.
+
+    :param versions: Values identifying the state a response is rendered from.
+    :return: The ETag, without quotes.
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(current_app.config.get("HTTP_CACHE_ETAG_SALT", "")).encode())
+    for version in versions:
+        digest.update(b"\x1f" + repr(version).encode())
+    return digest.hexdigest()
+
+
+def _cache_headers(response: Response, private: bool, max_age: Optional[int], shared_max_age: Optional[int]) -> None:
+    config = current_app.config
+    max_age = config.get("HTTP_CACHE_MAX_AGE", 0) if max_age is None else max_age
+    shared_max_age = config.get("HTTP_CACHE_SHARED_MAX_AGE", 0) if shared_max_age is None else shared_max_age
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.s_maxage = shared_max_age
+    response.cache_control.max_age = max_age
+    response.vary.update(("Accept-Encoding", "Cookie") if private else ("Accept-Encoding",))
+
+
+def conditional_view(versions: Callable[..., Iterable], private: bool = False, max_age: Optional[int] = None,
+                     shared_max_age: Optional[int] = None):
+    """
+    Decorator answering ``GET`` and ``HEAD`` requests with ETags derived from the state a view renders rather
+    than from its body, so ``If-None-Match`` requests that match get a 304 without the view or its templates
+    running.
+
+    ``versions`` is called with the view's arguments and returns values, typically ``updated_at`` columns from
+    :func:`entity_version` or :func:`entity_versions`, that change whenever the response would. If any of them
+    is ``None`` the view runs as usual, e.g. to answer 404.
+
+    :param versions: Returns the versions of the entities a request renders.
+    :type versions: Callable[..., Iterable]
+    :param private: Whether responses differ per user; they then carry the user id in their ETag and are kept
+        out of shared caches.
+    :type private: bool
+    :param max_age: Seconds browsers may reuse a response without revalidating. Defaults to
+        ``HTTP_CACHE_MAX_AGE``.
+    :type max_age: Optional[int]
+    :param shared_max_age: Seconds shared caches such as a CDN may reuse a response. Defaults to
+        ``HTTP_CACHE_SHARED_MAX_AGE``.
+    :type shared_max_age: Optional[int]
+    :return: The decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            state = list(versions(*args, **kwargs))
+            if any(version is None for version in state):
+                return view(*args, **kwargs)
+            if private:
+                from flask_login import current_user
+                state.append(getattr(current_user, "id", None))
+            etag = etag_for([request.endpoint, *state])
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            _cache_headers(response, private, max_age, shared_max_age)
+            return response
+        return wrapped
+    return decorator
+
+
+def render_fragment(template: str, versions: Iterable, **context) -> Markup:
+    """
+    Renders a template, reusing the rendering of earlier requests for the same versions.
+
+    :param template: Name of the template.
+    :type template: str
+    :param versions: Values identifying the state the fragment shows, e.g. ``updated_at`` of its entities.
+    :param context: Template variables.
+    :return: The rendered fragment.
+    :rtype: Markup
+    """
+    key = f"{template}:{etag_for(versions)}"
+    return Markup(cache.get_or_load("fragment", key, lambda: render_template(template, **context)))
+
+
+def _add_body_etag(response: Response) -> Response:
+    if (request.method not in ("GET", "HEAD") or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or response.get_etag()[0] is not None
+            or request.blueprint not in current_app.config.get("HTTP_CACHE_BLUEPRINTS", ())):
+        return response
+    response.add_etag()
+    if not response.cache_control.values():
+        response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    return response.make_conditional(request)
+
+
+def init_http_cache(app: Flask) -> None:
+    """
+    Gives ``GET`` responses of the blueprints in ``HTTP_CACHE_BLUEPRINTS`` that did not set their own ETag one
+    hashed from their body, so revalidations that match are answered with a 304, and exposes
+    :func:`render_fragment` to templates.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.after_request(_add_body_etag)
+    app.jinja_env.globals["render_fragment"] = render_fragment
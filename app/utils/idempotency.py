@@ -0,0 +1,295 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.idempotency import IdempotencyKey
+from .cache import cache, cache_namespace
+from .jobs import JobContext, job_handler
+
+
+logger = logging.getLogger(__name__)
+idempotency_cli = AppGroup("idempotency", help="Manage stored idempotency keys.")
+
+IDEMPOTENCY_PURGE_JOB = "idempotency_purge"
+MAX_KEY_LENGTH = 64
+
+# Stored responses never change, so replays during a retry storm are served from memory and concurrent lookups
+# of one key share a single query.
+cache_namespace("idempotency", local_ttl=60.0, local_size=50000)
+
+
+class IdempotencyError(Exception):
+    """
+    Base class of the errors returned to a client instead of a response.
+
+    :cvar status: The HTTP status to answer with.
+    """
+    status = 409
+
+
+class InvalidIdempotencyKey(IdempotencyError):
+    """Raised for a missing or overlong key."""
+    status = 400
+
+
+class IdempotencyMismatch(IdempotencyError):
+    """Raised when a key is reused for a different request."""
+    status = 422
+
+
+class RequestInProgress(IdempotencyError):
+    """Raised when a request with the same key is still being processed."""
+    status = 409
+
+
+class RequestRejected(Exception):
+    """
+    Raised by an idempotent operation to refuse a request, e.g. for lack of stock. Its changes are rolled back
+    and the refusal is stored and replayed like any other response.
+
+    :param status: The HTTP status.
+    :type status: int
+    :param body: The response body.
+    :type body: dict
+    """
+
+    def __init__(self, status: int, body: dict):
+        super().__init__(status, body)
+        self.status = status
+        self.body = body
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """
+    The response of an idempotent request.
+
+    :ivar fingerprint: Digest of the request, see :func:`request_fingerprint`.
+    :type fingerprint: bytes
+    :ivar status: The HTTP status.
+    :type status: int
+    :ivar body: The response body.
+    :type body: dict
+    :ivar expires_at: When the key may be reused.
+    :type expires_at: datetime
+    :ivar replayed: Whether the response was stored by an earlier request with the same key.
+    :type replayed: bool
+    """
+    fingerprint: bytes
+    status: int
+    body: dict
+    expires_at: datetime
+    replayed: bool = False
+
+
+class _Unknown(Exception):
+    # Raised by the cache loader so that missing keys are not cached.
+    pass
+
+
+def request_fingerprint(payload: dict) -> bytes:
+    """
+    Digests a request independently of the order of its fields.
+
+    :param payload: The JSON serializable request.
+    :type payload: dict
+    :return: A 16 byte digest.
+    :rtype: bytes
+    """
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+def _load_response(scope: str, key: str, session) -> StoredResponse:
+    row = session.execute(
+        sa.select(IdempotencyKey.fingerprint, IdempotencyKey.status, IdempotencyKey.response, IdempotencyKey.expires_at)
+        .where(
+            IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.status.is_not(None),
+            IdempotencyKey.expires_at > datetime.now(),
+        )
+    ).first()
+    if row is None:
+        raise _Unknown()
+    return StoredResponse(bytes(row.fingerprint), row.status, row.response, row.expires_at)
+
+
+def stored_response(scope: str, key: str, session=None) -> Optional[StoredResponse]:
+    """
+    Looks up the stored response of a key.
+
+    :param scope: The scope of the key.
+    :type scope: str
+    :param key: The key.
+    :type key: str
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The response, or ``None`` if the key is unknown, expired or its request still in progress.
+    :rtype: Optional[StoredResponse]
+    """
+    session = session or db.session
+    try:
+        stored = cache.get_or_load("idempotency", f"{scope}:{key}", lambda: _load_response(scope, key, session))
+    except _Unknown:
+        return None
+    return stored if stored.expires_at > datetime.now() else None
+
+
+def _replay(stored: StoredResponse, fingerprint: bytes) -> StoredResponse:
+    if stored.fingerprint != fingerprint:
+        raise IdempotencyMismatch("The idempotency key was already used for a different request")
+    return replace(stored, replayed=True)
+
+
+def _claim(scope: str, key: str, values: dict, session) -> bool:
+    try:
+        with session.begin_nested():
+            session.execute(sa.insert(IdempotencyKey).values(scope=scope, key=key, **values))
+    except IntegrityError:
+        # Take the key over if it expired, or if its request ran out of time without responding.
+        now = datetime.now()
+        taken = session.execute(
+            sa.update(IdempotencyKey).where(
+                IdempotencyKey.scope == scope, IdempotencyKey.key == key,
+                sa.or_(
+                    IdempotencyKey.expires_at <= now,
+                    sa.and_(IdempotencyKey.status.is_(None), IdempotencyKey.locked_until <= now),
+                ),
+            ).values(**values)
+        ).rowcount
+        if not taken:
+            session.rollback()
+            return False
+    session.commit()
+    return True
+
+
+def run_idempotent(scope: str, key: str, payload: dict, operation: Callable[[], tuple[int, dict]], session=None,
+                   ttl: Optional[float] = None, lease: Optional[float] = None) -> StoredResponse:
+    """
+    Runs an operation at most once per key and returns its stored response to every request with that key.
+
+    A new key is claimed in a short transaction of its own, so that concurrent retries find it taken and are
+    answered with :class:`RequestInProgress` at once instead of waiting on a lock. The operation then runs in a
+    savepoint and its changes are committed together with its response. If it raises, the key is released and
+    the client's next retry runs the operation again; a :class:`RequestRejected` is stored as the response
+    instead. Replays of a stored response never run the operation, and are answered from the cache.
+
+    :param scope: Namespace of the key, e.g. the operation and the client.
+    :type scope: str
+    :param key: The key the client sent.
+    :type key: str
+    :param payload: The request, compared with later requests using the same key.
+    :type payload: dict
+    :param operation: Performs the request in the session and returns the status and body of the response.
+    :type operation: Callable[[], tuple[int, dict]]
+    :param session: The session to use. Defaults to ``db.session``.
+    :param ttl: Seconds a key is kept. Defaults to ``IDEMPOTENCY_TTL_SECONDS``.
+    :type ttl: Optional[float]
+    :param lease: Seconds a request may hold a key without responding before a retry takes over. Defaults to
+        ``IDEMPOTENCY_LEASE_SECONDS``; it must exceed the operation's longest run.
+    :type lease: Optional[float]
+    :return: The response.
+    :rtype: StoredResponse
+    :raises IdempotencyError: If the key is invalid, was used for a different request or is in use.
+    """
+    session = session or db.session
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise InvalidIdempotencyKey(f"An idempotency key of 1 to {MAX_KEY_LENGTH} characters is required")
+    if ttl is None:
+        ttl = current_app.config.get("IDEMPOTENCY_TTL_SECONDS", 86400.0)
+    if lease is None:
+        lease = current_app.config.get("IDEMPOTENCY_LEASE_SECONDS", 30.0)
+    fingerprint = request_fingerprint(payload)
+    if (stored := stored_response(scope, key, session)) is not None:
+        return _replay(stored, fingerprint)
+
+    now = datetime.now()
+    values = {
+        "fingerprint": fingerprint, "status": None, "response": None,
+        "locked_until": now + timedelta(seconds=lease), "expires_at": now + timedelta(seconds=ttl),
+    }
+    if not _claim(scope, key, values, session):
+        if (stored := stored_response(scope, key, session)) is not None:
+            return _replay(stored, fingerprint)
+        raise RequestInProgress("A request with this idempotency key is in progress")
+    held = sa.and_(
+        IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.status.is_(None),
+        IdempotencyKey.locked_until == values["locked_until"],
+    )
+
+    try:
+        with session.begin_nested():
+            status, body = operation()
+    except RequestRejected as exc:
+        status, body = exc.status, exc.body
+    except BaseException:
+        session.rollback()
+        session.execute(sa.delete(IdempotencyKey).where(held))
+        session.commit()
+        raise
+    if not session.execute(sa.update(IdempotencyKey).where(held).values(status=status, response=body)).rowcount:
+        # The lease ran out and a retry took the key over; its outcome stands instead of this one.
+        session.rollback()
+        raise RequestInProgress("A request with this idempotency key is in progress")
+    session.commit()
+    return StoredResponse(fingerprint, status, body, values["expires_at"])
+
+
+def purge_expired_keys(session=None, batch_size: int = 10000) -> int:
+    """
+    Deletes expired keys in batches, committing after each.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param batch_size: Keys deleted per statement.
+    :type batch_size: int
+    :return: The number of keys deleted.
+    :rtype: int
+    """
+    session = session or db.session
+    purged = 0
+    while True:
+        expired = sa.select(IdempotencyKey.scope, IdempotencyKey.key) \
+            .where(IdempotencyKey.expires_at <= datetime.now()).limit(batch_size)
+        deleted = session.execute(
+            sa.delete(IdempotencyKey).where(sa.tuple_(IdempotencyKey.scope, IdempotencyKey.key).in_(expired))
+        ).rowcount
+        session.commit()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+@job_handler(IDEMPOTENCY_PURGE_JOB, concurrency=1)
+def run_purge_job(context: JobContext) -> dict:
+    """
+    Job handler deleting expired idempotency keys.
+
+    :return: The number of keys deleted.
+    :rtype: dict
+    """
+    return {"purged": purge_expired_keys()}
+
+
+@idempotency_cli.command("purge")
+def purge_command() -> None:
+    """Delete expired idempotency keys."""
+    click.echo(f"Purged {purge_expired_keys()} idempotency keys")
+
+
+def init_idempotency(app: Flask) -> None:
+    """
+    Registers the ``flask idempotency`` commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.cli.add_command(idempotency_cli)
@@ -0,0 +1,431 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ..extensions import db
+from ..models.library import Film, WatchHistory
+from ..models.scrolls import Scroll, ScrollEntry
+from ..models.utils.ids import new_uuid
+from ..models.jobs import Job
+from .jobs import JobContext, enqueue, job_handler
+from .matching import FilmMatcher
+
+
+IMPORT_JOB = "library_import"
+
+#: Header spellings used by the CSV exports of common tracking services, mapped to the fields they hold.
+#: Headers are compared lower cased with underscores read as spaces.
+FIELD_ALIASES = {
+    "title": ("title", "name", "film", "movie", "movie title"),
+    "year": ("year", "release year", "movie year"),
+    "imdb_id": ("imdb id", "imdb", "const", "imdb const"),
+    "tmdb_id": ("tmdb id", "tmdb"),
+    "rating": ("rating", "your rating", "my rating", "rating10", "score"),
+    "watched_at": ("watched at", "watched date", "date watched", "last watched", "watched", "date rated", "date"),
+}
+
+
+@dataclass(frozen=True)
+class ImportRow:
+    """
+    One watch log or rating entry parsed from an external export.
+
+    :ivar title: The film title as written by the source service.
+    :type title: Optional[str]
+    :ivar year: The release year, if given.
+    :type year: Optional[int]
+    :ivar imdb_id: The IMDb identifier, e.g. ``"tt0133093"``.
+    :type imdb_id: Optional[str]
+    :ivar tmdb_id: The TMDB identifier.
+    :type tmdb_id: Optional[int]
+    :ivar rating: The rating on the source service's own scale.
+    :type rating: Optional[float]
+    :ivar watched_at: When the film was watched or rated.
+    :type watched_at: Optional[datetime]
+    """
+    title: Optional[str] = None
+    year: Optional[int] = None
+    imdb_id: Optional[str] = None
+    tmdb_id: Optional[int] = None
+    rating: Optional[float] = None
+    watched_at: Optional[datetime] = None
+
+
+def _header_map(headers: Iterable[str]) -> dict[str, str]:
+    fields = {}
+    normalized = {header: " ".join(header.strip().lower().replace("_", " ").split()) for header in headers}
+    for name, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            header = next((header for header, key in normalized.items() if key == alias), None)
+            if header is not None:
+                fields[name] = header
+                break
+    return fields
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(value)) if value and value.strip() else None
+    except ValueError:
+        return None
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value and value.strip() else None
+    except ValueError:
+        return None
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value or not value.strip():
+        return None
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for pattern in ("%m/%d/%Y", "%d %b %Y", "%b %d, %Y"):
+        try:
+            return datetime.strptime(value, pattern)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_csv(stream: io.TextIOBase) -> Iterator[ImportRow]:
+    """
+    Parses an external CSV export row by row. Columns are recognized through :data:`FIELD_ALIASES`; unknown
+    columns are ignored and unparseable values read as missing.
+
+    :param stream: The CSV text stream, opened with ``newline=""``.
+    :return: The parsed rows, lazily.
+    :rtype: Iterator[ImportRow]
+    :raises ValueError: If the file has neither a title nor an IMDb or TMDB id column.
+    """
+    reader = csv.reader(stream)
+    headers = next(reader, None) or []
+    fields = _header_map(headers)
+    if not {"title", "imdb_id", "tmdb_id"} & set(fields):
+        raise ValueError("The file needs a title, IMDb id or TMDB id column")
+    position = {name: headers.index(header) for name, header in fields.items()}
+
+    def cell(row: list, name: str) -> Optional[str]:
+        index = position.get(name)
+        return row[index] if index is not None and index < len(row) else None
+
+    for row in reader:
+        if not any(row):
+            continue
+        imdb_id = (cell(row, "imdb_id") or "").strip()
+        yield ImportRow(
+            title=(cell(row, "title") or "").strip() or None,
+            year=_int(cell(row, "year")),
+            imdb_id=imdb_id if imdb_id.startswith("tt") else None,
+            tmdb_id=_int(cell(row, "tmdb_id")),
+            rating=_float(cell(row, "rating")),
+            watched_at=_datetime(cell(row, "watched_at")),
+        )
+
+
+class FilmResolver:
+    """
+    Resolves imported rows to films: by IMDb or TMDB id where the row has one, otherwise by title and year
+    through the :class:`~app.utils.matching.FilmMatcher`. Lookups are made per batch of rows and remembered,
+    so a title repeated across a watch log is resolved once.
+
+    :ivar matcher: The title matcher. Its film index is built on the first title lookup.
+    :type matcher: FilmMatcher
+    """
+
+    def __init__(self, session, matcher: Optional[FilmMatcher] = None):
+        self.session = session
+        self.matcher = matcher or FilmMatcher.from_config()
+        self._indexed = False
+        self._imdb: dict = {}
+        self._tmdb: dict = {}
+        self._titles: dict = {}
+
+    def _load_ids(self, column, cache: dict, values: set, chunk_size: int = 5000) -> None:
+        values = sorted(value for value in values if value not in cache)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            cache.update(dict.fromkeys(chunk))
+            cache.update(self.session.execute(
+                sa.select(column, Film.id).where(column.in_(chunk), Film.deleted_at.is_(None))
+            ).tuples().all())
+
+    def _match_titles(self, keys: set) -> None:
+        keys = [key for key in keys if key not in self._titles]
+        if not keys:
+            return
+        if not self._indexed:
+            release_year = sa.func.coalesce(Film.release_year, sa.func.extract("year", Film.release_date))
+            self.matcher.index_films(self.session.execute(
+                sa.select(Film.id, Film.title, Film.original_title, release_year, Film.runtime)
+                .where(Film.deleted_at.is_(None))
+            ))
+            self._indexed = True
+        self._titles.update(dict.fromkeys(keys))
+        matches = self.matcher.match((index, title, year, None) for index, (title, year) in enumerate(keys))
+        self._titles.update((keys[match.file_id], match.film_id) for match in matches if match.linked)
+
+    def resolve(self, rows: list[ImportRow]) -> list[tuple[Optional[uuid.UUID], str]]:
+        """
+        Resolves a batch of rows.
+
+        :param rows: The rows.
+        :type rows: list[ImportRow]
+        :return: For each row, the film id (or ``None``) and how it was found: ``"id"``, ``"title"`` or
+            ``"unmatched"``.
+        :rtype: list[tuple[Optional[uuid.UUID], str]]
+        """
+        self._load_ids(Film.imdb_id, self._imdb, {row.imdb_id for row in rows if row.imdb_id})
+        self._load_ids(Film.tmdb_id, self._tmdb, {row.tmdb_id for row in rows if row.tmdb_id})
+        unresolved = {
+            (row.title, row.year) for row in rows
+            if row.title and not self._imdb.get(row.imdb_id) and not self._tmdb.get(row.tmdb_id)
+        }
+        self._match_titles(unresolved)
+        resolved = []
+        for row in rows:
+            film_id = self._imdb.get(row.imdb_id) or self._tmdb.get(row.tmdb_id)
+            if film_id is not None:
+                resolved.append((film_id, "id"))
+                continue
+            film_id = self._titles.get((row.title, row.year))
+            resolved.append((film_id, "title" if film_id is not None else "unmatched"))
+        return resolved
+
+
+def _column_defaults(table: sa.Table) -> dict[str, Callable]:
+    defaults = {}
+    for column in table.c:
+        default = column.default
+        if default is None or not (default.is_scalar or default.is_callable):
+            continue
+        defaults[column.name] = (lambda d=default: d.arg(None)) if default.is_callable else (lambda d=default: d.arg)
+    return defaults
+
+
+def _copy_text(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(session, table: sa.Table, rows: list[dict]) -> int:
+    """
+    Bulk inserts rows, filling in the column defaults the ORM would apply. On PostgreSQL the rows are sent with
+    a single ``COPY ... FROM STDIN`` on the session's connection, inside its transaction; other databases get
+    one executemany ``INSERT``.
+
+    :param session: The session to write with.
+    :param table: The target table.
+    :type table: sqlalchemy.Table
+    :param rows: The rows, as column name to value mappings.
+    :type rows: list[dict]
+    :return: The number of inserted rows.
+    :rtype: int
+    """
+    if not rows:
+        return 0
+    defaults = _column_defaults(table)
+    columns = [column.name for column in table.c if column.name in defaults or column.name in rows[0]]
+    complete = [{name: row[name] if name in row else defaults[name]() for name in columns} for row in rows]
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        connection.execute(table.insert(), complete)
+        return len(complete)
+
+    buffer = io.StringIO()
+    for row in complete:
+        buffer.write("\t".join(_copy_text(row[name]) for name in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    quoted = ", ".join(connection.dialect.identifier_preparer.quote(name) for name in columns)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({quoted}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+    return len(complete)
+
+
+def import_watch_history(
+    library_id,
+    stream: io.TextIOBase,
+    session=None,
+    resolver: Optional[FilmResolver] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    batch_size: int = 5000,
+    unmatched_sample: int = 20,
+) -> dict:
+    """
+    Imports an external watch log or ratings export into a library.
+
+    The file is parsed as a stream and resolved in batches. Watches are folded per film into the library's
+    `WatchHistory`: films already in it get their watch count and last watched time updated with one bulk
+    UPDATE, new ones are inserted with :func:`copy_rows`. Rated films become a new `Scroll` reviewed by the
+    library, ranked from the highest rating down. Everything is written in one transaction.
+
+    :param library_id: The library to import into.
+    :param stream: The CSV text stream.
+    :param session: The session to use. Defaults to ``db.session``.
+    :param resolver: The film resolver. Defaults to one using the configured matcher.
+    :type resolver: Optional[FilmResolver]
+    :param progress: Called with the number of rows processed after every batch.
+    :param batch_size: Rows resolved together.
+    :type batch_size: int
+    :param unmatched_sample: Number of unmatched rows listed in the summary.
+    :type unmatched_sample: int
+    :return: A summary of the import.
+    :rtype: dict
+    """
+    session = session or db.session
+    resolver = resolver or FilmResolver(session)
+    summary = {"rows": 0, "matched_by_id": 0, "matched_by_title": 0, "unmatched": 0, "unmatched_rows": []}
+    watches: dict = {}
+    ratings: dict = {}
+
+    def process(batch: list[ImportRow]) -> None:
+        for row, (film_id, how) in zip(batch, resolver.resolve(batch)):
+            if film_id is None:
+                summary["unmatched"] += 1
+                if len(summary["unmatched_rows"]) < unmatched_sample:
+                    summary["unmatched_rows"].append({"title": row.title, "year": row.year})
+                continue
+            summary["matched_by_id" if how == "id" else "matched_by_title"] += 1
+            count, last = watches.get(film_id, (0, None))
+            if row.watched_at is not None and (last is None or row.watched_at > last):
+                last = row.watched_at
+            watches[film_id] = (count + 1, last)
+            if row.rating is not None:
+                previous = ratings.get(film_id)
+                if previous is None or (row.watched_at or datetime.min) >= (previous[1] or datetime.min):
+                    ratings[film_id] = (row.rating, row.watched_at)
+        summary["rows"] += len(batch)
+        if progress is not None:
+            progress(summary["rows"])
+
+    batch = []
+    for row in parse_csv(stream):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            process(batch)
+            batch = []
+    if batch:
+        process(batch)
+
+    summary["watch_history_updated"], summary["watch_history_created"] = _write_watch_history(
+        session, library_id, watches, batch_size
+    )
+    summary["scroll_id"], summary["ranked"] = _write_ranking(session, library_id, ratings)
+    session.commit()
+    return summary
+
+
+def _write_watch_history(session, library_id, watches: dict, chunk_size: int) -> tuple[int, int]:
+    existing = {}
+    film_ids = list(watches)
+    for start in range(0, len(film_ids), chunk_size):
+        existing.update((film_id, (history_id, count, last)) for history_id, film_id, count, last in session.execute(
+            sa.select(WatchHistory.id, WatchHistory.film_id, WatchHistory.watch_count, WatchHistory.last_watched)
+            .where(
+                WatchHistory.library_id == library_id,
+                WatchHistory.film_id.in_(film_ids[start:start + chunk_size]),
+                WatchHistory.deleted_at.is_(None),
+            )
+        ))
+
+    updates, inserts = [], []
+    now = datetime.now()
+    for film_id, (count, last) in watches.items():
+        if film_id in existing:
+            history_id, previous_count, previous_last = existing[film_id]
+            latest = max(filter(None, (last, previous_last)), default=None)
+            updates.append({"id": history_id, "watch_count": (previous_count or 0) + count, "last_watched": latest})
+        else:
+            inserts.append({
+                "library_id": library_id, "created_by": library_id, "film_id": film_id,
+                "watch_count": count, "last_watched": last or now,
+            })
+    for start in range(0, len(updates), chunk_size):
+        session.execute(sa.update(WatchHistory), updates[start:start + chunk_size])
+    copy_rows(session, WatchHistory.__table__, inserts)
+    return len(updates), len(inserts)
+
+
+def _write_ranking(session, library_id, ratings: dict) -> tuple[Optional[str], int]:
+    if not ratings:
+        return None, 0
+    scroll_id = new_uuid()
+    copy_rows(session, Scroll.__table__, [{"id": scroll_id, "reviewer_id": library_id, "created_by": library_id}])
+    ranked = sorted(ratings.items(), key=lambda item: (item[1][0], item[1][1] or datetime.min), reverse=True)
+    copy_rows(session, ScrollEntry.__table__, [
+        {"scroll_id": scroll_id, "item_id": film_id, "rank": rank, "created_by": library_id}
+        for rank, (film_id, _) in enumerate(ranked, start=1)
+    ])
+    return str(scroll_id), len(ranked)
+
+
+@job_handler(IMPORT_JOB, concurrency=4)
+def run_import_job(context: JobContext, library_id: str, path: str) -> dict:
+    """
+    Job handler importing an uploaded export, reporting progress in bytes of the file read. The upload is
+    removed once the import succeeded or its last attempt failed.
+
+    :return: The import summary.
+    :rtype: dict
+    """
+    succeeded = False
+    try:
+        with open(path, "rb") as raw:
+            context.report(0, os.fstat(raw.fileno()).st_size, force=True)
+            stream = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+            summary = import_watch_history(
+                uuid.UUID(library_id), stream, progress=lambda rows: context.report(raw.tell()),
+                batch_size=current_app.config.get("IMPORT_BATCH_SIZE", 5000),
+            )
+            context.report(raw.tell(), force=True)
+        succeeded = True
+        return summary
+    finally:
+        if (succeeded or context.final_attempt) and os.path.exists(path):
+            os.remove(path)
+
+
+def start_import_job(library_id, upload) -> Job:
+    """
+    Saves an uploaded CSV export to ``IMPORT_DIRECTORY`` and queues its import, so the request returns as soon
+    as the upload is on disk. The job becomes visible to workers when the session commits; its result is the
+    import summary.
+
+    :param library_id: The library to import into.
+    :param upload: The uploaded file, e.g. ``request.files["file"]``.
+    :type upload: werkzeug.datastructures.FileStorage
+    :return: The job.
+    :rtype: Job
+    """
+    directory = current_app.config.get("IMPORT_DIRECTORY") or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"library-{library_id}-{uuid.uuid4().hex}.csv")
+    upload.save(path)
+    return enqueue(IMPORT_JOB, {"library_id": str(library_id), "path": path})
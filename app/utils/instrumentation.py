@@ -0,0 +1,309 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+from flask import Flask, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+_request_stats: ContextVar[Optional["RequestStats"]] = ContextVar("db_request_stats", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement: str) -> tuple[str, str]:
+    """
+    Normalizes a SQL statement so that statements differing only in literal values, parameter style or the
+    length of an ``IN`` list are grouped together, and fingerprints the result.
+
+    :param statement: The SQL statement as sent to the driver.
+    :type statement: str
+    :return: The normalized statement and its 16 character fingerprint.
+    :rtype: tuple[str, str]
+    """
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    normalized = _PLACEHOLDER_LIST.sub("(?)", normalized)
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+@dataclass
+class RequestStats:
+    """
+    Database activity of a single sampled request.
+
+    :ivar blueprint: The blueprint that handled the request, or ``"app"``.
+    :type blueprint: str
+    :ivar query_count: Number of statements executed.
+    :type query_count: int
+    :ivar db_time: Total time spent executing statements, in seconds.
+    :type db_time: float
+    :ivar pool_wait: Total time spent waiting for a pooled connection, in seconds.
+    :type pool_wait: float
+    :ivar slowest: The slowest statements as ``(duration, statement)`` pairs, slowest first.
+    :type slowest: list[tuple[float, str]]
+    """
+    blueprint: str
+    query_count: int = 0
+    db_time: float = 0.0
+    pool_wait: float = 0.0
+    slowest: list = field(default_factory=list)
+    keep_slowest: int = 3
+
+    def record(self, statement: str, duration: float) -> None:
+        self.query_count += 1
+        self.db_time += duration
+        if len(self.slowest) < self.keep_slowest or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: -item[0])
+            del self.slowest[self.keep_slowest:]
+
+
+@dataclass
+class StatementStats:
+    """
+    Aggregated timings of one statement fingerprint.
+    """
+    statement: str
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class MetricsRegistry:
+    """
+    Process-wide aggregate of sampled database activity, rendered in the Prometheus text exposition format.
+
+    :ivar max_fingerprints: Maximum number of distinct statement fingerprints tracked; further fingerprints are
+        counted as dropped to keep memory bounded.
+    :type max_fingerprints: int
+    :ivar top_statements: Number of statements, by total time, exposed by :meth:`render`.
+    :type top_statements: int
+    """
+
+    def __init__(self, max_fingerprints: int = 1000, top_statements: int = 10):
+        self.max_fingerprints = max_fingerprints
+        self.top_statements = top_statements
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests: dict[str, int] = {}
+            self.queries: dict[str, int] = {}
+            self.db_seconds: dict[str, float] = {}
+            self.query_histogram: dict[str, list[int]] = {}
+            self.statements: dict[str, StatementStats] = {}
+            self.dropped_fingerprints = 0
+            self.pool_checkouts = 0
+            self.pool_wait_seconds = 0.0
+            self.pool_wait_max = 0.0
+
+    def record_request(self, stats: RequestStats) -> None:
+        """
+        Folds a finished request into the aggregates.
+
+        :param stats: The request's database activity.
+        :type stats: RequestStats
+        """
+        normalized = [(duration, normalize_statement(statement)) for duration, statement in stats.slowest]
+        bucket = next((i for i, bound in enumerate(QUERY_COUNT_BUCKETS) if stats.query_count <= bound), None)
+        with self._lock:
+            blueprint = stats.blueprint
+            self.requests[blueprint] = self.requests.get(blueprint, 0) + 1
+            self.queries[blueprint] = self.queries.get(blueprint, 0) + stats.query_count
+            self.db_seconds[blueprint] = self.db_seconds.get(blueprint, 0.0) + stats.db_time
+            histogram = self.query_histogram.setdefault(blueprint, [0] * len(QUERY_COUNT_BUCKETS))
+            if bucket is not None:
+                histogram[bucket] += 1
+            for duration, (statement, fingerprint) in normalized:
+                entry = self.statements.get(fingerprint)
+                if entry is None:
+                    if len(self.statements) >= self.max_fingerprints:
+                        self.dropped_fingerprints += 1
+                        continue
+                    entry = self.statements[fingerprint] = StatementStats(statement)
+                entry.count += 1
+                entry.total += duration
+                entry.max = max(entry.max, duration)
+
+    def record_pool_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.pool_checkouts += 1
+            self.pool_wait_seconds += seconds
+            self.pool_wait_max = max(self.pool_wait_max, seconds)
+
+    def render(self, engines: dict = None) -> str:
+        """
+        Renders the aggregates in the Prometheus text exposition format.
+
+        :param engines: Engines by bind key whose pool occupancy should be reported.
+        :type engines: dict
+        :return: The exposition text.
+        :rtype: str
+        """
+        def escape(value) -> str:
+            return str(value).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        with self._lock:
+            metric("amber_db_sampled_requests_total", "counter", "Sampled requests by blueprint.",
+                   [(f'{{blueprint="{escape(b)}"}}', n) for b, n in sorted(self.requests.items())])
+            metric("amber_db_queries_total", "counter", "Statements executed by sampled requests.",
+                   [(f'{{blueprint="{escape(b)}"}}', n) for b, n in sorted(self.queries.items())])
+            metric("amber_db_seconds_total", "counter", "Time spent executing statements in sampled requests.",
+                   [(f'{{blueprint="{escape(b)}"}}', round(s, 6)) for b, s in sorted(self.db_seconds.items())])
+            samples = []
+            for blueprint, histogram in sorted(self.query_histogram.items()):
+                cumulative = 0
+                for bound, count in zip(QUERY_COUNT_BUCKETS, histogram):
+                    cumulative += count
+                    samples.append((f'_bucket{{blueprint="{escape(blueprint)}",le="{bound}"}}', cumulative))
+                samples.append((f'_bucket{{blueprint="{escape(blueprint)}",le="+Inf"}}', self.requests[blueprint]))
+                samples.append((f'_sum{{blueprint="{escape(blueprint)}"}}', self.queries[blueprint]))
+                samples.append((f'_count{{blueprint="{escape(blueprint)}"}}', self.requests[blueprint]))
+            lines.append("# HELP amber_db_request_queries Statements per sampled request.")
+            lines.append("# TYPE amber_db_request_queries histogram")
+            lines.extend(f"amber_db_request_queries{labels} {value}" for labels, value in samples)
+
+            top = sorted(self.statements.items(), key=lambda item: -item[1].total)[:self.top_statements]
+            metric("amber_db_statement_seconds_total", "counter",
+                   "Time spent in the slowest statement fingerprints of sampled requests.",
+                   [(f'{{fingerprint="{f}",statement="{escape(s.statement[:300])}"}}', round(s.total, 6)) for f, s in top])
+            metric("amber_db_statement_max_seconds", "gauge", "Slowest execution of each reported fingerprint.",
+                   [(f'{{fingerprint="{f}"}}', round(s.max, 6)) for f, s in top])
+            metric("amber_db_statement_fingerprints_dropped_total", "counter",
+                   "Statements not tracked because the fingerprint limit was reached.", [("", self.dropped_fingerprints)])
+            metric("amber_db_pool_checkouts_total", "counter", "Connections checked out of instrumented pools.",
+                   [("", self.pool_checkouts)])
+            metric("amber_db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection.",
+                   [("", round(self.pool_wait_seconds, 6))])
+            metric("amber_db_pool_wait_max_seconds", "gauge", "Longest wait for a pooled connection.",
+                   [("", round(self.pool_wait_max, 6))])
+
+        pools = [(key or "default", engine.pool) for key, engine in (engines or {}).items()]
+        pools = [(key, pool) for key, pool in pools if isinstance(pool, QueuePool)]
+        for name, attribute, help_text in (
+            ("amber_db_pool_size", "size", "Configured pool_size."),
+            ("amber_db_pool_max_overflow", "_max_overflow", "Configured max_overflow."),
+            ("amber_db_pool_checked_out", "checkedout", "Connections currently checked out."),
+            ("amber_db_pool_overflow", "overflow", "Connections currently open beyond pool_size."),
+        ):
+            samples = []
+            for key, pool in pools:
+                value = getattr(pool, attribute)
+                samples.append((f'{{bind="{escape(key)}"}}', value() if callable(value) else value))
+            metric(name, "gauge", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    `QueuePool` that measures how long each checkout waits for a connection, which is time a request spends
+    blocked on ``pool_size``/``max_overflow`` rather than on the database itself.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            metrics.record_pool_wait(waited)
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if _request_stats.get() is not None:
+        conn.info.setdefault("instrumentation_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    started = conn.info.get("instrumentation_started")
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_statement_timer(context):
+    connection = context.connection
+    started = connection.info.get("instrumentation_started") if connection is not None else None
+    if started:
+        started.pop()
+
+
+def _begin_request() -> None:
+    rate = current_app.config.get("DB_INSTRUMENTATION_SAMPLE_RATE", 1.0)
+    if request.endpoint == "metrics.export" or rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    g.db_stats_token = _request_stats.set(RequestStats(blueprint=request.blueprint or "app"))
+
+
+def _finish_request(response):
+    stats = _request_stats.get()
+    if stats is None:
+        return response
+    if current_app.config.get("DB_INSTRUMENTATION_DEBUG_HEADER", False):
+        response.headers["X-DB-Query-Count"] = str(stats.query_count)
+        timing = f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries"'
+        if stats.pool_wait:
+            timing += f", db-pool;dur={stats.pool_wait * 1000:.2f}"
+        response.headers.add("Server-Timing", timing)
+        if stats.slowest:
+            response.headers["X-DB-Slowest"] = normalize_statement(stats.slowest[0][1])[1]
+    return response
+
+
+def _end_request(exception=None) -> None:
+    stats = _request_stats.get()
+    token = g.pop("db_stats_token", None)
+    if stats is None or token is None:
+        return
+    _request_stats.reset(token)
+    metrics.record_request(stats)
+
+
+def init_instrumentation(app: Flask) -> None:
+    """
+    Installs database instrumentation on an application. Must be called before ``db.init_app`` so that engines
+    are created with the instrumented pool.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    options.setdefault("poolclass", InstrumentedQueuePool)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    app.before_request(_begin_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
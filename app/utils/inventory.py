@@ -0,0 +1,329 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+from ..extensions import db
+from ..models.inventory import (
+    InventoryReservation, RESERVATION_HELD, RESERVATION_CONFIRMED, RESERVATION_RELEASED,
+)
+from .jobs import JobContext, job_handler
+
+
+logger = logging.getLogger(__name__)
+inventory_cli = AppGroup("inventory", help="Manage inventory reservations.")
+
+INVENTORY_EXPIRY_JOB = "inventory_expire_reservations"
+
+
+@dataclass(frozen=True)
+class StockKind:
+    """
+    A table whose rows hold a count of items for sale.
+
+    :ivar name: Name of the kind, stored on reservations.
+    :type name: str
+    :ivar table: Name of the table.
+    :type table: str
+    :ivar column: The column counting the items left.
+    :type column: str
+    """
+    name: str
+    table: str
+    column: str
+
+
+STOCK_KINDS: dict[str, StockKind] = {}
+
+
+def stock_kind(name: str, table: str, column: str) -> StockKind:
+    """
+    Registers a kind of stock.
+
+    :param name: Name of the kind.
+    :type name: str
+    :param table: Name of the table.
+    :type table: str
+    :param column: The column counting the items left.
+    :type column: str
+    :return: The kind.
+    :rtype: StockKind
+    """
+    kind = STOCK_KINDS[name] = StockKind(name, table, column)
+    return kind
+
+
+stock_kind("merchandise", "merchandises", "inventory_count")
+stock_kind("ticket", "tickets", "quantity")
+
+
+class SoldOut(Exception):
+    """Raised when fewer items are left than requested."""
+
+
+class ReservationUnavailable(Exception):
+    """Raised when confirming a reservation that expired, was released or does not exist."""
+
+
+class AdmissionGate:
+    """
+    Per-process memory of the requests each item was sold out for, which turns away requests for as many items
+    or more without a query. During a drop almost every request arrives after the item sold out, so the
+    database only sees the requests that can still succeed.
+
+    Only failed decrements are recorded: the count a successful one returns is not final until its transaction
+    commits, and a rolled back purchase would leave the gate turning away buyers for items that are in stock.
+
+    Stock only grows again when reservations are released, so an observation is trusted for ``ttl`` seconds;
+    afterwards, or once this process releases items itself, requests reach the database again.
+
+    :ivar ttl: Seconds an observation is trusted.
+    :type ttl: float
+    :ivar rejected: Requests turned away.
+    :type rejected: int
+    """
+
+    def __init__(self, ttl: float = 1.0, maxsize: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.rejected = 0
+        self._clock = clock
+        self._left: dict = {}
+        self._lock = threading.Lock()
+
+    def admits(self, kind: str, item_id, quantity: int) -> bool:
+        """
+        Returns whether a request for items may be sent to the database.
+        """
+        with self._lock:
+            seen = self._left.get((kind, item_id))
+            if seen is None or seen[0] >= quantity or self._clock() - seen[1] > self.ttl:
+                return True
+            self.rejected += 1
+            return False
+
+    def observe(self, kind: str, item_id, left: int) -> None:
+        """
+        Records that at most ``left`` items were left.
+        """
+        with self._lock:
+            if len(self._left) >= self.maxsize:
+                self._left.clear()
+            self._left[(kind, item_id)] = (left, self._clock())
+
+    def forget(self, kind: str, item_ids: Iterable) -> None:
+        with self._lock:
+            for item_id in item_ids:
+                self._left.pop((kind, item_id), None)
+
+
+gate = AdmissionGate()
+
+
+def _stock(kind: str) -> tuple[sa.Table, sa.Column]:
+    stock = STOCK_KINDS[kind]
+    table = db.metadata.tables[stock.table]
+    return table, table.c[stock.column]
+
+
+def take_stock(kind: str, item_id, quantity: int, session=None) -> int:
+    """
+    Takes items from stock with a single conditional decrement, ``UPDATE ... WHERE count >= quantity
+    RETURNING count``. Concurrent buyers never lock each other out for longer than that statement and the stock
+    cannot go negative. The caller commits.
+
+    :param kind: The kind of stock, see :data:`STOCK_KINDS`.
+    :type kind: str
+    :param item_id: The item.
+    :param quantity: Number of items to take.
+    :type quantity: int
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Number of items left.
+    :rtype: int
+    :raises SoldOut: If fewer items are left, possibly without asking the database, see :class:`AdmissionGate`.
+    :raises ValueError: If the quantity is not positive.
+    """
+    if quantity < 1:
+        raise ValueError("Quantity must be positive")
+    if not gate.admits(kind, item_id, quantity):
+        raise SoldOut(f"Fewer than {quantity} left")
+    session = session or db.session
+    table, count = _stock(kind)
+    left = session.execute(
+        table.update().where(table.c.id == item_id, count >= quantity).values({count: count - quantity})
+        .returning(count)
+    ).scalar()
+    if left is None:
+        gate.observe(kind, item_id, quantity - 1)
+        raise SoldOut(f"Fewer than {quantity} left")
+    return left
+
+
+def return_stock(kind: str, quantities: dict, session=None) -> None:
+    """
+    Puts items back into stock, in item order so that concurrent returns cannot deadlock. The caller commits.
+
+    :param kind: The kind of stock.
+    :type kind: str
+    :param quantities: Item ids mapped to the number of items to put back.
+    :type quantities: dict
+    :param session: The session to use. Defaults to ``db.session``.
+    """
+    session = session or db.session
+    table, count = _stock(kind)
+    rows = [{"item_id": item_id, "quantity": quantity} for item_id, quantity in sorted(quantities.items()) if quantity]
+    if rows:
+        session.execute(
+            table.update().where(table.c.id == sa.bindparam("item_id"))
+            .values({count: count + sa.bindparam("quantity")}),
+            rows,
+        )
+        gate.forget(kind, quantities)
+
+
+def reserve(kind: str, item_id, quantity: int = 1, holder: Optional[str] = None, ttl: Optional[float] = None,
+            session=None) -> InventoryReservation:
+    """
+    Takes items from stock and holds them until the reservation is confirmed, released or expires. The caller
+    commits.
+
+    :param kind: The kind of stock.
+    :type kind: str
+    :param item_id: The item.
+    :param quantity: Number of items.
+    :type quantity: int
+    :param holder: Who holds the reservation.
+    :type holder: Optional[str]
+    :param ttl: Seconds until the reservation expires. Defaults to ``INVENTORY_RESERVATION_SECONDS``.
+    :type ttl: Optional[float]
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The reservation.
+    :rtype: InventoryReservation
+    :raises SoldOut: If fewer items are left.
+    """
+    session = session or db.session
+    if ttl is None:
+        ttl = current_app.config.get("INVENTORY_RESERVATION_SECONDS", 600.0)
+    take_stock(kind, item_id, quantity, session)
+    reservation = InventoryReservation(
+        kind=kind, item_id=item_id, quantity=quantity, holder=holder, status=RESERVATION_HELD,
+        expires_at=datetime.now() + timedelta(seconds=ttl),
+    )
+    session.add(reservation)
+    session.flush()
+    return reservation
+
+
+def confirm_reservation(reservation_id, session=None) -> InventoryReservation:
+    """
+    Turns a held reservation into a sale; its items stay out of stock for good. The caller commits.
+
+    :param reservation_id: The reservation.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The reservation.
+    :rtype: InventoryReservation
+    :raises ReservationUnavailable: If the reservation is not held or has expired.
+    """
+    session = session or db.session
+    confirmed = session.execute(
+        sa.update(InventoryReservation)
+        .where(
+            InventoryReservation.id == reservation_id, InventoryReservation.status == RESERVATION_HELD,
+            InventoryReservation.expires_at > datetime.now(),
+        )
+        .values(status=RESERVATION_CONFIRMED)
+        .returning(InventoryReservation.id)
+    ).scalar()
+    if confirmed is None:
+        raise ReservationUnavailable(f"Reservation {reservation_id} is no longer held")
+    return session.get(InventoryReservation, reservation_id, populate_existing=True)
+
+
+def _release(condition, session) -> int:
+    # The status change and the return of the items happen together, and only for reservations still held, so
+    # a reservation that is confirmed, released or expired concurrently is never returned twice.
+    released = session.execute(
+        sa.update(InventoryReservation)
+        .where(condition, InventoryReservation.status == RESERVATION_HELD)
+        .values(status=RESERVATION_RELEASED)
+        .returning(InventoryReservation.kind, InventoryReservation.item_id, InventoryReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    quantities: dict = {}
+    for kind, item_id, quantity in released:
+        quantities.setdefault(kind, {})
+        quantities[kind][item_id] = quantities[kind].get(item_id, 0) + quantity
+    for kind, items in sorted(quantities.items()):
+        return_stock(kind, items, session)
+    return len(released)
+
+
+def release_reservation(reservation_id, session=None) -> bool:
+    """
+    Gives up a held reservation and puts its items back. The caller commits.
+
+    :param reservation_id: The reservation.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Whether the reservation was held.
+    :rtype: bool
+    """
+    return bool(_release(InventoryReservation.id == reservation_id, session or db.session))
+
+
+def expire_reservations(session=None, batch_size: int = 1000) -> int:
+    """
+    Releases held reservations that have expired, in batches, committing after each.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param batch_size: Reservations released per transaction.
+    :type batch_size: int
+    :return: The number of reservations released.
+    :rtype: int
+    """
+    session = session or db.session
+    expired = 0
+    while True:
+        due = sa.select(InventoryReservation.id).where(
+            InventoryReservation.status == RESERVATION_HELD, InventoryReservation.expires_at <= datetime.now(),
+        ).limit(batch_size)
+        released = _release(InventoryReservation.id.in_(due), session)
+        session.commit()
+        expired += released
+        if released < batch_size:
+            return expired
+
+
+@job_handler(INVENTORY_EXPIRY_JOB, concurrency=1)
+def run_expiry_job(context: JobContext) -> dict:
+    """
+    Job handler releasing expired reservations.
+
+    :return: The number of reservations released.
+    :rtype: dict
+    """
+    return {"released": expire_reservations()}
+
+
+@inventory_cli.command("expire")
+def expire_command() -> None:
+    """Release expired reservations and put their items back into stock."""
+    click.echo(f"Released {expire_reservations()} expired reservations")
+
+
+def init_inventory(app: Flask) -> None:
+    """
+    Configures the admission gate from ``INVENTORY_GATE_SECONDS`` and registers the ``flask inventory``
+    commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    gate.ttl = app.config.get("INVENTORY_GATE_SECONDS", 1.0)
+    app.cli.add_command(inventory_cli)
@@ -0,0 +1,563 @@
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.jobs import Job, JOB_ACTIVE, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+
+
+jobs_cli = AppGroup("jobs", help="Run and manage background jobs.")
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a handler by :meth:`JobContext.report` when the job was cancelled or taken over by another
+    worker, so that the handler stops working on it.
+    """
+
+
+class PermanentJobFailure(Exception):
+    """
+    Raised by a handler for failures that retrying cannot fix, e.g. a malformed payload. The job fails right away
+    instead of being retried.
+    """
+
+
+@dataclass(frozen=True)
+class JobHandler:
+    """
+    A registered job type.
+
+    :ivar kind: The job type name.
+    :type kind: str
+    :ivar function: Called as ``function(context, **payload)``; its return value becomes the job's result.
+    :type function: Callable
+    :ivar concurrency: Maximum number of jobs of this type running at once across all workers, or ``None``.
+    :type concurrency: Optional[int]
+    :ivar max_attempts: Attempts before a failing job is given up.
+    :type max_attempts: int
+    """
+    kind: str
+    function: Callable
+    concurrency: Optional[int] = None
+    max_attempts: int = 3
+
+
+HANDLERS: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, concurrency: Optional[int] = None, max_attempts: int = 3):
+    """
+    Registers a function as the handler of a job type. ``JOB_CONCURRENCY`` in the config overrides the
+    concurrency limit per type.
+
+    :param kind: The job type name.
+    :type kind: str
+    :param concurrency: Maximum number of jobs of this type running at once, or ``None`` for no limit.
+    :type concurrency: Optional[int]
+    :param max_attempts: Attempts before a failing job is given up.
+    :type max_attempts: int
+    :return: The decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        HANDLERS[kind] = JobHandler(kind, function, concurrency, max_attempts)
+        return function
+    return decorator
+
+
+def _concurrency_limits(config) -> dict[str, int]:
+    limits = {kind: handler.concurrency for kind, handler in HANDLERS.items() if handler.concurrency}
+    limits.update(config.get("JOB_CONCURRENCY", {}))
+    return {kind: limit for kind, limit in limits.items() if limit}
+
+
+def enqueue(
+    kind: str,
+    payload: Optional[dict] = None,
+    priority: int = 0,
+    dedupe_key: Optional[str] = None,
+    run_at: Optional[datetime] = None,
+    max_attempts: Optional[int] = None,
+    session=None,
+) -> Job:
+    """
+    Adds a job to the queue. The job is written in the session's transaction and becomes visible to workers
+    when the caller commits, so it is never run for work that was rolled back.
+
+    With a ``dedupe_key``, a job that is already queued or running under the same key is returned instead of
+    adding a second one.
+
+    :param kind: The job type; it must have a registered handler.
+    :type kind: str
+    :param payload: JSON serializable keyword arguments for the handler.
+    :type payload: Optional[dict]
+    :param priority: Jobs with a higher priority are claimed first.
+    :type priority: int
+    :param dedupe_key: Key identifying equivalent jobs.
+    :type dedupe_key: Optional[str]
+    :param run_at: Earliest time to run the job. Defaults to now.
+    :type run_at: Optional[datetime]
+    :param max_attempts: Overrides the handler's number of attempts.
+    :type max_attempts: Optional[int]
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The new job, or the active job holding ``dedupe_key``.
+    :rtype: Job
+    :raises KeyError: If no handler is registered for ``kind``.
+    """
+    if kind not in HANDLERS:
+        raise KeyError(f"No handler registered for job type '{kind}'")
+    session = session or db.session
+
+    def active() -> Optional[Job]:
+        return session.scalars(
+            sa.select(Job).where(Job.dedupe_key == dedupe_key, Job.status.in_(JOB_ACTIVE))
+        ).first()
+
+    if dedupe_key is not None and (existing := active()) is not None:
+        return existing
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        priority=priority,
+        dedupe_key=dedupe_key,
+        run_at=run_at or datetime.now(),
+        max_attempts=max_attempts or HANDLERS[kind].max_attempts,
+    )
+    try:
+        with session.begin_nested():
+            session.add(job)
+    except IntegrityError:
+        # Another transaction enqueued the same key between the lookup and the insert.
+        return active()
+    return job
+
+
+def get_job(job_id, kind: Optional[str] = None, session=None) -> Optional[Job]:
+    """
+    Looks up a job.
+
+    :param job_id: The job identifier.
+    :param kind: Only return the job if it is of this type.
+    :type kind: Optional[str]
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The job, or ``None`` if there is no such job.
+    :rtype: Optional[Job]
+    """
+    job = (session or db.session).get(Job, job_id)
+    return job if job is not None and kind in (None, job.kind) else None
+
+
+def cancel_job(job_id, session=None) -> bool:
+    """
+    Cancels a queued or running job. A running handler notices at its next progress report.
+
+    :param job_id: The job identifier.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Whether the job was active and is now cancelled.
+    :rtype: bool
+    """
+    session = session or db.session
+    cancelled = session.execute(
+        sa.update(Job).where(Job.id == job_id, Job.status.in_(JOB_ACTIVE))
+        .values(status=JOB_CANCELLED, finished_at=datetime.now())
+    ).rowcount
+    return bool(cancelled)
+
+
+def retry_delay(attempt: int, base: float = 10.0, cap: float = 3600.0) -> float:
+    """
+    Exponential backoff with jitter for the retry after attempt number ``attempt``.
+
+    :param attempt: The attempt that failed, starting at 1.
+    :type attempt: int
+    :param base: Delay after the first attempt, in seconds.
+    :type base: float
+    :param cap: Maximum delay, in seconds.
+    :type cap: float
+    :return: The delay in seconds.
+    :rtype: float
+    """
+    return min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+class JobContext:
+    """
+    Passed to a handler as its first argument to report progress on the job row.
+
+    :ivar job_id: The job identifier.
+    :ivar kind: The job type.
+    :type kind: str
+    :ivar attempt: The current attempt, starting at 1.
+    :type attempt: int
+    :ivar max_attempts: Attempts before the job is given up.
+    :type max_attempts: int
+    """
+
+    def __init__(self, engine, job_id, kind: str, attempt: int, max_attempts: int, worker_id: str,
+                 interval: float = 1.0):
+        self.engine = engine
+        self.job_id = job_id
+        self.kind = kind
+        self.attempt = attempt
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id
+        self.interval = interval
+        self._last_report = 0.0
+
+    @property
+    def final_attempt(self) -> bool:
+        """Whether a failure of this attempt fails the job for good."""
+        return self.attempt >= self.max_attempts
+
+    def report(self, progress: int, total: Optional[int] = None, message: Optional[str] = None,
+               force: bool = False) -> None:
+        """
+        Records progress. Writes are throttled to one per ``JOB_PROGRESS_INTERVAL`` unless ``force`` is set, and
+        each one also serves as a heartbeat.
+
+        :param progress: Units of work done so far.
+        :type progress: int
+        :param total: Units of work in total, if known.
+        :type total: Optional[int]
+        :param message: A short progress note.
+        :type message: Optional[str]
+        :param force: Write even if the last write was recent.
+        :type force: bool
+        :raises JobCancelled: If the job was cancelled or is no longer owned by this worker.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        values = {"progress": progress, "heartbeat_at": datetime.now()}
+        if total is not None:
+            values["total"] = total
+        if message is not None:
+            values["message"] = message[:255]
+        with self.engine.begin() as conn:
+            owned = conn.execute(_owned(self.job_id, self.worker_id).values(**values)).rowcount
+        if not owned:
+            raise JobCancelled(f"Job {self.job_id} was cancelled or taken over")
+
+
+def _owned(job_id, worker_id: str) -> sa.Update:
+    table = Job.__table__
+    return table.update().where(
+        table.c.id == job_id, table.c.status == JOB_RUNNING, table.c.locked_by == worker_id
+    )
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, engine, job_id, worker_id: str, interval: float):
+        super().__init__(daemon=True, name=f"job-heartbeat-{job_id}")
+        self.engine, self.job_id, self.worker_id, self.interval = engine, job_id, worker_id, interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(_owned(self.job_id, self.worker_id).values(heartbeat_at=datetime.now()))
+            except sa.exc.DBAPIError:
+                continue
+
+
+class Worker:
+    """
+    Claims and runs jobs one at a time. A worker process runs several of these on threads.
+
+    Jobs are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` on PostgreSQL, so concurrent workers never wait
+    on each other's rows; on SQLite, which serializes writers anyway, the conditional status update alone
+    decides who gets a job. Job types at their concurrency limit are skipped, and on PostgreSQL the limit is
+    checked under a per-type advisory lock so that two workers cannot both take the last slot.
+
+    :ivar worker_id: Identifier recorded on claimed jobs.
+    :type worker_id: str
+    :ivar kinds: Job types this worker runs; all registered types when ``None``.
+    :type kinds: Optional[set[str]]
+    """
+
+    def __init__(self, app: Flask, worker_id: Optional[str] = None, kinds: Optional[Iterable[str]] = None):
+        self.app = app
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.kinds = set(kinds) if kinds else None
+        with app.app_context():
+            self.engine = db.engine
+        config = app.config
+        self.poll_interval = config.get("JOB_POLL_INTERVAL", 1.0)
+        self.stale_after = config.get("JOB_STALE_AFTER", 300)
+        self.progress_interval = config.get("JOB_PROGRESS_INTERVAL", 1.0)
+        self.backoff = (config.get("JOB_RETRY_BACKOFF", 10.0), config.get("JOB_RETRY_BACKOFF_MAX", 3600.0))
+
+    def _runnable(self) -> list[str]:
+        kinds = set(HANDLERS) if self.kinds is None else self.kinds & set(HANDLERS)
+        return sorted(kinds)
+
+    def claim(self) -> Optional[dict]:
+        """
+        Claims the next runnable job: the highest priority, then the longest waiting, of the types that are
+        below their concurrency limit.
+
+        :return: The claimed job's row, or ``None`` if there is nothing to run.
+        :rtype: Optional[dict]
+        """
+        table = Job.__table__
+        limits = _concurrency_limits(self.app.config)
+        saturated: set[str] = set()
+        with self.engine.begin() as conn:
+            postgresql = conn.dialect.name == "postgresql"
+            if limits:
+                running = conn.execute(
+                    sa.select(table.c.kind, sa.func.count()).where(table.c.status == JOB_RUNNING)
+                    .group_by(table.c.kind)
+                ).tuples().all()
+                saturated = {kind for kind, count in running if count >= limits.get(kind, count + 1)}
+            for _ in range(len(limits) + 1):
+                kinds = [kind for kind in self._runnable() if kind not in saturated]
+                if not kinds:
+                    return None
+                row = conn.execute(
+                    sa.select(table).where(
+                        table.c.status == JOB_QUEUED, table.c.run_at <= datetime.now(), table.c.kind.in_(kinds)
+                    )
+                    .order_by(table.c.priority.desc(), table.c.run_at, table.c.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).mappings().first()
+                if row is None:
+                    return None
+                limit = limits.get(row["kind"])
+                if limit and postgresql:
+                    conn.execute(sa.select(sa.func.pg_advisory_xact_lock(sa.func.hashtext(f"jobs:{row['kind']}"))))
+                    count = conn.scalar(sa.select(sa.func.count()).where(
+                        table.c.kind == row["kind"], table.c.status == JOB_RUNNING
+                    ))
+                    if count >= limit:
+                        saturated.add(row["kind"])
+                        continue
+                now = datetime.now()
+                claimed = conn.execute(
+                    table.update().where(table.c.id == row["id"], table.c.status == JOB_QUEUED).values(
+                        status=JOB_RUNNING, locked_by=self.worker_id, attempts=table.c.attempts + 1,
+                        started_at=now, heartbeat_at=now, error=None,
+                    )
+                ).rowcount
+                if claimed:
+                    return dict(row) | {"attempts": row["attempts"] + 1}
+            return None
+
+    def execute(self, row: dict) -> str:
+        """
+        Runs a claimed job and records the outcome: ``done`` with the handler's result, back to ``queued`` with
+        a backoff delay if attempts remain, or ``failed``.
+
+        :param row: The claimed job's row.
+        :type row: dict
+        :return: The job's new status.
+        :rtype: str
+        """
+        handler = HANDLERS[row["kind"]]
+        context = JobContext(
+            self.engine, row["id"], row["kind"], row["attempts"], row["max_attempts"], self.worker_id,
+            self.progress_interval,
+        )
+        heartbeat = _Heartbeat(self.engine, row["id"], self.worker_id, max(1.0, self.stale_after / 3))
+        heartbeat.start()
+        now = datetime.now
+        try:
+            with self.app.app_context():
+                try:
+                    result = handler.function(context, **(row["payload"] or {}))
+                finally:
+                    db.session.remove()
+            values = {
+                "status": JOB_DONE, "result": json.loads(json.dumps(result, default=str)), "finished_at": now(),
+                "locked_by": None,
+            }
+        except JobCancelled:
+            return JOB_CANCELLED
+        except Exception as error:
+            message = "".join(traceback.format_exception_only(type(error), error)).strip()
+            if isinstance(error, PermanentJobFailure) or context.final_attempt:
+                values = {"status": JOB_FAILED, "error": message, "finished_at": now(), "locked_by": None}
+            else:
+                delay = retry_delay(context.attempt, *self.backoff)
+                values = {
+                    "status": JOB_QUEUED, "error": message, "run_at": now() + timedelta(seconds=delay),
+                    "locked_by": None,
+                }
+        finally:
+            heartbeat.stopped.set()
+        with self.engine.begin() as conn:
+            updated = conn.execute(_owned(row["id"], self.worker_id).values(**values)).rowcount
+        return values["status"] if updated else JOB_CANCELLED
+
+    def run_one(self) -> Optional[str]:
+        """
+        Claims and runs a single job.
+
+        :return: The job's new status, or ``None`` if no job was runnable.
+        :rtype: Optional[str]
+        """
+        row = self.claim()
+        return self.execute(row) if row is not None else None
+
+    def run(self, stop: threading.Event, burst: bool = False) -> None:
+        """
+        Runs jobs until ``stop`` is set, waiting ``JOB_POLL_INTERVAL`` whenever the queue is empty.
+
+        :param stop: Event that ends the loop after the current job.
+        :type stop: threading.Event
+        :param burst: Return as soon as the queue is empty instead of polling.
+        :type burst: bool
+        """
+        while not stop.is_set():
+            if self.run_one() is None:
+                if burst:
+                    return
+                stop.wait(self.poll_interval)
+
+
+def requeue_stale_jobs(engine=None, stale_after: Optional[float] = None) -> int:
+    """
+    Recovers jobs whose worker died: running jobs without a heartbeat for ``stale_after`` seconds are queued
+    again, or failed if they have used up their attempts.
+
+    :param engine: The engine to use. Defaults to ``db.engine``.
+    :param stale_after: Seconds without a heartbeat. Defaults to ``JOB_STALE_AFTER``.
+    :type stale_after: Optional[float]
+    :return: The number of recovered jobs.
+    :rtype: int
+    """
+    engine = engine or db.engine
+    stale_after = stale_after if stale_after is not None else current_app.config.get("JOB_STALE_AFTER", 300)
+    table = Job.__table__
+    stale = sa.and_(
+        table.c.status == JOB_RUNNING, table.c.heartbeat_at < datetime.now() - timedelta(seconds=stale_after)
+    )
+    with engine.begin() as conn:
+        failed = conn.execute(table.update().where(stale, table.c.attempts >= table.c.max_attempts).values(
+            status=JOB_FAILED, error="Worker stopped responding", finished_at=datetime.now(), locked_by=None,
+        )).rowcount
+        requeued = conn.execute(table.update().where(stale).values(
+            status=JOB_QUEUED, error="Worker stopped responding", locked_by=None,
+        )).rowcount
+    return failed + requeued
+
+
+def run_workers(
+    app: Flask,
+    threads: int,
+    kinds: Optional[Iterable[str]] = None,
+    burst: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Runs ``threads`` workers in this process until ``stop`` is set, requeueing abandoned jobs every
+    ``JOB_STALE_AFTER / 2`` seconds. Running jobs are finished before this returns.
+
+    :param app: The application.
+    :type app: Flask
+    :param threads: Number of worker threads.
+    :type threads: int
+    :param kinds: Job types to run; all registered types when ``None``.
+    :param burst: Return once the queue is empty.
+    :type burst: bool
+    :param stop: Event ending the workers.
+    :type stop: Optional[threading.Event]
+    """
+    stop = stop or threading.Event()
+    with app.app_context():
+        requeue_stale_jobs()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(
+            target=Worker(app, f"{prefix}:{i}", kinds).run, args=(stop, burst), name=f"job-worker-{i}"
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    reap_interval = app.config.get("JOB_STALE_AFTER", 300) / 2
+    next_reap = time.monotonic() + reap_interval
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(timeout=1.0)
+        if not stop.is_set() and time.monotonic() >= next_reap:
+            next_reap += reap_interval
+            with app.app_context():
+                requeue_stale_jobs()
+
+
+def _stop_on_signals() -> threading.Event:
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    return stop
+
+
+def _run_worker_process(threads: int, kinds: Optional[list], burst: bool) -> None:
+    from .. import create_app
+
+    run_workers(create_app(), threads, kinds, burst, _stop_on_signals())
+
+
+@jobs_cli.command("worker")
+@click.option("--threads", type=int, default=None, help="Worker threads per process (default JOB_WORKER_THREADS).")
+@click.option("--processes", type=int, default=1, show_default=True, help="Worker processes.")
+@click.option("--kind", "kinds", multiple=True, help="Only run jobs of this type. Repeatable.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+def worker_command(threads: Optional[int], processes: int, kinds: tuple, burst: bool) -> None:
+    """Run background job workers."""
+    app = current_app._get_current_object()
+    threads = threads or app.config.get("JOB_WORKER_THREADS", 4)
+    kinds = list(kinds) or None
+    click.echo(f"Running {processes} x {threads} job workers for {', '.join(kinds or sorted(HANDLERS))}")
+    if processes <= 1:
+        run_workers(app, threads, kinds, burst, _stop_on_signals())
+        return
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(target=_run_worker_process, args=(threads, kinds, burst), name=f"job-worker-process-{i}")
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+            child.join()
+
+
+@jobs_cli.command("requeue-stale")
+def requeue_stale_command() -> None:
+    """Requeue running jobs whose worker stopped responding."""
+    click.echo(f"Recovered {requeue_stale_jobs()} jobs")
+
+
+def init_jobs(app: Flask) -> None:
+    """
+    Registers the ``flask jobs`` commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.cli.add_command(jobs_cli)
@@ -0,0 +1,587 @@
+import logging
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_DOWN
+from typing import Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+from ..extensions import db
+from ..models.ledger import Posting, BalanceSnapshot, FundShard
+from .cache import cache, cache_namespace
+from .jobs import JobContext, job_handler
+
+
+logger = logging.getLogger(__name__)
+ledger_cli = AppGroup("ledger", help="Snapshot, shard and verify fund balances.")
+
+LEDGER_SNAPSHOT_JOB = "ledger_snapshot"
+LEDGER_COMPACTION_JOB = "ledger_compact_shards"
+QUANTUM = Decimal("0.0001")
+
+# Designating a fund hot only takes effect in other processes once their copy expires; until then they post to
+# it unsharded, which compaction folds in. Hot fund balances may be a second old.
+cache_namespace("hot_funds", local_ttl=60.0, local_size=1)
+cache_namespace("hot_fund_balance", ttl=1.0, local_ttl=1.0, local_size=1000)
+
+
+class UnbalancedEntry(ValueError):
+    """Raised for an entry whose legs do not sum to zero."""
+
+
+def to_amount(value) -> Decimal:
+    """
+    Rounds a number to the precision postings are stored with.
+
+    :param value: The number.
+    :return: The amount.
+    :rtype: Decimal
+    """
+    return Decimal(str(value)).quantize(QUANTUM)
+
+
+def hot_funds(session=None) -> dict:
+    """
+    Returns the funds with shards, see :class:`~app.models.ledger.FundShard`. Cached per process for up to a
+    minute; shards are only ever added, so a stale copy still names valid shards.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Fund ids mapped to their number of shards.
+    :rtype: dict[uuid.UUID, int]
+    """
+    session = session or db.session
+    return cache.get_or_load("hot_funds", "all", lambda: dict(session.execute(
+        sa.select(FundShard.fund_id, sa.func.count()).group_by(FundShard.fund_id)
+    ).tuples().all()))
+
+
+def shard_for(entry_id: uuid.UUID, shards: int) -> int:
+    """
+    Picks the shard of a hot fund an entry writes, spreading entries evenly over the shards.
+
+    :param entry_id: The entry.
+    :type entry_id: uuid.UUID
+    :param shards: The fund's number of shards.
+    :type shards: int
+    :return: The shard.
+    :rtype: int
+    """
+    return zlib.crc32(entry_id.bytes) % shards
+
+
+def lock_shards(session=None, keys: Iterable[tuple] = (), fund_ids: Iterable = ()) -> dict:
+    """
+    Locks shards with ``SELECT ... FOR UPDATE`` in ``(fund_id, shard)`` order, the order every writer of
+    shards locks them in.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param keys: Pairs of fund id and shard to lock.
+    :param fund_ids: Funds to lock every shard of.
+    :return: The pairs of fund id and shard locked mapped to their balance.
+    :rtype: dict[tuple[uuid.UUID, int], Decimal]
+    """
+    session = session or db.session
+    keys, fund_ids = list(keys), list(fund_ids)
+    conditions = []
+    if keys:
+        conditions.append(sa.tuple_(FundShard.fund_id, FundShard.shard).in_(keys))
+    if fund_ids:
+        conditions.append(FundShard.fund_id.in_(fund_ids))
+    if not conditions:
+        return {}
+    rows = session.execute(
+        sa.select(FundShard.fund_id, FundShard.shard, FundShard.balance)
+        .where(sa.or_(*conditions)).order_by(FundShard.fund_id, FundShard.shard).with_for_update()
+    )
+    return {(fund_id, shard): balance for fund_id, shard, balance in rows}
+
+
+def apply_shard_deltas(deltas: dict, session=None) -> None:
+    """
+    Adds amounts to shard balances in one statement, in lock order. Writers post the same amounts to the
+    shards in the same transaction.
+
+    :param deltas: Pairs of fund id and shard mapped to the amount to add.
+    :type deltas: dict[tuple[uuid.UUID, int], Decimal]
+    :param session: The session to use. Defaults to ``db.session``.
+    """
+    session = session or db.session
+    shards = FundShard.__table__
+    rows = [
+        {"key_fund_id": fund_id, "key_shard": shard, "delta": delta}
+        for (fund_id, shard), delta in sorted(deltas.items()) if delta
+    ]
+    if rows:
+        session.execute(
+            shards.update()
+            .where(shards.c.fund_id == sa.bindparam("key_fund_id"), shards.c.shard == sa.bindparam("key_shard"))
+            .values(balance=shards.c.balance + sa.bindparam("delta")),
+            rows,
+        )
+
+
+def post_entry(ledger_id, legs: Iterable[tuple], transaction_id=None, session=None) -> uuid.UUID:
+    """
+    Books an entry: one posting per leg, inserted in a single statement. Nothing is locked or updated, so
+    concurrent entries against the same funds do not wait for each other, except that legs of hot funds also
+    update the shard :func:`shard_for` picks. The caller commits.
+
+    :param ledger_id: The ledger to book the entry in.
+    :param legs: Pairs of fund id and amount, positive for credits and negative for debits, that sum to zero,
+        or triples adding the part of a debit paid as a fee. Legs of zero are skipped.
+    :param transaction_id: The transaction the entry records, if any.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The entry id shared by the postings.
+    :rtype: uuid.UUID
+    :raises UnbalancedEntry: If the legs do not sum to zero or a leg has no fund.
+    """
+    session = session or db.session
+    entry_id, now = uuid.uuid4(), datetime.now()
+    rows = []
+    for fund_id, amount, *fee in legs:
+        amount = to_amount(amount)
+        if not amount:
+            continue
+        if fund_id is None:
+            raise UnbalancedEntry("A leg of the entry has no fund")
+        rows.append({
+            "entry_id": entry_id, "ledger_id": ledger_id, "fund_id": fund_id, "transaction_id": transaction_id,
+            "amount": amount, "fee": to_amount(fee[0]) if fee and fee[0] else None, "shard": None, "created_at": now,
+        })
+    total = sum((row["amount"] for row in rows), Decimal(0))
+    if total:
+        raise UnbalancedEntry(f"Entry legs sum to {total}, not zero")
+    if rows:
+        hot, deltas = hot_funds(session), {}
+        for row in rows:
+            if row["fund_id"] in hot:
+                row["shard"] = shard_for(entry_id, hot[row["fund_id"]])
+                key = (row["fund_id"], row["shard"])
+                deltas[key] = deltas.get(key, Decimal(0)) + row["amount"]
+        session.execute(sa.insert(Posting), rows)
+        apply_shard_deltas(deltas, session)
+    return entry_id
+
+
+def post_transaction(transaction, session=None) -> uuid.UUID:
+    """
+    Books a :class:`~app.models.commerce.Transaction`: its ``from_fund`` is debited ``total_amount``, its
+    ``to_fund`` credited ``amount`` and its ``toll_fund`` credited ``fee``.
+
+    :param transaction: The transaction.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The entry id.
+    :rtype: uuid.UUID
+    :raises UnbalancedEntry: If ``total_amount`` is not ``amount`` plus ``fee``, or a fee has no toll fund.
+    """
+    amount, fee = to_amount(transaction.amount or 0), to_amount(transaction.fee or 0)
+    total = to_amount(transaction.total_amount) if transaction.total_amount else amount + fee
+    if total != amount + fee:
+        raise UnbalancedEntry(f"Transaction {transaction.id} total {total} is not amount {amount} plus fee {fee}")
+    return post_entry(
+        transaction.ledger_id,
+        [(transaction.from_fund_id, -total, fee), (transaction.to_fund_id, amount), (transaction.toll_fund, fee)],
+        transaction.id, session,
+    )
+
+
+def _settled_cutoff(settle: float) -> datetime:
+    return datetime.now() - timedelta(seconds=settle)
+
+
+def settled_position(session=None, settle: float = 10.0) -> Optional[int]:
+    """
+    Returns the id of the newest posting inserted more than ``settle`` seconds ago.
+
+    Posting ids are handed out on insert but become visible on commit, so a posting with a lower id may appear
+    after one with a higher id. Every posting up to the settled position was inserted before it, more than
+    ``settle`` seconds ago, and is therefore committed or rolled back as long as ``settle`` exceeds the longest
+    write transaction; balances up to it are final.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which a posting is considered settled.
+    :type settle: float
+    :return: The settled position, or ``None`` if no posting is settled yet.
+    :rtype: Optional[int]
+    """
+    session = session or db.session
+    return session.scalar(
+        sa.select(Posting.id).where(Posting.created_at < _settled_cutoff(settle)).order_by(Posting.id.desc()).limit(1)
+    )
+
+
+def latest_snapshots(fund_ids: Optional[Iterable] = None, session=None) -> dict:
+    """
+    Returns the latest snapshot of funds.
+
+    :param fund_ids: The funds, or ``None`` for all funds with a snapshot.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Fund ids mapped to the position and balance of their latest snapshot.
+    :rtype: dict[uuid.UUID, tuple[int, Decimal]]
+    """
+    session = session or db.session
+    latest = sa.select(BalanceSnapshot.fund_id, sa.func.max(BalanceSnapshot.posting_id).label("posting_id"))
+    if fund_ids is not None:
+        latest = latest.where(BalanceSnapshot.fund_id.in_(list(fund_ids)))
+    latest = latest.group_by(BalanceSnapshot.fund_id).subquery()
+    rows = session.execute(
+        sa.select(BalanceSnapshot.fund_id, BalanceSnapshot.posting_id, BalanceSnapshot.balance).join(
+            latest, sa.and_(
+                BalanceSnapshot.fund_id == latest.c.fund_id, BalanceSnapshot.posting_id == latest.c.posting_id,
+            )
+        )
+    )
+    return {fund_id: (posting_id, balance) for fund_id, posting_id, balance in rows}
+
+
+class RunningTotals:
+    """
+    Per-process running totals of fund balances.
+
+    A balance is the cached total up to some position plus the fund's postings after it, summed in one
+    grouped statement over the ``(fund_id, id)`` index. Each read moves the cached total forward to the
+    settled position, see :func:`settled_position`, so the part summed per read stays within the last
+    ``settle`` seconds of postings. Funds read for the first time start from their latest snapshot.
+
+    :ivar settle: Seconds after which a posting is considered settled.
+    :type settle: float
+    """
+
+    def __init__(self, settle: float = 10.0):
+        self.settle = settle
+        self._totals: dict = {}
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+    def balances(self, fund_ids: Iterable, session=None) -> dict:
+        """
+        Returns the current balance of funds, including postings that have not settled yet.
+
+        :param fund_ids: The funds.
+        :param session: The session to use. Defaults to ``db.session``.
+        :return: Fund ids mapped to their balance.
+        :rtype: dict[uuid.UUID, Decimal]
+        """
+        session = session or db.session
+        fund_ids = set(fund_ids)
+        if not fund_ids:
+            return {}
+        with self._lock:
+            known = {fund_id: self._totals[fund_id] for fund_id in fund_ids if fund_id in self._totals}
+        missing = fund_ids - known.keys()
+        if missing:
+            snapshots = latest_snapshots(missing, session)
+            known.update({fund_id: snapshots.get(fund_id, (0, Decimal(0))) for fund_id in missing})
+
+        settled_up_to = settled_position(session, self.settle) or 0
+        settled = Posting.id <= settled_up_to
+        rows = session.execute(
+            sa.select(
+                Posting.fund_id,
+                sa.func.sum(Posting.amount),
+                sa.func.sum(sa.case((settled, Posting.amount), else_=0)),
+                sa.func.max(sa.case((settled, Posting.id), else_=None)),
+            )
+            .where(sa.or_(*(
+                sa.and_(Posting.fund_id == fund_id, Posting.id > position)
+                for fund_id, (position, _) in known.items()
+            )))
+            .group_by(Posting.fund_id)
+        ).tuples().all()
+
+        result = {fund_id: balance for fund_id, (_, balance) in known.items()}
+        advanced = dict(known)
+        for fund_id, tail, settled_tail, settled_id in rows:
+            position, balance = known[fund_id]
+            result[fund_id] = balance + to_amount(tail)
+            if settled_id is not None:
+                advanced[fund_id] = (settled_id, balance + to_amount(settled_tail))
+        with self._lock:
+            for fund_id, (position, balance) in advanced.items():
+                current = self._totals.get(fund_id)
+                if current is None or current[0] < position:
+                    self._totals[fund_id] = (position, balance)
+        return result
+
+    def balance(self, fund_id, session=None) -> Decimal:
+        return self.balances([fund_id], session)[fund_id]
+
+
+running_totals = RunningTotals()
+
+
+def _shard_total(fund_id, session) -> Decimal:
+    # One statement, so a compaction cannot fold postings between reading the shards and the unfolded rest.
+    folded_through = sa.select(sa.func.max(FundShard.folded_through)).where(FundShard.fund_id == fund_id)
+    held = sa.select(sa.func.coalesce(sa.func.sum(FundShard.balance), 0)).where(FundShard.fund_id == fund_id)
+    unfolded = sa.select(sa.func.coalesce(sa.func.sum(Posting.amount), 0)).where(
+        Posting.fund_id == fund_id, Posting.shard.is_(None), Posting.id > folded_through.scalar_subquery(),
+    )
+    row = session.execute(sa.select(held.scalar_subquery(), unfolded.scalar_subquery())).one()
+    return to_amount(row[0]) + to_amount(row[1])
+
+
+def hot_fund_balance(fund_id, session=None) -> Decimal:
+    """
+    Returns the balance of a hot fund: the sum of its shards plus the postings written to it unsharded since
+    the last compaction, cached for a second.
+
+    :param fund_id: The fund.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The balance.
+    :rtype: Decimal
+    """
+    session = session or db.session
+    return cache.get_or_load("hot_fund_balance", fund_id, lambda: _shard_total(fund_id, session))
+
+
+def fund_balance(fund_id, session=None) -> Decimal:
+    """
+    Returns a fund's balance from the ledger. ``Fund.balance`` is not written by the ledger.
+
+    :param fund_id: The fund.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The balance.
+    :rtype: Decimal
+    """
+    if fund_id in hot_funds(session):
+        return hot_fund_balance(fund_id, session)
+    return running_totals.balance(fund_id, session)
+
+
+def shard_fund(fund_id, shards: int, session=None) -> int:
+    """
+    Makes a fund hot, or gives a hot fund more shards, and commits. Shards are never removed. A new hot fund's
+    first shard starts with its latest snapshot; later postings are folded in by :func:`compact_shards`.
+
+    :param fund_id: The fund.
+    :param shards: The number of shards the fund should have.
+    :type shards: int
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The number of shards added.
+    :rtype: int
+    """
+    session = session or db.session
+    existing = session.execute(
+        sa.select(FundShard.shard, FundShard.folded_through).where(FundShard.fund_id == fund_id)
+        .order_by(FundShard.shard).with_for_update()
+    ).tuples().all()
+    if shards <= len(existing):
+        session.rollback()
+        return 0
+    if existing:
+        folded_through, opening = existing[0][1], Decimal(0)
+    else:
+        folded_through, opening = latest_snapshots([fund_id], session).get(fund_id, (0, Decimal(0)))
+    now = datetime.now()
+    session.execute(sa.insert(FundShard), [
+        {
+            "fund_id": fund_id, "shard": shard, "balance": opening if shard == 0 else Decimal(0),
+            "folded_through": folded_through, "updated_at": now,
+        }
+        for shard in range(len(existing), shards)
+    ])
+    session.commit()
+    cache.invalidate("hot_funds")
+    return shards - len(existing)
+
+
+def compact_shards(session=None, settle: Optional[float] = None, fund_ids: Optional[Iterable] = None) -> int:
+    """
+    Folds the settled postings written to hot funds unsharded into their shards and spreads each fund's
+    balance evenly over its shards again, so that a debit rarely finds its shard short. Commits after each
+    fund, which keeps its shards locked only briefly.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which a posting is considered settled. Defaults to ``LEDGER_SETTLE_SECONDS``.
+    :type settle: Optional[float]
+    :param fund_ids: The funds to compact, or ``None`` for every hot fund.
+    :return: The number of funds compacted.
+    :rtype: int
+    """
+    session = session or db.session
+    if settle is None:
+        settle = current_app.config.get("LEDGER_SETTLE_SECONDS", 10.0)
+    if fund_ids is None:
+        fund_ids = session.execute(sa.select(FundShard.fund_id).distinct()).scalars().all()
+    position = settled_position(session, settle) or 0
+    compacted = 0
+    for fund_id in sorted(fund_ids):
+        shards = session.execute(
+            sa.select(FundShard).where(FundShard.fund_id == fund_id).order_by(FundShard.shard).with_for_update()
+        ).scalars().all()
+        if not shards:
+            session.rollback()
+            continue
+        folded_through = max(shards[0].folded_through, position)
+        unfolded = session.scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(Posting.amount), 0)).where(
+                Posting.fund_id == fund_id, Posting.shard.is_(None),
+                Posting.id > shards[0].folded_through, Posting.id <= folded_through,
+            )
+        )
+        total = sum((shard.balance for shard in shards), to_amount(unfolded))
+        share = (total / len(shards)).quantize(QUANTUM, rounding=ROUND_DOWN)
+        now = datetime.now()
+        for shard in shards:
+            shard.balance = total - share * (len(shards) - 1) if shard.shard == 0 else share
+            shard.folded_through = folded_through
+            shard.updated_at = now
+        session.commit()
+        compacted += 1
+    return compacted
+
+
+def take_snapshots(session=None, settle: Optional[float] = None) -> int:
+    """
+    Snapshots the balance of every fund with settled postings after its latest snapshot. The caller commits.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which a posting is considered settled. Defaults to ``LEDGER_SETTLE_SECONDS``.
+    :type settle: Optional[float]
+    :return: The number of snapshots taken.
+    :rtype: int
+    """
+    session = session or db.session
+    if settle is None:
+        settle = current_app.config.get("LEDGER_SETTLE_SECONDS", 10.0)
+    position = settled_position(session, settle)
+    if position is None:
+        return 0
+    previous = latest_snapshots(session=session)
+    latest = sa.select(BalanceSnapshot.fund_id, sa.func.max(BalanceSnapshot.posting_id).label("posting_id")) \
+        .group_by(BalanceSnapshot.fund_id).subquery()
+    deltas = session.execute(
+        sa.select(Posting.fund_id, sa.func.sum(Posting.amount))
+        .outerjoin(latest, latest.c.fund_id == Posting.fund_id)
+        .where(Posting.id <= position, Posting.id > sa.func.coalesce(latest.c.posting_id, 0))
+        .group_by(Posting.fund_id)
+    ).tuples().all()
+    now = datetime.now()
+    rows = [
+        {
+            "fund_id": fund_id, "posting_id": position, "created_at": now,
+            "balance": previous.get(fund_id, (0, Decimal(0)))[1] + to_amount(delta),
+        }
+        for fund_id, delta in deltas
+    ]
+    if rows:
+        session.execute(sa.insert(BalanceSnapshot), rows)
+    return len(rows)
+
+
+def verify_ledger(session=None) -> list[str]:
+    """
+    Checks that every entry sums to zero, that every fund's latest snapshot matches its postings and that the
+    shards of every hot fund hold its sharded and folded postings. This reads every posting and is meant for
+    audits, not requests.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Descriptions of the problems found.
+    :rtype: list[str]
+    """
+    session = session or db.session
+    problems = [
+        f"Entry {entry_id} sums to {total}"
+        for entry_id, total in session.execute(
+            sa.select(Posting.entry_id, sa.func.sum(Posting.amount))
+            .group_by(Posting.entry_id).having(sa.func.sum(Posting.amount) != 0)
+        )
+    ]
+    for fund_id, (position, balance) in latest_snapshots(session=session).items():
+        total = to_amount(session.scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(Posting.amount), 0))
+            .where(Posting.fund_id == fund_id, Posting.id <= position)
+        ))
+        if total != balance:
+            problems.append(f"Fund {fund_id} snapshot at {position} is {balance}, postings sum to {total}")
+    for fund_id in session.execute(sa.select(FundShard.fund_id).distinct()).scalars():
+        folded_through = sa.select(sa.func.max(FundShard.folded_through)).where(FundShard.fund_id == fund_id)
+        held = sa.select(sa.func.coalesce(sa.func.sum(FundShard.balance), 0)).where(FundShard.fund_id == fund_id)
+        posted = sa.select(sa.func.coalesce(sa.func.sum(Posting.amount), 0)).where(
+            Posting.fund_id == fund_id,
+            sa.or_(Posting.shard.is_not(None), Posting.id <= folded_through.scalar_subquery()),
+        )
+        held, posted = session.execute(sa.select(held.scalar_subquery(), posted.scalar_subquery())).one()
+        if to_amount(held) != to_amount(posted):
+            problems.append(f"Fund {fund_id} shards hold {to_amount(held)}, their postings sum to {to_amount(posted)}")
+    return problems
+
+
+@job_handler(LEDGER_SNAPSHOT_JOB, concurrency=1)
+def run_snapshot_job(context: JobContext) -> dict:
+    """
+    Job handler taking balance snapshots.
+
+    :return: The number of snapshots taken.
+    :rtype: dict
+    """
+    taken = take_snapshots()
+    db.session.commit()
+    return {"snapshots": taken}
+
+
+@job_handler(LEDGER_COMPACTION_JOB, concurrency=1)
+def run_compaction_job(context: JobContext) -> dict:
+    """
+    Job handler compacting the shards of hot funds.
+
+    :return: The number of funds compacted.
+    :rtype: dict
+    """
+    return {"funds": compact_shards()}
+
+
+@ledger_cli.command("snapshot")
+def snapshot_command() -> None:
+    """Snapshot fund balances up to the settled postings."""
+    taken = take_snapshots()
+    db.session.commit()
+    click.echo(f"Took {taken} balance snapshots")
+
+
+@ledger_cli.command("shard")
+@click.argument("fund_id", type=click.UUID)
+@click.option("--shards", type=int, default=None, help="Number of shards, defaults to LEDGER_FUND_SHARDS.")
+def shard_command(fund_id: uuid.UUID, shards: Optional[int]) -> None:
+    """Spread writes to a hot fund over shards."""
+    shards = shards or current_app.config.get("LEDGER_FUND_SHARDS", 16)
+    added = shard_fund(fund_id, shards)
+    click.echo(f"Added {added} shards to fund {fund_id}")
+
+
+@ledger_cli.command("compact")
+def compact_command() -> None:
+    """Fold unsharded postings into the shards of hot funds and rebalance them."""
+    click.echo(f"Compacted {compact_shards()} hot funds")
+
+
+@ledger_cli.command("verify")
+def verify_command() -> None:
+    """Check that entries balance and snapshots and shards match their postings."""
+    problems = verify_ledger()
+    for problem in problems:
+        click.echo(problem)
+    click.echo(f"{len(problems)} problems found")
+    if problems:
+        raise SystemExit(1)
+
+
+def init_ledger(app: Flask) -> None:
+    """
+    Configures :data:`running_totals` from ``LEDGER_SETTLE_SECONDS`` and registers the ``flask ledger``
+    commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    running_totals.settle = app.config.get("LEDGER_SETTLE_SECONDS", 10.0)
+    app.cli.add_command(ledger_cli)
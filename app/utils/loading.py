@@ -0,0 +1,253 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache, wraps
+from typing import Optional
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload, joinedload, subqueryload, load_only, raiseload
+
+from ..models.library import Film, Person
+
+
+STRATEGIES = {"selectin": selectinload, "joined": joinedload, "subquery": subqueryload}
+_active_counters: ContextVar[tuple] = ContextVar("active_query_counters", default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a block guarded by :func:`query_budget` issues more SQL statements than it is allowed.
+
+    It subclasses `AssertionError` so that a view exceeding its budget fails a test the same way a failed
+    assertion would.
+
+    :ivar label: Name of the guarded block, usually the loading profile.
+    :type label: str
+    :ivar budget: The allowed number of statements.
+    :type budget: int
+    :ivar statements: Every statement issued inside the block.
+    :type statements: list[str]
+    """
+
+    def __init__(self, label: str, budget: int, statements: list[str]):
+        self.label = label
+        self.budget = budget
+        self.statements = statements
+        listing = "\n".join(f"  {i + 1}. {' '.join(sql.split())[:200]}" for i, sql in enumerate(statements))
+        super().__init__(f"'{label}' issued {len(statements)} queries, budget is {budget}:\n{listing}")
+
+
+@dataclass(frozen=True)
+class LoadingProfile:
+    """
+    Declarative description of how a view loads an entity and its relationships.
+
+    Relationship paths are dotted attribute names relative to the profile's model, e.g. ``"gigs.career.person"``.
+    Every intermediate segment of a path is loaded with the strategy declared for it, or with ``selectin`` when
+    it is not declared itself.
+
+    :ivar model: The root model the profile applies to.
+    :type model: type
+    :ivar columns: Columns of the root model to load; all columns are loaded when empty.
+    :type columns: tuple[str, ...]
+    :ivar load: Relationship paths mapped to their loading strategy (``selectin``, ``joined`` or ``subquery``).
+    :type load: dict[str, str]
+    :ivar only: Relationship paths mapped to the columns to load for the related model.
+    :type only: dict[str, tuple[str, ...]]
+    :ivar query_budget: Maximum number of queries a view using the profile may issue, or ``None`` for no limit.
+    :type query_budget: Optional[int]
+    """
+    model: type
+    columns: tuple = ()
+    load: dict = field(default_factory=dict)
+    only: dict = field(default_factory=dict)
+    query_budget: Optional[int] = None
+
+
+LOADING_PROFILES: dict[str, LoadingProfile] = {
+    "film_card": LoadingProfile(
+        model=Film,
+        columns=(
+            "id", "created_at", "title", "release_year", "runtime", "imdb_rating", "popularity_score",
+            "available_locally",
+        ),
+        load={"genres": "selectin"},
+        query_budget=2,
+    ),
+    "film_detail": LoadingProfile(
+        model=Film,
+        load={
+            "genres": "selectin",
+            "tags": "selectin",
+            "languages": "selectin",
+            "countries": "selectin",
+            "themes": "selectin",
+            "boxoffice": "joined",
+            "studios": "selectin",
+            "production_companies": "selectin",
+            "gigs.career.person": "joined",
+            "characters.career.person": "joined",
+            "nominations": "selectin",
+            "wins": "selectin",
+            "subtitles": "selectin",
+        },
+        only={
+            "gigs.career.person": ("id", "first_name", "last_name", "full_name"),
+            "characters.career.person": ("id", "first_name", "last_name", "full_name"),
+        },
+        query_budget=15,
+    ),
+    "person_filmography": LoadingProfile(
+        model=Person,
+        load={
+            "careers": "selectin",
+            "careers.gigs": "selectin",
+            "careers.gigs.films": "joined",
+            "careers.characters": "selectin",
+            "careers.characters.films": "joined",
+        },
+        only={
+            "careers.gigs.films": ("id", "title", "release_year", "imdb_rating"),
+            "careers.characters.films": ("id", "title", "release_year", "imdb_rating"),
+        },
+        query_budget=6,
+    ),
+}
+
+
+def _strict_loading() -> bool:
+    return has_app_context() and bool(current_app.config.get("LOADING_PROFILES_STRICT", False))
+
+
+@lru_cache(maxsize=None)
+def _build_options(name: str, strict: bool) -> tuple:
+    """
+    Resolves a profile into loader options. Options are immutable, so each profile is resolved only once.
+
+    :param name: The profile name.
+    :type name: str
+    :param strict: Whether relationships outside the profile should raise instead of lazy loading.
+    :type strict: bool
+    :return: The loader options.
+    :rtype: tuple
+    """
+    profile = LOADING_PROFILES[name]
+    options = []
+    if profile.columns:
+        options.append(load_only(*(getattr(profile.model, column) for column in profile.columns)))
+
+    paths = set(profile.load) | set(profile.only)
+    leaves = {path for path in paths if not any(other.startswith(path + ".") for other in paths)}
+    for path in sorted(leaves):
+        loader, owner, prefix = None, profile.model, ""
+        for segment in path.split("."):
+            prefix = f"{prefix}.{segment}" if prefix else segment
+            attribute = getattr(owner, segment)
+            strategy = STRATEGIES[profile.load.get(prefix, "selectin")]
+            loader = strategy(attribute) if loader is None else getattr(loader, strategy.__name__)(attribute)
+            owner = attribute.property.mapper.class_
+            if prefix in profile.only:
+                loader = loader.load_only(*(getattr(owner, column) for column in profile.only[prefix]))
+        options.append(loader.raiseload("*") if strict else loader)
+    if strict:
+        options.append(raiseload("*"))
+    return tuple(options)
+
+
+def profile_options(name: str) -> tuple:
+    """
+    Returns the loader options of a profile.
+
+    :param name: The profile name.
+    :type name: str
+    :return: Options to pass to ``Select.options``.
+    :rtype: tuple
+    :raises KeyError: If no profile with that name exists.
+    """
+    if name not in LOADING_PROFILES:
+        raise KeyError(f"Unknown loading profile '{name}'")
+    return _build_options(name, _strict_loading())
+
+
+def apply_profile(statement, name: Optional[str] = None):
+    """
+    Applies a loading profile to a select statement.
+
+    :param statement: The statement to load with, e.g. ``select(Film).where(...)``.
+    :param name: The profile name. Defaults to the profile of the current view (see :func:`loading_profile`).
+    :type name: Optional[str]
+    :return: The statement with the profile's options applied.
+    """
+    name = name or g.get("loading_profile")
+    if name is None:
+        raise RuntimeError("No loading profile given and the current view does not declare one")
+    return statement.options(*profile_options(name))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for statements in _active_counters.get():
+        statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """
+    Records every SQL statement executed in the current context, on any engine.
+
+    :return: A list that receives the executed statements.
+    :rtype: list[str]
+    """
+    statements: list[str] = []
+    token = _active_counters.set(_active_counters.get() + (statements,))
+    try:
+        yield statements
+    finally:
+        _active_counters.reset(token)
+
+
+@contextmanager
+def query_budget(budget: int, label: str = "block"):
+    """
+    Fails with :class:`QueryBudgetExceeded` if the guarded block issues more than ``budget`` statements.
+
+    :param budget: The allowed number of statements.
+    :type budget: int
+    :param label: Name used in the error message.
+    :type label: str
+    :return: The list of executed statements.
+    :rtype: list[str]
+    """
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > budget:
+        raise QueryBudgetExceeded(label, budget, statements)
+
+
+def loading_profile(name: str):
+    """
+    View decorator declaring the loading profile a view uses.
+
+    The profile becomes the default of :func:`apply_profile` inside the view. When ``QUERY_BUDGET_ENFORCED`` is
+    set, as it is in testing, the view fails if it exceeds the profile's query budget.
+
+    :param name: The profile name.
+    :type name: str
+    :return: The decorator.
+    """
+    if name not in LOADING_PROFILES:
+        raise KeyError(f"Unknown loading profile '{name}'")
+    budget = LOADING_PROFILES[name].query_budget
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            g.loading_profile = name
+            if budget is None or not current_app.config.get("QUERY_BUDGET_ENFORCED", False):
+                return view(*args, **kwargs)
+            with query_budget(budget, name):
+                return view(*args, **kwargs)
+        return wrapped
+    return decorator
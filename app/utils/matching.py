@@ -0,0 +1,446 @@
+import re
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from flask import current_app, has_app_context
+from scipy import sparse
+from sqlalchemy import select, update, func
+
+from ..extensions import db
+from ..models.library import Film, File
+
+
+# Tokens that scanners leave behind in file titles and that never belong to a film title.
+RELEASE_NOISE = {
+    "480p", "576p", "720p", "1080p", "2160p", "4k", "uhd", "hdr", "hdr10", "dv", "bluray", "bdrip", "brrip",
+    "webrip", "webdl", "web", "dl", "hdtv", "dvdrip", "remux", "x264", "x265", "h264", "h265", "hevc", "avc",
+    "aac", "ac3", "dts", "ddp5", "atmos", "proper", "repack", "extended", "unrated", "remastered", "yts", "rarbg",
+}
+LEADING_ARTICLES = ("the ", "a ", "an ")
+YEAR_TOKEN = re.compile(r"(19|20)\d\d")
+UNKNOWN_YEAR = -1
+UNDATED = "undated"
+HASH_DIMENSIONS = 1 << 18
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """
+    Normalizes a film or file title into a canonical form used for blocking and scoring.
+
+    Accents are folded to ASCII, everything is lower-cased, ``&`` becomes ``and``, punctuation and release
+    noise tokens (resolutions, codecs, rip sources) are dropped, a trailing year is dropped and a single
+    leading article is removed, so that "The.Matrix.1999.1080p.BluRay" and "The Matrix" normalize to the same
+    string.
+
+    :param title: The raw title to normalize. ``None`` is treated as an empty title.
+    :type title: Optional[str]
+    :return: The normalized title, possibly empty.
+    :rtype: str
+    """
+    if not title:
+        return ""
+    text = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii").lower()
+    text = text.replace("&", " and ")
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    tokens = [token for token in text.split() if token not in RELEASE_NOISE]
+    if len(tokens) > 1 and YEAR_TOKEN.fullmatch(tokens[-1]):
+        tokens.pop()
+    text = " ".join(tokens)
+    for article in LEADING_ARTICLES:
+        if text.startswith(article) and len(text) > len(article):
+            text = text[len(article):]
+            break
+    return text
+
+
+def title_block(normalized: str) -> str:
+    """
+    Derives the title part of a blocking key from a normalized title.
+
+    The key is the first four characters of the first token plus the first character of the second one, which
+    keeps typos inside words from splitting a film and its files into different blocks while stopping common
+    opening words ("star", "love") from producing huge blocks.
+
+    :param normalized: A title already passed through :func:`normalize_title`.
+    :type normalized: str
+    :return: The title block key, or an empty string for empty titles.
+    :rtype: str
+    """
+    if not normalized:
+        return ""
+    tokens = normalized.split(" ", 2)
+    return tokens[0][:4] + (f":{tokens[1][0]}" if len(tokens) > 1 else "")
+
+
+def _trigram_matrix(titles: Sequence[str]) -> sparse.csr_matrix:
+    """
+    Builds an L2-normalized, hashed character-trigram matrix for a sequence of normalized titles.
+
+    Each row corresponds to one title; the dot product of two rows is the cosine similarity of their trigram
+    profiles. Hashing uses CRC32 so that the feature space is stable across processes.
+
+    :param titles: Normalized titles, one per row.
+    :type titles: Sequence[str]
+    :return: A sparse matrix of shape ``(len(titles), HASH_DIMENSIONS)``.
+    :rtype: scipy.sparse.csr_matrix
+    """
+    indptr = [0]
+    indices = []
+    for title in titles:
+        padded = f"  {title} "
+        grams = {zlib.crc32(padded[i:i + 3].encode()) % HASH_DIMENSIONS for i in range(len(padded) - 2)} if title else set()
+        indices.extend(grams)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(titles), HASH_DIMENSIONS),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+
+def _rowwise_dot(left: sparse.csr_matrix, right: sparse.csr_matrix, left_rows: np.ndarray, right_rows: np.ndarray) -> np.ndarray:
+    """
+    Computes the dot product of paired rows from two sparse matrices in one vectorized pass.
+
+    :param left: The left-hand matrix.
+    :param right: The right-hand matrix.
+    :param left_rows: Row indices into ``left``.
+    :param right_rows: Row indices into ``right``, paired element-wise with ``left_rows``.
+    :return: An array with one dot product per pair.
+    :rtype: numpy.ndarray
+    """
+    if len(left_rows) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.asarray(left[left_rows].multiply(right[right_rows]).sum(axis=1)).ravel()
+
+
+@dataclass
+class FilmMatch:
+    """
+    Represents the best scoring `Film` candidate found for a `File`.
+
+    :ivar file_id: The identifier of the scored file.
+    :type file_id: uuid.UUID
+    :ivar film_id: The identifier of the best candidate film.
+    :type film_id: uuid.UUID
+    :ivar score: The combined confidence score between 0 and 1.
+    :type score: float
+    :ivar title_score: Trigram cosine similarity between the titles.
+    :type title_score: float
+    :ivar year_score: Agreement between the file year and the film release year.
+    :type year_score: float
+    :ivar runtime_score: Agreement between the estimated file runtime and the film runtime.
+    :type runtime_score: float
+    :ivar runner_up: The score of the second-best candidate, if any.
+    :type runner_up: Optional[float]
+    :ivar linked: Whether the match cleared the auto-link threshold and margin.
+    :type linked: bool
+    """
+    file_id: object
+    film_id: object
+    score: float
+    title_score: float
+    year_score: float
+    runtime_score: float
+    runner_up: Optional[float] = None
+    linked: bool = False
+
+    def report(self) -> dict:
+        """
+        Builds the ``confidence_score_report`` payload stored on the matched `File`.
+
+        :return: A JSON-serializable breakdown of the match.
+        :rtype: dict
+        """
+        return {
+            "matcher": "film",
+            "film_id": str(self.film_id),
+            "score": round(self.score, 4),
+            "title": round(self.title_score, 4),
+            "year": round(self.year_score, 4),
+            "runtime": round(self.runtime_score, 4),
+            "runner_up": None if self.runner_up is None else round(self.runner_up, 4),
+            "linked": self.linked,
+        }
+
+
+@dataclass
+class FilmMatcher:
+    """
+    Entity resolution engine that links scanned `File` rows to `Film` records.
+
+    Films are indexed once into blocks keyed by ``(title block, release year)``. Files are then matched in a
+    single batch: every file only meets the films sharing one of its blocking keys (its year, the years either
+    side of it and undated films, or every film of its title block when the file has no year), and all
+    candidate pairs are scored together with vectorized trigram similarity plus year and runtime agreement.
+    Nothing here issues a query per file.
+
+    :ivar threshold: Minimum score required to auto-link a file to a film.
+    :type threshold: float
+    :ivar min_margin: Minimum lead the best candidate needs over the runner-up to be auto-linked.
+    :type min_margin: float
+    :ivar weights: Weights of the title, year and runtime components. They should sum to 1.
+    :type weights: tuple[float, float, float]
+    :ivar batch_size: Number of files scored together in one vectorized slice.
+    :type batch_size: int
+    """
+    threshold: float = 0.85
+    min_margin: float = 0.05
+    weights: tuple = (0.7, 0.2, 0.1)
+    batch_size: int = 20000
+    _film_ids: list = field(default_factory=list, init=False, repr=False)
+    _film_years: np.ndarray = field(default=None, init=False, repr=False)
+    _film_runtimes: np.ndarray = field(default=None, init=False, repr=False)
+    _film_titles: sparse.csr_matrix = field(default=None, init=False, repr=False)
+    _film_original_titles: sparse.csr_matrix = field(default=None, init=False, repr=False)
+    _blocks: dict = field(default_factory=dict, init=False, repr=False)
+
+    @classmethod
+    def from_config(cls) -> "FilmMatcher":
+        """
+        Creates a matcher using ``FILM_MATCH_THRESHOLD`` and ``FILM_MATCH_MIN_MARGIN`` from the application
+        config, falling back to the defaults outside an application context.
+
+        :return: A configured matcher.
+        :rtype: FilmMatcher
+        """
+        if not has_app_context():
+            return cls()
+        return cls(
+            threshold=current_app.config.get("FILM_MATCH_THRESHOLD", cls.threshold),
+            min_margin=current_app.config.get("FILM_MATCH_MIN_MARGIN", cls.min_margin),
+        )
+
+    def index_films(self, rows: Iterable[tuple]) -> "FilmMatcher":
+        """
+        Indexes candidate films for matching.
+
+        :param rows: Tuples of ``(film_id, title, original_title, release_year, runtime)``. Missing years and
+            runtimes may be ``None``.
+        :type rows: Iterable[tuple]
+        :return: The matcher itself, to allow chaining.
+        :rtype: FilmMatcher
+        """
+        ids, titles, originals, years, runtimes = [], [], [], [], []
+        blocks: dict = {}
+        for film_id, title, original_title, year, runtime in rows:
+            normalized = normalize_title(title)
+            original = normalize_title(original_title) or normalized
+            index = len(ids)
+            ids.append(film_id)
+            titles.append(normalized)
+            originals.append(original)
+            years.append(UNKNOWN_YEAR if year is None else int(year))
+            runtimes.append(np.nan if not runtime else float(runtime))
+            for key in {title_block(normalized), title_block(original)}:
+                blocks.setdefault((key, years[-1]), []).append(index)
+                if years[-1] == UNKNOWN_YEAR:
+                    blocks.setdefault((key, UNDATED), []).append(index)
+                else:
+                    blocks.setdefault((key, UNKNOWN_YEAR), []).append(index)
+        self._film_ids = ids
+        self._film_years = np.asarray(years, dtype=np.int32)
+        self._film_runtimes = np.asarray(runtimes, dtype=np.float64)
+        self._film_titles = _trigram_matrix(titles)
+        self._film_original_titles = _trigram_matrix(originals)
+        self._blocks = {key: np.asarray(sorted(set(members)), dtype=np.int64) for key, members in blocks.items()}
+        return self
+
+    def _candidate_pairs(self, normalized: list, years: np.ndarray) -> tuple:
+        """
+        Expands each file into the films sharing one of its blocking keys.
+
+        :param normalized: Normalized file titles.
+        :param years: File years, ``UNKNOWN_YEAR`` where missing.
+        :return: Two aligned arrays of file and film row indices.
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        file_rows, film_rows = [], []
+        empty = np.zeros(0, dtype=np.int64)
+        for index, (title, year) in enumerate(zip(normalized, years.tolist())):
+            key = title_block(title)
+            if not key:
+                continue
+            if year == UNKNOWN_YEAR:
+                members = self._blocks.get((key, UNKNOWN_YEAR), empty)
+            else:
+                members = np.unique(np.concatenate(
+                    [self._blocks.get((key, y), empty) for y in (year - 1, year, year + 1, UNDATED)]
+                ))
+            if len(members):
+                file_rows.append(np.full(len(members), index, dtype=np.int64))
+                film_rows.append(members)
+        if not file_rows:
+            return empty, empty
+        return np.concatenate(file_rows), np.concatenate(film_rows)
+
+    def match(self, rows: Iterable[tuple]) -> list[FilmMatch]:
+        """
+        Scores a batch of files against the indexed films and returns the best candidate per file.
+
+        Files are scored in slices of ``batch_size`` so that the candidate pair arrays stay bounded no matter
+        how large the import is.
+
+        :param rows: Tuples of ``(file_id, file_title, file_year, runtime_minutes)``. The runtime is an
+            estimate from the file itself and may be ``None``.
+        :type rows: Iterable[tuple]
+        :return: One `FilmMatch` per file that had at least one candidate.
+        :rtype: list[FilmMatch]
+        """
+        if self._film_titles is None:
+            raise RuntimeError("FilmMatcher.index_films() must be called before match()")
+        file_ids, normalized, years, runtimes = [], [], [], []
+        for file_id, title, year, runtime in rows:
+            file_ids.append(file_id)
+            normalized.append(normalize_title(title))
+            years.append(UNKNOWN_YEAR if year is None else int(year))
+            runtimes.append(np.nan if not runtime else float(runtime))
+        years = np.asarray(years, dtype=np.int32)
+        runtimes = np.asarray(runtimes, dtype=np.float64)
+
+        matches = []
+        for start in range(0, len(file_ids), self.batch_size):
+            stop = start + self.batch_size
+            matches.extend(self._score_slice(
+                file_ids[start:stop], normalized[start:stop], years[start:stop], runtimes[start:stop]
+            ))
+        return matches
+
+    def _score_slice(self, file_ids: list, normalized: list, years: np.ndarray, runtimes: np.ndarray) -> list[FilmMatch]:
+        """
+        Scores one slice of files against their blocked candidates with vectorized operations.
+
+        :param file_ids: Identifiers of the files in the slice.
+        :param normalized: Normalized file titles.
+        :param years: File years, ``UNKNOWN_YEAR`` where missing.
+        :param runtimes: Estimated file runtimes in minutes, ``NaN`` where missing.
+        :return: The best `FilmMatch` per file that had candidates.
+        :rtype: list[FilmMatch]
+        """
+        file_rows, film_rows = self._candidate_pairs(normalized, years)
+        if len(file_rows) == 0:
+            return []
+
+        vectors = _trigram_matrix(normalized)
+        title_scores = np.maximum(
+            _rowwise_dot(vectors, self._film_titles, file_rows, film_rows),
+            _rowwise_dot(vectors, self._film_original_titles, file_rows, film_rows),
+        )
+
+        file_years, film_years = years[file_rows], self._film_years[film_rows]
+        year_gap = np.abs(file_years - film_years)
+        year_scores = np.where(
+            (file_years == UNKNOWN_YEAR) | (film_years == UNKNOWN_YEAR), 0.5,
+            np.where(year_gap == 0, 1.0, np.where(year_gap == 1, 0.6, 0.0)),
+        )
+
+        file_runtimes, film_runtimes = runtimes[file_rows], self._film_runtimes[film_rows]
+        tolerance = np.maximum(10.0, 0.15 * np.nan_to_num(film_runtimes, nan=0.0))
+        runtime_scores = np.where(
+            np.isnan(file_runtimes) | np.isnan(film_runtimes), 0.5,
+            1.0 - np.minimum(np.abs(np.nan_to_num(file_runtimes - film_runtimes)) / tolerance, 1.0),
+        )
+
+        title_weight, year_weight, runtime_weight = self.weights
+        scores = title_weight * title_scores + year_weight * year_scores + runtime_weight * runtime_scores
+
+        # Sort by file, then by descending score, so the first row of each file group is its best candidate.
+        order = np.lexsort((-scores, file_rows))
+        sorted_files = file_rows[order]
+        starts = np.flatnonzero(np.r_[True, sorted_files[1:] != sorted_files[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+
+        matches = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            best = order[start]
+            runner_up = float(scores[order[start + 1]]) if end - start > 1 else None
+            score = float(scores[best])
+            margin = score - (runner_up or 0.0)
+            matches.append(FilmMatch(
+                file_id=file_ids[file_rows[best]],
+                film_id=self._film_ids[film_rows[best]],
+                score=score,
+                title_score=float(title_scores[best]),
+                year_score=float(year_scores[best]),
+                runtime_score=float(runtime_scores[best]),
+                runner_up=runner_up,
+                linked=score >= self.threshold and margin >= self.min_margin,
+            ))
+        return matches
+
+
+def estimate_runtime_minutes(size: Optional[int], bitrate: Optional[int]) -> Optional[float]:
+    """
+    Estimates a media file's runtime from its size and bitrate.
+
+    :param size: File size in bytes.
+    :type size: Optional[int]
+    :param bitrate: Overall bitrate in bits per second.
+    :type bitrate: Optional[int]
+    :return: The estimated runtime in minutes, or ``None`` if it cannot be estimated.
+    :rtype: Optional[float]
+    """
+    if not size or not bitrate:
+        return None
+    return size * 8 / bitrate / 60
+
+
+def link_files(session=None, matcher: Optional[FilmMatcher] = None, relink: bool = False, chunk_size: int = 5000) -> dict:
+    """
+    Runs the film matcher over every unlinked media `File` in one batch and writes the results back.
+
+    Films and files are each loaded with a single column-only query. Every scored file gets its
+    ``confidence_score`` and ``confidence_score_report`` recorded; files whose match clears the threshold are
+    also linked through ``film_id`` and flagged with ``is_film``. Updates are written as bulk
+    primary-key UPDATEs in chunks of ``chunk_size``.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param matcher: The matcher to use. Defaults to :meth:`FilmMatcher.from_config`.
+    :type matcher: Optional[FilmMatcher]
+    :param relink: Also re-score files that are already linked to a film.
+    :type relink: bool
+    :param chunk_size: Number of files per bulk UPDATE statement.
+    :type chunk_size: int
+    :return: A summary with the number of files scanned, scored and linked.
+    :rtype: dict
+    """
+    session = session or db.session
+    matcher = matcher or FilmMatcher.from_config()
+
+    release_year = func.coalesce(Film.release_year, func.extract("year", Film.release_date))
+    matcher.index_films(session.execute(
+        select(Film.id, Film.title, Film.original_title, release_year, Film.runtime).where(Film.deleted_at.is_(None))
+    ))
+
+    file_query = select(File.id, File.file_title, File.file_year, File.size, File.file_bitrate).where(
+        File.is_subtitle.is_(False), File.deleted_at.is_(None)
+    )
+    if not relink:
+        file_query = file_query.where(File.film_id.is_(None))
+    file_rows = [
+        (file_id, title, year, estimate_runtime_minutes(size, bitrate))
+        for file_id, title, year, size, bitrate in session.execute(file_query)
+    ]
+
+    matches = matcher.match(file_rows)
+    updates = []
+    for match in matches:
+        values = {"id": match.file_id, "confidence_score": match.score, "confidence_score_report": match.report()}
+        if match.linked:
+            values.update(film_id=match.film_id, is_film=True)
+        updates.append(values)
+    for start in range(0, len(updates), chunk_size):
+        session.execute(update(File), updates[start:start + chunk_size])
+    session.commit()
+
+    return {
+        "scanned": len(file_rows),
+        "scored": len(matches),
+        "linked": sum(1 for match in matches if match.linked),
+    }
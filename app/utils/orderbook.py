@@ -0,0 +1,791 @@
+import heapq
+import logging
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Hashable, Iterable, Optional, Sequence
+
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.commerce import AmberToken, Fund, Listing, Order, Token
+from ..models.library import Asset, Portfolio, Wallet
+from ..models.orderbook import OrderBookEntry, OrderBookSnapshot
+from ..models.utils.config import OrderStatusEnum
+from .rates import PRICE_QUANTUM
+from .transfers import Transfer, TransferExecutor
+
+
+logger = logging.getLogger(__name__)
+
+BUY = "buy"
+SELL = "sell"
+SUBMIT = "submit"
+CANCEL = "cancel"
+REINSTATE = "reinstate"
+REMATCH = "rematch"
+
+
+class UnknownBook(LookupError):
+    """Raised when trading a token that is not listed on a market."""
+
+
+class BookContention(RuntimeError):
+    """Raised when other processes keep appending to a book's log first."""
+
+
+class BookOrder:
+    """
+    An order resting in a book. A plain class with slots, since a busy book holds and updates many of them.
+
+    :ivar id: Position of the operation that submitted the order in the book's log.
+    :type id: int
+    :ivar side: :data:`BUY` or :data:`SELL`.
+    :type side: str
+    :ivar price: Limit price, in ticks of :data:`~app.utils.rates.PRICE_QUANTUM`.
+    :type price: int
+    :ivar quantity: Quantity left; ``0`` once the order is filled or cancelled.
+    :type quantity: int
+    :ivar owner: Who placed the order, opaque to the book.
+    """
+    __slots__ = ("id", "side", "price", "quantity", "owner")
+
+    def __init__(self, order_id: int, side: str, price: int, quantity: int, owner: Hashable):
+        self.id = order_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.owner = owner
+
+
+@dataclass(frozen=True)
+class Fill:
+    """
+    A trade between an incoming order and an order resting in the book, at the resting order's price.
+
+    :ivar maker_id: The resting order.
+    :type maker_id: int
+    :ivar taker_id: The incoming order.
+    :type taker_id: int
+    :ivar price: Price per unit, in ticks.
+    :type price: int
+    :ivar quantity: Quantity traded.
+    :type quantity: int
+    :ivar buyer: Owner of the buying order.
+    :ivar seller: Owner of the selling order.
+    """
+    maker_id: int
+    taker_id: int
+    price: int
+    quantity: int
+    buyer: Hashable
+    seller: Hashable
+
+
+class OrderBook:
+    """
+    The limit orders of one token, matched by price, then time priority.
+
+    Each side keeps a queue of orders per price level and a heap of its levels, so the best level is found in
+    constant time and orders within it fill in the order they arrived. Cancelled orders are only marked and are
+    dropped once they reach the head of their queue, or when enough of them pile up.
+
+    Every operation takes the next position in the book's log, and an order's id is the position of the
+    operation that submitted it, so applying the same operations to the same snapshot always gives the same book,
+    ids and fills.
+
+    :ivar token_id: The token traded.
+    :ivar seq: Position of the last operation applied.
+    :type seq: int
+    :ivar orders: Resting orders by id.
+    :type orders: dict[int, BookOrder]
+    """
+
+    def __init__(self, token_id=None, seq: int = 0):
+        self.token_id = token_id
+        self.seq = seq
+        self.orders: dict[int, BookOrder] = {}
+        self._queues: dict[str, dict[int, deque]] = {BUY: {}, SELL: {}}
+        # Bids are kept as negative prices, so the top of both heaps is the best price.
+        self._levels: dict[str, list[int]] = {BUY: [], SELL: []}
+        self._cancelled = 0
+
+    def best(self, side: str) -> Optional[int]:
+        """
+        Returns the best price of a side, the highest bid or the lowest ask.
+
+        :param side: :data:`BUY` or :data:`SELL`.
+        :type side: str
+        :return: The price in ticks, or ``None`` if the side is empty.
+        :rtype: Optional[int]
+        """
+        levels, queues = self._levels[side], self._queues[side]
+        while levels:
+            price = -levels[0] if side == BUY else levels[0]
+            queue = queues[price]
+            while queue and not queue[0].quantity:
+                queue.popleft()
+                self._cancelled -= 1
+            if queue:
+                return price
+            heapq.heappop(levels)
+            del queues[price]
+        return None
+
+    def submit(self, side: str, price: int, quantity: int, owner: Hashable = None) -> tuple[int, list[Fill]]:
+        """
+        Matches a limit order against the other side and rests what is left of it.
+
+        :param side: :data:`BUY` or :data:`SELL`.
+        :type side: str
+        :param price: Limit price in ticks.
+        :type price: int
+        :param quantity: Quantity.
+        :type quantity: int
+        :param owner: Who places the order.
+        :return: The order's id and its fills, in the order they happened.
+        :rtype: tuple[int, list[Fill]]
+        :raises ValueError: If the side is unknown or the price or quantity is not a positive integer.
+        """
+        if side not in (BUY, SELL):
+            raise ValueError(f"Unknown side {side!r}")
+        if type(price) is not int or type(quantity) is not int or price <= 0 or quantity <= 0:
+            raise ValueError("Price and quantity must be positive integers")
+        self.seq += 1
+        order_id = self.seq
+        fills, quantity = self._match(order_id, side, price, quantity, owner)
+        if quantity:
+            self._rest(BookOrder(order_id, side, price, quantity, owner))
+        return order_id, fills
+
+    def cancel(self, order_id: int) -> bool:
+        """
+        Cancels a resting order.
+
+        :param order_id: The order.
+        :type order_id: int
+        :return: Whether the order was resting.
+        :rtype: bool
+        """
+        self.seq += 1
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+        order.quantity = 0
+        self._cancelled += 1
+        if self._cancelled > 1024 and self._cancelled > len(self.orders):
+            self._compact()
+        return True
+
+    def reinstate(self, order_id: int, side: str, price: int, quantity: int, owner: Hashable = None) -> None:
+        """
+        Gives a resting order back quantity it traded in a fill that did not settle. An order the fill took off
+        the book rests again in its place, ahead of the orders that arrived after it.
+
+        :param order_id: The order.
+        :type order_id: int
+        :param side: Its side.
+        :type side: str
+        :param price: Its price in ticks.
+        :type price: int
+        :param quantity: Quantity to give back.
+        :type quantity: int
+        :param owner: Its owner.
+        """
+        self.seq += 1
+        self._give_back(order_id, side, price, quantity, owner)
+
+    def rematch(self, order_id: int, side: str, price: int, quantity: int, owner: Hashable = None) -> list[Fill]:
+        """
+        Gives an incoming order back quantity it traded in a fill that did not settle, and matches that quantity
+        against the other side again, as :meth:`submit` would. What is left rests in the order's place.
+
+        :param order_id: The order.
+        :type order_id: int
+        :param side: Its side.
+        :type side: str
+        :param price: Its limit price in ticks.
+        :type price: int
+        :param quantity: Quantity to give back.
+        :type quantity: int
+        :param owner: Its owner.
+        :return: The new fills of the order.
+        :rtype: list[Fill]
+        """
+        self.seq += 1
+        fills, quantity = self._match(order_id, side, price, quantity, owner)
+        if quantity:
+            self._give_back(order_id, side, price, quantity, owner)
+        return fills
+
+    def apply(self, operation: Sequence):
+        """
+        Applies a logged operation: ``["submit", side, price, quantity, owner]``, ``["cancel", order_id]``,
+        ``["reinstate", order_id, side, price, quantity, owner]`` or ``["rematch", order_id, side, price,
+        quantity, owner]``.
+
+        :param operation: The operation.
+        :type operation: Sequence
+        :return: What :meth:`submit`, :meth:`cancel`, :meth:`reinstate` or :meth:`rematch` returns.
+        :raises ValueError: If the operation is unknown.
+        """
+        if operation[0] == SUBMIT:
+            _, side, price, quantity, owner = operation
+            return self.submit(side, price, quantity, tuple(owner) if isinstance(owner, list) else owner)
+        if operation[0] == CANCEL:
+            return self.cancel(operation[1])
+        if operation[0] in (REINSTATE, REMATCH):
+            _, order_id, side, price, quantity, owner = operation
+            method = self.reinstate if operation[0] == REINSTATE else self.rematch
+            return method(order_id, side, price, quantity, tuple(owner) if isinstance(owner, list) else owner)
+        raise ValueError(f"Unknown operation {operation[0]!r}")
+
+    def depth(self, side: str, levels: int = 10) -> list[tuple[int, int]]:
+        """
+        Returns the best price levels of a side with the quantity resting at each.
+
+        :param side: :data:`BUY` or :data:`SELL`.
+        :type side: str
+        :param levels: Number of levels.
+        :type levels: int
+        :return: ``(price, quantity)`` pairs, best first.
+        :rtype: list[tuple[int, int]]
+        """
+        queues = self._queues[side]
+        depth = []
+        for key in heapq.nsmallest(len(self._levels[side]), self._levels[side]):
+            price = -key if side == BUY else key
+            quantity = sum(order.quantity for order in queues[price])
+            if quantity:
+                depth.append((price, quantity))
+                if len(depth) == levels:
+                    break
+        return depth
+
+    def snapshot(self) -> dict:
+        """
+        Returns the resting orders in priority order, as JSON compatible data.
+
+        :return: The snapshot.
+        :rtype: dict
+        """
+        orders = []
+        for side in (BUY, SELL):
+            for price, _ in self.depth(side, levels=len(self._levels[side])):
+                orders.extend(
+                    [order.id, side, price, order.quantity, order.owner]
+                    for order in self._queues[side][price] if order.quantity
+                )
+        return {"seq": self.seq, "orders": orders}
+
+    @classmethod
+    def restore(cls, state: dict, operations: Iterable[Sequence] = (), token_id=None) -> "OrderBook":
+        """
+        Rebuilds a book from a snapshot and the operations logged after it.
+
+        :param state: What :meth:`snapshot` returned.
+        :type state: dict
+        :param operations: The operations, in log order.
+        :param token_id: The token traded.
+        :return: The book.
+        :rtype: OrderBook
+        """
+        book = cls(token_id, state["seq"])
+        for order_id, side, price, quantity, owner in state["orders"]:
+            book._rest(BookOrder(order_id, side, price, quantity, tuple(owner) if isinstance(owner, list) else owner))
+        for operation in operations:
+            book.apply(operation)
+        return book
+
+    def _match(self, order_id: int, side: str, price: int, quantity: int, owner: Hashable) -> tuple[list, int]:
+        fills = []
+        buying = side == BUY
+        other = SELL if buying else BUY
+        queues = self._queues[other]
+        while quantity:
+            level = self.best(other)
+            if level is None or (level > price if buying else level < price):
+                break
+            queue = queues[level]
+            while queue and quantity:
+                maker = queue[0]
+                if not maker.quantity:
+                    queue.popleft()
+                    self._cancelled -= 1
+                    continue
+                traded = maker.quantity if maker.quantity < quantity else quantity
+                fills.append(Fill(
+                    maker.id, order_id, level, traded,
+                    owner if buying else maker.owner, maker.owner if buying else owner,
+                ))
+                maker.quantity -= traded
+                quantity -= traded
+                if not maker.quantity:
+                    queue.popleft()
+                    del self.orders[maker.id]
+        return fills, quantity
+
+    def _give_back(self, order_id: int, side: str, price: int, quantity: int, owner: Hashable) -> None:
+        order = self.orders.get(order_id)
+        if order is not None:
+            order.quantity += quantity
+            return
+        order = BookOrder(order_id, side, price, quantity, owner)
+        queue = self._queues[side].get(price)
+        if queue is None:
+            self._rest(order)
+            return
+        self.orders[order_id] = order
+        queue.insert(next((i for i, resting in enumerate(queue) if resting.id > order_id), len(queue)), order)
+
+    def _rest(self, order: BookOrder) -> None:
+        self.orders[order.id] = order
+        queues = self._queues[order.side]
+        queue = queues.get(order.price)
+        if queue is None:
+            queue = queues[order.price] = deque()
+            heapq.heappush(self._levels[order.side], -order.price if order.side == BUY else order.price)
+        queue.append(order)
+
+    def _compact(self) -> None:
+        for side in (BUY, SELL):
+            queues = self._queues[side]
+            for price in list(queues):
+                queues[price] = deque(order for order in queues[price] if order.quantity)
+                if not queues[price]:
+                    del queues[price]
+            self._levels[side] = [-price if side == BUY else price for price in queues]
+            heapq.heapify(self._levels[side])
+        self._cancelled = 0
+
+
+def to_ticks(price) -> int:
+    """
+    Converts a price to ticks of :data:`~app.utils.rates.PRICE_QUANTUM`.
+
+    :param price: The price.
+    :return: The number of ticks.
+    :rtype: int
+    :raises ValueError: If the price is not a whole number of ticks.
+    """
+    ticks = Decimal(str(price)) / PRICE_QUANTUM
+    if ticks != ticks.to_integral_value():
+        raise ValueError(f"{price} is not a multiple of {PRICE_QUANTUM}")
+    return int(ticks)
+
+
+def from_ticks(ticks: int) -> Decimal:
+    return ticks * PRICE_QUANTUM
+
+
+@dataclass(frozen=True)
+class Trader:
+    """
+    Who places an order, and the funds their trades settle through.
+
+    :ivar portfolio_id: The trading portfolio.
+    :type portfolio_id: uuid.UUID
+    :ivar fund_id: The AmberToken fund paying for purchases and receiving the proceeds of sales.
+    :type fund_id: uuid.UUID
+    :ivar token_fund_id: The fund holding the traded token.
+    :type token_fund_id: uuid.UUID
+    """
+    portfolio_id: uuid.UUID
+    fund_id: uuid.UUID
+    token_fund_id: uuid.UUID
+
+    def to_owner(self) -> tuple:
+        return str(self.portfolio_id), str(self.fund_id), str(self.token_fund_id)
+
+    @classmethod
+    def from_owner(cls, owner: Sequence) -> "Trader":
+        return cls(*(uuid.UUID(value) for value in owner))
+
+
+@dataclass(frozen=True)
+class BookMarket:
+    """
+    Where the trades of a token's book are recorded.
+
+    :ivar listing_id: The listing of the token's asset that orders are recorded against.
+    :type listing_id: uuid.UUID
+    :ivar token_ledger_id: The ledger of the traded token.
+    :type token_ledger_id: uuid.UUID
+    :ivar quote_token_id: The AmberToken prices are paid in.
+    :type quote_token_id: uuid.UUID
+    :ivar quote_ledger_id: Its ledger.
+    :type quote_ledger_id: uuid.UUID
+    """
+    listing_id: uuid.UUID
+    token_ledger_id: uuid.UUID
+    quote_token_id: uuid.UUID
+    quote_ledger_id: uuid.UUID
+
+
+_books: dict = {}
+_markets: dict = {}
+_locks: dict = {}
+_registry_lock = threading.Lock()
+
+
+def book_market(token_id, session=None) -> BookMarket:
+    """
+    Returns where a token's trades are recorded, cached per process.
+
+    :param token_id: The traded token.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The market.
+    :rtype: BookMarket
+    :raises UnknownBook: If the token has no listed asset.
+    """
+    market = _markets.get(token_id)
+    if market is None:
+        session = session or db.session
+        listed = session.execute(
+            sa.select(Listing.id, Token.ledger_id)
+            .join(Asset, Asset.merchandise_id == Listing.merchandise_id)
+            .join(Token, Token.id == Asset.token_id)
+            .where(Asset.token_id == token_id, Listing.deleted_at.is_(None))
+            .order_by(Listing.created_at)
+            .limit(1)
+        ).first()
+        quote = session.execute(
+            sa.select(AmberToken.id, AmberToken.ledger_id).order_by(AmberToken.created_at).limit(1)
+        ).first()
+        if listed is None or quote is None:
+            raise UnknownBook(f"Token {token_id} is not listed")
+        market = _markets[token_id] = BookMarket(listed[0], listed[1], quote[0], quote[1])
+    return market
+
+
+def load_book(token_id, session=None) -> OrderBook:
+    """
+    Rebuilds a token's book from its latest snapshot and the operations logged after it.
+
+    :param token_id: The traded token.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The book.
+    :rtype: OrderBook
+    """
+    session = session or db.session
+    while True:
+        state = session.execute(
+            sa.select(OrderBookSnapshot.state).where(OrderBookSnapshot.token_id == token_id)
+            .order_by(OrderBookSnapshot.seq.desc()).limit(1)
+        ).scalar()
+        book = OrderBook.restore(state or {"seq": 0, "orders": []}, token_id=token_id)
+        if catch_up(book, session):
+            return book
+
+
+def catch_up(book: OrderBook, session=None) -> bool:
+    """
+    Applies the operations other processes logged since the book's position.
+
+    :param book: The book.
+    :type book: OrderBook
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Whether the book caught up, rather than finding the operations it missed pruned by a snapshot, in
+        which case it must be loaded again.
+    :rtype: bool
+    """
+    session = session or db.session
+    entries = session.execute(
+        sa.select(OrderBookEntry.seq, OrderBookEntry.operation)
+        .where(OrderBookEntry.token_id == book.token_id, OrderBookEntry.seq > book.seq)
+        .order_by(OrderBookEntry.seq)
+    ).all()
+    if entries and entries[0].seq != book.seq + 1:
+        return False
+    if not entries and session.scalar(sa.select(OrderBookSnapshot.seq).where(
+        OrderBookSnapshot.token_id == book.token_id, OrderBookSnapshot.seq > book.seq,
+    ).limit(1)) is not None:
+        return False
+    for _, operation in entries:
+        book.apply(operation)
+    return True
+
+
+def log_operations(token_id, first_seq: int, operations: Sequence[Sequence], session=None) -> None:
+    """
+    Appends operations to a book's log. The caller commits.
+
+    :param token_id: The traded token.
+    :param first_seq: Position of the first operation.
+    :type first_seq: int
+    :param operations: The operations, in the order they were applied.
+    :param session: The session to use. Defaults to ``db.session``.
+    :raises IntegrityError: If another process logged operations at these positions first.
+    """
+    session = session or db.session
+    if operations:
+        session.execute(sa.insert(OrderBookEntry), [
+            {"token_id": token_id, "seq": first_seq + i, "operation": list(operation)}
+            for i, operation in enumerate(operations)
+        ])
+
+
+def snapshot_book(book: OrderBook, session=None) -> None:
+    """
+    Stores a snapshot of a book and prunes the log and the snapshots it replaces. The caller commits.
+
+    :param book: The book.
+    :type book: OrderBook
+    :param session: The session to use. Defaults to ``db.session``.
+    """
+    session = session or db.session
+    session.add(OrderBookSnapshot(token_id=book.token_id, seq=book.seq, state=book.snapshot()))
+    session.execute(sa.delete(OrderBookEntry).where(
+        OrderBookEntry.token_id == book.token_id, OrderBookEntry.seq <= book.seq,
+    ))
+    session.execute(sa.delete(OrderBookSnapshot).where(
+        OrderBookSnapshot.token_id == book.token_id, OrderBookSnapshot.seq < book.seq,
+    ))
+    session.flush()
+
+
+def settle(fills: Sequence[Fill], market: BookMarket, session=None) -> tuple[list[Order], set]:
+    """
+    Records a batch of fills as orders and books them: the payments from buyers to sellers in one batch of
+    transfers, then the delivery of the tokens for the payments that went through. A delivery the seller cannot
+    make is refunded. The caller commits.
+
+    :param fills: The fills.
+    :type fills: Sequence[Fill]
+    :param market: Where the book's trades are recorded.
+    :type market: BookMarket
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: One order per fill, completed or cancelled, and the owners whose funds could not cover their side.
+    :rtype: tuple[list[Order], set]
+    """
+    session = session or db.session
+    executor = TransferExecutor(session)
+    trades = [(fill, Trader.from_owner(fill.buyer), Trader.from_owner(fill.seller)) for fill in fills]
+    amounts = [from_ticks(fill.price) * fill.quantity for fill in fills]
+    paid = executor.apply([
+        Transfer(market.quote_ledger_id, buyer.fund_id, seller.fund_id, amount)
+        for (_, buyer, seller), amount in zip(trades, amounts)
+    ])
+    settled = [i for i, result in enumerate(paid) if result.applied]
+    delivered = dict(zip(settled, executor.apply([
+        Transfer(market.token_ledger_id, trades[i][2].token_fund_id, trades[i][1].token_fund_id,
+                 Decimal(trades[i][0].quantity))
+        for i in settled
+    ])))
+    refunds = [i for i, result in delivered.items() if not result.applied]
+    executor.apply([
+        Transfer(market.quote_ledger_id, trades[i][2].fund_id, trades[i][1].fund_id, amounts[i]) for i in refunds
+    ])
+
+    libraries = dict(session.execute(
+        sa.select(Portfolio.id, Portfolio.library_id)
+        .where(Portfolio.id.in_({buyer.portfolio_id for _, buyer, _ in trades}))
+    ).all())
+    orders, defaulted = [], set()
+    for i, (fill, buyer, seller) in enumerate(trades):
+        completed = i in delivered and delivered[i].applied
+        if not paid[i].applied:
+            defaulted.add(fill.buyer)
+        elif not completed:
+            defaulted.add(fill.seller)
+        orders.append(Order(
+            buyer_portfolio_id=buyer.portfolio_id, listing_id=market.listing_id, fund_id=buyer.fund_id,
+            quantity=fill.quantity, total_price=amounts[i], created_by=libraries.get(buyer.portfolio_id),
+            status=OrderStatusEnum.COMPLETED if completed else OrderStatusEnum.CANCELLED,
+        ))
+    session.add_all(orders)
+    session.flush()
+    return orders, defaulted
+
+
+def _lock(token_id) -> threading.Lock:
+    with _registry_lock:
+        return _locks.setdefault(token_id, threading.Lock())
+
+
+def _caught_up(token_id, session) -> OrderBook:
+    # The caller holds the token's lock.
+    book = _books.pop(token_id, None)
+    if book is None or not catch_up(book, session):
+        book = load_book(token_id, session)
+    _books[token_id] = book
+    return book
+
+
+def trade(token_id, operations: Sequence[Sequence], session=None, snapshot_interval: Optional[int] = None,
+          retries: int = 3) -> tuple[list, list[Order]]:
+    """
+    Applies operations to a token's book in this process and makes them durable in one transaction: the book
+    catches up with operations other processes logged, the operations are matched, their fills are settled,
+    resting orders of owners who could not settle are cancelled, and everything applied is appended to the log.
+    The other side of a fill that did not settle gets its quantity back: a resting order rests with it again and
+    an incoming order matches it again, until its new fills settle or it rests.
+
+    The log is the book's source of truth. If another process logs an operation first, the positions collide,
+    the transaction rolls back and the operations are retried on a book rebuilt from the log.
+
+    :param token_id: The traded token.
+    :param operations: The operations, see :meth:`OrderBook.apply`.
+    :type operations: Sequence[Sequence]
+    :param session: The session to use. Defaults to ``db.session``. It is committed.
+    :param snapshot_interval: Operations between snapshots. Defaults to ``ORDER_BOOK_SNAPSHOT_INTERVAL``.
+    :type snapshot_interval: Optional[int]
+    :param retries: Attempts before giving up on contention.
+    :type retries: int
+    :return: The result of each operation, with the fills of submitted orders including those of rematches, and
+        the orders recording these fills.
+    :rtype: tuple[list, list[Order]]
+    :raises UnknownBook: If the token is not listed.
+    :raises BookContention: If other processes logged operations first on every attempt.
+    :raises ValueError: If an operation is malformed; nothing is applied.
+    """
+    session = session or db.session
+    if snapshot_interval is None:
+        snapshot_interval = current_app.config.get("ORDER_BOOK_SNAPSHOT_INTERVAL", 10000)
+    market = book_market(token_id, session)
+    with _lock(token_id):
+        for _ in range(retries):
+            book = _books.pop(token_id, None)
+            try:
+                if book is None or not catch_up(book, session):
+                    book = load_book(token_id, session)
+                start, applied, results, incoming, pending = book.seq, [], [], {}, []
+                for operation in operations:
+                    result = book.apply(operation)
+                    applied.append(operation)
+                    results.append(result)
+                    if operation[0] == SUBMIT:
+                        incoming[result[0]] = (operation, result[1])
+                        pending.extend(result[1])
+                recorded, defaulted = {}, set()
+                while pending:
+                    orders, newly_defaulted = settle(pending, market, session)
+                    recorded.update(zip(map(id, pending), orders))
+                    defaulted |= newly_defaulted
+                    for order in [order for order in book.orders.values() if order.owner in defaulted]:
+                        book.cancel(order.id)
+                        applied.append([CANCEL, order.id])
+                    withdrawn = {operation[1] for operation in applied if operation[0] == CANCEL}
+                    given_back = {}
+                    for fill, order in zip(pending, orders):
+                        if order.status == OrderStatusEnum.COMPLETED:
+                            continue
+                        side = incoming[fill.taker_id][0][1]
+                        maker, taker = (fill.seller, fill.buyer) if side == BUY else (fill.buyer, fill.seller)
+                        if not (maker in defaulted or fill.maker_id in withdrawn):
+                            operation = [REINSTATE, fill.maker_id, SELL if side == BUY else BUY, fill.price,
+                                         fill.quantity, maker]
+                            book.apply(operation)
+                            applied.append(operation)
+                        if not (taker in defaulted or fill.taker_id in withdrawn):
+                            given_back[fill.taker_id] = given_back.get(fill.taker_id, 0) + fill.quantity
+                    # Every round defaults someone new, whose orders leave the book, so the rematches run out.
+                    pending = []
+                    for order_id in sorted(given_back):
+                        submitted, taker_fills = incoming[order_id]
+                        operation = [REMATCH, order_id, *submitted[1:3], given_back[order_id], submitted[4]]
+                        fills = book.apply(operation)
+                        applied.append(operation)
+                        taker_fills.extend(fills)
+                        pending.extend(fills)
+                orders = [recorded[id(fill)] for _, fills in incoming.values() for fill in fills]
+                log_operations(token_id, start + 1, applied, session)
+                if book.seq // snapshot_interval > start // snapshot_interval:
+                    snapshot_book(book, session)
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                logger.info("Order book of %s moved on in another process, retrying", token_id)
+                continue
+            except BaseException:
+                session.rollback()
+                raise
+            _books[token_id] = book
+            return results, orders
+    raise BookContention(f"Could not append to the order book of {token_id}")
+
+
+def submit_order(token_id, trader: Trader, side: str, price, quantity: int,
+                 session=None) -> tuple[int, list[Fill], list[Order], int]:
+    """
+    Places a limit order of a portfolio on a token's book, see :func:`trade`.
+
+    :param token_id: The traded token.
+    :param trader: Who places the order.
+    :type trader: Trader
+    :param side: :data:`BUY` or :data:`SELL`.
+    :type side: str
+    :param price: Limit price per unit, in AmberTokens.
+    :param quantity: Quantity.
+    :type quantity: int
+    :param session: The session to use. Defaults to ``db.session``. It is committed.
+    :return: The order's id, its fills, the orders recording them and the quantity left resting on the book.
+        Fills that did not settle leave the quantity to rest, unless the portfolio could not cover its side.
+    :rtype: tuple[int, list[Fill], list[Order], int]
+    :raises UnknownBook: If the token is not listed.
+    :raises ValueError: If the order is malformed or the funds are not the portfolio's funds of the token and
+        of AmberTokens.
+    """
+    session = session or db.session
+    market = book_market(token_id, session)
+    tokens = dict(session.execute(
+        sa.select(Fund.id, Fund.token_id)
+        .join(Wallet, Wallet.id == Fund.wallet_id)
+        .join(Portfolio, Portfolio.library_id == Wallet.library_id)
+        .where(Portfolio.id == trader.portfolio_id, Fund.id.in_((trader.fund_id, trader.token_fund_id)))
+    ).all())
+    if tokens.get(trader.fund_id) != market.quote_token_id or tokens.get(trader.token_fund_id) != token_id:
+        raise ValueError("The funds must be the portfolio's funds of AmberTokens and of the traded token")
+    (result,), orders = trade(token_id, [[SUBMIT, side, to_ticks(price), quantity, trader.to_owner()]], session)
+    order_id, fills = result
+    with _lock(token_id):
+        resting = _caught_up(token_id, session).orders.get(order_id)
+    return order_id, fills, orders, resting.quantity if resting is not None else 0
+
+
+def cancel_order(token_id, order_id: int, portfolio_id: uuid.UUID, session=None) -> bool:
+    """
+    Cancels a resting order of a portfolio, see :func:`trade`.
+
+    :param token_id: The traded token.
+    :param order_id: The order.
+    :type order_id: int
+    :param portfolio_id: The portfolio cancelling it.
+    :type portfolio_id: uuid.UUID
+    :param session: The session to use. Defaults to ``db.session``. It is committed.
+    :return: Whether the order was resting and placed by the portfolio.
+    :rtype: bool
+    """
+    session = session or db.session
+    # An order's owner never changes and its id is never reused, so checking a copy of the book is enough.
+    with _lock(token_id):
+        order = _caught_up(token_id, session).orders.get(order_id)
+    if order is None or Trader.from_owner(order.owner).portfolio_id != portfolio_id:
+        return False
+    (cancelled,), _ = trade(token_id, [[CANCEL, order_id]], session)
+    return cancelled
+
+
+def book_depth(token_id, levels: int = 10, session=None) -> dict:
+    """
+    Returns the best price levels of both sides of a token's book, caught up with the log.
+
+    :param token_id: The traded token.
+    :param levels: Levels per side.
+    :type levels: int
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: ``{"seq": ..., "bids": [(price, quantity), ...], "asks": [...]}`` with prices in AmberTokens.
+    :rtype: dict
+    """
+    session = session or db.session
+    with _lock(token_id):
+        book = _caught_up(token_id, session)
+        return {
+            "seq": book.seq,
+            "bids": [(from_ticks(price), quantity) for price, quantity in book.depth(BUY, levels)],
+            "asks": [(from_ticks(price), quantity) for price, quantity in book.depth(SELL, levels)],
+        }
@@ -0,0 +1,161 @@
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy as sa
+
+from ..extensions import db
+from ..models.commerce import AmberToken, Listing, Order, Fund, Token
+from ..models.library import Merchandise, Shop, Wallet, Portfolio
+from ..models.inventory import InventoryReservation
+from ..models.utils.config import OrderStatusEnum
+from .idempotency import RequestRejected, StoredResponse, run_idempotent
+from .inventory import ReservationUnavailable, SoldOut, confirm_reservation, take_stock
+from .ledger import to_amount
+from .pricing import effective_prices
+from .transfers import Transfer, TransferExecutor
+
+
+@dataclass(frozen=True)
+class OrderRequest:
+    """
+    A buyer's request to purchase a listing.
+
+    :ivar buyer_portfolio_id: The buying portfolio.
+    :type buyer_portfolio_id: uuid.UUID
+    :ivar listing_id: The listing bought.
+    :type listing_id: uuid.UUID
+    :ivar fund_id: The buyer's fund paying for the order.
+    :type fund_id: uuid.UUID
+    :ivar quantity: Number of items bought.
+    :type quantity: int
+    :ivar reservation_id: A reservation of the items to confirm, instead of taking them from stock.
+    :type reservation_id: Optional[uuid.UUID]
+    """
+    buyer_portfolio_id: uuid.UUID
+    listing_id: uuid.UUID
+    fund_id: uuid.UUID
+    quantity: int = 1
+    reservation_id: Optional[uuid.UUID] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "OrderRequest":
+        """
+        Reads a request from a JSON body.
+
+        :raises KeyError: If a field is missing.
+        :raises ValueError: If a field is malformed.
+        """
+        return cls(
+            uuid.UUID(data["buyer_portfolio_id"]), uuid.UUID(data["listing_id"]), uuid.UUID(data["fund_id"]),
+            int(data.get("quantity", 1)), uuid.UUID(data["reservation_id"]) if data.get("reservation_id") else None,
+        )
+
+    def to_payload(self) -> dict:
+        return {
+            "buyer_portfolio_id": str(self.buyer_portfolio_id), "listing_id": str(self.listing_id),
+            "fund_id": str(self.fund_id), "quantity": self.quantity,
+            "reservation_id": str(self.reservation_id) if self.reservation_id else None,
+        }
+
+
+def _rejected(status: int, error: str) -> RequestRejected:
+    return RequestRejected(status, {"error": error})
+
+
+def _place(request: OrderRequest, session) -> tuple[int, dict]:
+    if request.quantity < 1:
+        raise _rejected(422, "Quantity must be positive")
+    listing = session.get(Listing, request.listing_id)
+    if listing is None or listing.deleted_at is not None:
+        raise _rejected(404, "Unknown listing")
+    # The fund must be in the wallet of the buyer's library, like the funds of book orders.
+    owned = session.execute(
+        sa.select(Fund, Portfolio.library_id)
+        .join(Wallet, Wallet.id == Fund.wallet_id)
+        .join(Portfolio, Portfolio.library_id == Wallet.library_id)
+        .where(Portfolio.id == request.buyer_portfolio_id, Fund.id == request.fund_id, Fund.deleted_at.is_(None))
+    ).first()
+    if owned is None:
+        raise _rejected(404, "Unknown buyer or fund")
+    fund, library_id = owned
+    # Listing prices are in AmberTokens, see the market listings route.
+    if session.scalar(sa.select(AmberToken.id).where(AmberToken.id == fund.token_id)) is None:
+        raise _rejected(422, "Orders are paid from a fund of AmberTokens")
+    seller_fund_id = session.scalar(
+        sa.select(Fund.id)
+        .join(Wallet, Wallet.id == Fund.wallet_id)
+        .join(Shop, Shop.library_id == Wallet.library_id)
+        .join(Merchandise, Merchandise.shop_id == Shop.id)
+        .where(Merchandise.id == listing.merchandise_id, Fund.token_id == fund.token_id)
+    )
+    if seller_fund_id is None:
+        raise _rejected(422, "The seller does not accept this token")
+
+    if request.reservation_id is not None:
+        reservation = session.get(InventoryReservation, request.reservation_id)
+        held = None if reservation is None else \
+            (reservation.kind, reservation.item_id, reservation.quantity, reservation.holder)
+        if held != ("merchandise", listing.merchandise_id, request.quantity, str(request.buyer_portfolio_id)):
+            raise _rejected(422, "The reservation does not match the order")
+        try:
+            confirm_reservation(reservation.id, session)
+        except ReservationUnavailable:
+            raise _rejected(409, "The reservation expired")
+    else:
+        try:
+            take_stock("merchandise", listing.merchandise_id, request.quantity, session)
+        except SoldOut:
+            raise _rejected(409, "Sold out")
+
+    # Charged at the discounted price the market listings show, as of the time the order is recorded.
+    at = datetime.now()
+    price = effective_prices([listing], at)[listing.id]
+    total = to_amount(price.effective) * request.quantity
+    order = Order(
+        buyer_portfolio_id=request.buyer_portfolio_id, listing_id=listing.id, fund_id=fund.id,
+        quantity=request.quantity, total_price=total, status=OrderStatusEnum.COMPLETED, created_by=library_id,
+        created_at=at,
+    )
+    session.add(order)
+    session.flush()
+    ledger_id = session.scalar(sa.select(Token.ledger_id).where(Token.id == fund.token_id))
+    result, = TransferExecutor(session).apply([Transfer(ledger_id, fund.id, seller_fund_id, total)])
+    if not result.applied:
+        raise _rejected(409, result.error)
+    return 201, {
+        "order": {
+            "id": str(order.id), "listing_id": str(listing.id), "fund_id": str(fund.id),
+            "quantity": order.quantity, "price": str(price.price), "discount": str(price.percentage),
+            "effective_price": str(price.effective), "total_price": str(total), "status": order.status.value,
+        },
+        "entry_id": str(result.entry_id),
+    }
+
+
+def place_order(request: OrderRequest, idempotency_key: str, session=None) -> StoredResponse:
+    """
+    Places an order at most once per idempotency key of the buyer, see :func:`~app.utils.idempotency.run_idempotent`.
+
+    Placing an order takes the items from the merchandise's inventory, or confirms the buyer's reservation of
+    them, see :mod:`app.utils.inventory`, records the order and books the payment of the listing's discounted
+    price, see :func:`~app.utils.pricing.effective_prices`, in AmberTokens from the buyer's AmberToken fund to
+    the seller's, all in one transaction. A retry with the same key is answered with the stored response without
+    touching the inventory or the funds again; refusals, such as for lack of stock or funds, are stored and
+    replayed alike.
+
+    :param request: The order.
+    :type request: OrderRequest
+    :param idempotency_key: The key the client sent.
+    :type idempotency_key: str
+    :param session: The session to use. Defaults to ``db.session``. It is committed.
+    :return: The response, with status 201 for a placed order.
+    :rtype: StoredResponse
+    :raises ~app.utils.idempotency.IdempotencyError: If the key is invalid, reused or in use.
+    """
+    session = session or db.session
+    return run_idempotent(
+        f"orders:{request.buyer_portfolio_id}", idempotency_key, request.to_payload(),
+        lambda: _place(request, session), session,
+    )
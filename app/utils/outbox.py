@@ -0,0 +1,383 @@
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Callable, Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models.events import OutboxEvent, OutboxCursor, EVENT_DELETE, EVENT_INSERT, EVENT_UPDATE
+from ..models.library import Film, Person, WatchHistory
+from ..models.scrolls import Scroll, ScrollEntry
+from ..models.common import Genre, Tag
+from ..models.commerce import Conversion, Currency, Discount, Fund, Order, Transaction
+from ..models.mixins import ContributionMixin
+
+
+logger = logging.getLogger(__name__)
+outbox_cli = AppGroup("outbox", help="Relay and prune the change event outbox.")
+_installed = False
+
+#: Models whose changes are written to the outbox, with the fields every event of the model carries. Changes
+#: to subclasses are reported under the subclass' table.
+TRACKED_MODELS: dict[type, tuple] = {
+    Film: ("title", "release_year", "imdb_rating", "popularity_score", "available_locally", "created_by"),
+    Person: ("first_name", "last_name", "full_name", "created_by"),
+    Scroll: ("reviewer_id", "is_aggregate", "created_by"),
+    ScrollEntry: ("scroll_id", "item_id", "rank", "created_by"),
+    WatchHistory: ("library_id", "film_id", "watch_count", "last_watched"),
+    Fund: ("wallet_id", "token_id", "balance"),
+    Transaction: ("from_fund_id", "to_fund_id", "amount", "status", "type"),
+    Order: ("buyer_portfolio_id", "listing_id", "fund_id", "quantity", "total_price", "status"),
+    Genre: ("created_by",),
+    Tag: ("created_by",),
+    Currency: ("code", "exchange_rate_to_usd", "exchange_rate_to_ambertokens"),
+    Conversion: ("from_token_id", "to_token_id", "rate"),
+    Discount: ("merchandise_id", "percentage", "start_time", "end_time"),
+    # Every other contribution, for the rewards of :mod:`app.utils.rewards`.
+    ContributionMixin: ("created_by",),
+}
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    An outbox event as delivered to subscribers.
+
+    :ivar id: Position of the event in the stream.
+    :type id: int
+    :ivar created_at: When the change was flushed.
+    :type created_at: datetime
+    :ivar entity: Table name of the changed model.
+    :type entity: str
+    :ivar entity_id: Primary key of the changed row.
+    :type entity_id: str
+    :ivar operation: ``insert``, ``update`` or ``delete``.
+    :type operation: str
+    :ivar data: Tracked fields after the change, and the names of changed columns under ``"changed"``.
+    :type data: dict
+    """
+    id: int
+    created_at: datetime
+    entity: str
+    entity_id: str
+    operation: str
+    data: dict
+
+
+@dataclass(frozen=True)
+class Subscriber:
+    """
+    An in-process consumer of the outbox.
+
+    :ivar name: Unique name, also the key of the subscriber's cursor.
+    :type name: str
+    :ivar handler: Called with a list of events in stream order. Raising leaves the batch unacknowledged, so it
+        is delivered again.
+    :type handler: Callable[[list[ChangeEvent]], None]
+    :ivar entities: Table names the subscriber wants; all when ``None``.
+    :type entities: Optional[frozenset[str]]
+    """
+    name: str
+    handler: Callable
+    entities: Optional[frozenset] = None
+
+
+SUBSCRIBERS: dict[str, Subscriber] = {}
+
+
+def outbox_subscriber(name: str, entities: Optional[Iterable[str]] = None):
+    """
+    Registers a function as an outbox subscriber.
+
+    :param name: Unique name of the subscriber.
+    :type name: str
+    :param entities: Table names to receive events for; all when ``None``.
+    :return: The decorator.
+    """
+    def decorator(handler: Callable) -> Callable:
+        SUBSCRIBERS[name] = Subscriber(name, handler, frozenset(entities) if entities else None)
+        return handler
+    return decorator
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value if isinstance(value.value, (str, int)) else value.name
+    return str(value)
+
+
+def _entity_id(instance) -> str:
+    identity = sa.inspect(instance).identity or ()
+    value = getattr(instance, "id", None)
+    if value is None:
+        value = ",".join(str(part) for part in identity)
+    return str(value)
+
+
+def install_outbox(session_class=Session, tracked: Optional[dict[type, tuple]] = None) -> None:
+    """
+    Records changes to tracked models as outbox events in the flushing transaction. Events are only published
+    if that transaction commits, so subscribers never see changes that were rolled back and no change can be
+    saved without its event.
+
+    Bulk statements such as ``session.execute(update(Model), ...)`` bypass the unit of work and are not
+    recorded.
+
+    :param session_class: The session class to hook, all sessions by default.
+    :param tracked: Models mapped to the fields their events carry. Defaults to :data:`TRACKED_MODELS`.
+    :type tracked: Optional[dict[type, tuple]]
+    """
+    tracked = TRACKED_MODELS if tracked is None else tracked
+    resolved: dict[type, Optional[tuple]] = {}
+
+    def fields_of(cls: type) -> Optional[tuple]:
+        if cls not in resolved:
+            resolved[cls] = next((tracked[base] for base in cls.__mro__ if base in tracked), None)
+        return resolved[cls]
+
+    def build(instance, operation: str, fields: tuple, changed: Optional[list] = None) -> dict:
+        data = {name: _jsonable(getattr(instance, name, None)) for name in fields}
+        if changed is not None:
+            data["changed"] = changed
+        return {
+            "created_at": datetime.now(),
+            "entity": instance.__table__.name,
+            "entity_id": _entity_id(instance),
+            "operation": operation,
+            "data": data,
+        }
+
+    @event.listens_for(session_class, "after_flush")
+    def _write_outbox_events(session, flush_context) -> None:
+        rows = []
+        for instance in session.new:
+            fields = fields_of(type(instance))
+            if fields is not None:
+                rows.append(build(instance, EVENT_INSERT, fields))
+        for instance in session.dirty:
+            fields = fields_of(type(instance))
+            if fields is None:
+                continue
+            state = sa.inspect(instance)
+            changed = [
+                attribute.key for attribute in state.mapper.column_attrs
+                if state.attrs[attribute.key].history.has_changes()
+            ]
+            if not changed:
+                continue
+            deleted = "deleted_at" in changed and getattr(instance, "deleted_at", None) is not None
+            rows.append(build(instance, EVENT_DELETE if deleted else EVENT_UPDATE, fields, changed))
+        for instance in session.deleted:
+            fields = fields_of(type(instance))
+            if fields is not None:
+                rows.append(build(instance, EVENT_DELETE, fields))
+        if rows:
+            connection = session.connection(bind_arguments={"mapper": OutboxEvent.__mapper__})
+            connection.execute(OutboxEvent.__table__.insert(), rows)
+
+
+class OutboxRelay:
+    """
+    Publishes outbox events to the registered subscribers in stream order, with at-least-once delivery.
+
+    Each subscriber has its own cursor and receives events in batches; the cursor advances once per batch,
+    after the subscriber returned, so a failing subscriber sees the batch again and does not hold back the
+    others. Subscribers therefore have to tolerate duplicates.
+
+    Ids are handed out when events are inserted but become visible on commit, so a lower id may appear after a
+    higher one. A batch stops at the first missing id until it shows up or ``gap_timeout`` seconds pass, after
+    which it is taken to belong to a rolled back transaction.
+
+    :ivar batch_size: Maximum events per delivery.
+    :type batch_size: int
+    :ivar gap_timeout: Seconds to wait for a missing id.
+    :type gap_timeout: float
+    """
+
+    def __init__(self, engine, subscribers: Optional[Iterable[Subscriber]] = None, batch_size: int = 500,
+                 gap_timeout: float = 10.0):
+        self.engine = engine
+        self.subscribers = list(SUBSCRIBERS.values() if subscribers is None else subscribers)
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self._gaps: dict[int, float] = {}
+
+    def position(self, name: str) -> int:
+        """
+        Returns a subscriber's position, starting new subscribers before the oldest retained event.
+
+        :param name: The subscriber name.
+        :type name: str
+        :return: Id of the last acknowledged event.
+        :rtype: int
+        """
+        cursors, events = OutboxCursor.__table__, OutboxEvent.__table__
+        with self.engine.begin() as conn:
+            position = conn.scalar(sa.select(cursors.c.position).where(cursors.c.subscriber == name))
+            if position is None:
+                position = (conn.scalar(sa.select(sa.func.min(events.c.id))) or 1) - 1
+                conn.execute(cursors.insert().values(subscriber=name, position=position, updated_at=datetime.now()))
+        return position
+
+    def fetch(self, after: int) -> list[ChangeEvent]:
+        """
+        Reads the next contiguous run of events after a position.
+
+        :param after: The position to read after.
+        :type after: int
+        :return: Up to ``batch_size`` events.
+        :rtype: list[ChangeEvent]
+        """
+        events = OutboxEvent.__table__
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                sa.select(events).where(events.c.id > after).order_by(events.c.id).limit(self.batch_size)
+            ).mappings().all()
+        batch, expected, now = [], after + 1, time.monotonic()
+        for row in rows:
+            if row["id"] != expected and now - self._gaps.setdefault(expected, now) < self.gap_timeout:
+                break
+            self._gaps.pop(expected, None)
+            batch.append(ChangeEvent(**row))
+            expected = row["id"] + 1
+        return batch
+
+    def acknowledge(self, name: str, position: int) -> None:
+        cursors = OutboxCursor.__table__
+        with self.engine.begin() as conn:
+            conn.execute(
+                cursors.update().where(cursors.c.subscriber == name, cursors.c.position < position)
+                .values(position=position, updated_at=datetime.now())
+            )
+
+    def deliver(self, subscriber: Subscriber) -> int:
+        """
+        Delivers the next batch to one subscriber and acknowledges it.
+
+        :param subscriber: The subscriber.
+        :type subscriber: Subscriber
+        :return: The number of events the cursor moved past.
+        :rtype: int
+        """
+        events = self.fetch(self.position(subscriber.name))
+        if not events:
+            return 0
+        wanted = [e for e in events if subscriber.entities is None or e.entity in subscriber.entities]
+        if wanted:
+            subscriber.handler(wanted)
+        self.acknowledge(subscriber.name, events[-1].id)
+        return len(events)
+
+    def run_once(self) -> dict[str, int]:
+        """
+        Brings every subscriber up to date. A subscriber that raises is logged and retried on the next run.
+
+        :return: The number of events each subscriber moved past.
+        :rtype: dict[str, int]
+        """
+        delivered = {}
+        for subscriber in self.subscribers:
+            total = 0
+            try:
+                while (count := self.deliver(subscriber)) > 0:
+                    total += count
+                    if count < self.batch_size:
+                        break
+            except Exception:
+                logger.exception("Outbox subscriber %s failed", subscriber.name)
+            delivered[subscriber.name] = total
+        return delivered
+
+    def run(self, stop: threading.Event, poll_interval: float = 0.5) -> None:
+        """
+        Relays events until ``stop`` is set, polling every ``poll_interval`` seconds while idle.
+
+        :param stop: Event that ends the loop.
+        :type stop: threading.Event
+        :param poll_interval: Seconds between polls of an idle outbox.
+        :type poll_interval: float
+        """
+        while not stop.is_set():
+            if not any(self.run_once().values()):
+                stop.wait(poll_interval)
+
+
+def prune_outbox(engine=None, retention_days: Optional[int] = None) -> int:
+    """
+    Deletes events that every subscriber has acknowledged and that are older than the retention period. Readers
+    of the outbox other than the relay's subscribers, such as the contribution rewards, see
+    :func:`~app.utils.rewards.accrue_rewards`, hold back pruning with a cursor of their own.
+
+    :param engine: The engine to use. Defaults to ``db.engine``.
+    :param retention_days: Days events are kept. Defaults to ``OUTBOX_RETENTION_DAYS``.
+    :type retention_days: Optional[int]
+    :return: The number of deleted events.
+    :rtype: int
+    """
+    engine = engine or db.engine
+    if retention_days is None:
+        retention_days = current_app.config.get("OUTBOX_RETENTION_DAYS", 7)
+    events, cursors = OutboxEvent.__table__, OutboxCursor.__table__
+    with engine.begin() as conn:
+        condition = events.c.created_at < datetime.now() - timedelta(days=retention_days)
+        acknowledged = conn.scalar(sa.select(sa.func.min(cursors.c.position)))
+        if acknowledged is not None:
+            condition = sa.and_(condition, events.c.id <= acknowledged)
+        return conn.execute(events.delete().where(condition)).rowcount
+
+
+@outbox_cli.command("relay")
+@click.option("--once", is_flag=True, help="Deliver pending events and exit.")
+def relay_command(once: bool) -> None:
+    """Publish outbox events to the registered subscribers."""
+    config = current_app.config
+    relay = OutboxRelay(
+        db.engine, batch_size=config.get("OUTBOX_BATCH_SIZE", 500), gap_timeout=config.get("OUTBOX_GAP_TIMEOUT", 10.0)
+    )
+    click.echo(f"Relaying outbox events to {', '.join(s.name for s in relay.subscribers) or 'no subscribers'}")
+    if once:
+        click.echo(relay.run_once())
+        return
+    stop = threading.Event()
+    try:
+        relay.run(stop, config.get("OUTBOX_POLL_INTERVAL", 0.5))
+    except KeyboardInterrupt:
+        stop.set()
+
+
+@outbox_cli.command("prune")
+def prune_command() -> None:
+    """Delete acknowledged events past the retention period."""
+    click.echo(f"Deleted {prune_outbox()} outbox events")
+
+
+def init_outbox(app: Flask) -> None:
+    """
+    Starts recording changes to tracked models, unless ``OUTBOX_ENABLED`` is off, and registers the
+    ``flask outbox`` commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    global _installed
+    if app.config.get("OUTBOX_ENABLED", True) and not _installed:
+        install_outbox()
+        _installed = True
+    app.cli.add_command(outbox_cli)
@@ -0,0 +1,290 @@
+import hashlib
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional, Sequence
+
+import sqlalchemy as sa
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from ..extensions import db
+
+
+ASC = "asc"
+DESC = "desc"
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor was tampered with, is malformed, or was issued for a different ordering.
+    """
+
+
+@dataclass
+class Page:
+    """
+    One page of a keyset paginated query.
+
+    :ivar items: The rows of the page, in the requested order.
+    :type items: list
+    :ivar next_cursor: Cursor of the following page, or ``None`` on the last page.
+    :type next_cursor: Optional[str]
+    :ivar prev_cursor: Cursor of the preceding page, or ``None`` on the first page.
+    :type prev_cursor: Optional[str]
+    """
+    items: list
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+    def to_dict(self, serialize=lambda item: item) -> dict:
+        return {
+            "items": [serialize(item) for item in self.items],
+            "next_cursor": self.next_cursor,
+            "prev_cursor": self.prev_cursor,
+        }
+
+
+def _normalize_order(model, order_by: Sequence) -> list[tuple[sa.ColumnElement, str]]:
+    """
+    Resolves sort specifications into ``(column, direction)`` pairs and appends the primary key as tie breaker,
+    which makes the ordering total and therefore stable across pages.
+    """
+    resolved = []
+    for spec in order_by:
+        name, direction = spec if isinstance(spec, tuple) else (spec, ASC)
+        if direction not in (ASC, DESC):
+            raise ValueError(f"Unknown sort direction '{direction}'")
+        resolved.append((getattr(model, name), direction))
+    if not any(column.key == "id" for column, _ in resolved):
+        resolved.append((model.id, resolved[-1][1] if resolved else ASC))
+    return resolved
+
+
+def _signature(model, order: list) -> str:
+    spec = ",".join(f"{column.key}:{direction}" for column, direction in order)
+    return hashlib.sha1(f"{model.__name__}|{spec}".encode()).hexdigest()[:12]
+
+
+def _encode_value(value) -> Any:
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    if isinstance(value, uuid.UUID):
+        return ["u", str(value)]
+    if isinstance(value, Decimal):
+        return ["n", str(value)]
+    if hasattr(value, "value") and hasattr(value, "name"):
+        return ["e", value.name]
+    return value
+
+
+def _decode_value(value, column) -> Any:
+    if not isinstance(value, list):
+        return value
+    tag, raw = value
+    if tag == "dt":
+        return datetime.fromisoformat(raw)
+    if tag == "d":
+        return date.fromisoformat(raw)
+    if tag == "u":
+        return uuid.UUID(raw)
+    if tag == "n":
+        return Decimal(raw)
+    if tag == "e":
+        return column.type.enum_class[raw]
+    raise InvalidCursor(f"Unknown cursor value tag '{tag}'")
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="keyset-cursor")
+
+
+def encode_cursor(model, order: list, values: Sequence, direction: str) -> str:
+    """
+    Encodes the sort key of a boundary row into an opaque, signed cursor.
+
+    :param model: The paginated model.
+    :param order: The resolved ordering.
+    :param values: The boundary row's values of the ordering columns.
+    :param direction: ``"next"`` or ``"prev"``.
+    :return: The cursor.
+    :rtype: str
+    """
+    return _serializer().dumps({"s": _signature(model, order), "d": direction, "k": [_encode_value(v) for v in values]})
+
+
+def decode_cursor(model, order: list, cursor: str) -> tuple[str, list]:
+    """
+    Verifies and decodes a cursor produced by :func:`encode_cursor`.
+
+    :return: The direction and the boundary values.
+    :rtype: tuple[str, list]
+    :raises InvalidCursor: If the cursor is forged, malformed or belongs to another ordering.
+    """
+    try:
+        payload = _serializer().loads(cursor)
+    except BadSignature as error:
+        raise InvalidCursor("Cursor signature does not match") from error
+    if not isinstance(payload, dict) or payload.get("s") != _signature(model, order):
+        raise InvalidCursor("Cursor was issued for a different ordering")
+    values = payload.get("k")
+    if payload.get("d") not in ("next", "prev") or not isinstance(values, list) or len(values) != len(order):
+        raise InvalidCursor("Malformed cursor")
+    return payload["d"], [_decode_value(value, column) for value, (column, _) in zip(values, order)]
+
+
+def keyset_predicate(order: list, values: Sequence, forward: bool = True) -> sa.ColumnElement:
+    """
+    Builds the predicate selecting rows strictly after (or, with ``forward=False``, before) a boundary row.
+
+    When all columns sort in the same direction this is a single row-value comparison, e.g.
+    ``(created_at, id) < (:created_at, :id)``, which PostgreSQL answers with one index range scan. Mixed
+    directions expand into the equivalent disjunction.
+
+    :param order: The resolved ordering.
+    :param values: The boundary row's values.
+    :param forward: Whether to select rows after the boundary in sort order.
+    :return: The predicate.
+    """
+    def after(direction: str) -> bool:
+        return (direction == ASC) == forward
+
+    directions = {direction for _, direction in order}
+    if len(directions) == 1:
+        left = sa.tuple_(*(column for column, _ in order))
+        right = sa.tuple_(*(sa.literal(value, column.type) for (column, _), value in zip(order, values)))
+        return left > right if after(order[0][1]) else left < right
+    clauses = []
+    for i, (column, direction) in enumerate(order):
+        equal = [order[j][0] == values[j] for j in range(i)]
+        clauses.append(sa.and_(*equal, column > values[i] if after(direction) else column < values[i]))
+    return sa.or_(*clauses)
+
+
+def paginate(
+    statement: sa.Select,
+    model,
+    order_by: Sequence = (("created_at", DESC),),
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    session=None,
+) -> Page:
+    """
+    Fetches one page of ``statement`` using keyset pagination: instead of skipping ``OFFSET`` rows, every page
+    starts right after the last row of the previous one, so deep pages cost the same as the first.
+
+    Sort columns must not be nullable. The primary key is appended to the ordering to make it total.
+
+    :param statement: A select of ``model`` with any filters applied, e.g. ``select(Film).where(...)``.
+    :type statement: sqlalchemy.Select
+    :param model: The paginated model.
+    :param order_by: Column names, or ``(column name, "asc" | "desc")`` pairs.
+    :type order_by: Sequence
+    :param limit: Page size, capped at ``MAX_PAGE_SIZE``.
+    :type limit: int
+    :param cursor: A cursor from a previous page, or ``None`` for the first page.
+    :type cursor: Optional[str]
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The page.
+    :rtype: Page
+    :raises InvalidCursor: If the cursor is not valid for this ordering.
+    """
+    session = session or db.session
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    order = _normalize_order(model, order_by)
+    direction, values = decode_cursor(model, order, cursor) if cursor else ("next", None)
+    forward = direction == "next"
+
+    query = statement
+    if values is not None:
+        query = query.where(keyset_predicate(order, values, forward))
+    sort = [
+        column.asc() if (direction_ == ASC) == forward else column.desc()
+        for column, direction_ in order
+    ]
+    rows = session.scalars(query.order_by(*sort).limit(limit + 1)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    def key(row) -> list:
+        return [getattr(row, column.key) for column, _ in order]
+
+    has_next = more if forward else values is not None
+    has_prev = values is not None if forward else more
+    return Page(
+        items=rows,
+        next_cursor=encode_cursor(model, order, key(rows[-1]), "next") if rows and has_next else None,
+        prev_cursor=encode_cursor(model, order, key(rows[0]), "prev") if rows and has_prev else None,
+    )
+
+
+@dataclass(frozen=True)
+class KeysetIndex:
+    """
+    Declares the covering index serving a paginated list.
+
+    :ivar table: The table name.
+    :type table: str
+    :ivar order: Sort columns of the list, the primary key is appended.
+    :type order: tuple[str, ...]
+    :ivar prefix: Equality filter columns the list is scoped by, e.g. the owner of the rows.
+    :type prefix: tuple[str, ...]
+    :ivar include: Extra columns stored in the index (``INCLUDE``) so that list pages avoid heap lookups.
+    :type include: tuple[str, ...]
+    """
+    table: str
+    order: tuple
+    prefix: tuple = ()
+    include: tuple = ()
+
+    @property
+    def name(self) -> str:
+        return "ix_{}_keyset_{}".format(self.table, "_".join(self.prefix + self.order))
+
+
+KEYSET_INDEXES = (
+    KeysetIndex("films", order=("created_at",), include=("title", "release_year")),
+    KeysetIndex("notifications", prefix=("recipient_id",), order=("created_at",), include=("read",)),
+    KeysetIndex("transactions", prefix=("from_fund_id",), order=("timestamp",), include=("amount", "status")),
+    KeysetIndex("transactions", prefix=("to_fund_id",), order=("timestamp",), include=("amount", "status")),
+    KeysetIndex("fans", prefix=("fandom_id",), order=("created_at",)),
+    KeysetIndex("threads", order=("updated_at",)),
+    KeysetIndex("messages", prefix=("thread_id",), order=("created_at",)),
+    KeysetIndex("watch_histories", prefix=("library_id",), order=("updated_at",)),
+)
+
+
+def attach_keyset_indexes(metadata: sa.MetaData, declarations: Sequence[KeysetIndex] = KEYSET_INDEXES) -> list:
+    """
+    Adds the declared covering indexes to their tables so that ``create_all`` and autogenerated migrations
+    create them. Indexes on soft-delete tables cover live rows only. Declarations naming a table or column that
+    does not exist are skipped.
+
+    :param metadata: The metadata.
+    :param declarations: The index declarations.
+    :return: The attached indexes.
+    :rtype: list[sqlalchemy.Index]
+    """
+    attached = []
+    for declaration in declarations:
+        table = metadata.tables.get(declaration.table)
+        if table is None or declaration.name in {index.name for index in table.indexes}:
+            continue
+        names = declaration.prefix + declaration.order + ("id",)
+        if not all(name in table.c for name in names + declaration.include):
+            continue
+        live = table.c.deleted_at.is_(None) if "deleted_at" in table.c else None
+        attached.append(sa.Index(
+            declaration.name,
+            *(table.c[name] for name in names),
+            postgresql_include=list(declaration.include),
+            postgresql_where=live,
+            sqlite_where=live,
+        ))
+    return attached
@@ -0,0 +1,256 @@
+import heapq
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN, localcontext
+from typing import Iterable, Optional
+
+import sqlalchemy as sa
+from flask import current_app
+
+from ..extensions import db
+from ..models.commerce import Discount
+from .cache import ALL, cache, cache_namespace
+from .outbox import ChangeEvent, outbox_subscriber
+from .rates import PRICE_QUANTUM
+
+
+# The schedule covers ``PRICING_HORIZON_SECONDS`` from when it was loaded, which must exceed ``ttl``.
+cache_namespace("discount_schedule", entities={"discounts": ALL}, ttl=3600.0, local_ttl=60.0, local_size=1)
+
+_HUNDRED = Decimal(100)
+
+
+@dataclass(frozen=True)
+class PriceChange:
+    """
+    A moment a price changes because a discount starts or ends.
+
+    :ivar at: When the change takes effect.
+    :type at: datetime
+    :ivar percentage: The discount from then on, ``0`` when none applies.
+    :type percentage: Decimal
+    :ivar price: The effective price from then on, when known.
+    :type price: Optional[Decimal]
+    """
+    at: datetime
+    percentage: Decimal
+    price: Optional[Decimal] = None
+
+
+@dataclass(frozen=True)
+class DiscountSchedule:
+    """
+    The discount of every merchandise over a window of time, as a timeline of the moments it changes. Discounts
+    of the same merchandise that overlap do not stack: the largest one applies. Looking up the discount at a time
+    is a binary search; the upcoming changes are the rest of the timeline.
+
+    :ivar since: Start of the window.
+    :type since: datetime
+    :ivar until: End of the window; the schedule knows nothing from then on.
+    :type until: datetime
+    :ivar timelines: Merchandise ids mapped to the times their discount changes at and the discounts from then
+        on; merchandise without a discount in the window is absent.
+    :type timelines: dict
+    """
+    since: datetime
+    until: datetime
+    timelines: dict
+
+    @classmethod
+    def build(cls, discounts: Iterable[tuple], since: datetime, until: datetime) -> "DiscountSchedule":
+        """
+        Builds the schedule with a sweep over the start and end times of each merchandise's discounts.
+
+        :param discounts: ``(merchandise_id, percentage, start_time, end_time)`` rows; a discount applies from its
+            start time until, but not including, its end time.
+        :param since: Start of the window.
+        :type since: datetime
+        :param until: End of the window.
+        :type until: datetime
+        :return: The schedule.
+        :rtype: DiscountSchedule
+        """
+        events: dict = {}
+        for merchandise_id, percentage, start, end in discounts:
+            percentage = min(Decimal(str(percentage or 0)), _HUNDRED)
+            if max(start, since) < min(end, until) and percentage > 0:
+                edges = events.setdefault(merchandise_id, [])
+                edges.append((max(start, since), 1, percentage))
+                if end < until:
+                    edges.append((end, -1, percentage))
+
+        timelines = {}
+        for merchandise_id, edges in events.items():
+            edges.sort(key=lambda edge: edge[0])
+            active, ended, times, percentages = [], {}, [], []
+            for i, (at, change, percentage) in enumerate(edges):
+                if change > 0:
+                    heapq.heappush(active, -percentage)
+                else:
+                    ended[percentage] = ended.get(percentage, 0) + 1
+                if i + 1 < len(edges) and edges[i + 1][0] == at:
+                    continue
+                # Discounts that ended are only dropped once they reach the top of the heap.
+                while active and ended.get(-active[0]):
+                    ended[-active[0]] -= 1
+                    heapq.heappop(active)
+                best = -active[0] if active else Decimal(0)
+                if (percentages[-1] if percentages else Decimal(0)) != best:
+                    times.append(at)
+                    percentages.append(best)
+            if since not in times[:1]:
+                times.insert(0, since)
+                percentages.insert(0, Decimal(0))
+            timelines[merchandise_id] = (tuple(times), tuple(percentages))
+        return cls(since, until, timelines)
+
+    def percentage_at(self, merchandise_id, at: datetime) -> Decimal:
+        """
+        Returns the discount of a merchandise at a time within the window.
+
+        :param merchandise_id: The merchandise.
+        :param at: The time.
+        :type at: datetime
+        :return: The percentage, ``0`` without a discount.
+        :rtype: Decimal
+        """
+        timeline = self.timelines.get(merchandise_id)
+        if timeline is None:
+            return Decimal(0)
+        times, percentages = timeline
+        return percentages[max(bisect_right(times, at) - 1, 0)]
+
+    def changes(self, merchandise_id, after: datetime) -> list[PriceChange]:
+        """
+        Returns the changes of a merchandise's discount after a time until the end of the window.
+
+        :param merchandise_id: The merchandise.
+        :param after: The time.
+        :type after: datetime
+        :return: The changes, in order.
+        :rtype: list[PriceChange]
+        """
+        times, percentages = self.timelines.get(merchandise_id, ((), ()))
+        start = bisect_right(times, after)
+        return [PriceChange(at, percentage) for at, percentage in zip(times[start:], percentages[start:])]
+
+
+def discounted(price, percentage: Decimal) -> Decimal:
+    """
+    Applies a discount to a price, rounding half to even to the precision prices are stored with.
+
+    :param price: The price.
+    :param percentage: The discount.
+    :type percentage: Decimal
+    :return: The discounted price.
+    :rtype: Decimal
+    """
+    with localcontext() as context:
+        context.rounding = ROUND_HALF_EVEN
+        return (Decimal(str(price)) * (_HUNDRED - percentage) / _HUNDRED).quantize(PRICE_QUANTUM)
+
+
+@dataclass(frozen=True)
+class EffectivePrice:
+    """
+    What a listing costs at a time, and when that changes.
+
+    :ivar listing_id: The listing.
+    :ivar price: The listing's price before discounts.
+    :type price: Decimal
+    :ivar percentage: The discount applied.
+    :type percentage: Decimal
+    :ivar effective: The price after the discount.
+    :type effective: Decimal
+    :ivar changes: The upcoming changes within the schedule's window, with their prices.
+    :type changes: tuple[PriceChange, ...]
+    """
+    listing_id: object
+    price: Decimal
+    percentage: Decimal
+    effective: Decimal
+    changes: tuple = ()
+
+    @property
+    def valid_until(self) -> Optional[datetime]:
+        """When the effective price next changes, or ``None`` if not within the schedule's window."""
+        return self.changes[0].at if self.changes else None
+
+
+def load_discount_schedule(session=None, since: Optional[datetime] = None,
+                           horizon: Optional[float] = None) -> DiscountSchedule:
+    """
+    Reads the discounts in effect during a window of time, in one query.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param since: Start of the window. Defaults to now.
+    :type since: Optional[datetime]
+    :param horizon: Length of the window in seconds. Defaults to ``PRICING_HORIZON_SECONDS``.
+    :type horizon: Optional[float]
+    :return: The schedule.
+    :rtype: DiscountSchedule
+    """
+    session = session or db.session
+    since = since or datetime.now()
+    if horizon is None:
+        horizon = current_app.config.get("PRICING_HORIZON_SECONDS", 86400.0)
+    until = since + timedelta(seconds=horizon)
+    rows = session.execute(
+        sa.select(Discount.merchandise_id, Discount.percentage, Discount.start_time, Discount.end_time).where(
+            Discount.deleted_at.is_(None), Discount.percentage > 0,
+            Discount.start_time < until, Discount.end_time > since,
+        )
+    ).all()
+    return DiscountSchedule.build(rows, since, until)
+
+
+def discount_schedule(at: Optional[datetime] = None) -> DiscountSchedule:
+    """
+    Returns the cached schedule of every discount, reloaded when a discount changes or when ``at`` is past its
+    window.
+
+    :param at: The time the schedule is needed for. Defaults to now.
+    :type at: Optional[datetime]
+    :return: The schedule.
+    :rtype: DiscountSchedule
+    """
+    at = at or datetime.now()
+    schedule = cache.get_or_load("discount_schedule", "all", load_discount_schedule)
+    if at >= schedule.until:
+        cache.invalidate("discount_schedule")
+        schedule = cache.get_or_load("discount_schedule", "all", load_discount_schedule)
+    return schedule
+
+
+def effective_prices(listings: Iterable, at: Optional[datetime] = None,
+                     schedule: Optional[DiscountSchedule] = None) -> dict:
+    """
+    Prices many listings at once from the discount schedule, without a query per listing, together with their
+    upcoming price changes so that a page showing them knows how long it stays correct.
+
+    :param listings: Objects with ``id``, ``merchandise_id`` and ``price``, such as listings.
+    :param at: The time to price at. Defaults to now.
+    :type at: Optional[datetime]
+    :param schedule: The schedule to use. Defaults to :func:`discount_schedule`.
+    :type schedule: Optional[DiscountSchedule]
+    :return: Listing ids mapped to their prices.
+    :rtype: dict[object, EffectivePrice]
+    """
+    at = at or datetime.now()
+    schedule = schedule or discount_schedule(at)
+    prices = {}
+    for listing in listings:
+        price = Decimal(str(listing.price or 0))
+        percentage = schedule.percentage_at(listing.merchandise_id, at)
+        changes = tuple(
+            PriceChange(change.at, change.percentage, discounted(price, change.percentage))
+            for change in schedule.changes(listing.merchandise_id, at)
+        )
+        prices[listing.id] = EffectivePrice(listing.id, price, percentage, discounted(price, percentage), changes)
+    return prices
+
+
+@outbox_subscriber("pricing", {"discounts"})
+def invalidate_discount_schedule(events: list[ChangeEvent]) -> None:
+    cache.apply_events(events)
@@ -0,0 +1,234 @@
+import hashlib
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_EVEN, localcontext
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional
+
+import sqlalchemy as sa
+from flask import Flask
+
+from ..extensions import db
+from ..models.commerce import Conversion, Currency
+from .cache import ALL, cache, cache_namespace
+
+
+#: Pseudo currency code of amounts in AmberTokens, which :attr:`Currency.exchange_rate_to_ambertokens` converts to.
+AMBERTOKENS = "ambertokens"
+#: Precision prices are stored with.
+PRICE_QUANTUM = Decimal("0.0001")
+
+# Rates change rarely but are read by every page showing a price; a change is picked up everywhere once the outbox
+# relays it, or after ``local_ttl`` at the latest.
+cache_namespace("rate_table", entities={"currencies": ALL, "conversions": ALL}, local_ttl=30.0, local_size=1)
+
+
+class RateUnavailable(LookupError):
+    """Raised when converting from or to a currency or token without a usable rate."""
+
+
+@dataclass(frozen=True)
+class RateTable:
+    """
+    An immutable snapshot of every exchange rate. A new table replaces the old one as a whole when rates change,
+    so code that takes the table once converts everything it shows with the same rates, and can tag what it
+    renders with their :attr:`version`.
+
+    :ivar version: Digest of the rates, equal in every process that loaded the same rates.
+    :type version: str
+    :ivar usd: Currency codes mapped to the USD one unit is worth.
+    :type usd: Mapping[str, Decimal]
+    :ivar ambertokens: Currency codes mapped to the AmberTokens one unit is worth.
+    :type ambertokens: Mapping[str, Decimal]
+    :ivar pairs: ``(from_token_id, to_token_id)`` mapped to the rate of the latest conversion between them.
+    :type pairs: Mapping[tuple, Decimal]
+    """
+    version: str
+    usd: Mapping[str, Decimal]
+    ambertokens: Mapping[str, Decimal]
+    pairs: Mapping[tuple, Decimal]
+
+    def __post_init__(self):
+        for name in ("usd", "ambertokens", "pairs"):
+            object.__setattr__(self, name, MappingProxyType(dict(getattr(self, name))))
+
+    def __reduce__(self):
+        return RateTable, (self.version, dict(self.usd), dict(self.ambertokens), dict(self.pairs))
+
+    @classmethod
+    def build(cls, currencies: Iterable[tuple], pairs: Iterable[tuple]) -> "RateTable":
+        """
+        Builds a table from rows of rates, deriving its version from them.
+
+        :param currencies: ``(code, rate to USD, rate to AmberTokens)`` rows.
+        :param pairs: ``(from_token_id, to_token_id, rate)`` rows.
+        :return: The table.
+        :rtype: RateTable
+        """
+        # Normalized, so that the version does not depend on the scale the database returns rates with.
+        currencies = sorted(
+            (code, _decimal(usd or 0).normalize(), _decimal(tokens or 0).normalize())
+            for code, usd, tokens in currencies
+        )
+        pairs = sorted(
+            (str(source), str(target), source, target, _decimal(rate or 0).normalize())
+            for source, target, rate in pairs
+        )
+        digest = hashlib.blake2b(digest_size=8)
+        for row in currencies:
+            digest.update(repr(row).encode())
+        for source, target, _, _, rate in pairs:
+            digest.update(repr((source, target, rate)).encode())
+        return cls(
+            digest.hexdigest(),
+            {code: usd for code, usd, _ in currencies},
+            {code: tokens for code, _, tokens in currencies},
+            {(source, target): rate for _, _, source, target, rate in pairs},
+        )
+
+    def _rate_of(self, rates: Mapping, code: str) -> Decimal:
+        rate = rates.get(code)
+        if not rate:
+            raise RateUnavailable(f"No exchange rate for {code}")
+        return rate
+
+    def rate(self, source: str, target: str) -> Decimal:
+        """
+        Returns what one unit of a currency is worth in another, crossing over USD, or over AmberTokens when one
+        side is :data:`AMBERTOKENS`.
+
+        :param source: Code of the currency converted from.
+        :type source: str
+        :param target: Code of the currency converted to.
+        :type target: str
+        :return: The rate, unrounded.
+        :rtype: Decimal
+        :raises RateUnavailable: If either currency is unknown or has no rate.
+        """
+        if source == target:
+            return Decimal(1)
+        with localcontext() as context:
+            context.prec = 34
+            if source == AMBERTOKENS:
+                return 1 / self._rate_of(self.ambertokens, target)
+            if target == AMBERTOKENS:
+                return self._rate_of(self.ambertokens, source)
+            return self._rate_of(self.usd, source) / self._rate_of(self.usd, target)
+
+    def token_rate(self, from_token_id, to_token_id) -> Decimal:
+        """
+        Returns the rate of the latest conversion between two tokens, or the inverse of the latest conversion the
+        other way.
+
+        :raises RateUnavailable: If the tokens were never converted into one another.
+        """
+        if from_token_id == to_token_id:
+            return Decimal(1)
+        rate = self.pairs.get((from_token_id, to_token_id))
+        if rate:
+            return rate
+        inverse = self.pairs.get((to_token_id, from_token_id))
+        if not inverse:
+            raise RateUnavailable(f"No conversion from {from_token_id} to {to_token_id}")
+        with localcontext() as context:
+            context.prec = 34
+            return 1 / inverse
+
+    def convert_many(self, amounts: Iterable, source: str, target: str,
+                     quantum: Decimal = PRICE_QUANTUM) -> list[Optional[Decimal]]:
+        """
+        Converts many amounts, such as the prices of a page of listings, in one pass: the rate is looked up once
+        and every amount is multiplied in 34 digit decimal arithmetic and rounded half to even only at the end, so
+        converting a page gives the same amounts as converting its prices one by one.
+
+        :param amounts: The amounts, as ``Decimal``, ``int``, ``str`` or ``float``; ``None`` stays ``None``.
+        :param source: Code of the currency of the amounts.
+        :type source: str
+        :param target: Code of the currency to convert to.
+        :type target: str
+        :param quantum: Precision of the results.
+        :type quantum: Decimal
+        :return: The converted amounts, in order.
+        :rtype: list[Optional[Decimal]]
+        :raises RateUnavailable: If either currency has no rate.
+        """
+        return _apply(self.rate(source, target), amounts, quantum)
+
+    def convert_tokens(self, amounts: Iterable, from_token_id, to_token_id,
+                       quantum: Decimal = PRICE_QUANTUM) -> list[Optional[Decimal]]:
+        """
+        Like :meth:`convert_many`, between tokens at the rate of :meth:`token_rate`.
+        """
+        return _apply(self.token_rate(from_token_id, to_token_id), amounts, quantum)
+
+
+def _decimal(amount) -> Decimal:
+    return Decimal(str(amount)) if isinstance(amount, float) else Decimal(amount)
+
+
+def _apply(rate: Decimal, amounts: Iterable, quantum: Decimal) -> list[Optional[Decimal]]:
+    with localcontext() as context:
+        context.prec = 34
+        context.rounding = ROUND_HALF_EVEN
+        return [None if amount is None else (_decimal(amount) * rate).quantize(quantum) for amount in amounts]
+
+
+def load_rate_table(session=None) -> RateTable:
+    """
+    Reads every currency's rates and the latest rate of every pair of converted tokens in two queries.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The table.
+    :rtype: RateTable
+    """
+    session = session or db.session
+    currencies = session.execute(
+        sa.select(Currency.code, Currency.exchange_rate_to_usd, Currency.exchange_rate_to_ambertokens)
+        .where(Currency.deleted_at.is_(None))
+    ).all()
+    live = (Conversion.deleted_at.is_(None),)
+    latest = (
+        sa.select(Conversion.from_token_id, Conversion.to_token_id, sa.func.max(Conversion.created_at).label("at"))
+        .where(*live).group_by(Conversion.from_token_id, Conversion.to_token_id).subquery()
+    )
+    pairs = session.execute(
+        sa.select(Conversion.from_token_id, Conversion.to_token_id, Conversion.rate)
+        .join(latest, sa.and_(
+            Conversion.from_token_id == latest.c.from_token_id, Conversion.to_token_id == latest.c.to_token_id,
+            Conversion.created_at == latest.c.at,
+        ))
+        .where(*live)
+        .order_by(Conversion.id)
+    ).all()
+    return RateTable.build(currencies, pairs)
+
+
+def rate_table() -> RateTable:
+    """
+    Returns the current rate table, cached in both tiers and replaced as a whole when a currency or conversion
+    changes. Take it once per request and convert through that copy.
+
+    :return: The table.
+    :rtype: RateTable
+    """
+    return cache.get_or_load("rate_table", "all", load_rate_table)
+
+
+def rates_version() -> str:
+    """
+    The version of the current rates, to add to the versions of :func:`~app.utils.http_cache.conditional_view`
+    and :func:`~app.utils.http_cache.render_fragment` for anything that shows converted prices.
+
+    :return: The version.
+    :rtype: str
+    """
+    return rate_table().version
+
+
+def init_rates(app: Flask) -> None:
+    """
+    Exposes :func:`rates_version` to templates, for the versions of fragments showing converted prices.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.jinja_env.globals["rates_version"] = rates_version
@@ -0,0 +1,280 @@
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_DOWN
+from typing import Iterable, Mapping, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.commerce import AmberToken, Fund
+from ..models.events import OutboxCursor, OutboxEvent, EVENT_INSERT, EVENT_UPDATE
+from ..models.library import Wallet
+from ..models.rewards import RewardAccrual
+from .jobs import JobContext, job_handler
+from .ledger import QUANTUM, post_entry
+
+
+logger = logging.getLogger(__name__)
+rewards_cli = AppGroup("rewards", help="Accrue AmberToken rewards for contributions.")
+
+REWARDS_ACCRUAL_JOB = "contribution_rewards"
+
+_release_tables: Optional[dict] = None
+
+
+class RewardsNotConfigured(RuntimeError):
+    """Raised when accruing rewards without a fund to pay them from."""
+
+
+def event_points(operation: str, weight) -> Decimal:
+    """
+    Returns the points one change earns.
+
+    :param operation: ``insert``, ``update`` or ``delete``.
+    :type operation: str
+    :param weight: Points per operation, or a number of points for inserts and updates alike.
+    :return: The points; deletes earn none unless a mapping says otherwise.
+    :rtype: Decimal
+    """
+    if isinstance(weight, Mapping):
+        return Decimal(str(weight.get(operation, 0)))
+    return Decimal(str(weight)) if operation in (EVENT_INSERT, EVENT_UPDATE) else Decimal(0)
+
+
+def contribution_points(events: Iterable[tuple], weights: Mapping) -> tuple[dict, dict, int]:
+    """
+    Scores contribution events. A contribution is credited to the library that created the changed row, the
+    only contributor the models record.
+
+    :param events: ``(id, entity, entity_id, operation, data)`` rows of the outbox.
+    :param weights: Table names mapped to their weights, see :func:`event_points`.
+    :type weights: Mapping
+    :return: Library ids mapped to their points, ``(table, entity id)`` pairs mapped to the points earned on them,
+        and the number of events that earned points.
+    :rtype: tuple[dict, dict, int]
+    """
+    libraries, entities, counted = defaultdict(Decimal), defaultdict(Decimal), 0
+    for _, entity, entity_id, operation, data in events:
+        library_id = (data or {}).get("created_by")
+        if not library_id or entity not in weights:
+            continue
+        points = event_points(operation, weights[entity])
+        if points <= 0:
+            continue
+        libraries[library_id] += points
+        entities[entity, entity_id] += points
+        counted += 1
+    return dict(libraries), dict(entities), counted
+
+
+def settled_event_position(session=None, settle: float = 10.0) -> Optional[int]:
+    """
+    Returns the id of the newest outbox event written more than ``settle`` seconds ago. Like posting ids, event
+    ids become visible on commit, out of order; every event up to the settled position is final.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which an event is considered committed or rolled back.
+    :type settle: float
+    :return: The settled position, or ``None`` if no event is settled yet.
+    :rtype: Optional[int]
+    """
+    session = session or db.session
+    cutoff = datetime.now() - timedelta(seconds=settle)
+    return session.scalar(
+        sa.select(OutboxEvent.id).where(OutboxEvent.created_at < cutoff).order_by(OutboxEvent.id.desc()).limit(1)
+    )
+
+
+def reward_token(session=None) -> tuple[uuid.UUID, uuid.UUID]:
+    """
+    Returns the AmberToken rewards are paid in and its ledger.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The token id and ledger id.
+    :rtype: tuple[uuid.UUID, uuid.UUID]
+    :raises RewardsNotConfigured: If there is no AmberToken.
+    """
+    session = session or db.session
+    token = session.execute(
+        sa.select(AmberToken.id, AmberToken.ledger_id).order_by(AmberToken.created_at).limit(1)
+    ).first()
+    if token is None:
+        raise RewardsNotConfigured("There is no AmberToken to pay rewards in")
+    return token[0], token[1]
+
+
+def reward_funds(library_ids: Iterable[str], token_id, session=None) -> dict:
+    """
+    Finds the funds rewards are credited to: each library's oldest fund of the token in its wallet.
+
+    :param library_ids: The libraries, as strings.
+    :param token_id: The token rewards are paid in.
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: Library ids mapped to fund ids; libraries without such a fund are absent.
+    :rtype: dict
+    """
+    session = session or db.session
+    funds = {}
+    for library_id, fund_id in session.execute(
+        sa.select(Wallet.library_id, Fund.id).join(Fund, Fund.wallet_id == Wallet.id)
+        .where(Wallet.library_id.in_([uuid.UUID(str(library_id)) for library_id in library_ids]),
+               Fund.token_id == token_id, Fund.deleted_at.is_(None))
+        .order_by(Fund.created_at.desc())
+    ):
+        funds[str(library_id)] = fund_id
+    return funds
+
+
+def release_tables() -> dict:
+    """
+    Returns the tables of mapped models with ``contributor_amber_points``, such as releases, by the name of the
+    table their changes are reported under, with the table holding the column.
+
+    :return: Table names mapped to tables.
+    :rtype: dict[str, sqlalchemy.Table]
+    """
+    global _release_tables
+    if _release_tables is None:
+        _release_tables = {
+            mapper.local_table.name: mapper.columns["contributor_amber_points"].table
+            for mapper in db.Model.registry.mappers if "contributor_amber_points" in mapper.columns
+        }
+    return _release_tables
+
+
+def _add_release_points(entities: dict, session) -> None:
+    tables, updates = release_tables(), defaultdict(list)
+    for (entity, entity_id), points in entities.items():
+        if entity in tables:
+            updates[entity].append({"entity_key": uuid.UUID(entity_id), "earned": float(points)})
+    for entity, rows in updates.items():
+        table = tables[entity]
+        session.execute(
+            sa.update(table).where(table.c.id == sa.bindparam("entity_key"))
+            .values(contributor_amber_points=table.c.contributor_amber_points + sa.bindparam("earned")),
+            rows,
+        )
+
+
+def accrue_rewards(session=None, settle: Optional[float] = None,
+                   batch_size: Optional[int] = None) -> Optional[RewardAccrual]:
+    """
+    Rewards the contributions recorded in the outbox since the last run. Changes to tables with a weight in
+    ``CONTRIBUTION_REWARD_WEIGHTS`` earn their library points, which are paid at ``CONTRIBUTION_REWARD_RATE``
+    AmberTokens each from ``CONTRIBUTION_REWARD_FUND_ID`` in one ledger entry for the whole run, and added to
+    the ``contributor_amber_points`` of releases.
+
+    The run is recorded as a :class:`~app.models.rewards.RewardAccrual` in the same transaction as its ledger
+    entry, and the next run starts where it stopped. Running again, or twice at once, therefore never pays a
+    contribution twice: a concurrent run starting from the same position fails to record itself and rolls back.
+    The run also moves an outbox cursor named after :data:`REWARDS_ACCRUAL_JOB`, so
+    :func:`~app.utils.outbox.prune_outbox` keeps the events the next run has yet to read. Commits.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which an outbox event is considered committed or rolled back. Defaults to
+        ``OUTBOX_GAP_TIMEOUT``.
+    :type settle: Optional[float]
+    :param batch_size: Most events rewarded in one run. Defaults to ``CONTRIBUTION_REWARD_BATCH_SIZE``.
+    :type batch_size: Optional[int]
+    :return: The run, or ``None`` if there was nothing new or another run got there first.
+    :rtype: Optional[RewardAccrual]
+    :raises RewardsNotConfigured: If ``CONTRIBUTION_REWARD_FUND_ID`` is not set.
+    """
+    session = session or db.session
+    config = current_app.config
+    if settle is None:
+        settle = config.get("OUTBOX_GAP_TIMEOUT", 10.0)
+    if batch_size is None:
+        batch_size = config.get("CONTRIBUTION_REWARD_BATCH_SIZE", 50000)
+    weights = config.get("CONTRIBUTION_REWARD_WEIGHTS", {})
+    rate = Decimal(str(config.get("CONTRIBUTION_REWARD_RATE", "0.1")))
+    treasury = config.get("CONTRIBUTION_REWARD_FUND_ID")
+    if not treasury:
+        raise RewardsNotConfigured("CONTRIBUTION_REWARD_FUND_ID is not set")
+
+    after = session.scalar(sa.select(sa.func.coalesce(sa.func.max(RewardAccrual.through_position), 0)))
+    settled = settled_event_position(session, settle) or 0
+    if settled <= after:
+        session.rollback()
+        return None
+    events = session.execute(
+        sa.select(OutboxEvent.id, OutboxEvent.entity, OutboxEvent.entity_id, OutboxEvent.operation, OutboxEvent.data)
+        .where(OutboxEvent.id > after, OutboxEvent.id <= settled, OutboxEvent.entity.in_(list(weights)))
+        .order_by(OutboxEvent.id).limit(batch_size)
+    ).tuples().all()
+    libraries, entities, counted = contribution_points(events, weights)
+    accrual = RewardAccrual(
+        after_position=after, through_position=events[-1][0] if len(events) == batch_size else settled,
+        events=counted, points={}, amount=Decimal(0), unpaid={}, created_at=datetime.now(),
+    )
+    session.add(accrual)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        logger.info("Another run is accruing contribution rewards after event %s", after)
+        return None
+    session.merge(OutboxCursor(
+        subscriber=REWARDS_ACCRUAL_JOB, position=accrual.through_position, updated_at=accrual.created_at,
+    ))
+
+    if libraries:
+        token_id, ledger_id = reward_token(session)
+        funds = reward_funds(libraries, token_id, session)
+        legs, unpaid = [], {}
+        for library_id, points in sorted(libraries.items()):
+            if library_id not in funds:
+                unpaid[library_id] = str(points)
+                continue
+            legs.append((funds[library_id], (points * rate).quantize(QUANTUM, rounding=ROUND_DOWN)))
+        total = sum((amount for _, amount in legs), Decimal(0))
+        if total:
+            accrual.entry_id = post_entry(ledger_id, [(uuid.UUID(str(treasury)), -total), *legs], session=session)
+        accrual.points = {library_id: str(points) for library_id, points in libraries.items()}
+        accrual.unpaid = unpaid
+        accrual.amount = total
+        _add_release_points(entities, session)
+        if unpaid:
+            logger.warning("%d libraries earned rewards but have no AmberToken fund", len(unpaid))
+    session.commit()
+    return accrual
+
+
+@job_handler(REWARDS_ACCRUAL_JOB, concurrency=1)
+def run_accrual_job(context: JobContext) -> dict:
+    """
+    Job handler paying the rewards of contributions since the last run.
+
+    :return: The events rewarded and the AmberTokens paid.
+    :rtype: dict
+    """
+    accrual = accrue_rewards()
+    if accrual is None:
+        return {"events": 0, "amount": "0"}
+    return {"events": accrual.events, "amount": str(accrual.amount)}
+
+
+@rewards_cli.command("accrue")
+def accrue_command() -> None:
+    """Pay the rewards of contributions since the last run."""
+    accrual = accrue_rewards()
+    if accrual is None:
+        click.echo("No new contributions")
+    else:
+        click.echo(f"Rewarded {accrual.events} contributions with {accrual.amount} AmberTokens")
+
+
+def init_rewards(app: Flask) -> None:
+    """
+    Registers the ``flask rewards`` commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.cli.add_command(rewards_cli)
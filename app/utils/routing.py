@@ -0,0 +1,237 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from flask import Flask, current_app, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+
+def postgresql_replica_lag(engine: sa.engine.Engine) -> float:
+    """
+    Measures how far a replica lags behind its primary.
+
+    PostgreSQL reports the replay time of the last replicated transaction; an idle primary with no recent writes
+    will make an up to date replica look lagged, which errs on the side of reading from the primary. Other
+    dialects have no equivalent and are reported as not lagging.
+
+    :param engine: The replica engine.
+    :type engine: sqlalchemy.engine.Engine
+    :return: The lag in seconds.
+    :rtype: float
+    """
+    if engine.dialect.name != "postgresql":
+        return 0.0
+    with engine.connect() as conn:
+        lag = conn.execute(sa.text(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+        )).scalar()
+    return float(lag or 0.0)
+
+
+class ReplicaMonitor:
+    """
+    Tracks which read replicas are fresh enough to serve reads and hands them out round-robin.
+
+    Lag is probed lazily: a replica is re-probed at most once every ``check_interval`` seconds, by whichever
+    request first needs it. Replicas that lag more than ``max_lag`` seconds, or whose probe fails, are skipped
+    until a later probe finds them healthy again.
+
+    :ivar bind_keys: The `SQLALCHEMY_BINDS` keys of the replicas.
+    :type bind_keys: list[str]
+    :ivar max_lag: Maximum tolerated replication lag, in seconds.
+    :type max_lag: float
+    :ivar check_interval: Seconds between lag probes of a replica.
+    :type check_interval: float
+    :ivar probe: Callable measuring the lag of a replica engine.
+    :type probe: Callable
+    """
+
+    def __init__(self, bind_keys: list[str], max_lag: float = 5.0, check_interval: float = 2.0,
+                 probe: Callable[[sa.engine.Engine], float] = postgresql_replica_lag):
+        self.bind_keys = list(bind_keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._lag: dict[str, float] = {}
+        self._checked_at: dict[str, float] = {}
+        self._cycle = itertools.cycle(self.bind_keys) if self.bind_keys else None
+
+    def lag(self, key: str, engine: sa.engine.Engine) -> float:
+        """
+        Returns the last known lag of a replica, probing it if the last probe is stale.
+
+        :param key: The replica's bind key.
+        :type key: str
+        :param engine: The replica's engine.
+        :return: The lag in seconds, or infinity if the replica could not be probed.
+        :rtype: float
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at.get(key, float("-inf")) < self.check_interval:
+                return self._lag[key]
+            self._checked_at[key] = now
+        try:
+            lag = self.probe(engine)
+        except sa.exc.SQLAlchemyError:
+            lag = float("inf")
+        with self._lock:
+            self._lag[key] = lag
+        return lag
+
+    def choose(self, engines: dict) -> Optional[sa.engine.Engine]:
+        """
+        Picks the next healthy replica.
+
+        :param engines: Engines by bind key.
+        :type engines: dict
+        :return: A replica engine, or ``None`` if no replica is fresh enough.
+        :rtype: Optional[sqlalchemy.engine.Engine]
+        """
+        if self._cycle is None:
+            return None
+        for _ in range(len(self.bind_keys)):
+            with self._lock:
+                key = next(self._cycle)
+            engine = engines.get(key)
+            if engine is not None and self.lag(key, engine) <= self.max_lag:
+                return engine
+        return None
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a read replica and everything else to the primary.
+
+    A statement is routed to a replica only when all of the following hold: the routing policy in effect is
+    ``replica``; the statement is a plain ``SELECT`` (not ``FOR UPDATE``) against the default bind; the session
+    has not written in its current transaction, by flushing or by executing an ``INSERT``, ``UPDATE``, ``DELETE``
+    or textual statement; and the session is not pinned to the primary because it
+    committed a write within the last ``DB_READ_YOUR_WRITES_SECONDS``.
+
+    The routing policy comes from, in order, :func:`use_primary`/:func:`use_replica`, the current blueprint's
+    entry in ``DB_BLUEPRINT_ROUTING`` and ``DB_DEFAULT_ROUTING``.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines.get(None) or not self._may_read_from_replica(clause):
+            return engine
+        monitor = current_app.extensions.get("replica_monitor")
+        replica = monitor.choose(self._db.engines) if monitor is not None else None
+        return replica or engine
+
+    def _may_read_from_replica(self, clause) -> bool:
+        if self._flushing or self.info.get("wrote") or not has_app_context():
+            return False
+        if not isinstance(clause, sa.Select) or clause._for_update_arg is not None:
+            return False
+        if time.monotonic() < self.info.get("pinned_until", 0.0):
+            return False
+        return routing_policy(self) == REPLICA
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    # Core and bulk DML passed to session.execute() never flushes. Textual SQL may write too, so it counts.
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+            or isinstance(orm_execute_state.statement, sa.TextClause)):
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_to_primary(session):
+    if session.info.pop("wrote", False) and has_app_context():
+        window = current_app.config.get("DB_READ_YOUR_WRITES_SECONDS", 5.0)
+        session.info["pinned_until"] = time.monotonic() + window
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+def routing_policy(session) -> str:
+    """
+    Returns the routing policy in effect for a session.
+
+    :param session: The session.
+    :return: ``"primary"`` or ``"replica"``.
+    :rtype: str
+    """
+    forced = session.info.get("routing")
+    if forced is not None:
+        return forced
+    config = current_app.config
+    if has_request_context() and request.blueprint:
+        policy = config.get("DB_BLUEPRINT_ROUTING", {}).get(request.blueprint)
+        if policy is not None:
+            return policy
+    return config.get("DB_DEFAULT_ROUTING", PRIMARY)
+
+
+@contextmanager
+def _force_routing(session, policy: str):
+    previous = session.info.get("routing")
+    session.info["routing"] = policy
+    try:
+        yield session
+    finally:
+        if previous is None:
+            session.info.pop("routing", None)
+        else:
+            session.info["routing"] = previous
+
+
+def use_primary(session):
+    """
+    Context manager sending every statement of a session to the primary, e.g. for a read that must see the
+    latest committed data.
+
+    :param session: The session, usually ``db.session``.
+    """
+    return _force_routing(session, PRIMARY)
+
+
+def use_replica(session):
+    """
+    Context manager allowing a session's reads to go to a replica regardless of the blueprint policy. Writes and
+    read-your-writes pinning still take precedence.
+
+    :param session: The session, usually ``db.session``.
+    """
+    return _force_routing(session, REPLICA)
+
+
+def init_replica_routing(app: Flask) -> None:
+    """
+    Installs the replica monitor for the binds listed in ``DB_REPLICA_BINDS``. Without replicas every statement
+    goes to the primary.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    keys = app.config.get("DB_REPLICA_BINDS") or []
+    missing = [key for key in keys if key not in (app.config.get("SQLALCHEMY_BINDS") or {})]
+    if missing:
+        raise RuntimeError(f"Replica binds {missing} are not in SQLALCHEMY_BINDS")
+    app.extensions["replica_monitor"] = ReplicaMonitor(
+        keys,
+        max_lag=app.config.get("DB_REPLICA_MAX_LAG", 5.0),
+        check_interval=app.config.get("DB_REPLICA_LAG_CHECK_INTERVAL", 2.0),
+    )
@@ -0,0 +1,238 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import ORMExecuteState, Session, with_loader_criteria
+
+from ..extensions import db
+from ..models.mixins import ModelMixin
+
+
+ARCHIVE_SUFFIX = "_archive"
+_filter_installed = False
+
+
+def soft_delete(instance, deleted_by=None) -> None:
+    """
+    Marks a row as deleted without removing it. Entities also get their ``is_deleted`` flag set.
+
+    :param instance: The model instance to delete.
+    :param deleted_by: Identifier of the deleting user.
+    """
+    instance.deleted_at = datetime.now()
+    instance.deleted_by = deleted_by
+    if hasattr(instance, "is_deleted"):
+        instance.is_deleted = True
+
+
+def restore(instance) -> None:
+    """
+    Reverts :func:`soft_delete`.
+
+    :param instance: The model instance to restore.
+    """
+    instance.deleted_at = None
+    instance.deleted_by = None
+    if hasattr(instance, "is_deleted"):
+        instance.is_deleted = False
+
+
+def install_soft_delete_filter(session_class=Session, mixin: type = ModelMixin) -> None:
+    """
+    Hides soft deleted rows of every model using ``mixin`` from ORM selects made through ``session_class``,
+    relationship and lazy loads included. Refreshing an already loaded row is left alone so that a deleted
+    instance can still be inspected and restored.
+
+    A statement can opt out with the ``include_deleted`` execution option, e.g.
+    ``select(Person).execution_options(include_deleted=True)``.
+
+    :param session_class: The session class to filter, all sessions by default.
+    :param mixin: The mixin whose subclasses carry ``deleted_at``.
+    :type mixin: type
+    """
+
+    @event.listens_for(session_class, "do_orm_execute")
+    def _hide_deleted_rows(state: ORMExecuteState) -> None:
+        if (
+            state.is_select
+            and not state.is_column_load
+            and not state.execution_options.get("include_deleted", False)
+        ):
+            state.statement = state.statement.options(
+                with_loader_criteria(mixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+            )
+
+
+def live_index_name(table_name: str) -> str:
+    return f"ix_{table_name}_live"
+
+
+def tombstone_index_name(table_name: str) -> str:
+    return f"ix_{table_name}_tombstones"
+
+
+def partial_indexes(table: sa.Table) -> list[sa.Index]:
+    """
+    Builds the soft-delete indexes of a table: one over live rows, ordered by creation time, which serves list
+    queries without wading through tombstones, and a small one over tombstones for the purge job.
+
+    :param table: A table with a ``deleted_at`` column.
+    :type table: sqlalchemy.Table
+    :return: The indexes, which attach themselves to the table.
+    :rtype: list[sqlalchemy.Index]
+    """
+    live_key = table.c.created_at if "created_at" in table.c else table.c.id
+    live = table.c.deleted_at.is_(None)
+    dead = table.c.deleted_at.isnot(None)
+    return [
+        sa.Index(live_index_name(table.name), live_key, postgresql_where=live, sqlite_where=live),
+        sa.Index(tombstone_index_name(table.name), table.c.deleted_at, postgresql_where=dead, sqlite_where=dead),
+    ]
+
+
+def soft_delete_tables(metadata: sa.MetaData) -> list[sa.Table]:
+    """
+    :return: The tables of ``metadata`` that carry a ``deleted_at`` column, archive tables excluded.
+    :rtype: list[sqlalchemy.Table]
+    """
+    return [
+        table for table in metadata.sorted_tables
+        if "deleted_at" in table.c and not table.name.endswith(ARCHIVE_SUFFIX)
+    ]
+
+
+def attach_partial_indexes(metadata: sa.MetaData) -> None:
+    """
+    Adds the soft-delete indexes to every soft-delete table of ``metadata`` so that ``create_all`` and
+    autogenerated migrations know about them. Safe to call more than once.
+
+    :param metadata: The metadata.
+    :type metadata: sqlalchemy.MetaData
+    """
+    for table in soft_delete_tables(metadata):
+        if live_index_name(table.name) not in {index.name for index in table.indexes}:
+            partial_indexes(table)
+
+
+def archive_table(table: sa.Table) -> sa.Table:
+    """
+    Returns the archive table of a soft-delete table: the same columns without keys or constraints, so that
+    archived rows never block changes to the live schema, plus the time they were archived.
+
+    :param table: The live table.
+    :type table: sqlalchemy.Table
+    :return: The archive table, defined in the live table's metadata.
+    :rtype: sqlalchemy.Table
+    """
+    name = table.name + ARCHIVE_SUFFIX
+    if name in table.metadata.tables:
+        return table.metadata.tables[name]
+    columns = [sa.Column(column.name, column.type, nullable=True) for column in table.c]
+    columns.append(sa.Column("archived_at", sa.DateTime, nullable=False, default=datetime.now))
+    return sa.Table(name, table.metadata, *columns, sa.Index(f"ix_{name}_id", "id"))
+
+
+def purge_tombstones(
+    older_than: timedelta,
+    batch_size: int = 1000,
+    session=None,
+    tables: Optional[Iterable[sa.Table]] = None,
+) -> dict[str, int]:
+    """
+    Moves rows soft deleted more than ``older_than`` ago into their archive tables, in batches of ``batch_size``
+    rows with one transaction per batch so that locks stay short.
+
+    Tombstones that live rows still reference through foreign keys cannot be removed; they are left in place
+    and counted as skipped.
+
+    :param older_than: Minimum age of a tombstone to be archived.
+    :type older_than: timedelta
+    :param batch_size: Rows moved per transaction.
+    :type batch_size: int
+    :param session: The session to use. Defaults to ``db.session``.
+    :param tables: Tables to purge. Defaults to every soft-delete table of the application.
+    :return: Archived and skipped row counts by table name.
+    :rtype: dict[str, int]
+    """
+    session = session or db.session
+    cutoff = datetime.now() - older_than
+    tables = list(tables) if tables is not None else soft_delete_tables(db.metadata)
+    bind = session.get_bind()
+    postgresql = bind.dialect.name == "postgresql"
+    report = {}
+    # Children are purged before their parents so that their tombstones do not hold parents back.
+    for table in reversed(tables):
+        archive = archive_table(table)
+        archive.create(bind, checkfirst=True)
+        moved = skipped = 0
+        blocked: set = set()
+        while True:
+            query = sa.select(table.c.id).where(table.c.deleted_at < cutoff)
+            if blocked:
+                query = query.where(table.c.id.notin_(blocked))
+            query = query.order_by(table.c.deleted_at).limit(batch_size)
+            if postgresql:
+                query = query.with_for_update(skip_locked=True)
+            ids = session.execute(query).scalars().all()
+            if not ids:
+                break
+            try:
+                _move(session, table, archive, ids)
+                session.commit()
+                moved += len(ids)
+            except IntegrityError:
+                session.rollback()
+                for row_id in ids:
+                    try:
+                        _move(session, table, archive, [row_id])
+                        session.commit()
+                        moved += 1
+                    except IntegrityError:
+                        session.rollback()
+                        blocked.add(row_id)
+                        skipped += 1
+        report[table.name] = moved
+        if skipped:
+            report[f"{table.name}.skipped"] = skipped
+    return report
+
+
+def _move(session, table: sa.Table, archive: sa.Table, ids: list) -> None:
+    columns = [column.name for column in table.c]
+    session.execute(
+        archive.insert().from_select(
+            [*columns, "archived_at"],
+            sa.select(*table.c, sa.literal(datetime.now()).label("archived_at")).where(table.c.id.in_(ids)),
+        )
+    )
+    session.execute(table.delete().where(table.c.id.in_(ids)))
+
+
+@click.command("purge-tombstones")
+@click.option("--days", type=int, default=None, help="Archive rows soft deleted more than this many days ago.")
+@click.option("--batch-size", type=int, default=None, help="Rows moved per transaction.")
+def purge_tombstones_command(days: Optional[int], batch_size: Optional[int]) -> None:
+    """Move old soft deleted rows into archive tables."""
+    days = days if days is not None else current_app.config.get("SOFT_DELETE_RETENTION_DAYS", 90)
+    batch_size = batch_size or current_app.config.get("SOFT_DELETE_PURGE_BATCH_SIZE", 1000)
+    for name, count in purge_tombstones(timedelta(days=days), batch_size).items():
+        click.echo(f"{name}: {count}")
+
+
+def init_soft_delete(app: Flask) -> None:
+    """
+    Installs the global soft-delete filter, the partial indexes and the ``flask purge-tombstones`` command.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    global _filter_installed
+    if not _filter_installed:
+        install_soft_delete_filter()
+        _filter_installed = True
+    attach_partial_indexes(db.metadata)
+    app.cli.add_command(purge_tombstones_command)
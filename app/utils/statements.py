@@ -0,0 +1,269 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+import click
+import sqlalchemy as sa
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+from ..extensions import db
+from ..models.ledger import Posting
+from ..models.statements import FundDayRollup, RollupCursor
+from .jobs import JobContext, job_handler
+from .ledger import settled_position, to_amount
+from .pagination import DESC, Page, paginate
+
+
+statements_cli = AppGroup("statements", help="Roll up and rebuild daily fund statements.")
+
+STATEMENTS_ROLLUP_JOB = "statements_rollup"
+STATEMENTS_REBUILD_JOB = "statements_rebuild"
+ROLLUP_CURSOR = "fund_days"
+
+
+class _Day:
+    """The activity of one fund on one day within a batch of postings."""
+    __slots__ = ("credits", "debits", "fees", "postings")
+
+    def __init__(self):
+        self.credits = self.debits = self.fees = Decimal(0)
+        self.postings = 0
+
+
+def _lock_cursor(session) -> RollupCursor:
+    cursor = session.execute(
+        sa.select(RollupCursor).where(RollupCursor.name == ROLLUP_CURSOR).with_for_update()
+    ).scalar_one_or_none()
+    if cursor is None:
+        cursor = RollupCursor(name=ROLLUP_CURSOR, position=0, updated_at=datetime.now())
+        session.add(cursor)
+        session.flush()
+    return cursor
+
+
+def _aggregate(postings) -> dict:
+    days = defaultdict(dict)
+    for _, fund_id, amount, fee, created_at in postings:
+        amount, fee = to_amount(amount), to_amount(fee or 0)
+        day = days[fund_id].get(created_at.date())
+        if day is None:
+            day = days[fund_id][created_at.date()] = _Day()
+        if amount > 0:
+            day.credits += amount
+        else:
+            day.debits -= amount + fee
+            day.fees += fee
+        day.postings += 1
+    return days
+
+
+def _apply_days(days: dict, session) -> None:
+    """
+    Adds the activity of a batch to the rollups. The balances of every day from the earliest one in the batch
+    on are carried forward again from the closing before it, which is usually just the current day's row but
+    also covers postings that settled after the day they were inserted on had rolled up.
+    """
+    since = min(day for fund_days in days.values() for day in fund_days)
+    fund_ids = list(days)
+    rows = defaultdict(dict)
+    for row in session.execute(
+        sa.select(FundDayRollup).where(FundDayRollup.fund_id.in_(fund_ids), FundDayRollup.day >= since)
+    ).scalars():
+        rows[row.fund_id][row.day] = row
+    before = sa.select(FundDayRollup.fund_id, sa.func.max(FundDayRollup.day).label("day")).where(
+        FundDayRollup.fund_id.in_(fund_ids), FundDayRollup.day < since,
+    ).group_by(FundDayRollup.fund_id).subquery()
+    closings = dict(session.execute(
+        sa.select(FundDayRollup.fund_id, FundDayRollup.closing).join(
+            before, sa.and_(before.c.fund_id == FundDayRollup.fund_id, before.c.day == FundDayRollup.day)
+        )
+    ).tuples().all())
+
+    for fund_id, fund_days in days.items():
+        balance = to_amount(closings.get(fund_id, 0))
+        for day in sorted(fund_days.keys() | rows[fund_id].keys()):
+            row = rows[fund_id].get(day)
+            if row is None:
+                row = FundDayRollup(
+                    fund_id=fund_id, day=day, credits=Decimal(0), debits=Decimal(0), fees=Decimal(0), postings=0,
+                )
+                session.add(row)
+            activity = fund_days.get(day)
+            if activity is not None:
+                row.credits = to_amount(row.credits) + activity.credits
+                row.debits = to_amount(row.debits) + activity.debits
+                row.fees = to_amount(row.fees) + activity.fees
+                row.postings += activity.postings
+            row.opening = balance
+            row.closing = balance = balance + to_amount(row.credits) - to_amount(row.debits) - to_amount(row.fees)
+
+
+def update_rollups(session=None, settle: Optional[float] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Rolls the settled postings after the rollup cursor up into the daily rollups of their funds, one batch at a
+    time. Each batch is read by posting id, aggregated in memory and applied together with the cursor advance,
+    so that a run interrupted between batches resumes where it stopped without counting a posting twice.
+    Commits after each batch.
+
+    A posting counts towards the day it was inserted on. Credits are positive postings; a negative posting is a
+    debit of its amount less its fee, see :attr:`~app.models.ledger.Posting.fee`.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which a posting is considered settled. Defaults to ``LEDGER_SETTLE_SECONDS``.
+    :type settle: Optional[float]
+    :param batch_size: Postings per batch. Defaults to ``STATEMENTS_BATCH_SIZE``.
+    :type batch_size: Optional[int]
+    :return: The number of postings rolled up.
+    :rtype: int
+    """
+    session = session or db.session
+    if settle is None:
+        settle = current_app.config.get("LEDGER_SETTLE_SECONDS", 10.0)
+    if batch_size is None:
+        batch_size = current_app.config.get("STATEMENTS_BATCH_SIZE", 10000)
+    rolled_up = 0
+    while True:
+        cursor = _lock_cursor(session)
+        position = settled_position(session, settle) or 0
+        postings = session.execute(
+            sa.select(Posting.id, Posting.fund_id, Posting.amount, Posting.fee, Posting.created_at)
+            .where(Posting.id > cursor.position, Posting.id <= position)
+            .order_by(Posting.id).limit(batch_size)
+        ).tuples().all()
+        if not postings:
+            session.rollback()
+            return rolled_up
+        _apply_days(_aggregate(postings), session)
+        cursor.position = postings[-1][0]
+        cursor.updated_at = datetime.now()
+        session.commit()
+        rolled_up += len(postings)
+        if len(postings) < batch_size:
+            return rolled_up
+
+
+def rebuild_rollups(session=None, settle: Optional[float] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Discards every rollup and rolls all settled postings up again, for audits or after a change to how rollups
+    are computed. Statements read during a rebuild are incomplete. Commits.
+
+    :param session: The session to use. Defaults to ``db.session``.
+    :param settle: Seconds after which a posting is considered settled. Defaults to ``LEDGER_SETTLE_SECONDS``.
+    :type settle: Optional[float]
+    :param batch_size: Postings per batch. Defaults to ``STATEMENTS_BATCH_SIZE``.
+    :type batch_size: Optional[int]
+    :return: The number of postings rolled up.
+    :rtype: int
+    """
+    session = session or db.session
+    cursor = _lock_cursor(session)
+    session.execute(sa.delete(FundDayRollup))
+    cursor.position = 0
+    cursor.updated_at = datetime.now()
+    session.commit()
+    return update_rollups(session, settle, batch_size)
+
+
+def statement(fund_id, limit: int = 20, cursor: Optional[str] = None, since: Optional[date] = None,
+              until: Optional[date] = None, session=None) -> Page:
+    """
+    Returns a page of a fund's daily statement, newest day first, straight from the rollups. Only days with
+    activity have a row, and the activity of the last ``LEDGER_SETTLE_SECONDS`` is not rolled up yet.
+
+    :param fund_id: The fund.
+    :param limit: Page size.
+    :type limit: int
+    :param cursor: A cursor from a previous page, or ``None`` for the first page.
+    :type cursor: Optional[str]
+    :param since: The first day to include, if any.
+    :type since: Optional[date]
+    :param until: The last day to include, if any.
+    :type until: Optional[date]
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: The page of :class:`~app.models.statements.FundDayRollup` rows.
+    :rtype: Page
+    :raises InvalidCursor: If the cursor is not valid.
+    """
+    query = sa.select(FundDayRollup).where(FundDayRollup.fund_id == fund_id)
+    if since is not None:
+        query = query.where(FundDayRollup.day >= since)
+    if until is not None:
+        query = query.where(FundDayRollup.day <= until)
+    return paginate(query, FundDayRollup, order_by=(("day", DESC),), limit=limit, cursor=cursor, session=session)
+
+
+def balance_series(fund_id, since: date, until: date, session=None) -> list[tuple[date, Decimal]]:
+    """
+    Returns a fund's closing balance on every day of a range, read from the rollups of the range and the last
+    one before it; days without activity carry the previous closing forward.
+
+    :param fund_id: The fund.
+    :param since: The first day.
+    :type since: date
+    :param until: The last day.
+    :type until: date
+    :param session: The session to use. Defaults to ``db.session``.
+    :return: ``(day, closing balance)`` pairs, in order.
+    :rtype: list[tuple[date, Decimal]]
+    """
+    session = session or db.session
+    opening = session.scalar(
+        sa.select(FundDayRollup.closing).where(FundDayRollup.fund_id == fund_id, FundDayRollup.day < since)
+        .order_by(FundDayRollup.day.desc()).limit(1)
+    )
+    closings = dict(session.execute(
+        sa.select(FundDayRollup.day, FundDayRollup.closing)
+        .where(FundDayRollup.fund_id == fund_id, FundDayRollup.day >= since, FundDayRollup.day <= until)
+    ).tuples().all())
+    balance, series = to_amount(opening or 0), []
+    for offset in range((until - since).days + 1):
+        day = since + timedelta(days=offset)
+        balance = to_amount(closings.get(day, balance))
+        series.append((day, balance))
+    return series
+
+
+@job_handler(STATEMENTS_ROLLUP_JOB, concurrency=1)
+def run_rollup_job(context: JobContext) -> dict:
+    """
+    Job handler rolling settled postings up into daily fund rollups.
+
+    :return: The number of postings rolled up.
+    :rtype: dict
+    """
+    return {"postings": update_rollups()}
+
+
+@job_handler(STATEMENTS_REBUILD_JOB, concurrency=1)
+def run_rebuild_job(context: JobContext) -> dict:
+    """
+    Job handler rebuilding every daily fund rollup from the postings.
+
+    :return: The number of postings rolled up.
+    :rtype: dict
+    """
+    return {"postings": rebuild_rollups()}
+
+
+@statements_cli.command("rollup")
+def rollup_command() -> None:
+    """Roll settled postings up into daily fund rollups."""
+    click.echo(f"Rolled up {update_rollups()} postings")
+
+
+@statements_cli.command("rebuild")
+def rebuild_command() -> None:
+    """Discard the daily fund rollups and rebuild them from every posting."""
+    click.echo(f"Rebuilt rollups from {rebuild_rollups()} postings")
+
+
+def init_statements(app: Flask) -> None:
+    """
+    Registers the ``flask statements`` commands.
+
+    :param app: The application.
+    :type app: Flask
+    """
+    app.cli.add_command(statements_cli)
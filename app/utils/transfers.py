@@ -0,0 +1,304 @@
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError
+
+from ..extensions import db
+from ..models.ledger import Posting
+from .ledger import to_amount, running_totals, hot_funds, shard_for, lock_shards, apply_shard_deltas
+
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_APPLIED = "applied"
+TRANSFER_REJECTED = "rejected"
+TRANSFER_FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class Transfer:
+    """
+    A movement of value from one fund to another, optionally with a fee credited to a toll fund.
+
+    Conversions between tokens are two transfers in the same batch, each within one token, through the
+    conversion pool funds.
+
+    :ivar ledger_id: The ledger to book the transfer in.
+    :type ledger_id: uuid.UUID
+    :ivar from_fund_id: The fund debited ``amount`` plus ``fee``.
+    :type from_fund_id: uuid.UUID
+    :ivar to_fund_id: The fund credited ``amount``.
+    :type to_fund_id: uuid.UUID
+    :ivar amount: The amount received by ``to_fund_id``.
+    :type amount: Decimal
+    :ivar fee: The amount received by ``toll_fund_id``.
+    :type fee: Decimal
+    :ivar toll_fund_id: The fund credited the fee.
+    :type toll_fund_id: Optional[uuid.UUID]
+    :ivar transaction_id: The transaction the transfer records, if any.
+    :type transaction_id: Optional[uuid.UUID]
+    :ivar allow_overdraft: Whether ``from_fund_id`` may go negative, as issuing funds do.
+    :type allow_overdraft: bool
+    """
+    ledger_id: uuid.UUID
+    from_fund_id: uuid.UUID
+    to_fund_id: uuid.UUID
+    amount: Decimal
+    fee: Decimal = Decimal(0)
+    toll_fund_id: Optional[uuid.UUID] = None
+    transaction_id: Optional[uuid.UUID] = None
+    allow_overdraft: bool = False
+
+    @classmethod
+    def from_transaction(cls, transaction) -> "Transfer":
+        """
+        Builds the transfer a :class:`~app.models.commerce.Transaction` describes.
+        """
+        return cls(
+            transaction.ledger_id, transaction.from_fund_id, transaction.to_fund_id,
+            to_amount(transaction.amount or 0), to_amount(transaction.fee or 0), transaction.toll_fund, transaction.id,
+        )
+
+    @property
+    def debit(self) -> Decimal:
+        return to_amount(self.amount) + to_amount(self.fee)
+
+
+@dataclass(frozen=True)
+class TransferResult:
+    """
+    The outcome of one transfer of a batch.
+
+    :ivar transfer: The transfer.
+    :type transfer: Transfer
+    :ivar status: ``applied``, ``rejected`` for transfers that were invalid or lacked funds, or ``failed`` when
+        the database refused them.
+    :type status: str
+    :ivar entry_id: The ledger entry of an applied transfer.
+    :type entry_id: Optional[uuid.UUID]
+    :ivar error: Why the transfer was not applied.
+    :type error: Optional[str]
+    """
+    transfer: Transfer
+    status: str
+    entry_id: Optional[uuid.UUID] = None
+    error: Optional[str] = None
+
+    @property
+    def applied(self) -> bool:
+        return self.status == TRANSFER_APPLIED
+
+
+def _is_retryable(error: DBAPIError) -> bool:
+    # PostgreSQL serialization failure and deadlock; the sorted lock order avoids the latter between
+    # executors, but other writers of the funds table can still take locks in another order.
+    return getattr(getattr(error, "orig", None), "pgcode", None) in ("40001", "40P01")
+
+
+class TransferExecutor:
+    """
+    Applies transfers in batches, each batch in one transaction.
+
+    A batch locks the funds it debits with ``SELECT ... FOR UPDATE`` in id order, so executors running
+    concurrently always lock in the same order and cannot deadlock, reads their balances once, applies the
+    transfers in order against those balances and inserts the postings of every applied transfer in one
+    statement. Credited funds are not locked: appending postings never conflicts, so a fund that only
+    receives, such as a toll fund, does not serialize batches.
+
+    Hot funds, see :class:`~app.models.ledger.FundShard`, are not locked either. Each transfer writes the shard
+    of a hot fund :func:`~app.utils.ledger.shard_for` picks for its entry, and a batch locks those shards after
+    the funds, again in order. A debit its shard cannot cover is applied after the rest of the batch, in a
+    second transaction that locks every shard of the fund and draws from several of them.
+
+    A transfer that is invalid or would overdraw its fund is rejected without affecting the others. If the
+    database refuses a batch, e.g. for a constraint violation, the batch is rolled back and its transfers are
+    applied one by one to find the culprit. Deadlocks and serialization failures are retried.
+
+    Row locks need PostgreSQL; SQLite ignores ``FOR UPDATE`` and serializes the whole database instead.
+
+    :ivar batch_size: Maximum number of transfers per transaction.
+    :type batch_size: int
+    :ivar retries: Attempts of a batch that hits a deadlock or serialization failure.
+    :type retries: int
+    """
+
+    def __init__(self, session=None, batch_size: int = 500, retries: int = 3):
+        self.session = session or db.session
+        self.batch_size = batch_size
+        self.retries = retries
+
+    def execute(self, transfers: Sequence[Transfer]) -> list[TransferResult]:
+        """
+        Applies transfers, committing after each batch.
+
+        :param transfers: The transfers, applied in order.
+        :type transfers: Sequence[Transfer]
+        :return: One result per transfer, in the same order.
+        :rtype: list[TransferResult]
+        """
+        results = []
+        for start in range(0, len(transfers), self.batch_size):
+            results.extend(self._execute_batch(transfers[start:start + self.batch_size]))
+        return results
+
+    def apply(self, transfers: Sequence[Transfer]) -> list[TransferResult]:
+        """
+        Applies transfers in the caller's transaction, for callers that book them together with other changes.
+        Nothing is committed or retried, and debits of hot funds lock every shard of the fund at once.
+
+        :param transfers: The transfers, applied in order.
+        :type transfers: Sequence[Transfer]
+        :return: One result per transfer, in the same order.
+        :rtype: list[TransferResult]
+        """
+        results, _ = self._apply(transfers, spread=True)
+        return results
+
+    def _execute_batch(self, batch: Sequence[Transfer], spread: bool = False) -> list[TransferResult]:
+        for attempt in range(1, self.retries + 1):
+            try:
+                results, deferred = self._apply(batch, spread)
+                self.session.commit()
+                break
+            except DBAPIError as exc:
+                self.session.rollback()
+                if _is_retryable(exc) and attempt < self.retries:
+                    logger.info("Retrying transfer batch after %s", exc.orig)
+                    continue
+                if len(batch) == 1:
+                    return [TransferResult(batch[0], TRANSFER_FAILED, error=str(exc.orig))]
+                logger.warning("Transfer batch of %d failed, applying its transfers one by one", len(batch))
+                return [result for transfer in batch for result in self._execute_batch([transfer], spread)]
+            except BaseException:
+                self.session.rollback()
+                raise
+        if deferred:
+            retried = iter(self._execute_batch([batch[index] for index in deferred], spread=True))
+            results = [next(retried) if result is None else result for result in results]
+        return results
+
+    def _validate(self, transfer: Transfer) -> Optional[str]:
+        if transfer.from_fund_id is None or transfer.to_fund_id is None:
+            return "Unknown fund"
+        if transfer.amount < 0 or transfer.fee < 0:
+            return "Amounts must not be negative"
+        if not transfer.debit:
+            return "Nothing to transfer"
+        if transfer.from_fund_id == transfer.to_fund_id:
+            return "Source and destination are the same fund"
+        if transfer.fee and transfer.toll_fund_id is None:
+            return "A fee needs a toll fund"
+        return None
+
+    @staticmethod
+    def _draw(shards: dict, fund_id, debit: Decimal, allow_overdraft: bool) -> Optional[list[tuple]]:
+        # Takes a debit from the fullest shards of a fund first; an allowed overdraft lands on the fullest one.
+        available = sorted(
+            ((balance, shard) for (shard_fund_id, shard), balance in shards.items() if shard_fund_id == fund_id),
+            reverse=True,
+        )
+        if not available or (not allow_overdraft and sum(balance for balance, _ in available) < debit):
+            return None
+        draws, remaining = [], debit
+        for balance, shard in available:
+            taken = min(max(balance, Decimal(0)), remaining)
+            if taken:
+                draws.append((shard, -taken))
+                remaining -= taken
+        if remaining:
+            draws.append((available[0][1], -remaining))
+        return draws
+
+    def _apply(self, batch: Sequence[Transfer], spread: bool = False) -> tuple[list, list[int]]:
+        funds = db.metadata.tables["funds"]
+        hot = hot_funds(self.session)
+        debited = list({t.from_fund_id for t in batch} - hot.keys())
+        involved = [t.from_fund_id for t in batch] + [t.to_fund_id for t in batch] + \
+            [t.toll_fund_id for t in batch if t.toll_fund_id]
+        locked = self.session.execute(
+            sa.select(funds.c.id).where(funds.c.id.in_(debited)).order_by(funds.c.id).with_for_update()
+        ).scalars().all()
+        known = {None, *locked} | set(self.session.execute(
+            sa.select(funds.c.id).where(funds.c.id.in_(set(involved) - set(locked)))
+        ).scalars())
+        balances = running_totals.balances(locked, self.session)
+
+        entry_ids = [uuid.uuid4() for _ in batch]
+        shard_keys, spread_funds = set(), set()
+        for transfer, entry_id in zip(batch, entry_ids):
+            for fund_id in (transfer.from_fund_id, transfer.to_fund_id, transfer.toll_fund_id):
+                if fund_id not in hot:
+                    continue
+                if spread and fund_id == transfer.from_fund_id:
+                    spread_funds.add(fund_id)
+                else:
+                    shard_keys.add((fund_id, shard_for(entry_id, hot[fund_id])))
+        shards = lock_shards(self.session, shard_keys, spread_funds)
+
+        results, deferred, rows, deltas, now = [], [], [], {}, datetime.now()
+        for index, (transfer, entry_id) in enumerate(zip(batch, entry_ids)):
+            source, draws = transfer.from_fund_id, None
+            error = self._validate(transfer)
+            if error is None and not {source, transfer.to_fund_id, transfer.toll_fund_id} <= known:
+                error = "Unknown fund"
+            if error is None and source in hot:
+                if spread:
+                    draws = self._draw(shards, source, transfer.debit, transfer.allow_overdraft)
+                    if draws is None:
+                        error = "Insufficient funds"
+                else:
+                    shard = shard_for(entry_id, hot[source])
+                    if not transfer.allow_overdraft and shards[(source, shard)] < transfer.debit:
+                        results.append(None)
+                        deferred.append(index)
+                        continue
+                    draws = [(shard, -transfer.debit)]
+            elif error is None and not transfer.allow_overdraft and balances[source] < transfer.debit:
+                error = "Insufficient funds"
+            if error is not None:
+                results.append(TransferResult(transfer, TRANSFER_REJECTED, error=error))
+                continue
+            legs = [(source, shard, amount) for shard, amount in draws] if draws else [(source, None, -transfer.debit)]
+            legs.append((transfer.to_fund_id, None, to_amount(transfer.amount)))
+            if transfer.fee:
+                legs.append((transfer.toll_fund_id, None, to_amount(transfer.fee)))
+            fee = to_amount(transfer.fee) or None
+            for leg, (fund_id, shard, amount) in enumerate(legs):
+                if fund_id in hot and shard is None:
+                    shard = shard_for(entry_id, hot[fund_id])
+                if shard is not None:
+                    shards[(fund_id, shard)] += amount
+                    deltas[(fund_id, shard)] = deltas.get((fund_id, shard), Decimal(0)) + amount
+                elif fund_id in balances:
+                    balances[fund_id] += amount
+                rows.append({
+                    "entry_id": entry_id, "ledger_id": transfer.ledger_id, "fund_id": fund_id,
+                    "transaction_id": transfer.transaction_id, "amount": amount, "shard": shard, "created_at": now,
+                    # A debit drawn from several shards carries the fee on its first posting.
+                    "fee": fee if leg == 0 else None,
+                })
+            results.append(TransferResult(transfer, TRANSFER_APPLIED, entry_id))
+        if rows:
+            self.session.execute(sa.insert(Posting), rows)
+            apply_shard_deltas(deltas, self.session)
+        return results, deferred
+
+
+def execute_transfers(transfers: Sequence[Transfer], session=None, batch_size: int = 500) -> list[TransferResult]:
+    """
+    Applies transfers with a :class:`TransferExecutor`.
+
+    :param transfers: The transfers.
+    :type transfers: Sequence[Transfer]
+    :param session: The session to use. Defaults to ``db.session``.
+    :param batch_size: Maximum number of transfers per transaction.
+    :type batch_size: int
+    :return: One result per transfer.
+    :rtype: list[TransferResult]
+    """
+    return TransferExecutor(session, batch_size).execute(transfers)
@@ -0,0 +1,65 @@
+"""
+Measures the overhead of the database instrumentation on a request issuing a handful of statements.
+
+Run with ``python -m benchmarks.bench_instrumentation``. The view runs against a file-backed SQLite database, so
+statements take microseconds and the relative overhead shown is a worst case; against PostgreSQL, where a
+statement takes hundreds of microseconds, the same absolute cost is far smaller.
+"""
+import os
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from app.utils.instrumentation import InstrumentedQueuePool, init_instrumentation
+
+REQUESTS = 2000
+ROUNDS = 5
+STATEMENTS_PER_REQUEST = 10
+
+
+def build_app(engine, instrumented: bool, sample_rate: float) -> Flask:
+    app = Flask(__name__)
+    app.config.update(DB_INSTRUMENTATION_SAMPLE_RATE=sample_rate)
+    if instrumented:
+        init_instrumentation(app)
+
+    @app.route("/")
+    def index():
+        with engine.connect() as conn:
+            for i in range(STATEMENTS_PER_REQUEST):
+                conn.execute(text("SELECT * FROM films WHERE id = :id"), {"id": i})
+        return "ok"
+
+    return app
+
+
+def run(app: Flask) -> float:
+    client = app.test_client()
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get("/")
+    return (time.perf_counter() - started) / REQUESTS
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", poolclass=InstrumentedQueuePool)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE films (id INTEGER PRIMARY KEY, title TEXT)"))
+            conn.execute(text("INSERT INTO films VALUES (1, 'Heat')"))
+        apps = {"baseline": build_app(engine, False, 0.0)}
+        apps.update({f"sample rate {rate}": build_app(engine, True, rate) for rate in (0.1, 1.0)})
+        # Rounds are interleaved and the best round is kept, so machine noise does not favour any variant.
+        best = dict.fromkeys(apps, float("inf"))
+        for _ in range(ROUNDS):
+            for name, app in apps.items():
+                best[name] = min(best[name], run(app))
+        baseline = best["baseline"]
+        for name, elapsed in best.items():
+            print(f"{name:<18} {elapsed * 1e6:8.1f} us/request  overhead {(elapsed - baseline) / baseline:+.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Load test of a drop: ``BENCH_BUYERS`` buyers race for ``BENCH_ITEMS`` items of one merchandise.
+
+Run with ``BENCH_DATABASE_URL=postgresql://localhost/amber_bench python -m benchmarks.bench_inventory``.
+``BENCH_THREADS`` threads share the buyers, each of whom reserves one item and commits. The drop runs once with
+the admission gate and once without it, and fails if a single item is oversold. Without ``BENCH_DATABASE_URL``
+the load test falls back to a temporary SQLite file, where writers are serialized by the database lock instead of
+row locks.
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.models.inventory import InventoryReservation
+from app.utils.inventory import SoldOut, gate, reserve
+
+BUYERS = int(os.environ.get("BENCH_BUYERS", "10000"))
+ITEMS = int(os.environ.get("BENCH_ITEMS", "100"))
+THREADS = int(os.environ.get("BENCH_THREADS", "32"))
+
+
+def make_tables(metadata: sa.MetaData) -> sa.Table:
+    merchandises = sa.Table(
+        "merchandises", metadata, sa.Column("id", sa.Uuid, primary_key=True), sa.Column("inventory_count", sa.Integer),
+    )
+    InventoryReservation.__table__.to_metadata(metadata)
+    return merchandises
+
+
+def drop(engine: sa.engine.Engine, merchandises: sa.Table, gate_seconds: float) -> None:
+    item = uuid.uuid4()
+    with engine.begin() as conn:
+        conn.execute(merchandises.insert().values(id=item, inventory_count=ITEMS))
+    gate.ttl, gate.rejected = gate_seconds, 0
+    sold, lock, queue = [], threading.Lock(), iter(range(BUYERS))
+
+    def work() -> None:
+        with Session(engine) as session:
+            while True:
+                with lock:
+                    if next(queue, None) is None:
+                        return
+                try:
+                    reservation = reserve("merchandise", item, 1, ttl=600, session=session)
+                    session.commit()
+                except SoldOut:
+                    session.rollback()
+                    continue
+                with lock:
+                    sold.append(reservation.id)
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    with engine.connect() as conn:
+        left = conn.execute(sa.select(merchandises.c.inventory_count).where(merchandises.c.id == item)).scalar_one()
+    oversold = len(sold) + left - ITEMS
+    label = "with admission gate" if gate_seconds else "without gate"
+    print(
+        f"{label:>20}: {BUYERS / elapsed:8.0f} buyers/s, {len(sold)} sold, {left} left, {oversold} oversold, "
+        f"{gate.rejected} turned away by the gate"
+    )
+    assert oversold == 0 and len(sold) == ITEMS and left == 0
+
+
+def main() -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    directory = None
+    if not url:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(directory.name, 'bench.db')}"
+    engine = sa.create_engine(url, pool_size=THREADS, connect_args={"timeout": 60} if url.startswith("sqlite") else {})
+    metadata = sa.MetaData()
+    merchandises = make_tables(metadata)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    try:
+        print(f"{engine.dialect.name}, {BUYERS} buyers over {THREADS} threads for {ITEMS} items")
+        drop(engine, merchandises, gate_seconds=1.0)
+        drop(engine, merchandises, gate_seconds=0.0)
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the in-memory order book: ``BENCH_OPERATIONS`` operations on one book, a mix of resting limit
+orders around the mid price, marketable orders that sweep one or more levels and cancellations of recent orders.
+
+Run with ``python -m benchmarks.bench_orderbook``. The operations are generated up front, so only matching is
+timed; the book must sustain ``BENCH_TARGET`` operations per second. The final book is then snapshotted,
+restored and compared, and the log is replayed from an empty book to check it rebuilds the same state.
+"""
+import os
+import random
+import time
+
+from app.utils.orderbook import BUY, CANCEL, SELL, SUBMIT, OrderBook
+
+OPERATIONS = int(os.environ.get("BENCH_OPERATIONS", "1000000"))
+TARGET = int(os.environ.get("BENCH_TARGET", "100000"))
+MID = 10000
+
+
+def generate(count: int, seed: int = 0) -> list[list]:
+    rng, operations = random.Random(seed), []
+    owners = [(f"trader-{i}",) for i in range(1000)]
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.35 and operations:
+            operations.append([CANCEL, rng.randint(max(1, len(operations) - 500), len(operations))])
+            continue
+        side = rng.choice((BUY, SELL))
+        if roll < 0.9:
+            offset = rng.randint(1, 50)
+        else:
+            offset = -rng.randint(0, 10)
+        price = MID - offset if side == BUY else MID + offset
+        operations.append([SUBMIT, side, price, rng.randint(1, 100), rng.choice(owners)])
+    return operations
+
+
+def main() -> None:
+    operations = generate(OPERATIONS)
+    book = OrderBook()
+    fills = 0
+    started = time.perf_counter()
+    for operation in operations:
+        if operation[0] == SUBMIT:
+            fills += len(book.submit(operation[1], operation[2], operation[3], operation[4])[1])
+        else:
+            book.cancel(operation[1])
+    elapsed = time.perf_counter() - started
+    rate = OPERATIONS / elapsed
+    print(
+        f"{OPERATIONS} operations in {elapsed:.2f}s: {rate:,.0f} operations/s, {fills} fills, "
+        f"{len(book.orders)} orders resting"
+    )
+
+    restored = OrderBook.restore(book.snapshot())
+    replayed = OrderBook.restore({"seq": 0, "orders": []}, operations)
+    assert restored.snapshot() == replayed.snapshot() == book.snapshot()
+    assert rate >= TARGET, f"below the target of {TARGET:,} operations/s"
+
+
+if __name__ == "__main__":
+    main()
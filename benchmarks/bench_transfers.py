@@ -0,0 +1,95 @@
+"""
+Compares transfer throughput of one commit per transfer with batches applied by the transfer executor.
+
+Run with ``BENCH_DATABASE_URL=postgresql://localhost/amber_bench python -m benchmarks.bench_transfers``.
+``BENCH_THREADS`` executors run concurrently, each moving money between random pairs of ``BENCH_FUNDS``
+funds, so that batches contend for the same fund locks as purchases against popular funds would. Without
+``BENCH_DATABASE_URL`` the benchmark falls back to a temporary SQLite file, where writers are serialized by
+the database lock instead of row locks.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.models.ledger import Posting, BalanceSnapshot, FundShard
+from app.utils.ledger import verify_ledger
+from app.utils.transfers import Transfer, TransferExecutor
+
+TRANSFERS = int(os.environ.get("BENCH_TRANSFERS", "20000"))
+THREADS = int(os.environ.get("BENCH_THREADS", "4"))
+FUNDS = int(os.environ.get("BENCH_FUNDS", "100"))
+BATCH_SIZES = (1, 50, 500)
+LEDGER = uuid.uuid4()
+
+
+def make_tables(metadata: sa.MetaData) -> sa.Table:
+    # Bare referenced tables, so the ledger tables can be created without the rest of the schema.
+    for name in ("ledgers", "transactions"):
+        sa.Table(name, metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    funds = sa.Table("funds", metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    Posting.__table__.to_metadata(metadata)
+    BalanceSnapshot.__table__.to_metadata(metadata)
+    FundShard.__table__.to_metadata(metadata)
+    return funds
+
+
+def run(engine: sa.engine.Engine, funds: list[uuid.UUID], batch_size: int) -> float:
+    per_thread = TRANSFERS // THREADS
+
+    def work(seed: int) -> None:
+        rng = random.Random(seed)
+        transfers = [
+            Transfer(LEDGER, *rng.sample(funds, 2), Decimal(rng.randint(1, 100)) / 100, allow_overdraft=True)
+            for _ in range(per_thread)
+        ]
+        with Session(engine) as session:
+            results = TransferExecutor(session, batch_size).execute(transfers)
+        assert all(result.applied for result in results)
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_thread * THREADS / (time.perf_counter() - started)
+
+
+def main() -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    directory = None
+    if not url:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(directory.name, 'bench.db')}"
+    engine = sa.create_engine(url, pool_size=THREADS, connect_args={"timeout": 60} if url.startswith("sqlite") else {})
+    metadata = sa.MetaData()
+    funds_table = make_tables(metadata)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    funds = [uuid.uuid4() for _ in range(FUNDS)]
+    with engine.begin() as conn:
+        conn.execute(funds_table.insert(), [{"id": fund_id} for fund_id in funds])
+    try:
+        print(f"{engine.dialect.name}, {TRANSFERS} transfers over {THREADS} threads between {FUNDS} funds")
+        for batch_size in BATCH_SIZES:
+            label = "one commit per transfer" if batch_size == 1 else f"batches of {batch_size}"
+            print(f"{label:>24}: {run(engine, funds, batch_size):10.0f} transfers/s")
+        with Session(engine) as session:
+            problems = verify_ledger(session)
+        print(f"ledger verified, {len(problems)} problems")
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares insert throughput and primary key index size of random (version 4) and time-ordered (version 7) UUIDs.
+
+Run with ``BENCH_DATABASE_URL=postgresql://localhost/amber_bench python -m benchmarks.bench_uuid_keys``. Each
+variant fills its own table shaped like a high-insert table such as ``watch_histories``, in committed batches,
+while the table already holds rows, so that inserts land in an index larger than shared buffers for big runs.
+Without ``BENCH_DATABASE_URL`` the benchmark falls back to a temporary SQLite file, which shows the same
+ordering effect on a smaller scale.
+"""
+import os
+import tempfile
+import time
+import uuid
+
+import sqlalchemy as sa
+
+from app.models.utils.ids import uuid7
+
+ROWS = int(os.environ.get("BENCH_ROWS", "1000000"))
+BATCH = 10000
+
+
+def make_table(metadata: sa.MetaData, name: str) -> sa.Table:
+    return sa.Table(
+        name, metadata,
+        sa.Column("id", sa.Uuid, primary_key=True),
+        sa.Column("library_id", sa.Uuid, nullable=False),
+        sa.Column("watch_count", sa.Integer, nullable=False),
+        sa.Column("current_position", sa.Float, nullable=False),
+    )
+
+
+def index_bytes(conn, table: sa.Table) -> int:
+    if conn.dialect.name == "postgresql":
+        return conn.execute(sa.text(f"SELECT pg_relation_size('{table.name}_pkey')")).scalar()
+    # SQLite keeps the primary key in an automatic index; its page count is the best available proxy.
+    pages = conn.execute(sa.text(
+        "SELECT count(*) FROM dbstat WHERE name = :name"
+    ), {"name": f"sqlite_autoindex_{table.name}_1"}).scalar()
+    return pages * conn.execute(sa.text("PRAGMA page_size")).scalar()
+
+
+def run(engine: sa.engine.Engine, table: sa.Table, generate) -> tuple[float, int]:
+    library_id = uuid.uuid4()
+    started = time.perf_counter()
+    for offset in range(0, ROWS, BATCH):
+        rows = [
+            {"id": generate(), "library_id": library_id, "watch_count": 1, "current_position": 0.0}
+            for _ in range(min(BATCH, ROWS - offset))
+        ]
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+    elapsed = time.perf_counter() - started
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(sa.text(f"ANALYZE {table.name}"))
+        return ROWS / elapsed, index_bytes(conn, table)
+
+
+def main() -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    directory = None
+    if not url:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(directory.name, 'bench.db')}"
+    engine = sa.create_engine(url)
+    metadata = sa.MetaData()
+    tables = {"uuid4": make_table(metadata, "bench_ids_v4"), "uuid7": make_table(metadata, "bench_ids_v7")}
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    try:
+        print(f"{engine.dialect.name}, {ROWS} rows in batches of {BATCH}")
+        for name, generate in (("uuid4", uuid.uuid4), ("uuid7", uuid7)):
+            throughput, size = run(engine, tables[name], generate)
+            print(f"{name}: {throughput:10.0f} rows/s   primary key index {size / 2 ** 20:8.1f} MiB")
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
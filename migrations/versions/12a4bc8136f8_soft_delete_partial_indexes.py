@@ -0,0 +1,61 @@
+"""Soft-delete partial indexes
+
+Revision ID: 12a4bc8136f8
+Revises: 4e0439e36afe
+Create Date: 2026-10-18 09:12:44.118305
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12a4bc8136f8'
+down_revision = '4e0439e36afe'
+branch_labels = None
+depends_on = None
+
+
+def soft_delete_tables():
+    """Reflects every table that has a ``deleted_at`` column, archive tables excluded."""
+    inspector = sa.inspect(op.get_bind())
+    for name in inspector.get_table_names():
+        if name.endswith("_archive"):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(name)}
+        if "deleted_at" in columns:
+            existing = {index["name"] for index in inspector.get_indexes(name)}
+            yield name, columns, existing
+
+
+def upgrade():
+    # Built concurrently on PostgreSQL so that large tables stay writable while the indexes are created.
+    postgresql = op.get_bind().dialect.name == "postgresql"
+    tables = list(soft_delete_tables())
+    with op.get_context().autocommit_block() if postgresql else nullcontext():
+        for name, columns, existing in tables:
+            live_key = "created_at" if "created_at" in columns else "id"
+            if f"ix_{name}_live" not in existing:
+                op.create_index(
+                    f"ix_{name}_live", name, [live_key],
+                    postgresql_where=sa.text("deleted_at IS NULL"), sqlite_where=sa.text("deleted_at IS NULL"),
+                    postgresql_concurrently=postgresql,
+                )
+            if f"ix_{name}_tombstones" not in existing:
+                op.create_index(
+                    f"ix_{name}_tombstones", name, ["deleted_at"],
+                    postgresql_where=sa.text("deleted_at IS NOT NULL"), sqlite_where=sa.text("deleted_at IS NOT NULL"),
+                    postgresql_concurrently=postgresql,
+                )
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == "postgresql"
+    tables = list(soft_delete_tables())
+    with op.get_context().autocommit_block() if postgresql else nullcontext():
+        for name, columns, existing in tables:
+            for index in (f"ix_{name}_live", f"ix_{name}_tombstones"):
+                if index in existing:
+                    op.drop_index(index, table_name=name, postgresql_concurrently=postgresql)
@@ -0,0 +1,62 @@
+"""Job queue
+
+Revision ID: 7c3e91d0a5b2
+Revises: 12a4bc8136f8
+Create Date: 2026-10-18 14:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e91d0a5b2'
+down_revision = '12a4bc8136f8'
+branch_labels = None
+depends_on = None
+
+job_data = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def upgrade():
+    op.create_table(
+        'jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('payload', job_data, nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('dedupe_key', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=128), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('progress', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('message', sa.String(length=255), nullable=True),
+        sa.Column('result', job_data, nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_jobs_claim', 'jobs', ['priority', 'run_at'],
+        postgresql_where=sa.text("status = 'queued'"), sqlite_where=sa.text("status = 'queued'"),
+    )
+    op.create_index('ix_jobs_kind_status', 'jobs', ['kind', 'status'])
+    op.create_index(
+        'uq_jobs_dedupe_key_active', 'jobs', ['dedupe_key'], unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+        sqlite_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade():
+    op.drop_index('uq_jobs_dedupe_key_active', table_name='jobs')
+    op.drop_index('ix_jobs_kind_status', table_name='jobs')
+    op.drop_index('ix_jobs_claim', table_name='jobs')
+    op.drop_table('jobs')
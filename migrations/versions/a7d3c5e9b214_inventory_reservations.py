@@ -0,0 +1,41 @@
+"""Inventory reservations
+
+Revision ID: a7d3c5e9b214
+Revises: f2c8d6e4a913
+Create Date: 2026-10-18 21:08:15.447620
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3c5e9b214'
+down_revision = 'f2c8d6e4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inventory_reservations',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column('item_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('holder', sa.String(length=64), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_inventory_reservations_status_expires_at', 'inventory_reservations', ['status', 'expires_at'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_inventory_reservations_status_expires_at', table_name='inventory_reservations')
+    op.drop_table('inventory_reservations')
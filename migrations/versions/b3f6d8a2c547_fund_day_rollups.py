@@ -0,0 +1,50 @@
+"""Daily fund rollups and posting fees
+
+Revision ID: b3f6d8a2c547
+Revises: c9e4a2f7d318
+Create Date: 2026-10-18 23:52:16.408127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6d8a2c547'
+down_revision = 'c9e4a2f7d318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ledger_postings', sa.Column('fee', sa.Numeric(precision=20, scale=4), nullable=True))
+    op.create_table(
+        'fund_day_rollups',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('fund_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('opening', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('credits', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('debits', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('fees', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('closing', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('postings', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['fund_id'], ['funds.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_fund_day_rollups_fund_id_day', 'fund_day_rollups', ['fund_id', 'day'], unique=True)
+    op.create_table(
+        'rollup_cursors',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('position', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_cursors')
+    op.drop_index('ix_fund_day_rollups_fund_id_day', table_name='fund_day_rollups')
+    op.drop_table('fund_day_rollups')
+    op.drop_column('ledger_postings', 'fee')
@@ -0,0 +1,42 @@
+"""Change event outbox
+
+Revision ID: b8d2f4e61c07
+Revises: 7c3e91d0a5b2
+Create Date: 2026-10-18 15:41:09.217364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d2f4e61c07'
+down_revision = '7c3e91d0a5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('entity', sa.String(length=64), nullable=False),
+        sa.Column('entity_id', sa.String(length=64), nullable=False),
+        sa.Column('operation', sa.String(length=16), nullable=False),
+        sa.Column('data', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'outbox_cursors',
+        sa.Column('subscriber', sa.String(length=64), nullable=False),
+        sa.Column('position', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('subscriber'),
+    )
+
+
+def downgrade():
+    op.drop_table('outbox_cursors')
+    op.drop_table('outbox_events')
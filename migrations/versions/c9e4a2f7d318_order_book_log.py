@@ -0,0 +1,45 @@
+"""Order book log and snapshots
+
+Revision ID: c9e4a2f7d318
+Revises: a7d3c5e9b214
+Create Date: 2026-10-18 22:41:07.392815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a2f7d318'
+down_revision = 'a7d3c5e9b214'
+branch_labels = None
+depends_on = None
+
+book_data = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def upgrade():
+    op.create_table(
+        'order_book_log',
+        sa.Column('token_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('seq', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('operation', book_data, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['token_id'], ['tokens.id']),
+        sa.PrimaryKeyConstraint('token_id', 'seq'),
+    )
+    op.create_table(
+        'order_book_snapshots',
+        sa.Column('token_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('seq', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('state', book_data, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['token_id'], ['tokens.id']),
+        sa.PrimaryKeyConstraint('token_id', 'seq'),
+    )
+
+
+def downgrade():
+    op.drop_table('order_book_snapshots')
+    op.drop_table('order_book_log')
@@ -0,0 +1,52 @@
+"""Ledger postings and balance snapshots
+
+Revision ID: d41a7c9e2f13
+Revises: b8d2f4e61c07
+Create Date: 2026-10-18 17:02:44.581903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7c9e2f13'
+down_revision = 'b8d2f4e61c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ledger_postings',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('entry_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('ledger_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('fund_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('transaction_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('amount', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['ledger_id'], ['ledgers.id']),
+        sa.ForeignKeyConstraint(['fund_id'], ['funds.id']),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_ledger_postings_fund_id_id', 'ledger_postings', ['fund_id', 'id'], unique=False)
+    op.create_index('ix_ledger_postings_entry_id', 'ledger_postings', ['entry_id'], unique=False)
+    op.create_table(
+        'balance_snapshots',
+        sa.Column('fund_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('posting_id', sa.BigInteger(), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['fund_id'], ['funds.id']),
+        sa.PrimaryKeyConstraint('fund_id', 'posting_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_ledger_postings_entry_id', table_name='ledger_postings')
+    op.drop_index('ix_ledger_postings_fund_id_id', table_name='ledger_postings')
+    op.drop_table('ledger_postings')
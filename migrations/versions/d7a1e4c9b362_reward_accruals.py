@@ -0,0 +1,40 @@
+"""Contribution reward accruals
+
+Revision ID: d7a1e4c9b362
+Revises: b3f6d8a2c547
+Create Date: 2026-10-19 01:14:52.630418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a1e4c9b362'
+down_revision = 'b3f6d8a2c547'
+branch_labels = None
+depends_on = None
+
+accrual_data = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def upgrade():
+    op.create_table(
+        'reward_accruals',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('after_position', sa.BigInteger(), nullable=False),
+        sa.Column('through_position', sa.BigInteger(), nullable=False),
+        sa.Column('entry_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('events', sa.Integer(), nullable=False),
+        sa.Column('points', accrual_data, nullable=False),
+        sa.Column('amount', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('unpaid', accrual_data, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('after_position'),
+    )
+
+
+def downgrade():
+    op.drop_table('reward_accruals')
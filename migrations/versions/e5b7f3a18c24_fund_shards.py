@@ -0,0 +1,40 @@
+"""Shards of hot funds
+
+Revision ID: e5b7f3a18c24
+Revises: d41a7c9e2f13
+Create Date: 2026-10-18 19:41:07.215338
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7f3a18c24'
+down_revision = 'd41a7c9e2f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ledger_postings', sa.Column('shard', sa.SmallInteger(), nullable=True))
+    op.create_index(
+        'ix_ledger_postings_fund_id_shard_id', 'ledger_postings', ['fund_id', 'shard', 'id'], unique=False,
+    )
+    op.create_table(
+        'fund_shards',
+        sa.Column('fund_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('shard', sa.SmallInteger(), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=20, scale=4), nullable=False),
+        sa.Column('folded_through', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['fund_id'], ['funds.id']),
+        sa.PrimaryKeyConstraint('fund_id', 'shard'),
+    )
+
+
+def downgrade():
+    op.drop_table('fund_shards')
+    op.drop_index('ix_ledger_postings_fund_id_shard_id', table_name='ledger_postings')
+    op.drop_column('ledger_postings', 'shard')
@@ -0,0 +1,29 @@
+"""Library owners
+
+Revision ID: e8b4d2c6f731
+Revises: d7a1e4c9b362
+Create Date: 2026-10-19 09:41:07.215836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4d2c6f731'
+down_revision = 'd7a1e4c9b362'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('libraries', sa.Column('owner_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key('fk_libraries_owner_id_users', 'libraries', 'users', ['owner_id'], ['id'])
+    op.create_index('ix_libraries_owner_id', 'libraries', ['owner_id'])
+
+
+def downgrade():
+    op.drop_index('ix_libraries_owner_id', table_name='libraries')
+    op.drop_constraint('fk_libraries_owner_id_users', 'libraries', type_='foreignkey')
+    op.drop_column('libraries', 'owner_id')
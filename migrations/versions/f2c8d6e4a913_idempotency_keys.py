@@ -0,0 +1,39 @@
+"""Idempotency keys
+
+Revision ID: f2c8d6e4a913
+Revises: e5b7f3a18c24
+Create Date: 2026-10-18 20:26:52.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8d6e4a913'
+down_revision = 'e5b7f3a18c24'
+branch_labels = None
+depends_on = None
+
+response_data = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def upgrade():
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('fingerprint', sa.LargeBinary(length=16), nullable=False),
+        sa.Column('status', sa.SmallInteger(), nullable=True),
+        sa.Column('response', response_data, nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'key'),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,28 @@
+"""Shop libraries
+
+Revision ID: f4a9c1e7b385
+Revises: e8b4d2c6f731
+Create Date: 2026-10-19 10:26:53.904172
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c1e7b385'
+down_revision = 'e8b4d2c6f731'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing shops have no library to backfill from, so the column stays nullable.
+    op.add_column('shops', sa.Column('library_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key('fk_shops_library_id_libraries', 'shops', 'libraries', ['library_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('fk_shops_library_id_libraries', 'shops', type_='foreignkey')
+    op.drop_column('shops', 'library_id')
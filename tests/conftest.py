@@ -1,4 +1,8 @@
+import uuid
+from datetime import date, datetime
+
 import pytest
+import sqlalchemy as sa
 from app import create_app
 from app.extensions import db
 from sqlalchemy_utils import database_exists, create_database, drop_database
@@ -35,3 +39,46 @@ def session(app):
         yield db.session # this is where tests get to interact with the database
         db.session.rollback() # roll back the transaction to undo db changes for the next test
 
+
+
+@pytest.fixture(scope="function")
+def make(session):
+    """
+    Provides a factory persisting model instances with placeholder values for every required column the test
+    does not care about. Foreign keys are not enforced while the test runs, so a test only creates the rows it
+    queries; this needs a PostgreSQL role allowed to set ``session_replication_role``.
+
+    :param session: The database session fixture.
+    :return: A function taking a model and column values and returning the flushed instance.
+    """
+    session.execute(sa.text("SET session_replication_role = replica"))
+
+    def placeholder(column):
+        if isinstance(column.type, sa.Enum) and column.type.enum_class is not None:
+            return next(iter(column.type.enum_class))
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return None
+        if python_type is uuid.UUID:
+            return uuid.uuid4()
+        if python_type is str:
+            return f"{column.key}-{uuid.uuid4().hex[:8]}"
+        if python_type in (datetime, date):
+            return python_type.today() if python_type is date else datetime.now()
+        return python_type()
+
+    def make(model, **values):
+        mapper = sa.inspect(model)
+        for column in mapper.columns:
+            if column.key in values or column.nullable or column.default is not None \
+                    or column.server_default is not None or column is mapper.polymorphic_on:
+                continue
+            values[column.key] = placeholder(column)
+        instance = model(**values)
+        session.add(instance)
+        session.flush()
+        return instance
+
+    yield make
+    session.execute(sa.text("SET session_replication_role = DEFAULT"))
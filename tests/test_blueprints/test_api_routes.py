@@ -0,0 +1,126 @@
+import io
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from app.models.commerce import Fund
+from app.models.library import Library, Portfolio, Wallet
+from app.models.user import User
+
+
+UNKNOWN = uuid.uuid4()
+ROUTES = [
+    ("post", "/commerce/orders", {"json": {}}),
+    ("post", f"/commerce/listings/{UNKNOWN}/reservations", {"json": {}}),
+    ("delete", f"/commerce/reservations/{UNKNOWN}", {}),
+    ("post", f"/commerce/tokens/{UNKNOWN}/orders", {"json": {
+        "fund_id": str(UNKNOWN), "token_fund_id": str(UNKNOWN), "side": "buy", "price": "1.00", "quantity": 1,
+    }}),
+    ("delete", f"/commerce/tokens/{UNKNOWN}/orders/1", {}),
+    ("get", f"/commerce/funds/{UNKNOWN}/statement", {}),
+    ("get", f"/commerce/funds/{UNKNOWN}/balances", {}),
+    ("post", f"/jobs/{UNKNOWN}/cancel", {}),
+    ("post", f"/library/libraries/{UNKNOWN}/exports", {}),
+    ("get", f"/library/exports/{UNKNOWN}", {}),
+    ("post", f"/library/libraries/{UNKNOWN}/imports", {"data": {"file": (io.BytesIO(b"title\n"), "films.csv")}}),
+]
+
+
+@pytest.fixture
+def caller(make) -> SimpleNamespace:
+    """
+    Fixture that provides a user with an API key owning a library with a portfolio and a fund, and another
+    library's portfolio and fund.
+
+    :param make: The model factory fixture.
+    :return: The rows, by name.
+    """
+    user = make(User, api_key=uuid.uuid4().hex)
+    library, other = make(Library, owner_id=user.id), make(Library)
+    wallet, other_wallet = make(Wallet, library_id=library.id), make(Wallet, library_id=other.id)
+    return SimpleNamespace(
+        user=user, headers={"Authorization": f"Bearer {user.api_key}"},
+        portfolio=make(Portfolio, library_id=library.id), other_portfolio=make(Portfolio, library_id=other.id),
+        fund=make(Fund, wallet_id=wallet.id), other_fund=make(Fund, wallet_id=other_wallet.id),
+    )
+
+
+@pytest.mark.parametrize("method, path, kwargs", ROUTES)
+def test_api_routes_require_authentication(app, session, method, path, kwargs) -> None:
+    """
+    Tests that the JSON API routes answer 401, rather than a CSRF error, to requests without credentials.
+
+    :param app: The application fixture.
+    :param session: The database session fixture.
+    :param method: The HTTP method.
+    :param path: The route.
+    :param kwargs: The request body.
+    :return: None
+    """
+    response = getattr(app.test_client(), method)(path, **kwargs)
+    assert response.status_code == 401 and "CSRF" not in response.text
+
+
+@pytest.mark.parametrize("method, path, kwargs", ROUTES)
+def test_api_keys_need_no_csrf_token(app, caller, method, path, kwargs) -> None:
+    """
+    Tests that requests authenticated with an API key reach the routes without a CSRF token: unknown entities
+    are reported as missing and a malformed order as a bad request.
+
+    :param app: The application fixture.
+    :param caller: The caller fixture.
+    :param method: The HTTP method.
+    :param path: The route.
+    :param kwargs: The request body.
+    :return: None
+    """
+    response = getattr(app.test_client(), method)(path, headers=caller.headers, **kwargs)
+    assert "CSRF" not in response.text
+    assert response.status_code == (400 if path == "/commerce/orders" else 404)
+
+
+def test_login_sessions_need_a_csrf_token(app, caller) -> None:
+    """
+    Tests that a request authenticated by a login session cookie is refused without a CSRF token.
+
+    :param app: The application fixture.
+    :param caller: The caller fixture.
+    :return: None
+    """
+    client = app.test_client()
+    with client.session_transaction() as cookie_session:
+        cookie_session["_user_id"] = str(caller.user.id)
+    response = client.post("/commerce/orders", json={})
+    assert response.status_code == 400 and "CSRF" in response.text
+
+
+@pytest.mark.parametrize("fund, status", [("fund", 200), ("other_fund", 404)])
+def test_statements_are_the_callers_own(app, caller, fund, status) -> None:
+    """
+    Tests that a caller reads the statement of its own funds, and that other libraries' funds are reported as
+    missing.
+
+    :param app: The application fixture.
+    :param caller: The caller fixture.
+    :param fund: The name of the fund read.
+    :param status: The expected status.
+    :return: None
+    """
+    fund_id = getattr(caller, fund).id
+    response = app.test_client().get(f"/commerce/funds/{fund_id}/statement", headers=caller.headers)
+    assert response.status_code == status
+
+
+def test_orders_act_for_the_callers_portfolio(app, caller) -> None:
+    """
+    Tests that a book order naming another library's portfolio is refused as if the portfolio did not exist.
+
+    :param app: The application fixture.
+    :param caller: The caller fixture.
+    :return: None
+    """
+    response = app.test_client().post(f"/commerce/tokens/{UNKNOWN}/orders", headers=caller.headers, json={
+        "portfolio_id": str(caller.other_portfolio.id), "fund_id": str(caller.other_fund.id),
+        "token_fund_id": str(caller.other_fund.id), "side": "buy", "price": "1.00", "quantity": 1,
+    })
+    assert response.status_code == 404
@@ -0,0 +1,60 @@
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from app.models.utils.ids import new_uuid, set_uuid_version, uuid7, uuid7_datetime, uuid7_floor
+
+
+def test_uuid7_layout_and_timestamp() -> None:
+    """
+    Tests that generated ids are RFC 9562 version 7 UUIDs whose embedded time is the generation time.
+
+    :return: None
+    """
+    before = datetime.now(timezone.utc)
+    value = uuid7()
+    after = datetime.now(timezone.utc)
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before - timedelta(milliseconds=1) <= uuid7_datetime(str(value)) <= after
+
+
+def test_uuid7_is_strictly_increasing() -> None:
+    """
+    Tests that ids generated in a burst, many within the same millisecond, are unique and strictly increasing.
+
+    :return: None
+    """
+    values = [uuid7() for _ in range(20000)]
+    assert all(a < b for a, b in zip(values, values[1:]))
+
+
+def test_uuid7_floor_bounds_ids() -> None:
+    """
+    Tests that the floor of a moment sorts before every id generated from that moment on.
+
+    :return: None
+    """
+    floor = uuid7_floor(datetime.now(timezone.utc))
+    assert floor <= uuid7()
+    assert uuid7_floor(datetime.now(timezone.utc) + timedelta(seconds=1)) > uuid7()
+
+
+def test_uuid_version_is_configurable() -> None:
+    """
+    Tests that the generator can switch between version 7 and version 4 UUIDs and rejects other versions, and
+    that the creation time of a non version 7 UUID cannot be extracted.
+
+    :return: None
+    """
+    try:
+        set_uuid_version(4)
+        assert new_uuid().version == 4
+        with pytest.raises(ValueError):
+            uuid7_datetime(new_uuid())
+        set_uuid_version("7")
+        assert new_uuid().version == 7
+        with pytest.raises(ValueError):
+            set_uuid_version(1)
+    finally:
+        set_uuid_version(7)
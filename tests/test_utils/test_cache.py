@@ -0,0 +1,196 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from app.utils import cache as cache_module
+from app.utils.cache import (
+    ALL, BY_KEY, CACHE_NAMESPACES, Cache, CacheNamespace, LocalTier, SQLiteTier, cache_namespace, film_card, genre,
+    init_cache, invalidate_cached_entities, open_shared_tier, person_header, tag,
+)
+from app.utils.outbox import SUBSCRIBERS, ChangeEvent
+
+
+NAMESPACES = {
+    "film_card": CacheNamespace("film_card", entities={"films": BY_KEY}),
+    "currency_rates": CacheNamespace("currency_rates", entities={"currencies": ALL}),
+}
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """
+    Fixture that provides a shared tier in a temporary SQLite file.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The shared tier.
+    """
+    return open_shared_tier(f"sqlite:///{tmp_path / 'cache.db'}")
+
+
+def change(entity: str, entity_id: str) -> ChangeEvent:
+    return ChangeEvent(1, datetime.now(), entity, entity_id, "update", {})
+
+
+def test_local_tier_evicts_least_recently_used_and_expired() -> None:
+    """
+    Tests that the process tier evicts the least recently used entry when full and drops expired entries.
+
+    :return: None
+    """
+    now = [0.0]
+    tier = LocalTier(maxsize=2, ttl=10, clock=lambda: now[0])
+    tier.set("a", 1)
+    tier.set("b", 2)
+    assert tier.get("a") == (True, 1)
+    tier.set("c", 3)
+    assert (tier.get("b"), tier.evictions) == ((False, None), 1)
+    now[0] = 10.0
+    assert tier.get("a") == (False, None)
+
+
+def test_concurrent_misses_load_once() -> None:
+    """
+    Tests that concurrent reads of a missing key run the loader once and share its value, and that loader
+    errors reach every waiting caller without being cached.
+
+    :return: None
+    """
+    cache = Cache(namespaces=NAMESPACES)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"title": "Alien"}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("film_card", 1, loader))) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (len(calls), results) == (1, [{"title": "Alien"}] * 8)
+    stats = cache.stats("film_card")
+    assert (stats.misses, stats.coalesced) == (1, 7)
+    assert cache.get_or_load("film_card", "1", loader) == {"title": "Alien"}
+    assert cache.stats("film_card").local_hits == 1
+
+    def failing():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("film_card", 2, failing)
+    assert cache.get_or_load("film_card", 2, lambda: "loaded") == "loaded"
+
+
+def test_shared_tier_serves_and_invalidates_across_processes(shared) -> None:
+    """
+    Tests that a value loaded by one process is served to another from the shared tier, and that an
+    invalidation in one process evicts the other's local copy once it syncs.
+
+    :param shared: The shared tier fixture.
+    :return: None
+    """
+    first = Cache(shared, namespaces=NAMESPACES, sync_interval=0)
+    second = Cache(shared, namespaces=NAMESPACES, sync_interval=0)
+    first.sync()
+    second.sync()
+
+    assert first.get_or_load("film_card", 1, lambda: "v1") == "v1"
+    assert second.get_or_load("film_card", 1, lambda: "unused") == "v1"
+    assert second.stats("film_card").shared_hits == 1
+
+    first.apply_events([change("films", "1"), change("people", "1")])
+    assert second.get_or_load("film_card", 1, lambda: "v2") == "v2"
+    assert first.get_or_load("film_card", 1, lambda: "unused") == "v2"
+
+    second.get_or_load("currency_rates", "all", lambda: {"EUR": 1})
+    first.apply_events([change("currencies", "7")])
+    assert second.get_or_load("currency_rates", "all", lambda: {"EUR": 2}) == {"EUR": 2}
+
+
+def test_shared_lock_coalesces_loads_across_processes(shared) -> None:
+    """
+    Tests that two processes missing the same key load it once, the second one waiting for the first one's
+    value in the shared tier.
+
+    :param shared: The shared tier fixture.
+    :return: None
+    """
+    caches = [Cache(SQLiteTier(shared.path), namespaces=NAMESPACES) for _ in range(2)]
+    calls, results = [], []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return "loaded"
+
+    threads = [
+        threading.Thread(target=lambda c=c: results.append(c.get_or_load("film_card", 1, loader))) for c in caches
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (len(calls), results) == (1, ["loaded", "loaded"])
+
+
+def test_value_loaded_during_invalidation_is_not_stored() -> None:
+    """
+    Tests that a value whose key is invalidated while it is being loaded is returned but not cached.
+
+    :return: None
+    """
+    cache = Cache(namespaces=NAMESPACES)
+
+    def loader():
+        cache.invalidate("film_card", [1])
+        return "stale"
+
+    assert cache.get_or_load("film_card", 1, loader) == "stale"
+    assert cache.get_or_load("film_card", 1, lambda: "fresh") == "fresh"
+    assert 'amber_cache_misses_total{namespace="film_card"} 2' in cache.render_metrics()
+
+
+def test_relay_invalidates_namespaces_declared_after_the_cache(caplog) -> None:
+    """
+    Tests that the cache's outbox subscription covers the tables of namespaces declared by modules imported
+    after the cache, and that relaying invalidations without a shared tier is warned about.
+
+    :param caplog: The log capture fixture.
+    :return: None
+    """
+    cache_namespace("late_rows", entities={"late_rows": ALL})
+    try:
+        init_cache(Flask(__name__))
+        assert "late_rows" in SUBSCRIBERS["cache"].entities
+        invalidate_cached_entities([change("late_rows", "1")])
+        assert "CACHE_SHARED_URL" in caplog.text
+    finally:
+        CACHE_NAMESPACES.pop("late_rows")
+
+
+def test_entity_readers_load_once_until_their_rows_change(monkeypatch) -> None:
+    """
+    Tests that film, person, genre and tag reads are served from the cache after the first load, and that a
+    change to the row evicts only that entry.
+
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    loads = []
+    monkeypatch.setattr(cache_module, "cache", Cache())
+    monkeypatch.setattr(cache_module, "_row", lambda model, entity_id, fields=None: loads.append(entity_id) or {
+        "id": entity_id, "loads": loads.count(entity_id),
+    })
+    readers = {"films": film_card, "people": person_header, "genres": genre, "tags": tag}
+
+    for entity, reader in readers.items():
+        assert reader(f"{entity}-1") == reader(f"{entity}-1") == {"id": f"{entity}-1", "loads": 1}
+        reader(f"{entity}-2")
+        cache_module.cache.apply_events([change(entity, f"{entity}-1")])
+        assert reader(f"{entity}-1")["loads"] == 2 and reader(f"{entity}-2")["loads"] == 1
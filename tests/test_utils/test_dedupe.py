@@ -0,0 +1,104 @@
+from datetime import date
+
+import pytest
+from app.models.library import Person, Relationship
+from app.utils.dedupe import MergePlan, PersonDeduper, PersonRecord, apply_merge_plan, jaro_winkler, soundex
+
+
+@pytest.fixture
+def records() -> list[PersonRecord]:
+    """
+    Fixture that provides person records containing one cluster of duplicates (an exact duplicate and a
+    misspelled, undated variant), a namesake born decades earlier and an unrelated person.
+
+    :return: The person records.
+    :rtype: list[PersonRecord]
+    """
+    return [
+        PersonRecord.from_row(1, "Robert", "Downey", "Robert Downey Jr.", ["RDJ"], date(1965, 4, 4)),
+        PersonRecord.from_row(2, "Robert", "Downey", None, None, date(1965, 4, 4)),
+        PersonRecord.from_row(3, "Robert", "Downey", None, None, date(1935, 10, 24)),
+        PersonRecord.from_row(4, "Bob", "Downy", "Robert Downy Jr", None, None),
+        PersonRecord.from_row(5, "Emily", "Blunt", None, None, None),
+    ]
+
+
+def test_phonetic_and_string_similarity() -> None:
+    """
+    Tests the Soundex codes used for blocking and the Jaro-Winkler similarity used for scoring.
+
+    :return: None
+    """
+    assert soundex("robert") == soundex("rupert") == "R163"
+    assert soundex("ashcraft") == "A261"
+    assert jaro_winkler("martha", "marhta") == pytest.approx(0.9611, abs=1e-4)
+    assert jaro_winkler("", "martha") == 0.0
+
+
+def test_plan_clusters_duplicates(records: list[PersonRecord]) -> None:
+    """
+    Tests that duplicates are clustered into a single merge plan, that a conflicting birth year keeps a
+    namesake out of the cluster and that every name variant is carried over as an alias.
+
+    :param records: The person records fixture.
+    :type records: list[PersonRecord]
+    :return: None
+    """
+    plans = PersonDeduper().plan(records)
+    assert len(plans) == 1
+    plan = plans[0]
+    assert plan.survivor_id == 1
+    assert sorted(plan.duplicate_ids) == [2, 4]
+    assert "rdj" in plan.aliases
+    assert plan.score >= PersonDeduper().threshold
+
+
+def test_plan_uses_survivor_rank(records: list[PersonRecord]) -> None:
+    """
+    Tests that the highest ranked member of a cluster is chosen as the survivor.
+
+    :param records: The person records fixture.
+    :type records: list[PersonRecord]
+    :return: None
+    """
+    plan = PersonDeduper().plan(records, rank={2: (True,), 1: (False,), 4: (False,)})[0]
+    assert plan.survivor_id == 2
+
+
+def test_large_blocks_use_windowed_comparisons() -> None:
+    """
+    Tests that blocks above the exhaustive size limit are still de-duplicated through the sorted
+    neighbourhood window.
+
+    :return: None
+    """
+    records = [PersonRecord.from_row(i, "Sam", f"Smith{chr(97 + i % 26)}", None, None, None) for i in range(60)]
+    records.append(PersonRecord.from_row(100, "Sam", "Smitha", None, None, None))
+    plans = PersonDeduper(max_block_size=10, window=5).plan(records)
+    assert any(100 in [plan.survivor_id, *plan.duplicate_ids] for plan in plans)
+
+
+def test_merge_drops_relationships_within_the_cluster(make, session, monkeypatch) -> None:
+    """
+    Tests that merging repoints the duplicate's relationships with other people to the survivor, and
+    soft-deletes those between the duplicate and the survivor instead of relating the survivor to itself.
+
+    :param make: The model factory fixture.
+    :param session: The database session fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    survivor, duplicate, other = make(Person), make(Person), make(Person)
+    inside = [
+        make(Relationship, person_id=duplicate.id, related_person_id=survivor.id),
+        make(Relationship, person_id=survivor.id, related_person_id=duplicate.id),
+    ]
+    outgoing = make(Relationship, person_id=duplicate.id, related_person_id=other.id)
+    incoming = make(Relationship, person_id=other.id, related_person_id=duplicate.id)
+    monkeypatch.setattr(session, "commit", session.flush)
+
+    apply_merge_plan(MergePlan(survivor.id, [duplicate.id], 0.95), session=session)
+    session.expire_all()
+    assert all(relationship.deleted_at is not None for relationship in inside)
+    assert (outgoing.person_id, outgoing.related_person_id, outgoing.deleted_at) == (survivor.id, other.id, None)
+    assert (incoming.person_id, incoming.related_person_id, incoming.deleted_at) == (other.id, survivor.id, None)
@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+import tracemalloc
+import zipfile
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from app.utils.export import iter_jsonl_gzip, iter_sections, write_parquet_archive
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Library(Base):
+    __tablename__ = "libraries"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(sa.String)
+
+
+class WatchHistory(Base):
+    __tablename__ = "watch_histories"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    library_id: Mapped[int] = mapped_column(sa.ForeignKey("libraries.id"))
+    current_position: Mapped[float] = mapped_column(sa.Float)
+    note: Mapped[str] = mapped_column(sa.String)
+    deleted_at: Mapped[str] = mapped_column(sa.String, nullable=True)
+
+
+class Fund(Base):
+    __tablename__ = "funds"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    library_id: Mapped[int] = mapped_column(sa.ForeignKey("libraries.id"))
+    balance: Mapped[Decimal] = mapped_column(sa.Numeric(12, 2))
+
+
+def owned(model):
+    table = model.__table__
+    return model.__table__, lambda library_id: sa.select(*table.c).where(
+        table.c[("id" if model is Library else "library_id")] == library_id
+    ).where(*([table.c.deleted_at.is_(None)] if "deleted_at" in table.c else []))
+
+
+SECTIONS = tuple((name, *owned(model)) for name, model in (
+    ("library", Library), ("watch_history", WatchHistory), ("funds", Fund),
+))
+
+
+@pytest.fixture
+def session():
+    """
+    Fixture that provides a session on a database holding two libraries. Library 1 has 20,000 watch history
+    rows, one of them soft deleted, and a fund; library 2 has 2,000 watch history rows.
+
+    :return: The session.
+    """
+    engine = sa.create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([Library(id=1, name="Large"), Library(id=2, name="Small")])
+        session.add(Fund(id=1, library_id=1, balance=Decimal("12.50")))
+        session.execute(sa.insert(WatchHistory), [
+            {"library_id": 1 if i <= 20000 else 2, "current_position": i / 3, "note": f"entry {i} " * 4,
+             "deleted_at": "2024-01-01" if i == 7 else None}
+            for i in range(1, 22001)
+        ])
+        session.commit()
+        yield session
+
+
+def export_bytes(session, library_id: int) -> bytes:
+    return b"".join(iter_jsonl_gzip(iter_sections(library_id, session, batch_size=500, sections=SECTIONS)))
+
+
+def test_jsonl_gzip_round_trip(session) -> None:
+    """
+    Tests that the gzip stream holds one line per live row, tagged with its section, with exact decimals.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    lines = [json.loads(line) for line in gzip.decompress(export_bytes(session, 1)).splitlines()]
+    sections = [line["section"] for line in lines]
+    assert sections == ["library"] + ["watch_history"] * 19999 + ["funds"]
+    assert lines[0]["data"] == {"id": 1, "name": "Large"}
+    assert lines[-1]["data"]["balance"] == "12.50"
+    assert 7 not in {line["data"]["id"] for line in lines[1:-1]}
+
+
+def test_export_memory_is_flat(session) -> None:
+    """
+    Tests that exporting ten times as many rows does not need noticeably more memory, i.e. rows are streamed
+    rather than accumulated.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    def peak(library_id: int) -> int:
+        tracemalloc.start()
+        try:
+            for _ in iter_jsonl_gzip(iter_sections(library_id, session, batch_size=500, sections=SECTIONS)):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    small, large = peak(2), peak(1)
+    assert large < small * 2
+
+
+def test_parquet_archive(session, tmp_path) -> None:
+    """
+    Tests that the Parquet archive holds one file per section with the section's rows and column types.
+
+    :param session: The session fixture.
+    :param tmp_path: Temporary directory fixture.
+    :return: None
+    """
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = os.path.join(tmp_path, "export.zip")
+    write_parquet_archive(iter_sections(1, session, sections=SECTIONS), path, batch_size=4096)
+    with zipfile.ZipFile(path) as archive:
+        assert sorted(archive.namelist()) == ["funds.parquet", "library.parquet", "watch_history.parquet"]
+        archive.extractall(tmp_path)
+    history = pq.read_table(os.path.join(tmp_path, "watch_history.parquet"))
+    funds = pq.read_table(os.path.join(tmp_path, "funds.parquet"))
+    assert history.num_rows == 19999
+    assert funds.column("balance").to_pylist() == [Decimal("12.50")]
@@ -0,0 +1,137 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from app.models.library import Gig
+from app.utils.graph import CollaborationGraph, _credit_states
+from app.models.utils.config import RelationshipTypeEnum
+
+
+@pytest.fixture
+def graph() -> CollaborationGraph:
+    """
+    Fixture that provides a small collaboration graph: a chain of people linked through shared films, a pair of
+    frequent collaborators, an isolated person and one family relationship.
+
+    :return: The graph.
+    :rtype: CollaborationGraph
+    """
+    return CollaborationGraph.from_edges(
+        [
+            ("ana", "f1", None), ("ben", "f1", "Director"),
+            ("ben", "f2", None), ("cai", "f2", None),
+            ("cai", "f3", "Writer"), ("dee", "f3", None),
+            ("ana", "f4", None), ("ben", "f4", None),
+            ("eve", "f5", None),
+        ],
+        [("ana", "ben", RelationshipTypeEnum.SIBLING)],
+    )
+
+
+def test_credit_queries(graph: CollaborationGraph) -> None:
+    """
+    Tests film lookups, co-credit counts, collaborator ranking and relationship lookups.
+
+    :param graph: The graph fixture.
+    :type graph: CollaborationGraph
+    :return: None
+    """
+    assert sorted(graph.films_of("ben")) == ["f1", "f2", "f4"]
+    assert graph.co_credit_count("ana", "ben") == 2
+    assert graph.co_credit_count("ana", "eve") == 0
+    assert graph.top_collaborators("ben") == [("ana", 2), ("cai", 1)]
+    assert graph.relationships_of("ana") == [("ben", RelationshipTypeEnum.SIBLING)]
+    assert graph.relationships_of("ana", RelationshipTypeEnum.SPOUSE) == []
+
+
+def test_collaboration_path(graph: CollaborationGraph) -> None:
+    """
+    Tests that the shortest collaboration path alternates people and films, and that unconnected people or a
+    too small search depth yield no path.
+
+    :param graph: The graph fixture.
+    :type graph: CollaborationGraph
+    :return: None
+    """
+    path = graph.collaboration_path("ana", "dee")
+    assert path[0] == "ana" and path[-1] == "dee"
+    assert len(path) == 7
+    assert path[2:] == ["ben", "f2", "cai", "f3", "dee"]
+    assert graph.collaboration_path("ana", "eve") is None
+    assert graph.collaboration_path("ana", "dee", max_degrees=1) is None
+    assert graph.collaboration_path("ana", "ana") == ["ana"]
+
+
+def test_patches_and_compaction(graph: CollaborationGraph) -> None:
+    """
+    Tests that added and removed credits are visible before and after the overlay is compacted.
+
+    :param graph: The graph fixture.
+    :type graph: CollaborationGraph
+    :return: None
+    """
+    graph.add_credit("eve", "f3")
+    graph.remove_credit("ben", "f4")
+    assert graph.co_credit_count("ana", "ben") == 1
+    assert graph.collaboration_path("eve", "dee") == ["eve", "f3", "dee"]
+    graph.compact()
+    assert graph.co_credit_count("ana", "ben") == 1
+    assert sorted(graph.films_of("eve")) == ["f3", "f5"]
+
+
+def test_credits_sharing_an_edge(graph: CollaborationGraph, tmp_path) -> None:
+    """
+    Tests that a person credited twice on a film stays linked to it until both credits are removed, also across
+    compactions and snapshots.
+
+    :param graph: The graph fixture.
+    :type graph: CollaborationGraph
+    :param tmp_path: Pytest temporary directory.
+    :return: None
+    """
+    graph.add_credit("ana", "f1", "Producer")
+    graph.remove_credit("ana", "f1")
+    assert graph.co_credit_count("ana", "ben") == 2
+    graph.add_credit("ana", "f1")
+    graph.compact()
+    path = str(tmp_path / "graph.npz")
+    graph.save(path)
+    graph = CollaborationGraph.load(path)
+    graph.remove_credit("ana", "f1")
+    assert graph.co_credit_count("ana", "ben") == 2
+    graph.remove_credit("ana", "f1")
+    assert graph.co_credit_count("ana", "ben") == 1 and sorted(graph.films_of("ana")) == ["f4"]
+
+
+def test_credit_changes_move_edges(make) -> None:
+    """
+    Tests that a credit moved to another film is patched as leaving its old film and joining the new one, that
+    other changes patch nothing and that a soft deleted credit leaves its film.
+
+    :param make: The model factory fixture.
+    :return: None
+    """
+    gig = make(Gig, film_id=uuid.uuid4())
+    old_film, new_film = gig.film_id, uuid.uuid4()
+    assert _credit_states(gig, False, False) == ((gig.career_id, old_film, gig.crew_type),) * 2
+    gig.film_id = new_film
+    before, after = _credit_states(gig, False, False)
+    assert before[1] == old_film and after[1] == new_film
+    gig.deleted_at = datetime.now()
+    assert _credit_states(gig, False, False)[1] is None
+
+
+def test_snapshot_round_trip(graph: CollaborationGraph, tmp_path) -> None:
+    """
+    Tests that a saved snapshot loads back into an equivalent graph.
+
+    :param graph: The graph fixture.
+    :type graph: CollaborationGraph
+    :param tmp_path: Pytest temporary directory.
+    :return: None
+    """
+    path = str(tmp_path / "graph.npz")
+    graph.save(path)
+    loaded = CollaborationGraph.load(path)
+    assert loaded.top_collaborators("ben") == graph.top_collaborators("ben")
+    assert loaded.relationships_of("ana") == graph.relationships_of("ana")
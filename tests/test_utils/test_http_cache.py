@@ -0,0 +1,164 @@
+from datetime import datetime
+
+import pytest
+import sqlalchemy as sa
+from flask import Blueprint, Flask, abort, jsonify, render_template_string
+from jinja2 import DictLoader
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from app.extensions import db
+from app.utils.cache import cache
+from app.utils.http_cache import conditional_view, entity_version, entity_versions, init_http_cache, render_fragment
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Film(Base):
+    __tablename__ = "films"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(sa.String)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    reviews: Mapped[list["Review"]] = relationship(back_populates="film")
+
+
+class Review(Base):
+    __tablename__ = "reviews"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    film_id: Mapped[int] = mapped_column(sa.ForeignKey("films.id"))
+    text: Mapped[str] = mapped_column(sa.String)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    film: Mapped[Film] = relationship(back_populates="reviews")
+
+
+renders: list = []
+
+
+@pytest.fixture
+def app():
+    """
+    Fixture that provides an application with conditional views of a film and of a film with its reviews, a
+    plain JSON view in a cached blueprint and a fragment template.
+
+    :return: The application.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://", HTTP_CACHE_MAX_AGE=0, HTTP_CACHE_SHARED_MAX_AGE=60,
+        HTTP_CACHE_BLUEPRINTS=("library",),
+    )
+    app.jinja_loader = DictLoader({"card.html": "<b>{{ film.title }}</b>"})
+    db.init_app(app)
+    init_http_cache(app)
+    cache.configure()
+    renders.clear()
+    library = Blueprint("library", __name__)
+
+    @library.route("/films/<int:film_id>")
+    @conditional_view(lambda film_id: [entity_version(Film, film_id)])
+    def film(film_id):
+        renders.append(film_id)
+        return render_template_string("{{ film.title }}", film=db.session.get(Film, film_id) or abort(404))
+
+    @library.route("/films/<int:film_id>/reviews")
+    @conditional_view(lambda film_id: entity_versions(Film, film_id, ["reviews"]))
+    def film_reviews(film_id):
+        film = db.session.get(Film, film_id) or abort(404)
+        return jsonify(title=film.title, reviews=[review.text for review in film.reviews])
+
+    @library.route("/stats")
+    def stats():
+        renders.append("stats")
+        return jsonify(films=db.session.scalar(sa.select(sa.func.count(Film.id))))
+
+    app.register_blueprint(library)
+    with app.app_context():
+        Base.metadata.create_all(db.engine)
+        db.session.add(Film(id=1, title="Alien", updated_at=datetime(2024, 1, 1)))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def test_conditional_view_answers_304_without_rendering(app) -> None:
+    """
+    Tests that a matching ``If-None-Match`` is answered with a 304 without running the view, that a change to
+    the entity changes the ETag, and that cache headers are set.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    client = app.test_client()
+    first = client.get("/films/1")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] in ("public, max-age=0, s-maxage=60", "public, s-maxage=60, max-age=0")
+    assert first.headers["Vary"] == "Accept-Encoding"
+    etag = first.headers["ETag"]
+
+    revalidated = client.get("/films/1", headers={"If-None-Match": etag})
+    assert (revalidated.status_code, revalidated.headers["ETag"], renders) == (304, etag, [1])
+
+    db.session.execute(sa.update(Film).values(updated_at=datetime(2024, 1, 2)))
+    db.session.commit()
+    changed = client.get("/films/1", headers={"If-None-Match": etag})
+    assert (changed.status_code, changed.text) == (200, "Alien")
+    assert changed.headers["ETag"] != etag
+    assert client.get("/films/2").status_code == 404
+
+
+def test_blueprint_responses_get_body_etags(app) -> None:
+    """
+    Tests that views of cached blueprints without their own ETag get one hashed from the body and must be
+    revalidated.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    client = app.test_client()
+    first = client.get("/stats")
+    assert first.headers["Cache-Control"] == "no-cache"
+    revalidated = client.get("/stats", headers={"If-None-Match": first.headers["ETag"]})
+    assert (revalidated.status_code, revalidated.data) == (304, b"")
+
+
+def test_fragments_are_cached_per_version(app) -> None:
+    """
+    Tests that a fragment is rendered once per version.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    film = db.session.get(Film, 1)
+    with app.test_request_context():
+        assert render_fragment("card.html", [film.updated_at], film=film) == "<b>Alien</b>"
+        film.title = "Aliens"
+        assert render_fragment("card.html", [film.updated_at], film=film) == "<b>Alien</b>"
+        film.updated_at = datetime(2024, 2, 1)
+        assert render_fragment("card.html", [film.updated_at], film=film) == "<b>Aliens</b>"
+    assert cache.stats("fragment").misses == 2
+
+
+def test_conditional_views_follow_related_rows(app) -> None:
+    """
+    Tests that the ETag of a view over a row and its related rows changes when a related row is edited or
+    added, and not otherwise.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    db.session.add(Review(id=1, film_id=1, text="Tense", updated_at=datetime(2024, 1, 1)))
+    db.session.commit()
+    client = app.test_client()
+    etag = client.get("/films/1/reviews").headers["ETag"]
+    assert client.get("/films/1/reviews", headers={"If-None-Match": etag}).status_code == 304
+
+    db.session.execute(sa.update(Review).values(text="Terrifying", updated_at=datetime(2024, 1, 2)))
+    db.session.commit()
+    edited = client.get("/films/1/reviews", headers={"If-None-Match": etag})
+    assert (edited.status_code, edited.json["reviews"]) == (200, ["Terrifying"])
+
+    db.session.add(Review(id=2, film_id=1, text="Slow", updated_at=datetime(2023, 1, 1)))
+    db.session.commit()
+    added = client.get("/films/1/reviews", headers={"If-None-Match": edited.headers["ETag"]})
+    assert (added.status_code, added.json["reviews"]) == (200, ["Terrifying", "Slow"])
+    assert client.get("/films/2/reviews").status_code == 404
@@ -0,0 +1,129 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from app.models.idempotency import IdempotencyKey
+from app.utils.idempotency import (
+    IdempotencyMismatch, RequestInProgress, RequestRejected, purge_expired_keys, run_idempotent,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture that provides a SQLite file database holding the idempotency key table.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The engine.
+    """
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'keys.db'}", connect_args={"timeout": 30})
+    IdempotencyKey.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_responses_are_stored_and_replayed(engine) -> None:
+    """
+    Tests that an operation runs once per key, that replays return its stored response, that a key cannot be
+    reused for another request, that refusals are replayed too and that a failed operation releases its key.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    scope, runs = f"orders:{uuid.uuid4()}", []
+
+    def operation():
+        runs.append(1)
+        return 201, {"order": len(runs)}
+
+    def refuse():
+        runs.append(1)
+        raise RequestRejected(409, {"error": "Sold out"})
+
+    def fail():
+        raise RuntimeError("database went away")
+
+    with Session(engine) as session:
+        first = run_idempotent(scope, "a", {"quantity": 1}, operation, session, ttl=60, lease=5)
+        replay = run_idempotent(scope, "a", {"quantity": 1}, operation, session, ttl=60, lease=5)
+        assert (first.status, first.body, first.replayed) == (201, {"order": 1}, False)
+        assert (replay.status, replay.body, replay.replayed) == (201, {"order": 1}, True)
+        with pytest.raises(IdempotencyMismatch):
+            run_idempotent(scope, "a", {"quantity": 2}, operation, session, ttl=60, lease=5)
+
+        assert run_idempotent(scope, "b", {}, refuse, session, ttl=60, lease=5).status == 409
+        assert run_idempotent(scope, "b", {}, refuse, session, ttl=60, lease=5).body == {"error": "Sold out"}
+        assert len(runs) == 2
+
+        with pytest.raises(RuntimeError):
+            run_idempotent(scope, "c", {}, fail, session, ttl=60, lease=5)
+        assert run_idempotent(scope, "c", {}, operation, session, ttl=60, lease=5).body == {"order": 3}
+
+
+def test_retry_storm_runs_the_operation_once(engine) -> None:
+    """
+    Stress test: many clients retry the same key while its first request is still running. Exactly one runs the
+    operation; the others are told it is in progress or get the stored response, never a second run.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    scope, runs, outcomes = f"orders:{uuid.uuid4()}", [], []
+    lock = threading.Lock()
+
+    def operation():
+        time.sleep(0.3)
+        runs.append(1)
+        return 201, {"placed": True}
+
+    def client() -> None:
+        with Session(engine) as session:
+            for _ in range(20):
+                try:
+                    response = run_idempotent(scope, "storm", {"item": 1}, operation, session, ttl=60, lease=5)
+                except RequestInProgress:
+                    outcome = "in progress"
+                else:
+                    outcome = "replayed" if response.replayed else "placed"
+                with lock:
+                    outcomes.append(outcome)
+                time.sleep(0.02)
+
+    clients = [threading.Thread(target=client) for _ in range(8)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    assert len(runs) == 1
+    assert outcomes.count("placed") == 1
+    assert "in progress" in outcomes and "replayed" in outcomes
+
+
+def test_expired_keys_are_taken_over_and_purged(engine) -> None:
+    """
+    Tests that a key whose request stopped responding is taken over after its lease, that expired keys can be
+    reused and that purging removes them.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    scope = f"orders:{uuid.uuid4()}"
+    with Session(engine) as session:
+        run_idempotent(scope, "done", {}, lambda: (200, {"run": 1}), session, ttl=0.1, lease=5)
+        run_idempotent(scope, "old", {}, lambda: (200, {"run": 1}), session, ttl=0.1, lease=5)
+        session.execute(sa.insert(IdempotencyKey).values(
+            scope=scope, key="stuck", fingerprint=b"\0" * 16, locked_until=datetime.now() - timedelta(minutes=1),
+            expires_at=datetime.now() + timedelta(hours=1),
+        ))
+        session.commit()
+        taken_over = run_idempotent(scope, "stuck", {}, lambda: (200, {"run": 2}), session, ttl=60, lease=5)
+        assert (taken_over.body, taken_over.replayed) == ({"run": 2}, False)
+        time.sleep(0.2)
+        reused = run_idempotent(scope, "done", {"other": True}, lambda: (200, {"run": 3}), session, ttl=60, lease=5)
+        assert (reused.body, reused.replayed) == ({"run": 3}, False)
+        assert purge_expired_keys(session) == 1
+        assert sorted(session.scalars(sa.select(IdempotencyKey.key))) == ["done", "stuck"]
@@ -0,0 +1,256 @@
+import io
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from app.utils import importing
+from app.utils.importing import FilmResolver, ImportRow, copy_rows, import_watch_history, parse_csv, run_import_job
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class WatchHistory(Base):
+    __tablename__ = "watch_histories"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    film_id: Mapped[str] = mapped_column(sa.String)
+    watch_count: Mapped[int] = mapped_column(default=0)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    report: Mapped[dict] = mapped_column(sa.JSON, default={})
+
+
+class Catalog(DeclarativeBase):
+    pass
+
+
+class CatalogRow:
+    id: Mapped[uuid.UUID] = mapped_column(sa.Uuid, primary_key=True, default=uuid.uuid4)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    created_by: Mapped[Optional[uuid.UUID]] = mapped_column(sa.Uuid)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column()
+
+
+class Film(CatalogRow, Catalog):
+    __tablename__ = "films"
+    title: Mapped[str] = mapped_column(sa.String)
+    original_title: Mapped[Optional[str]] = mapped_column(sa.String)
+    release_year: Mapped[Optional[int]] = mapped_column()
+    release_date: Mapped[Optional[datetime]] = mapped_column()
+    runtime: Mapped[Optional[int]] = mapped_column()
+    imdb_id: Mapped[Optional[str]] = mapped_column(sa.String)
+    tmdb_id: Mapped[Optional[int]] = mapped_column()
+
+
+class LibraryWatch(CatalogRow, Catalog):
+    __tablename__ = "watch_histories"
+    library_id: Mapped[uuid.UUID] = mapped_column(sa.Uuid)
+    film_id: Mapped[uuid.UUID] = mapped_column(sa.Uuid)
+    watch_count: Mapped[int] = mapped_column(default=0)
+    last_watched: Mapped[datetime] = mapped_column(default=datetime.now)
+
+
+class Scroll(CatalogRow, Catalog):
+    __tablename__ = "scrolls"
+    reviewer_id: Mapped[uuid.UUID] = mapped_column(sa.Uuid)
+
+
+class ScrollEntry(CatalogRow, Catalog):
+    __tablename__ = "scroll_entries"
+    scroll_id: Mapped[uuid.UUID] = mapped_column(sa.Uuid)
+    item_id: Mapped[uuid.UUID] = mapped_column(sa.Uuid)
+    rank: Mapped[int] = mapped_column()
+
+
+@pytest.fixture
+def catalog(monkeypatch) -> SimpleNamespace:
+    """
+    Fixture that provides a session on an in-memory SQLite database standing in for the films, watch histories
+    and scrolls the importer writes, with three films and a library that already watched one of them.
+
+    :param monkeypatch: The monkeypatch fixture.
+    :return: The session, library id and films, by name.
+    """
+    monkeypatch.setattr(importing, "Film", Film)
+    monkeypatch.setattr(importing, "WatchHistory", LibraryWatch)
+    monkeypatch.setattr(importing, "Scroll", Scroll)
+    monkeypatch.setattr(importing, "ScrollEntry", ScrollEntry)
+    engine = sa.create_engine("sqlite://")
+    Catalog.metadata.create_all(engine)
+    library_id = uuid.uuid4()
+    with Session(engine) as session:
+        films = {
+            "matrix": Film(title="The Matrix", release_year=1999, imdb_id="tt0133093"),
+            "alien": Film(title="Alien", release_year=1979, tmdb_id=348),
+            "heat": Film(title="Heat", release_year=1995),
+        }
+        session.add_all(films.values())
+        session.flush()
+        session.add(LibraryWatch(
+            library_id=library_id, film_id=films["matrix"].id, watch_count=2, last_watched=datetime(2020, 1, 1),
+        ))
+        session.commit()
+        yield SimpleNamespace(session=session, library_id=library_id, **films)
+    engine.dispose()
+
+
+def test_parse_letterboxd_diary() -> None:
+    """
+    Tests that a diary style export is parsed by its header names, with blank lines skipped and unparseable
+    values read as missing.
+
+    :return: None
+    """
+    data = (
+        "Date,Name,Year,Letterboxd URI,Rating,Watched Date\n"
+        "2024-02-03,The Matrix,1999,https://boxd.it/1,4.5,2024-02-01\n"
+        "\n"
+        "2024-02-04,Alien,n/a,https://boxd.it/2,,2024-02-02\n"
+    )
+    rows = list(parse_csv(io.StringIO(data, newline="")))
+    assert rows == [
+        ImportRow(title="The Matrix", year=1999, rating=4.5, watched_at=datetime(2024, 2, 1)),
+        ImportRow(title="Alien", year=None, rating=None, watched_at=datetime(2024, 2, 2)),
+    ]
+
+
+def test_parse_imdb_ratings() -> None:
+    """
+    Tests that an IMDb ratings export yields its identifiers, and that a file without any column identifying
+    films is rejected.
+
+    :return: None
+    """
+    data = (
+        "Const,Your Rating,Date Rated,Title,URL,Title Type,IMDb Rating,Runtime (mins),Year\n"
+        "tt0133093,9,2023-11-05,The Matrix,https://www.imdb.com/title/tt0133093/,movie,8.7,136,1999\n"
+    )
+    [row] = parse_csv(io.StringIO(data, newline=""))
+    assert (row.imdb_id, row.title, row.year, row.rating) == ("tt0133093", "The Matrix", 1999, 9.0)
+    assert row.watched_at == datetime(2023, 11, 5)
+    with pytest.raises(ValueError):
+        next(parse_csv(io.StringIO("Rating,Date\n5,2024-01-01\n", newline="")))
+
+
+def test_copy_rows_applies_column_defaults() -> None:
+    """
+    Tests that bulk inserted rows receive the defaults the ORM would have applied.
+
+    :return: None
+    """
+    engine = sa.create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        inserted = copy_rows(session, WatchHistory.__table__, [
+            {"id": i, "film_id": f"film-{i}", "watch_count": 3} for i in range(1, 1001)
+        ])
+        session.commit()
+        assert inserted == 1000
+        assert session.scalar(sa.select(sa.func.count()).select_from(WatchHistory)) == 1000
+        row = session.get(WatchHistory, 1)
+        assert row.watch_count == 3 and row.report == {} and isinstance(row.created_at, datetime)
+        assert copy_rows(session, WatchHistory.__table__, []) == 0
+
+
+def test_films_resolve_by_id_then_title(catalog) -> None:
+    """
+    Tests that rows are resolved by their IMDb or TMDB id before their title and year, and that rows matching
+    no film are reported as unmatched.
+
+    :param catalog: The catalog fixture.
+    :return: None
+    """
+    resolver = FilmResolver(catalog.session)
+    assert resolver.resolve([
+        ImportRow(title="Something Else", imdb_id="tt0133093"),
+        ImportRow(tmdb_id=348),
+        ImportRow(title="Heat", year=1995),
+        ImportRow(title="Heat", year=1995),
+        ImportRow(title="Unknown Film", year=2001, imdb_id="tt9999999"),
+    ]) == [
+        (catalog.matrix.id, "id"), (catalog.alien.id, "id"), (catalog.heat.id, "title"),
+        (catalog.heat.id, "title"), (None, "unmatched"),
+    ]
+
+
+def test_import_folds_watches_into_history_and_ranking(catalog) -> None:
+    """
+    Tests that an import resolved over several batches adds every film's watches to the library's history,
+    keeping the latest watch, ranks the rated films in a new scroll and reports its progress after each batch.
+
+    :param catalog: The catalog fixture.
+    :return: None
+    """
+    data = (
+        "Const,Title,Year,Your Rating,Date Rated\n"
+        "tt0133093,The Matrix,1999,9,2023-11-05\n"
+        ",Heat,1995,7,2023-06-01\n"
+        ",Unknown Film,2001,5,2023-01-01\n"
+        "tt0133093,The Matrix,1999,8,2024-02-01\n"
+        ",Heat,1995,,2023-08-01\n"
+    )
+    progress = []
+    summary = import_watch_history(
+        catalog.library_id, io.StringIO(data, newline=""), session=catalog.session, progress=progress.append,
+        batch_size=2,
+    )
+    assert progress == [2, 4, 5]
+    assert {key: summary[key] for key in ("rows", "matched_by_id", "matched_by_title", "unmatched")} == {
+        "rows": 5, "matched_by_id": 2, "matched_by_title": 2, "unmatched": 1,
+    }
+    assert summary["unmatched_rows"] == [{"title": "Unknown Film", "year": 2001}]
+    assert (summary["watch_history_updated"], summary["watch_history_created"]) == (1, 1)
+
+    history = dict(
+        (film_id, (count, last)) for film_id, count, last in catalog.session.execute(
+            sa.select(LibraryWatch.film_id, LibraryWatch.watch_count, LibraryWatch.last_watched)
+            .where(LibraryWatch.library_id == catalog.library_id)
+        )
+    )
+    assert history == {
+        catalog.matrix.id: (4, datetime(2024, 2, 1)),
+        catalog.heat.id: (2, datetime(2023, 8, 1)),
+    }
+    ranking = catalog.session.execute(
+        sa.select(ScrollEntry.item_id, ScrollEntry.rank).where(ScrollEntry.scroll_id == uuid.UUID(summary["scroll_id"]))
+        .order_by(ScrollEntry.rank)
+    ).tuples().all()
+    assert ranking == [(catalog.matrix.id, 1), (catalog.heat.id, 2)] and summary["ranked"] == 2
+    assert catalog.session.scalar(sa.select(Scroll.reviewer_id)) == catalog.library_id
+
+
+def test_import_job_reports_bytes_read(catalog, tmp_path, monkeypatch) -> None:
+    """
+    Tests that the import job streams the uploaded file, reports its progress in bytes of the file read up to
+    its size, and removes the upload once imported.
+
+    :param catalog: The catalog fixture.
+    :param tmp_path: Temporary directory fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    path = tmp_path / "upload.csv"
+    path.write_text("Name,Year,Watched Date\n" + "Heat,1995,2023-08-01\n" * 50, encoding="utf-8")
+    size = path.stat().st_size
+    reports = []
+    context = SimpleNamespace(
+        final_attempt=False,
+        report=lambda progress, total=None, force=False: reports.append((progress, total, force)),
+    )
+    monkeypatch.setattr(importing, "db", SimpleNamespace(session=catalog.session))
+    app = Flask(__name__)
+    app.config["IMPORT_BATCH_SIZE"] = 20
+    with app.app_context():
+        summary = run_import_job(context, str(catalog.library_id), str(path))
+    assert summary["rows"] == 50 and summary["matched_by_title"] == 50
+    assert reports[0] == (0, size, True) and reports[-1] == (size, None, True)
+    assert len(reports) == 5 and all(0 < progress <= size for progress, _, _ in reports[1:])
+    assert not path.exists()
+    assert catalog.session.scalar(
+        sa.select(LibraryWatch.watch_count).where(LibraryWatch.film_id == catalog.heat.id)
+    ) == 50
@@ -0,0 +1,89 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+from app.utils.instrumentation import InstrumentedQueuePool, init_instrumentation, metrics, normalize_statement
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture that provides a file-backed SQLite engine using the instrumented pool.
+
+    :param tmp_path: Pytest temporary directory.
+    :return: The engine.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}", poolclass=InstrumentedQueuePool, pool_size=2)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def app(engine) -> Flask:
+    """
+    Fixture that provides an instrumented application with a view issuing three statements.
+
+    :param engine: The instrumented engine fixture.
+    :return: The application.
+    :rtype: Flask
+    """
+    metrics.reset()
+    app = Flask(__name__)
+    app.config.update(DB_INSTRUMENTATION_SAMPLE_RATE=1.0, DB_INSTRUMENTATION_DEBUG_HEADER=True)
+    init_instrumentation(app)
+
+    @app.route("/films")
+    def films():
+        with engine.connect() as conn:
+            for film_id in (1, 2, 3):
+                conn.execute(text("SELECT :id"), {"id": film_id})
+        return "ok"
+
+    return app
+
+
+def test_normalize_statement_groups_literals() -> None:
+    """
+    Tests that statements differing only in literals, parameter style or IN list length share a fingerprint.
+
+    :return: None
+    """
+    first, first_fingerprint = normalize_statement("SELECT * FROM films WHERE title = 'Heat' AND id IN (1, 2, 3)")
+    second, second_fingerprint = normalize_statement("SELECT *  FROM films\nWHERE title = %(title)s AND id IN (%s, %s)")
+    assert first == second == "SELECT * FROM films WHERE title = ? AND id IN (?)"
+    assert first_fingerprint == second_fingerprint
+    assert normalize_statement("SELECT * FROM films")[1] != first_fingerprint
+
+
+def test_request_metrics_and_debug_headers(app: Flask) -> None:
+    """
+    Tests that a sampled request reports its statements through debug headers and the Prometheus exposition,
+    including pool checkouts.
+
+    :param app: The instrumented application fixture.
+    :type app: Flask
+    :return: None
+    """
+    response = app.test_client().get("/films")
+    assert response.headers["X-DB-Query-Count"] == "3"
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert response.headers["X-DB-Slowest"] == normalize_statement("SELECT ?")[1]
+
+    exposition = metrics.render()
+    assert 'amber_db_queries_total{blueprint="app"} 3' in exposition
+    assert 'amber_db_request_queries_bucket{blueprint="app",le="5"} 1' in exposition
+    assert 'statement="SELECT ?"' in exposition
+    assert "amber_db_pool_checkouts_total 1" in exposition
+
+
+def test_unsampled_requests_are_not_recorded(app: Flask) -> None:
+    """
+    Tests that requests outside the sample are neither recorded nor given debug headers.
+
+    :param app: The instrumented application fixture.
+    :type app: Flask
+    :return: None
+    """
+    app.config["DB_INSTRUMENTATION_SAMPLE_RATE"] = 0.0
+    response = app.test_client().get("/films")
+    assert "X-DB-Query-Count" not in response.headers
+    assert metrics.requests == {}
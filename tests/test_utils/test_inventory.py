@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.inventory import InventoryReservation, RESERVATION_CONFIRMED, RESERVATION_RELEASED
+from app.utils.inventory import (
+    ReservationUnavailable, SoldOut, confirm_reservation, expire_reservations, gate, release_reservation, reserve,
+    take_stock,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture that provides a SQLite file database holding merchandise and ticket stock and the reservations.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The engine.
+    """
+    for name, column in (("merchandises", "inventory_count"), ("tickets", "quantity")):
+        if name not in db.metadata.tables:
+            sa.Table(name, db.metadata, sa.Column("id", sa.Uuid, primary_key=True), sa.Column(column, sa.Integer))
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'inventory.db'}", connect_args={"timeout": 30})
+    for name in ("merchandises", "tickets", "inventory_reservations"):
+        db.metadata.tables[name].create(engine)
+    yield engine
+    engine.dispose()
+
+
+def add_item(engine, table: str, count: int) -> uuid.UUID:
+    item_id = uuid.uuid4()
+    column = {"merchandises": "inventory_count", "tickets": "quantity"}[table]
+    with engine.begin() as conn:
+        conn.execute(db.metadata.tables[table].insert().values({"id": item_id, column: count}))
+    return item_id
+
+
+def stock(engine, table: str, item_id) -> int:
+    table = db.metadata.tables[table]
+    with engine.connect() as conn:
+        return conn.execute(sa.select(table.c[1]).where(table.c.id == item_id)).scalar_one()
+
+
+def test_reservations_hold_confirm_release_and_expire(engine) -> None:
+    """
+    Tests that reserving takes items from stock, that confirmed reservations keep them, that released and
+    expired reservations put them back exactly once and that an expired reservation cannot be confirmed.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    shirt, ticket = add_item(engine, "merchandises", 5), add_item(engine, "tickets", 2)
+    with Session(engine) as session:
+        kept = reserve("merchandise", shirt, 2, "buyer", ttl=60, session=session)
+        dropped = reserve("merchandise", shirt, 2, "buyer", ttl=60, session=session)
+        stale = reserve("ticket", ticket, 2, "buyer", ttl=0.05, session=session)
+        session.commit()
+        with pytest.raises(SoldOut):
+            take_stock("merchandise", shirt, 2, session)
+        with pytest.raises(SoldOut):
+            reserve("ticket", ticket, 1, ttl=60, session=session)
+        assert stock(engine, "merchandises", shirt) == 1 and stock(engine, "tickets", ticket) == 0
+
+        assert confirm_reservation(kept.id, session).status == RESERVATION_CONFIRMED
+        assert release_reservation(dropped.id, session) and not release_reservation(dropped.id, session)
+        assert not release_reservation(kept.id, session)
+        session.commit()
+        assert stock(engine, "merchandises", shirt) == 3
+        assert take_stock("merchandise", shirt, 3, session) == 0
+
+        time.sleep(0.1)
+        with pytest.raises(ReservationUnavailable):
+            confirm_reservation(stale.id, session)
+        assert expire_reservations(session) == 1
+        assert expire_reservations(session) == 0
+        assert stock(engine, "tickets", ticket) == 2
+        assert session.get(InventoryReservation, stale.id, populate_existing=True).status == RESERVATION_RELEASED
+
+
+def test_concurrent_buyers_never_oversell(engine) -> None:
+    """
+    Stress test: hundreds of buyers on concurrent threads race for a few items. Exactly as many buyers as there
+    are items succeed, the stock ends at zero and the admission gate turns most latecomers away without a query.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    item, buyers = add_item(engine, "merchandises", 20), 400
+    bought, lock = [], threading.Lock()
+    rejected_before = gate.rejected
+
+    def buyer(count: int) -> None:
+        with Session(engine) as session:
+            for _ in range(count):
+                try:
+                    reservation = reserve("merchandise", item, 1, ttl=60, session=session)
+                    session.commit()
+                except SoldOut:
+                    session.rollback()
+                    continue
+                with lock:
+                    bought.append(reservation.id)
+
+    threads = [threading.Thread(target=buyer, args=(buyers // 16,)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(bought) == len(set(bought)) == 20
+    assert stock(engine, "merchandises", item) == 0
+    assert gate.rejected - rejected_before > buyers // 2
+
+
+def test_rolled_back_purchases_do_not_close_the_gate(engine) -> None:
+    """
+    Tests that a purchase rolled back after taking the last items does not turn away the next buyer.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    item = add_item(engine, "merchandises", 2)
+    with Session(engine) as session:
+        assert take_stock("merchandise", item, 2, session=session) == 0
+        session.rollback()
+        assert take_stock("merchandise", item, 1, session=session) == 1
+        session.commit()
+    assert stock(engine, "merchandises", item) == 1
@@ -0,0 +1,202 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from app.extensions import db
+from app.models.jobs import Job, JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING
+from app.utils.jobs import (
+    PermanentJobFailure, Worker, cancel_job, enqueue, job_handler, requeue_stale_jobs,
+    run_workers,
+)
+
+
+ran: list = []
+
+
+@job_handler("test_record")
+def record(context, value):
+    ran.append(value)
+    return {"value": value}
+
+
+@job_handler("test_limited", concurrency=1)
+def limited(context, value):
+    ran.append(value)
+
+
+@job_handler("test_flaky", max_attempts=3)
+def flaky(context, permanent=False):
+    raise (PermanentJobFailure if permanent else RuntimeError)("boom")
+
+
+@job_handler("test_progress")
+def progress(context, steps, cancel_at=None):
+    for step in range(steps):
+        if step == cancel_at:
+            cancel_job(context.job_id)
+            db.session.commit()
+        context.report(step + 1, steps, force=True)
+    return {"steps": steps}
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    Fixture that provides an application on a SQLite file database holding the job table, with retries
+    rescheduled immediately.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The application, inside an application context.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'jobs.db'}",
+        JOB_RETRY_BACKOFF=0.0,
+        JOB_POLL_INTERVAL=0.01,
+        JOB_PROGRESS_INTERVAL=0.0,
+    )
+    db.init_app(app)
+    ran.clear()
+    with app.app_context():
+        Job.__table__.create(db.engine)
+        yield app
+        db.session.remove()
+
+
+def statuses() -> dict:
+    return dict(db.session.execute(sa.select(Job.id, Job.status)).tuples().all())
+
+
+def test_priority_and_deduplication(app) -> None:
+    """
+    Tests that higher priority jobs run first and that a dedupe key returns the active job instead of adding
+    another one, until that job has finished.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    enqueue("test_record", {"value": "low"})
+    high = enqueue("test_record", {"value": "high"}, priority=5, dedupe_key="high")
+    assert enqueue("test_record", {"value": "again"}, dedupe_key="high").id == high.id
+    db.session.commit()
+
+    worker = Worker(app, "test")
+    assert [worker.run_one(), worker.run_one(), worker.run_one()] == [JOB_DONE, JOB_DONE, None]
+    assert ran == ["high", "low"]
+    db.session.expire_all()
+    assert db.session.get(Job, high.id).result == {"value": "high"}
+    assert enqueue("test_record", {"value": "again"}, dedupe_key="high").id != high.id
+
+
+def test_retries_then_fails(app) -> None:
+    """
+    Tests that a failing job is retried until its attempts are used up, while a permanent failure is not
+    retried at all.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    flaky_job = enqueue("test_flaky")
+    permanent = enqueue("test_flaky", {"permanent": True})
+    db.session.commit()
+
+    worker = Worker(app, "test")
+    outcomes = []
+    while (outcome := worker.run_one()) is not None:
+        outcomes.append(outcome)
+    assert sorted(outcomes) == sorted([JOB_QUEUED, JOB_QUEUED, JOB_FAILED, JOB_FAILED])
+    db.session.expire_all()
+    assert db.session.get(Job, flaky_job.id).attempts == 3
+    assert db.session.get(Job, permanent.id).attempts == 1
+    assert "boom" in db.session.get(Job, flaky_job.id).error
+
+
+def test_concurrency_limit_skips_saturated_types(app) -> None:
+    """
+    Tests that a job type at its concurrency limit is skipped in favour of other types.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    busy = enqueue("test_limited", {"value": "busy"})
+    waiting = enqueue("test_limited", {"value": "waiting"}, priority=10)
+    other = enqueue("test_record", {"value": "other"})
+    db.session.commit()
+    db.session.execute(sa.update(Job).where(Job.id == busy.id).values(status=JOB_RUNNING, locked_by="elsewhere"))
+    db.session.commit()
+
+    worker = Worker(app, "test")
+    assert worker.claim()["id"] == other.id
+    assert worker.claim() is None
+    db.session.execute(sa.update(Job).where(Job.id == busy.id).values(status=JOB_DONE))
+    db.session.commit()
+    assert worker.claim()["id"] == waiting.id
+
+
+def test_progress_and_cancellation(app) -> None:
+    """
+    Tests that progress reports land on the job row and that cancelling a running job stops its handler.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    finished = enqueue("test_progress", {"steps": 4})
+    cancelled = enqueue("test_progress", {"steps": 4, "cancel_at": 2})
+    db.session.commit()
+
+    worker = Worker(app, "test")
+    assert sorted([worker.run_one(), worker.run_one()]) == [JOB_CANCELLED, JOB_DONE]
+    db.session.expire_all()
+    done = db.session.get(Job, finished.id)
+    assert (done.progress, done.total, done.result) == (4, 4, {"steps": 4})
+    stopped = db.session.get(Job, cancelled.id)
+    assert (stopped.status, stopped.progress) == (JOB_CANCELLED, 2)
+
+
+def test_stale_jobs_are_requeued(app) -> None:
+    """
+    Tests that running jobs whose worker stopped sending heartbeats are queued again, or failed when they have
+    no attempts left.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    retry = enqueue("test_record", {"value": 1})
+    exhausted = enqueue("test_record", {"value": 2}, max_attempts=1)
+    db.session.commit()
+    db.session.execute(sa.update(Job).values(
+        status=JOB_RUNNING, attempts=1, locked_by="gone", heartbeat_at=datetime.now() - timedelta(hours=1)
+    ))
+    db.session.commit()
+
+    assert requeue_stale_jobs(stale_after=60) == 2
+    assert statuses() == {retry.id: JOB_QUEUED, exhausted.id: JOB_FAILED}
+
+
+def test_worker_threads_run_each_job_once(app) -> None:
+    """
+    Tests that a pool of worker threads drains the queue with every job run exactly once.
+
+    :param app: The application fixture.
+    :return: None
+    """
+    for value in range(40):
+        enqueue("test_record", {"value": value})
+    db.session.commit()
+
+    run_workers(app, threads=4, burst=True, stop=threading.Event())
+    assert sorted(ran) == list(range(40))
+    assert set(statuses().values()) == {JOB_DONE}
+
+
+def test_serialized_results_keep_paths_on_the_server() -> None:
+    """
+    Tests that serializing a job leaves out the path of the file it wrote and keeps the rest of its result.
+
+    :return: None
+    """
+    job = Job(kind="export", status=JOB_DONE, result={"path": "/var/exports/library.jsonl.gz", "rows": 3})
+    assert job.to_dict()["result"] == {"rows": 3}
+    assert Job(kind="export", status=JOB_QUEUED).to_dict()["result"] is None
@@ -0,0 +1,185 @@
+import random
+import threading
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.ledger import Posting, BalanceSnapshot, FundShard
+from app.utils.ledger import (
+    RunningTotals, UnbalancedEntry, compact_shards, fund_balance, post_entry, post_transaction, shard_fund,
+    take_snapshots, verify_ledger,
+)
+
+
+LEDGER = uuid.uuid4()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture that provides a SQLite file database holding the posting, snapshot and shard tables.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The engine.
+    """
+    for name in ("ledgers", "funds", "transactions"):
+        if name not in db.metadata.tables:
+            sa.Table(name, db.metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'ledger.db'}", connect_args={"timeout": 30})
+    Posting.__table__.create(engine)
+    BalanceSnapshot.__table__.create(engine)
+    FundShard.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_entries_must_balance(engine) -> None:
+    """
+    Tests that unbalanced entries are rejected and that transactions are booked with their fee.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    buyer, seller, toll = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    with Session(engine) as session:
+        with pytest.raises(UnbalancedEntry):
+            post_entry(LEDGER, [(buyer, -10), (seller, 9)], session=session)
+        transaction = SimpleNamespace(
+            id=None, ledger_id=LEDGER, from_fund_id=buyer, to_fund_id=seller, toll_fund=toll,
+            amount=Decimal("10.00"), fee=Decimal("0.25"), total_amount=Decimal("10.25"),
+        )
+        post_transaction(transaction, session)
+        session.commit()
+        totals = RunningTotals(settle=0)
+        assert totals.balances([buyer, seller, toll], session) == {
+            buyer: Decimal("-10.25"), seller: Decimal("10.00"), toll: Decimal("0.25"),
+        }
+        transaction.total_amount = Decimal("11")
+        with pytest.raises(UnbalancedEntry):
+            post_transaction(transaction, session)
+
+
+def test_balances_combine_snapshots_and_later_postings(engine) -> None:
+    """
+    Tests that balances read from snapshots plus later postings, whether cached or fresh, agree with the sum
+    of all postings.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    a, b = uuid.uuid4(), uuid.uuid4()
+    with Session(engine) as session:
+        post_entry(LEDGER, [(a, -5), (b, 5)], session=session)
+        session.commit()
+        assert take_snapshots(session, settle=0) == 2
+        session.commit()
+        cached = RunningTotals(settle=0)
+        assert cached.balance(a, session) == Decimal(-5)
+        post_entry(LEDGER, [(a, 2), (b, -2)], session=session)
+        session.commit()
+        assert cached.balance(a, session) == RunningTotals(settle=0).balance(a, session) == Decimal(-3)
+        assert take_snapshots(session, settle=0) == 2
+        assert take_snapshots(session, settle=0) == 0
+        session.commit()
+        assert session.scalar(sa.select(sa.func.count()).select_from(BalanceSnapshot)) == 4
+        assert verify_ledger(session) == []
+
+
+def test_concurrent_transfers_conserve_balances(engine) -> None:
+    """
+    Stress test: threads transfer between a few hot funds while another thread snapshots balances and reads
+    running totals. Every fund must end at exactly the sum of the transfers it took part in, the funds must
+    sum to zero at every read, and every snapshot must match the postings. The settle window covers SQLite's
+    lock waits between stamping and inserting a posting.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    funds = [uuid.uuid4() for _ in range(4)]
+    expected = {fund: Decimal(0) for fund in funds}
+    expected_lock, done = threading.Lock(), threading.Event()
+    totals = RunningTotals(settle=0.5)
+    errors = []
+
+    def transfer(seed: int) -> None:
+        rng = random.Random(seed)
+        try:
+            with Session(engine) as session:
+                for _ in range(150):
+                    source, target = rng.sample(funds, 2)
+                    amount = Decimal(rng.randint(1, 10000)) / 100
+                    post_entry(LEDGER, [(source, -amount), (target, amount)], session=session)
+                    session.commit()
+                    with expected_lock:
+                        expected[source] -= amount
+                        expected[target] += amount
+        except Exception as exc:
+            errors.append(exc)
+
+    def snapshot_and_read() -> None:
+        try:
+            with Session(engine) as session:
+                while not done.is_set():
+                    take_snapshots(session, settle=0.5)
+                    session.commit()
+                    assert sum(totals.balances(funds, session).values()) == 0
+        except Exception as exc:
+            errors.append(exc)
+
+    writers = [threading.Thread(target=transfer, args=(seed,)) for seed in range(8)]
+    background = threading.Thread(target=snapshot_and_read)
+    background.start()
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    done.set()
+    background.join()
+
+    assert errors == []
+    with Session(engine) as session:
+        assert session.scalar(sa.select(sa.func.count()).select_from(Posting)) == 8 * 150 * 2
+        assert totals.balances(funds, session) == expected
+        assert RunningTotals(settle=0).balances(funds, session) == expected
+        assert sum(expected.values()) == 0
+        assert verify_ledger(session) == []
+
+
+def test_hot_fund_shards_fold_and_compact(engine) -> None:
+    """
+    Tests that a fund made hot starts from its snapshot, that later entries write its shards, that postings
+    written unsharded by processes unaware of the shards are folded in by compaction, and that shards are
+    only ever added.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    source, treasury = uuid.uuid4(), uuid.uuid4()
+    with Session(engine) as session:
+        post_entry(LEDGER, [(source, -10), (treasury, 10)], session=session)
+        session.commit()
+        take_snapshots(session, settle=0)
+        assert shard_fund(treasury, 4, session) == 4
+        post_entry(LEDGER, [(source, -5), (treasury, 5)], session=session)
+        stale = uuid.uuid4()
+        session.execute(sa.insert(Posting), [
+            {"entry_id": stale, "ledger_id": LEDGER, "fund_id": source, "amount": Decimal(-3)},
+            {"entry_id": stale, "ledger_id": LEDGER, "fund_id": treasury, "amount": Decimal(3)},
+        ])
+        session.commit()
+        assert session.scalar(sa.select(sa.func.count()).where(Posting.shard.is_not(None))) == 1
+        assert fund_balance(treasury, session) == RunningTotals(settle=0).balance(treasury, session) == Decimal(18)
+        assert verify_ledger(session) == []
+
+        assert compact_shards(session, settle=0) == 1
+        assert session.execute(sa.select(FundShard.balance)).scalars().all() == [Decimal("4.5")] * 4
+        assert verify_ledger(session) == []
+        assert shard_fund(treasury, 2, session) == 0
+        assert shard_fund(treasury, 6, session) == 2
+        assert compact_shards(session, settle=0) == 1
+        assert sum(session.execute(sa.select(FundShard.balance)).scalars()) == Decimal(18)
+        assert verify_ledger(session) == []
@@ -0,0 +1,109 @@
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, select, text
+from app.utils.loading import (
+    QueryBudgetExceeded, count_queries, query_budget, loading_profile, profile_options, LOADING_PROFILES,
+    _build_options,
+)
+
+
+@pytest.fixture
+def engine():
+    """
+    Fixture that provides an in-memory SQLite engine to issue statements against.
+
+    :return: The engine.
+    """
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def test_count_queries_records_statements(engine) -> None:
+    """
+    Tests that statements are recorded while counting, including by nested counters, and not afterwards.
+
+    :param engine: The SQLite engine fixture.
+    :return: None
+    """
+    with engine.connect() as conn:
+        with count_queries() as outer:
+            conn.execute(text("SELECT 1"))
+            with count_queries() as inner:
+                conn.execute(text("SELECT 2"))
+        conn.execute(text("SELECT 3"))
+    assert outer == ["SELECT 1", "SELECT 2"]
+    assert inner == ["SELECT 2"]
+
+
+def test_query_budget_fails_when_exceeded(engine) -> None:
+    """
+    Tests that a block within its budget passes and that exceeding the budget lists the offending statements.
+
+    :param engine: The SQLite engine fixture.
+    :return: None
+    """
+    with engine.connect() as conn:
+        with query_budget(2):
+            conn.execute(text("SELECT 1"))
+        with pytest.raises(QueryBudgetExceeded) as error:
+            with query_budget(1, "film_card"):
+                for i in range(3):
+                    conn.execute(text(f"SELECT {i}"))
+    assert len(error.value.statements) == 3
+    assert "'film_card' issued 3 queries, budget is 1" in str(error.value)
+
+
+def test_profiled_view_enforces_budget(engine) -> None:
+    """
+    Tests that a view declaring a loading profile fails once it exceeds the profile's budget, but only while
+    budgets are enforced.
+
+    :param engine: The SQLite engine fixture.
+    :return: None
+    """
+    app = Flask(__name__)
+    budget = LOADING_PROFILES["film_card"].query_budget
+
+    @app.route("/cards")
+    @loading_profile("film_card")
+    def cards():
+        with engine.connect() as conn:
+            for i in range(budget + 1):
+                conn.execute(text(f"SELECT {i}"))
+        return "ok"
+
+    app.config["QUERY_BUDGET_ENFORCED"] = False
+    assert app.test_client().get("/cards").status_code == 200
+    app.config.update(QUERY_BUDGET_ENFORCED=True, PROPAGATE_EXCEPTIONS=True)
+    with pytest.raises(QueryBudgetExceeded):
+        app.test_client().get("/cards")
+
+
+def test_unknown_profile() -> None:
+    """
+    Tests that referring to a profile that does not exist fails early.
+
+    :return: None
+    """
+    with pytest.raises(KeyError):
+        profile_options("missing")
+    with pytest.raises(KeyError):
+        loading_profile("missing")
+
+
+@pytest.mark.parametrize("strict", [False, True])
+@pytest.mark.parametrize("name", sorted(LOADING_PROFILES))
+def test_profiles_resolve_against_the_models(session, name, strict) -> None:
+    """
+    Tests that every profile's columns and relationship paths exist on the mapped models, by building its
+    options and loading its model with them.
+
+    :param session: The database session fixture.
+    :param name: The profile name.
+    :param strict: Whether the options raise on relationships outside the profile.
+    :return: None
+    """
+    profile = LOADING_PROFILES[name]
+    statement = select(profile.model).options(*_build_options(name, strict)).limit(1)
+    session.scalars(statement).unique().all()
@@ -0,0 +1,98 @@
+import pytest
+from app.utils.matching import FilmMatcher, normalize_title, title_block, estimate_runtime_minutes
+
+
+@pytest.fixture
+def matcher() -> FilmMatcher:
+    """
+    Fixture that provides a `FilmMatcher` indexed with a small catalogue of films, including a film with an
+    original title, a sequel sharing its title block with the original and a film without a release year.
+
+    :return: An indexed `FilmMatcher`.
+    :rtype: FilmMatcher
+    """
+    return FilmMatcher().index_films([
+        (1, "The Matrix", None, 1999, 136),
+        (2, "The Matrix Reloaded", None, 2003, 138),
+        (3, "Inception", None, 2010, 148),
+        (4, "Amélie", "Le Fabuleux Destin d'Amélie Poulain", 2001, 122),
+        (5, "Heat", None, None, 170),
+    ])
+
+
+def test_normalize_title_strips_noise() -> None:
+    """
+    Tests that release noise, a trailing year, punctuation, accents and a leading article are removed during
+    normalization, and that the blocking key is derived from the normalized title.
+
+    :return: None
+    """
+    assert normalize_title("The Matrix (1999) 1080p BluRay x264") == "matrix"
+    assert normalize_title("1917") == "1917"
+    assert normalize_title("Amélie & Nino") == "amelie and nino"
+    assert normalize_title(None) == ""
+    assert title_block("matrix reloaded") == "matr:r"
+    assert title_block("") == ""
+
+
+def test_estimate_runtime_minutes() -> None:
+    """
+    Tests that a file runtime is estimated from its size and bitrate, and is unknown without either.
+
+    :return: None
+    """
+    assert estimate_runtime_minutes(60 * 1_000_000, 8_000_000) == pytest.approx(1.0)
+    assert estimate_runtime_minutes(None, 8_000_000) is None
+
+
+def test_matcher_links_confident_matches(matcher: FilmMatcher) -> None:
+    """
+    Tests that files with matching titles, years and runtimes are linked to the right films, including a file
+    named after a film's title without accents, and that files without candidates produce no match.
+
+    :param matcher: The indexed matcher fixture.
+    :type matcher: FilmMatcher
+    :return: None
+    """
+    matches = {match.file_id: match for match in matcher.match([
+        ("matrix", "The.Matrix.1999.1080p", 1999, 135),
+        ("amelie", "Amelie", 2001, None),
+        ("unknown", "Completely Different", 2001, None),
+    ])}
+    assert matches["matrix"].film_id == 1
+    assert matches["matrix"].linked
+    assert matches["amelie"].film_id == 4
+    assert matches["amelie"].linked
+    assert "unknown" not in matches
+
+    report = matches["matrix"].report()
+    assert report["film_id"] == "1"
+    assert report["linked"] is True
+
+
+def test_matcher_does_not_link_weak_matches(matcher: FilmMatcher) -> None:
+    """
+    Tests that a misspelled title with no year agreement is scored but not auto-linked, and that a year that
+    disagrees by more than one year keeps a file out of the film's blocks.
+
+    :param matcher: The indexed matcher fixture.
+    :type matcher: FilmMatcher
+    :return: None
+    """
+    matches = {match.file_id: match for match in matcher.match([
+        ("typo", "Incepshun", 2010, None),
+        ("wrong_year", "Inception", 1980, None),
+    ])}
+    assert matches["typo"].film_id == 3
+    assert not matches["typo"].linked
+    assert "wrong_year" not in matches
+
+
+def test_matcher_requires_index() -> None:
+    """
+    Tests that matching before indexing any films raises an error.
+
+    :return: None
+    """
+    with pytest.raises(RuntimeError):
+        FilmMatcher().match([("file", "Inception", 2010, None)])
@@ -0,0 +1,231 @@
+import random
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.utils.config import OrderStatusEnum
+from app.utils import orderbook
+from app.utils.orderbook import (
+    BUY, CANCEL, SELL, SUBMIT, OrderBook, Trader, cancel_order, catch_up, load_book, log_operations, snapshot_book,
+    trade,
+)
+
+
+def random_operations(count: int, seed: int) -> list[list]:
+    rng, submitted, operations = random.Random(seed), 0, []
+    for _ in range(count):
+        if submitted and rng.random() < 0.45:
+            operations.append([CANCEL, rng.randint(max(1, len(operations) - 100), len(operations))])
+        else:
+            side = rng.choice((BUY, SELL))
+            price = rng.randint(95, 105) + (-3 if side == BUY else 3)
+            operations.append([SUBMIT, side, price, rng.randint(1, 20), [f"trader-{rng.randrange(10)}"]])
+            submitted += 1
+    return operations
+
+
+def test_orders_match_by_price_then_time() -> None:
+    """
+    Tests that incoming orders fill against the best price first and the oldest order within a price, at the
+    resting order's price, that partial fills leave the rest resting and that cancelled orders never fill, also
+    once they were compacted away.
+
+    :return: None
+    """
+    book = OrderBook()
+    first, _ = book.submit(SELL, 101, 5, "ann")
+    second, _ = book.submit(SELL, 101, 5, "bob")
+    cheaper, _ = book.submit(SELL, 100, 2, "cat")
+    cancelled, _ = book.submit(SELL, 100, 50, "dan")
+    assert book.cancel(cancelled) and not book.cancel(cancelled)
+    assert book.best(SELL) == 100 and book.depth(SELL) == [(100, 2), (101, 10)]
+
+    taker, fills = book.submit(BUY, 101, 9, "eve")
+    assert [(fill.maker_id, fill.price, fill.quantity, fill.seller) for fill in fills] == [
+        (cheaper, 100, 2, "cat"), (first, 101, 5, "ann"), (second, 101, 2, "bob"),
+    ]
+    assert all(fill.taker_id == taker and fill.buyer == "eve" for fill in fills)
+    assert book.depth(SELL) == [(101, 3)] and book.orders[second].quantity == 3
+
+    resting, fills = book.submit(BUY, 99, 4, "eve")
+    assert fills == [] and book.best(BUY) == 99 and book.best(SELL) == 101
+    _, fills = book.submit(SELL, 90, 10, "fay")
+    assert [(fill.maker_id, fill.price, fill.quantity) for fill in fills] == [(resting, 99, 4)]
+    assert book.depth(SELL) == [(90, 6), (101, 3)] and book.best(BUY) is None
+    with pytest.raises(ValueError):
+        book.submit(BUY, 1.5, 1)
+
+    withdrawn = [book.submit(BUY, 50 + i % 7, 1, "gus")[0] for i in range(2000)]
+    assert all(book.cancel(order_id) for order_id in withdrawn)
+    assert book.best(BUY) is None and book.submit(SELL, 1, 1, "hal")[1] == []
+
+
+def test_snapshots_and_replay_rebuild_the_same_book() -> None:
+    """
+    Tests that restoring a snapshot and replaying the operations logged after it gives the same book and the
+    same fills as applying every operation.
+
+    :return: None
+    """
+    operations = random_operations(20000, seed=48)
+    book, replayed = OrderBook(), None
+    fills = []
+    for i, operation in enumerate(operations):
+        result = book.apply(operation)
+        if operation[0] == SUBMIT:
+            fills.extend(result[1])
+        if i == 7000:
+            replayed = OrderBook.restore(book.snapshot())
+            tail = len(fills)
+    replayed_fills = []
+    for operation in operations[7001:]:
+        result = replayed.apply(operation)
+        if operation[0] == SUBMIT:
+            replayed_fills.extend(result[1])
+    assert replayed_fills == fills[tail:]
+    assert replayed.snapshot() == book.snapshot() and replayed.seq == book.seq == len(operations)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """
+    Fixture that provides a SQLite file database holding the order book log and snapshots.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The engine.
+    """
+    if "tokens" not in db.metadata.tables:
+        sa.Table("tokens", db.metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'books.db'}")
+    for name in ("order_book_log", "order_book_snapshots"):
+        db.metadata.tables[name].create(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_books_recover_from_snapshots_and_logs(engine) -> None:
+    """
+    Tests that a book loads from its latest snapshot and log, that a stale copy catches up with operations
+    logged elsewhere, that a copy whose missed operations were pruned must be reloaded and that two processes
+    cannot log the same position.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    token_id, operations = uuid.uuid4(), random_operations(300, seed=7)
+    expected = OrderBook(token_id)
+    for operation in operations:
+        expected.apply(operation)
+
+    with Session(engine) as session:
+        log_operations(token_id, 1, operations[:100], session)
+        session.commit()
+        stale = load_book(token_id, session)
+        assert stale.seq == 100
+
+        book = load_book(token_id, session)
+        for operation in operations[100:200]:
+            book.apply(operation)
+        log_operations(token_id, 101, operations[100:200], session)
+        snapshot_book(book, session)
+        log_operations(token_id, 201, operations[200:], session)
+        session.commit()
+
+        assert not catch_up(stale, session)
+        assert load_book(token_id, session).snapshot() == expected.snapshot()
+        assert session.scalar(sa.select(sa.func.min(db.metadata.tables["order_book_log"].c.seq))) == 201
+
+        behind = OrderBook.restore(book.snapshot(), token_id=token_id)
+        assert catch_up(behind, session) and behind.snapshot() == expected.snapshot()
+        with pytest.raises(sa.exc.IntegrityError):
+            log_operations(token_id, 300, [[CANCEL, 1]], session)
+
+
+def test_unsettled_fills_give_resting_orders_back_their_quantity(engine, monkeypatch) -> None:
+    """
+    Tests that when a buyer who cannot pay hits a resting ask, the ask keeps its quantity and its place ahead of
+    later asks at its price, the buyer's resting orders are cancelled, and the book loaded from the log agrees.
+
+    :param engine: The engine fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    token_id, broke = uuid.uuid4(), ("broke",)
+    monkeypatch.setattr(orderbook, "book_market", lambda token_id, session: None)
+    monkeypatch.setattr(orderbook, "settle", lambda fills, market, session: (
+        [SimpleNamespace(status=OrderStatusEnum.CANCELLED) for _ in fills], {broke},
+    ))
+
+    with Session(engine) as session:
+        results, _ = trade(token_id, [[SUBMIT, SELL, 100, 5, ["ann"]], [SUBMIT, SELL, 100, 5, ["bob"]]],
+                           session, snapshot_interval=1000)
+        (ask, _), (later, _) = results
+        ((bid, _),), _ = trade(token_id, [[SUBMIT, BUY, 90, 1, broke]], session, snapshot_interval=1000)
+        ((taker, fills),), _ = trade(token_id, [[SUBMIT, BUY, 100, 8, broke]], session, snapshot_interval=1000)
+        assert [(fill.maker_id, fill.quantity) for fill in fills] == [(ask, 5), (later, 3)]
+
+        book = load_book(token_id, session)
+        assert book.depth(SELL) == [(100, 10)] and book.depth(BUY) == []
+        assert bid not in book.orders and taker not in book.orders
+        assert [fill.seller for fill in book.submit(BUY, 100, 6, "cat")[1]] == [("ann",), ("bob",)]
+
+
+def test_unsettled_fills_give_incoming_orders_back_their_quantity(engine, monkeypatch) -> None:
+    """
+    Tests that when a seller who cannot deliver fills part of an incoming bid, the bid matches the quantity again
+    against the next asks and rests with what is left, the seller's resting orders are cancelled, and the book
+    loaded from the log agrees.
+
+    :param engine: The engine fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    token_id, broke = uuid.uuid4(), ("broke",)
+    monkeypatch.setattr(orderbook, "book_market", lambda token_id, session: None)
+    monkeypatch.setattr(orderbook, "settle", lambda fills, market, session: (
+        [SimpleNamespace(status=OrderStatusEnum.CANCELLED if fill.seller == broke else OrderStatusEnum.COMPLETED)
+         for fill in fills],
+        {fill.seller for fill in fills if fill.seller == broke},
+    ))
+
+    with Session(engine) as session:
+        results, _ = trade(token_id, [
+            [SUBMIT, SELL, 100, 5, broke], [SUBMIT, SELL, 100, 5, ["bob"]], [SUBMIT, SELL, 105, 5, broke],
+        ], session, snapshot_interval=1000)
+        (ask, _), (later, _), (dearer, _) = results
+        ((taker, fills),), orders = trade(token_id, [[SUBMIT, BUY, 100, 8, ["cat"]]], session,
+                                          snapshot_interval=1000)
+        assert [(fill.maker_id, fill.quantity) for fill in fills] == [(ask, 5), (later, 3), (later, 2)]
+        assert [order.status for order in orders] == [
+            OrderStatusEnum.CANCELLED, OrderStatusEnum.COMPLETED, OrderStatusEnum.COMPLETED,
+        ]
+
+        book = load_book(token_id, session)
+        assert book.snapshot() == orderbook._books[token_id].snapshot()
+        assert book.depth(SELL) == [] and dearer not in book.orders
+        assert book.depth(BUY) == [(100, 3)] and book.orders[taker].quantity == 3
+
+
+def test_only_the_owner_cancels_an_order(engine, monkeypatch) -> None:
+    """
+    Tests that a portfolio cannot cancel another portfolio's resting order, and that the owner can.
+
+    :param engine: The engine fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    token_id, owner = uuid.uuid4(), Trader(uuid.uuid4(), uuid.uuid4(), uuid.uuid4())
+    monkeypatch.setattr(orderbook, "book_market", lambda token_id, session: None)
+
+    with Flask(__name__).app_context(), Session(engine) as session:
+        ((order_id, _),), _ = trade(token_id, [[SUBMIT, SELL, 100, 5, owner.to_owner()]], session,
+                                    snapshot_interval=1000)
+        assert not cancel_order(token_id, order_id, uuid.uuid4(), session)
+        assert load_book(token_id, session).depth(SELL) == [(100, 5)]
+        assert not cancel_order(token_id, order_id + 1, owner.portfolio_id, session)
+        assert cancel_order(token_id, order_id, owner.portfolio_id, session)
+        assert load_book(token_id, session).depth(SELL) == []
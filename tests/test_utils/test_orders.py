@@ -0,0 +1,91 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from app.models.commerce import AmberToken, CustomToken, Fund, Listing
+from app.models.library import Library, Merchandise, Portfolio, Shop, Wallet
+from app.utils import orders, pricing
+from app.utils.idempotency import RequestRejected
+from app.utils.orders import OrderRequest, _place
+from app.utils.pricing import DiscountSchedule
+
+
+@pytest.fixture
+def market(make) -> SimpleNamespace:
+    """
+    Fixture that provides a listing priced in AmberTokens of merchandise sold by another library's shop, a
+    buyer's portfolio with funds of AmberTokens and of a custom token, and the seller's AmberToken fund.
+
+    :param make: The model factory fixture.
+    :return: The rows, by name.
+    """
+    buyer, other = make(Library), make(Library)
+    wallet, other_wallet = make(Wallet, library_id=buyer.id), make(Wallet, library_id=other.id)
+    amber = make(AmberToken)
+    merchandise = make(Merchandise, shop_id=make(Shop, library_id=other.id).id)
+    return SimpleNamespace(
+        listing=make(Listing, price=Decimal("5.0000"), merchandise_id=merchandise.id),
+        portfolio=make(Portfolio, library_id=buyer.id),
+        wallet=wallet,
+        fund=make(Fund, wallet_id=wallet.id, token_id=amber.id, balance=Decimal(100)),
+        custom_fund=make(Fund, wallet_id=wallet.id, token_id=make(CustomToken).id, balance=Decimal(100)),
+        other_fund=make(Fund, wallet_id=other_wallet.id, token_id=amber.id, balance=Decimal(100)),
+    )
+
+
+def test_orders_are_paid_from_the_buyers_funds(market, session) -> None:
+    """
+    Tests that an order paid from a fund outside the buyer's wallet is refused as unknown, and one paid from the
+    buyer's fund of a token other than AmberTokens, which listings are priced in, as unprocessable.
+
+    :param market: The market fixture.
+    :param session: The database session fixture.
+    :return: None
+    """
+    request = OrderRequest(market.portfolio.id, market.listing.id, market.other_fund.id)
+    with pytest.raises(RequestRejected) as rejected:
+        _place(request, session)
+    assert rejected.value.status == 404
+
+    request = OrderRequest(market.portfolio.id, market.listing.id, market.custom_fund.id)
+    with pytest.raises(RequestRejected) as rejected:
+        _place(request, session)
+    assert rejected.value.status == 422
+
+
+def test_orders_are_charged_the_discounted_price(market, session, monkeypatch) -> None:
+    """
+    Tests that an order is charged the listing's price after the discount in effect, as the market listings show
+    it, and that the stored response states the price charged.
+
+    :param market: The market fixture.
+    :param session: The database session fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    now = datetime.now()
+    monkeypatch.setattr(pricing, "discount_schedule", lambda at=None: DiscountSchedule.build(
+        [(market.listing.merchandise_id, Decimal(20), now - timedelta(hours=1), now + timedelta(hours=1))],
+        now - timedelta(hours=1), now + timedelta(days=1),
+    ))
+    monkeypatch.setattr(orders, "take_stock", lambda *args: None)
+    transfers = []
+
+    class Executor:
+        def __init__(self, session):
+            pass
+
+        def apply(self, batch):
+            transfers.extend(batch)
+            return [SimpleNamespace(applied=True, entry_id=uuid.uuid4(), error=None)]
+
+    monkeypatch.setattr(orders, "TransferExecutor", Executor)
+    status, body = _place(OrderRequest(market.portfolio.id, market.listing.id, market.fund.id, quantity=2), session)
+    assert status == 201
+    assert (body["order"]["price"], body["order"]["discount"]) == ("5.0000", "20")
+    assert (body["order"]["effective_price"], body["order"]["total_price"]) == ("4.0000", "8.0000")
+    [transfer] = transfers
+    assert (transfer.from_fund_id, transfer.to_fund_id) == (market.fund.id, market.other_fund.id)
+    assert transfer.amount == Decimal("8.0000")
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from app.models.events import OutboxEvent, OutboxCursor
+from app.utils.outbox import OutboxRelay, Subscriber, install_outbox, prune_outbox
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Film(Base):
+    __tablename__ = "films"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(sa.String)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column()
+
+
+class Fund(Base):
+    __tablename__ = "funds"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(sa.Numeric(12, 2))
+
+
+class Note(Base):
+    __tablename__ = "notes"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    text: Mapped[str] = mapped_column(sa.String)
+
+
+class OutboxSession(Session):
+    pass
+
+
+install_outbox(OutboxSession, {Film: ("title",), Fund: ("balance",)})
+
+
+@pytest.fixture
+def engine():
+    """
+    Fixture that provides an in-memory database holding the test models and the outbox tables.
+
+    :return: The engine.
+    """
+    engine = sa.create_engine("sqlite://", poolclass=sa.pool.StaticPool)
+    Base.metadata.create_all(engine)
+    OutboxEvent.__table__.create(engine)
+    OutboxCursor.__table__.create(engine)
+    return engine
+
+
+def events(engine) -> list[tuple]:
+    table = OutboxEvent.__table__
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(table.c.id, table.c.entity, table.c.entity_id, table.c.operation, table.c.data)
+            .order_by(table.c.id)
+        ).tuples().all()
+
+
+def test_flushes_write_events_in_the_same_transaction(engine) -> None:
+    """
+    Tests that inserts, updates, soft deletes and deletes of tracked models are recorded with their tracked
+    fields, while rolled back changes, untracked models and no-op updates are not.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    with OutboxSession(engine) as session:
+        film = Film(id=1, title="Alien")
+        session.add_all([film, Fund(id=7, balance=Decimal("10.50")), Note(id=1, text="untracked")])
+        session.commit()
+        film.title = "Aliens"
+        session.commit()
+        film.title = film.title
+        session.commit()
+        session.add(Film(id=2, title="Rolled back"))
+        session.flush()
+        session.rollback()
+        film.deleted_at = datetime.now()
+        session.commit()
+        session.delete(session.get(Fund, 7))
+        session.commit()
+
+    assert [event[1:] for event in events(engine)] == [
+        ("films", "1", "insert", {"title": "Alien"}),
+        ("funds", "7", "insert", {"balance": "10.50"}),
+        ("films", "1", "update", {"title": "Aliens", "changed": ["title"]}),
+        ("films", "1", "delete", {"title": "Aliens", "changed": ["deleted_at"]}),
+        ("funds", "7", "delete", {"balance": "10.50"}),
+    ]
+
+
+def test_relay_delivers_in_order_at_least_once(engine) -> None:
+    """
+    Tests that subscribers receive their events in order and in batches, that a failing subscriber gets its
+    batch again without holding back the others, and that entity filters apply.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    with OutboxSession(engine) as session:
+        for i in range(1, 8):
+            session.add(Film(id=i, title=f"Film {i}"))
+            session.add(Fund(id=i, balance=Decimal(i)))
+            session.commit()
+
+    received, funds, failures = [], [], [1]
+
+    def flaky(batch):
+        if failures:
+            failures.pop()
+            raise RuntimeError("subscriber down")
+        received.append([event.id for event in batch])
+
+    relay = OutboxRelay(engine, [
+        Subscriber("flaky", flaky),
+        Subscriber("funds", lambda batch: funds.extend(event.entity_id for event in batch), frozenset({"funds"})),
+    ], batch_size=5)
+
+    assert relay.run_once() == {"flaky": 0, "funds": 14}
+    assert funds == [str(i) for i in range(1, 8)]
+    assert relay.run_once() == {"flaky": 14, "funds": 0}
+    assert received == [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10], [11, 12, 13, 14]]
+    assert relay.position("flaky") == relay.position("funds") == 14
+
+
+def test_relay_waits_for_missing_ids(engine) -> None:
+    """
+    Tests that delivery stops at a missing id, as left by a transaction that has not committed yet, until the
+    gap timeout has passed.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(OutboxEvent.__table__.insert(), [
+            {"id": i, "created_at": now, "entity": "films", "entity_id": str(i), "operation": "insert", "data": {}}
+            for i in (1, 2, 4, 5)
+        ])
+    waiting = OutboxRelay(engine, [], gap_timeout=60)
+    assert [event.id for event in waiting.fetch(0)] == [1, 2]
+    assert [event.id for event in waiting.fetch(2)] == []
+    skipping = OutboxRelay(engine, [], gap_timeout=0)
+    assert [event.id for event in skipping.fetch(2)] == [4, 5]
+
+
+def test_prune_keeps_unacknowledged_events(engine) -> None:
+    """
+    Tests that pruning only removes old events every subscriber has acknowledged.
+
+    :param engine: The engine fixture.
+    :return: None
+    """
+    old = datetime.now() - timedelta(days=30)
+    with engine.begin() as conn:
+        conn.execute(OutboxEvent.__table__.insert(), [
+            {"id": i, "created_at": old, "entity": "films", "entity_id": str(i), "operation": "insert", "data": {}}
+            for i in range(1, 6)
+        ])
+        conn.execute(OutboxCursor.__table__.insert(), [
+            {"subscriber": "fast", "position": 5, "updated_at": old},
+            {"subscriber": "slow", "position": 3, "updated_at": old},
+        ])
+    assert prune_outbox(engine, retention_days=7) == 3
+    assert [event[0] for event in events(engine)] == [4, 5]
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from app.utils.pagination import InvalidCursor, KeysetIndex, attach_keyset_indexes, paginate
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Film(Base):
+    __tablename__ = "films"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column()
+    release_year: Mapped[int] = mapped_column()
+    title: Mapped[str] = mapped_column(sa.String)
+    deleted_at: Mapped[datetime] = mapped_column(nullable=True)
+
+
+@pytest.fixture
+def session():
+    """
+    Fixture that provides a session, inside an application context with a secret key for signing cursors, on
+    an in-memory database holding 25 films. Films share creation times and release years in groups, so that
+    every ordering needs its tie breakers.
+
+    :return: The session.
+    """
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "test"
+    engine = sa.create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with app.app_context(), Session(engine) as session:
+        session.add_all(
+            Film(id=i, created_at=start + timedelta(hours=i // 3), release_year=2000 + i % 4, title=f"Film {i}")
+            for i in range(1, 26)
+        )
+        session.commit()
+        yield session
+
+
+def walk(session, order_by, limit=7) -> list:
+    pages, cursor = [], None
+    while True:
+        page = paginate(sa.select(Film), Film, order_by=order_by, limit=limit, cursor=cursor, session=session)
+        pages.append(page)
+        cursor = page.next_cursor
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_row_once(session) -> None:
+    """
+    Tests that walking the pages forward visits every row exactly once, in order, with tied sort keys.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    pages = walk(session, [("created_at", "desc")])
+    ids = [film.id for page in pages for film in page.items]
+    expected = sorted(range(1, 26), key=lambda i: (i // 3, i), reverse=True)
+    assert ids == expected
+    assert [len(page.items) for page in pages] == [7, 7, 7, 4]
+    assert pages[0].prev_cursor is None and pages[-1].next_cursor is None
+
+
+def test_mixed_direction_multi_column_sort(session) -> None:
+    """
+    Tests that a multi-column sort with mixed directions pages consistently with the same ordering in memory.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    order = [("release_year", "asc"), ("created_at", "desc")]
+    ids = [film.id for page in walk(session, order, limit=4) for film in page.items]
+    expected = sorted(range(1, 26), key=lambda i: (2000 + i % 4, -(i // 3), -i))
+    assert ids == expected
+
+
+def test_previous_pages(session) -> None:
+    """
+    Tests that following a previous cursor returns the preceding page in the original order.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    pages = walk(session, ["created_at"])
+    back = paginate(sa.select(Film), Film, order_by=["created_at"], limit=7, cursor=pages[2].prev_cursor,
+                    session=session)
+    assert [film.id for film in back.items] == [film.id for film in pages[1].items]
+    assert back.next_cursor is not None and back.prev_cursor is not None
+
+
+def test_deep_pages_do_not_use_offset(session) -> None:
+    """
+    Tests that deep pages seek to the sort key of the previous page instead of skipping rows, and fetch only
+    one row beyond the page size.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    executed = []
+    sa.event.listen(session.get_bind(), "before_cursor_execute",
+                    lambda conn, cursor, statement, parameters, *args: executed.append((statement, parameters)))
+    walk(session, ["created_at"])
+    assert len(executed) == 4
+    for statement, parameters in executed[1:]:
+        assert "(films.created_at, films.id) > (?, ?)" in statement
+        assert parameters[-2:] == (8, 0)
+
+
+def test_invalid_cursors_are_rejected(session) -> None:
+    """
+    Tests that tampered cursors and cursors issued for another ordering are rejected.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    cursor = walk(session, ["created_at"])[0].next_cursor
+    with pytest.raises(InvalidCursor):
+        paginate(sa.select(Film), Film, order_by=["created_at"], cursor=cursor[:-2] + "xx", session=session)
+    with pytest.raises(InvalidCursor):
+        paginate(sa.select(Film), Film, order_by=["release_year"], cursor=cursor, session=session)
+
+
+def test_covering_indexes_are_attached() -> None:
+    """
+    Tests that declared covering indexes are attached to existing tables and that declarations naming unknown
+    tables or columns are skipped.
+
+    :return: None
+    """
+    metadata = sa.MetaData()
+    table = Film.__table__.to_metadata(metadata)
+    indexes = attach_keyset_indexes(metadata, [
+        KeysetIndex("films", order=("created_at",), include=("title",)),
+        KeysetIndex("films", order=("missing",)),
+        KeysetIndex("missing", order=("created_at",)),
+    ])
+    assert [index.name for index in indexes] == ["ix_films_keyset_created_at"]
+    index = indexes[0]
+    assert [column.name for column in index.columns] == ["created_at", "id"]
+    assert index.dialect_options["postgresql"]["include"] == ["title"]
+    assert index in table.indexes
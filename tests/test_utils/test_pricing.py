@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from app.utils.pricing import DiscountSchedule, discounted, effective_prices
+
+
+NOW = datetime(2026, 1, 1, 12)
+
+
+def hours(count: float) -> datetime:
+    return NOW + timedelta(hours=count)
+
+
+def test_overlapping_discounts_price_listings_and_their_changes() -> None:
+    """
+    Tests that the largest of overlapping discounts applies, that discounts end before their end time and that
+    listings get their upcoming price changes within the window, but no change for the window's end.
+
+    :return: None
+    """
+    schedule = DiscountSchedule.build([
+        ("shirt", Decimal("10.00"), hours(-5), hours(2)),
+        ("shirt", Decimal("25.00"), hours(1), hours(3)),
+        ("shirt", Decimal("10.00"), hours(2), hours(4)),
+        ("mug", Decimal("50.00"), hours(6), hours(48)),
+        ("hat", Decimal("0.00"), hours(0), hours(1)),
+        ("hat", Decimal("30.00"), hours(-3), hours(-1)),
+    ], NOW, hours(24))
+    listings = [
+        SimpleNamespace(id=1, merchandise_id="shirt", price=Decimal("19.9900")),
+        SimpleNamespace(id=2, merchandise_id="mug", price=Decimal("8.0000")),
+        SimpleNamespace(id=3, merchandise_id="hat", price=Decimal("12.0000")),
+    ]
+    prices = effective_prices(listings, at=NOW, schedule=schedule)
+    assert prices[1].effective == Decimal("17.9910") and prices[1].percentage == Decimal(10)
+    assert [(change.at, change.percentage, change.price) for change in prices[1].changes] == [
+        (hours(1), Decimal(25), Decimal("14.9925")), (hours(3), Decimal(10), Decimal("17.9910")),
+        (hours(4), Decimal(0), Decimal("19.9900")),
+    ]
+    assert prices[2].effective == Decimal("8.0000") and prices[2].valid_until == hours(6)
+    assert [change.price for change in prices[2].changes] == [Decimal("4.0000")]
+    assert prices[3].changes == () and "hat" not in schedule.timelines
+
+    later = effective_prices(listings, at=hours(2), schedule=schedule)
+    assert later[1].percentage == Decimal(25) and later[1].valid_until == hours(3)
+    assert discounted(Decimal("0.0005"), Decimal(50)) == Decimal("0.0002")
+
+
+def test_schedule_matches_scanning_every_discount() -> None:
+    """
+    Tests the schedule against computing the best discount at many times by scanning every discount.
+
+    :return: None
+    """
+    rng = random.Random(47)
+    discounts = [
+        (rng.randrange(20), Decimal(rng.randrange(1, 8) * 5), hours(start), hours(start + rng.randrange(1, 12)))
+        for start in (rng.randrange(-24, 48) for _ in range(400))
+    ]
+    schedule = DiscountSchedule.build(discounts, NOW, hours(24))
+    for step in range(24 * 4):
+        at = NOW + timedelta(minutes=15 * step)
+        for merchandise_id in range(20):
+            active = [
+                percentage for item, percentage, start, end in discounts if item == merchandise_id and start <= at < end
+            ]
+            expected = max(active, default=Decimal(0))
+            assert schedule.percentage_at(merchandise_id, at) == expected
@@ -0,0 +1,102 @@
+import pickle
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.models.commerce import Conversion, Currency
+from app.utils.cache import init_cache
+from app.utils.outbox import SUBSCRIBERS
+from app.utils.rates import AMBERTOKENS, RateTable, RateUnavailable, load_rate_table
+
+
+CURRENCIES = [("USD", "1.0000", "100.0000"), ("EUR", "1.0800", "108.0000"), ("JPY", "0.0067", "0.6700")]
+
+
+def test_pages_convert_like_single_prices() -> None:
+    """
+    Tests that converting a page of prices in one pass gives the amounts of converting them one by one, rounded
+    half to even, and that prices cross over USD or AmberTokens as their currencies require.
+
+    :return: None
+    """
+    table = RateTable.build(CURRENCIES, [])
+    prices = [Decimal("19.9900"), 5, "0.0050", 12.5, None, Decimal("1000000.0001")]
+    page = table.convert_many(prices, "EUR", "JPY")
+    assert page == [None if price is None else table.convert_many([price], "EUR", "JPY")[0] for price in prices]
+    assert page[0] == Decimal("3222.2687") and page[4] is None
+
+    assert table.convert_many([Decimal("2.5")], "USD", AMBERTOKENS) == [Decimal("250.0000")]
+    assert table.convert_many([Decimal("216")], AMBERTOKENS, "EUR") == [Decimal("2.0000")]
+    assert table.convert_many([Decimal("0.00005"), Decimal("0.00015")], "USD", "USD") == [
+        Decimal("0.0000"), Decimal("0.0002"),
+    ]
+    with pytest.raises(RateUnavailable):
+        table.convert_many([1], "USD", "GBP")
+    with pytest.raises(RateUnavailable):
+        RateTable.build([("XXX", 0, 0)], []).rate("XXX", "USD")
+
+
+def test_tables_are_immutable_and_versioned_by_their_rates() -> None:
+    """
+    Tests that a table cannot be changed in place, that its version depends on the rates and not on the order
+    they were read in, and that it survives the shared cache tier's pickling.
+
+    :return: None
+    """
+    gold, silver = uuid.uuid4(), uuid.uuid4()
+    table = RateTable.build(CURRENCIES, [(gold, silver, Decimal("12.5"))])
+    with pytest.raises(TypeError):
+        table.usd["USD"] = Decimal(2)
+    assert table.token_rate(gold, silver) == Decimal("12.5")
+    assert table.token_rate(silver, gold) == Decimal("0.08")
+    with pytest.raises(RateUnavailable):
+        table.token_rate(gold, uuid.uuid4())
+
+    assert RateTable.build(reversed(CURRENCIES), [(gold, silver, Decimal("12.5"))]).version == table.version
+    moved = RateTable.build([("USD", "1.0000", "101.0000"), *CURRENCIES[1:]], [(gold, silver, Decimal("12.5"))])
+    assert moved.version != table.version
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy == table and copy.convert_tokens([4], silver, gold) == [Decimal("0.3200")]
+
+
+def test_loading_reads_the_latest_conversion_of_each_pair(tmp_path) -> None:
+    """
+    Tests that loading a table reads every currency and only the latest conversion of each pair of tokens.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: None
+    """
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'rates.db'}")
+    Currency.__table__.create(engine)
+    Conversion.__table__.create(engine)
+    gold, silver, author, now = uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), datetime.now()
+    with Session(engine) as session:
+        for code, usd, tokens in CURRENCIES:
+            session.add(Currency(
+                code=code, name=code, exchange_rate_to_usd=Decimal(usd), exchange_rate_to_ambertokens=Decimal(tokens),
+                created_by=author,
+            ))
+        for rate, age in ((Decimal("11"), 2), (Decimal("12.5"), 1)):
+            session.add(Conversion(
+                from_token_id=gold, to_token_id=silver, from_fund_id=uuid.uuid4(), to_fund_id=uuid.uuid4(), rate=rate,
+                created_at=now - timedelta(minutes=age), created_by=author,
+            ))
+        session.commit()
+        table = load_rate_table(session)
+    assert table == RateTable.build(CURRENCIES, [(gold, silver, Decimal("12.5"))])
+    engine.dispose()
+
+
+def test_rate_changes_reach_the_cache_subscriber() -> None:
+    """
+    Tests that the cache's outbox subscription covers both tables the rate table is loaded from.
+
+    :return: None
+    """
+    init_cache(Flask(__name__))
+    assert {"currencies", "conversions"} <= set(SUBSCRIBERS["cache"].entities)
+    assert "rates" not in SUBSCRIBERS
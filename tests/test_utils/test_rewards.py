@@ -0,0 +1,141 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.events import OutboxCursor, OutboxEvent
+from app.models.ledger import FundShard, Posting
+from app.models.rewards import RewardAccrual
+from app.utils import rewards
+from app.utils.outbox import prune_outbox
+from app.utils.rewards import REWARDS_ACCRUAL_JOB, accrue_rewards, contribution_points
+
+
+LEDGER, TOKEN, TREASURY = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+WEIGHTS = {"films": {"insert": 10, "update": 2}, "tags": 1}
+
+
+@pytest.fixture
+def session(tmp_path):
+    """
+    Fixture that provides a session, inside an application context configured to pay rewards from a treasury
+    fund, on a SQLite file database holding the outbox, its cursors, the ledger and accrual tables.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The session.
+    """
+    for name in ("ledgers", "funds", "transactions"):
+        if name not in db.metadata.tables:
+            sa.Table(name, db.metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    app = Flask(__name__)
+    app.config.update(
+        CONTRIBUTION_REWARD_WEIGHTS=WEIGHTS, CONTRIBUTION_REWARD_RATE="0.25",
+        CONTRIBUTION_REWARD_FUND_ID=str(TREASURY),
+    )
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'rewards.db'}")
+    for model in (OutboxEvent, OutboxCursor, Posting, FundShard, RewardAccrual):
+        model.__table__.create(engine)
+    with app.app_context(), Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def record(session, *changes) -> None:
+    at = datetime.now() - timedelta(minutes=1)
+    session.execute(sa.insert(OutboxEvent), [
+        {"created_at": at, "entity": entity, "entity_id": str(uuid.uuid4()), "operation": operation,
+         "data": {"created_by": library_id}}
+        for entity, operation, library_id in changes
+    ])
+    session.commit()
+
+
+def credits(session) -> dict:
+    return dict(session.execute(
+        sa.select(Posting.fund_id, sa.func.sum(Posting.amount)).group_by(Posting.fund_id)
+    ).tuples().all())
+
+
+def test_points_follow_the_weights() -> None:
+    """
+    Tests that changes earn the points of their table and operation, credited to the library that created the
+    row, and that deletes, unweighted tables and rows without a creator earn nothing.
+
+    :return: None
+    """
+    events = [
+        (1, "films", "f1", "insert", {"created_by": "ann"}),
+        (2, "films", "f1", "update", {"created_by": "ann"}),
+        (3, "films", "f1", "delete", {"created_by": "ann"}),
+        (4, "tags", "t1", "update", {"created_by": "bob"}),
+        (5, "funds", "x1", "insert", {"created_by": "bob"}),
+        (6, "tags", "t2", "insert", {}),
+    ]
+    libraries, entities, counted = contribution_points(events, WEIGHTS)
+    assert libraries == {"ann": Decimal(12), "bob": Decimal(1)}
+    assert entities == {("films", "f1"): Decimal(12), ("tags", "t1"): Decimal(1)}
+    assert counted == 3
+
+
+def test_accruals_pay_each_contribution_once(session, monkeypatch) -> None:
+    """
+    Tests that a run pays every library's rewards from the treasury in one ledger entry, that running again
+    pays nothing, that the next run only pays later contributions, that libraries without a fund are recorded
+    as unpaid and that runs stop at unsettled events.
+
+    :param session: The session fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    ann, bob, cat = (str(uuid.uuid4()) for _ in range(3))
+    funds = {ann: uuid.uuid4(), bob: uuid.uuid4()}
+    monkeypatch.setattr(rewards, "reward_token", lambda session: (TOKEN, LEDGER))
+    monkeypatch.setattr(rewards, "reward_funds", lambda libraries, token_id, session: {
+        library_id: funds[library_id] for library_id in libraries if library_id in funds
+    })
+
+    record(session, ("films", "insert", ann), ("films", "update", ann), ("tags", "insert", bob),
+           ("tags", "delete", bob), ("films", "insert", cat))
+    first = accrue_rewards(session)
+    assert (first.after_position, first.through_position, first.events) == (0, 5, 4)
+    assert first.amount == Decimal("3.25") and first.unpaid == {cat: "10"}
+    assert credits(session) == {funds[ann]: Decimal("3"), funds[bob]: Decimal("0.25"), TREASURY: Decimal("-3.25")}
+    assert session.scalar(sa.select(sa.func.count(sa.distinct(Posting.entry_id)))) == 1
+
+    assert accrue_rewards(session) is None
+    record(session, ("tags", "update", ann))
+    session.execute(sa.insert(OutboxEvent), {
+        "created_at": datetime.now(), "entity": "films", "entity_id": str(uuid.uuid4()), "operation": "insert",
+        "data": {"created_by": bob},
+    })
+    session.commit()
+    second = accrue_rewards(session, settle=30)
+    assert (second.after_position, second.through_position, second.events) == (5, 6, 1)
+    assert credits(session)[funds[ann]] == Decimal("3.25") and bob not in second.points
+    assert accrue_rewards(session, settle=0).points == {bob: "10"}
+    assert credits(session) == {funds[ann]: Decimal("3.25"), funds[bob]: Decimal("2.75"), TREASURY: Decimal("-6")}
+
+
+def test_pruning_keeps_events_until_rewarded(session, monkeypatch) -> None:
+    """
+    Tests that pruning the outbox keeps the contributions the next accrual has yet to read.
+
+    :param session: The session fixture.
+    :param monkeypatch: The monkeypatch fixture.
+    :return: None
+    """
+    monkeypatch.setattr(rewards, "reward_token", lambda session: (TOKEN, LEDGER))
+    monkeypatch.setattr(rewards, "reward_funds", lambda libraries, token_id, session: {})
+    library_id = str(uuid.uuid4())
+    record(session, ("films", "insert", library_id))
+    accrual = accrue_rewards(session)
+    assert session.get(OutboxCursor, REWARDS_ACCRUAL_JOB).position == accrual.through_position == 1
+
+    record(session, ("films", "update", library_id))
+    assert prune_outbox(session.get_bind(), retention_days=0) == 1
+    assert session.scalars(sa.select(OutboxEvent.id)).all() == [2]
+    assert accrue_rewards(session).points == {library_id: "2"}
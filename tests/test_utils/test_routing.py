@@ -0,0 +1,147 @@
+import pytest
+from flask import Blueprint, Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import String, create_engine, select, text, update
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from app.utils.routing import RoutingSession, init_replica_routing, use_primary
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+
+
+class Film(db.Model):
+    __tablename__ = "films"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(String)
+
+
+@pytest.fixture
+def app(tmp_path) -> Flask:
+    """
+    Fixture that provides an application with a primary and two replicas backed by SQLite files. Each database
+    holds a film titled after the database, which reveals where a read was served from; replication is not
+    simulated.
+
+    :param tmp_path: Pytest temporary directory.
+    :return: The application.
+    :rtype: Flask
+    """
+    urls = {name: f"sqlite:///{tmp_path / name}.db" for name in ("primary", "replica_1", "replica_2")}
+    for name, url in urls.items():
+        engine = create_engine(url)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO films (id, title) VALUES (1, :title)"), {"title": name})
+        engine.dispose()
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=urls["primary"],
+        SQLALCHEMY_BINDS={"replica_1": urls["replica_1"], "replica_2": urls["replica_2"]},
+        DB_REPLICA_BINDS=["replica_1", "replica_2"],
+        DB_BLUEPRINT_ROUTING={"library": "replica", "commerce": "primary"},
+        DB_READ_YOUR_WRITES_SECONDS=60,
+    )
+    db.init_app(app)
+    init_replica_routing(app)
+
+    library = Blueprint("library", __name__)
+    commerce = Blueprint("commerce", __name__)
+
+    @library.route("/library/film")
+    @commerce.route("/commerce/film")
+    def film_title():
+        return db.session.scalar(select(Film.title).where(Film.id == 1))
+
+    app.register_blueprint(library)
+    app.register_blueprint(commerce)
+    return app
+
+
+def test_reads_follow_blueprint_routing(app: Flask) -> None:
+    """
+    Tests that reads in replica-routed blueprints are spread over the replicas and that other blueprints read
+    from the primary.
+
+    :param app: The application fixture.
+    :type app: Flask
+    :return: None
+    """
+    client = app.test_client()
+    served = {client.get("/library/film").text for _ in range(4)}
+    assert served == {"replica_1", "replica_2"}
+    assert client.get("/commerce/film").text == "primary"
+
+
+def test_read_your_writes(app: Flask) -> None:
+    """
+    Tests that a session reads from the primary once it has written, both before and after committing.
+
+    :param app: The application fixture.
+    :type app: Flask
+    :return: None
+    """
+    with app.test_request_context("/library/film"):
+        app.preprocess_request()
+        assert db.session.scalar(select(Film.title)).startswith("replica")
+        db.session.add(Film(id=2, title="new"))
+        db.session.flush()
+        assert db.session.scalar(select(Film.title).where(Film.id == 2)) == "new"
+        db.session.commit()
+        assert db.session.scalar(select(Film.title).where(Film.id == 1)) == "primary"
+        with use_primary(db.session):
+            assert db.session.scalar(select(Film.title).where(Film.id == 1)) == "primary"
+
+
+def test_read_your_statement_writes(app: Flask) -> None:
+    """
+    Tests that a session reads from the primary once it has executed an ``UPDATE`` statement, which does not
+    flush, both before and after committing.
+
+    :param app: The application fixture.
+    :type app: Flask
+    :return: None
+    """
+    with app.test_request_context("/library/film"):
+        app.preprocess_request()
+        assert db.session.scalar(select(Film.title)).startswith("replica")
+        db.session.execute(update(Film).where(Film.id == 1).values(title="updated"))
+        assert db.session.scalar(select(Film.title).where(Film.id == 1)) == "updated"
+        db.session.commit()
+        assert db.session.scalar(select(Film.title).where(Film.id == 1)) == "updated"
+
+
+def test_lagging_replicas_are_skipped(app: Flask) -> None:
+    """
+    Tests that replicas lagging beyond the limit stop serving reads and that the primary serves them when no
+    replica is fresh enough.
+
+    :param app: The application fixture.
+    :type app: Flask
+    :return: None
+    """
+    monitor = app.extensions["replica_monitor"]
+    monitor.probe = lambda engine: 60.0 if "replica_1" in str(engine.url) else 0.0
+    client = app.test_client()
+    assert {client.get("/library/film").text for _ in range(4)} == {"replica_2"}
+
+    monitor.probe = lambda engine: 60.0
+    monitor.check_interval = 0
+    assert client.get("/library/film").text == "primary"
+
+
+def test_unknown_replica_bind(app: Flask) -> None:
+    """
+    Tests that listing a replica that has no engine bind is a configuration error.
+
+    :param app: The application fixture.
+    :type app: Flask
+    :return: None
+    """
+    app.config["DB_REPLICA_BINDS"] = ["replica_3"]
+    with pytest.raises(RuntimeError):
+        init_replica_routing(app)
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, sessionmaker
+from app.utils.softdelete import (
+    archive_table, attach_partial_indexes, install_soft_delete_filter, purge_tombstones, restore, soft_delete
+)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Tombstoned:
+    id: Mapped[int] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(default=None)
+    deleted_by: Mapped[Optional[int]] = mapped_column(default=None)
+
+
+class Studio(Base, Tombstoned):
+    __tablename__ = "studios"
+    name: Mapped[str] = mapped_column(sa.String)
+    films: Mapped[list["Film"]] = relationship(back_populates="studio")
+
+
+class Film(Base, Tombstoned):
+    __tablename__ = "films"
+    title: Mapped[str] = mapped_column(sa.String)
+    is_deleted: Mapped[bool] = mapped_column(default=False)
+    studio_id: Mapped[Optional[int]] = mapped_column(sa.ForeignKey("studios.id"))
+    studio: Mapped[Optional[Studio]] = relationship(back_populates="films")
+
+
+Session = sessionmaker()
+install_soft_delete_filter(Session, Tombstoned)
+attach_partial_indexes(Base.metadata)
+
+
+@pytest.fixture
+def session(tmp_path):
+    """
+    Fixture that provides a session on a SQLite database with foreign keys enforced, holding a studio with one
+    live and one long deleted film, and a long deleted studio still referenced by a live film.
+
+    :param tmp_path: Pytest temporary directory.
+    :return: The session.
+    """
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'soft.db'}")
+    sa.event.listen(engine, "connect", lambda conn, record: conn.execute("PRAGMA foreign_keys=ON"))
+    Base.metadata.create_all(engine)
+    session = Session(bind=engine)
+    long_ago = datetime.now() - timedelta(days=365)
+    studio = Studio(id=1, name="Ghibli")
+    closed = Studio(id=2, name="Closed", deleted_at=long_ago)
+    session.add_all([
+        studio, closed,
+        Film(id=1, title="Spirited Away", studio=studio),
+        Film(id=2, title="Lost", studio=studio, deleted_at=long_ago, is_deleted=True),
+        Film(id=3, title="Orphan", studio=closed),
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_deleted_rows_are_hidden(session) -> None:
+    """
+    Tests that soft deleted rows are filtered from selects and relationship loads, unless explicitly included.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    assert session.scalars(sa.select(Film.title).order_by(Film.id)).all() == ["Spirited Away", "Orphan"]
+    assert [film.title for film in session.get(Studio, 1).films] == ["Spirited Away"]
+    everything = sa.select(Film).execution_options(include_deleted=True)
+    assert len(session.scalars(everything).all()) == 3
+
+
+def test_soft_delete_and_restore(session) -> None:
+    """
+    Tests that soft deleting hides a row and flags entities, and that restoring brings it back.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    film = session.get(Film, 1)
+    soft_delete(film, deleted_by=7)
+    session.commit()
+    assert film.is_deleted and film.deleted_by == 7
+    assert session.scalars(sa.select(Film).where(Film.id == 1)).first() is None
+    restore(film)
+    session.commit()
+    assert session.scalars(sa.select(Film).where(Film.id == 1)).first() is film
+
+
+def test_partial_indexes_are_created(session) -> None:
+    """
+    Tests that every soft-delete table gets its live and tombstone partial indexes.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    indexes = {index["name"] for index in sa.inspect(session.get_bind()).get_indexes("films")}
+    assert {"ix_films_live", "ix_films_tombstones"} <= indexes
+
+
+def test_purge_moves_old_tombstones(session) -> None:
+    """
+    Tests that old tombstones are moved to archive tables and that tombstones still referenced by live rows are
+    left in place.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    report = purge_tombstones(timedelta(days=30), batch_size=1, session=session,
+                              tables=[Studio.__table__, Film.__table__])
+    assert report == {"films": 1, "studios": 0, "studios.skipped": 1}
+    archived = session.execute(sa.select(archive_table(Film.__table__))).mappings().all()
+    assert [row["title"] for row in archived] == ["Lost"]
+    assert session.get(Studio, 2, execution_options={"include_deleted": True}) is not None
@@ -0,0 +1,133 @@
+import random
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from flask import Flask
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.ledger import Posting
+from app.models.statements import FundDayRollup, RollupCursor
+from app.utils.statements import balance_series, rebuild_rollups, statement, update_rollups
+
+
+LEDGER = uuid.uuid4()
+START = datetime(2026, 3, 1, 9)
+
+
+@pytest.fixture
+def session(tmp_path):
+    """
+    Fixture that provides a session, inside an application context with a secret key for signing cursors, on a
+    SQLite file database holding the posting and rollup tables.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The session.
+    """
+    for name in ("ledgers", "funds", "transactions"):
+        if name not in db.metadata.tables:
+            sa.Table(name, db.metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "test"
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'statements.db'}")
+    for model in (Posting, FundDayRollup, RollupCursor):
+        model.__table__.create(engine)
+    with app.app_context(), Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def post(session, at: datetime, payer, payee, amount, fee=None, toll=None) -> None:
+    entry_id, amount, fee = uuid.uuid4(), Decimal(amount), Decimal(fee or 0)
+    rows = [
+        {"fund_id": payer, "amount": -amount - fee, "fee": fee or None},
+        {"fund_id": payee, "amount": amount, "fee": None},
+    ]
+    if fee:
+        rows.append({"fund_id": toll, "amount": fee, "fee": None})
+    session.execute(sa.insert(Posting), [
+        {**row, "entry_id": entry_id, "ledger_id": LEDGER, "created_at": at} for row in rows
+    ])
+
+
+def rollups(session) -> dict:
+    return {
+        (row.fund_id, row.day): (row.opening, row.credits, row.debits, row.fees, row.closing, row.postings)
+        for row in session.execute(sa.select(FundDayRollup)).scalars()
+    }
+
+
+def test_rollups_follow_the_postings(session) -> None:
+    """
+    Tests that rollups updated in batches sum each fund's credits, debits and fees per day, chain each day's
+    opening to the previous closing, absorb a posting that settles after later days rolled up, and match a
+    rebuild from scratch.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    funds, toll = [uuid.uuid4() for _ in range(4)], uuid.uuid4()
+    rng = random.Random(49)
+    for i in range(300):
+        payer, payee = rng.sample(funds, 2)
+        post(session, START + timedelta(hours=i // 4), payer, payee, rng.randint(1, 50), rng.choice((0, "0.25")), toll)
+    session.commit()
+    assert update_rollups(session, settle=0, batch_size=64) == session.scalar(sa.select(sa.func.count(Posting.id)))
+    assert update_rollups(session, settle=0) == 0
+
+    post(session, START + timedelta(days=2), funds[0], funds[1], "7.5", "0.5", toll)
+    session.commit()
+    assert update_rollups(session, settle=0) == 3
+    for fund_id in (*funds, toll):
+        days = sorted((day, values) for (fund, day), values in rollups(session).items() if fund == fund_id)
+        closing = Decimal(0)
+        for day, (opening, credits, debits, fees, day_closing, _) in days:
+            assert opening == closing and day_closing == opening + credits - debits - fees
+            closing = day_closing
+        postings = session.execute(sa.select(Posting.amount, Posting.fee).where(Posting.fund_id == fund_id)).all()
+        assert closing == sum(amount for amount, _ in postings)
+        assert sum(values[3] for _, values in days) == sum(fee or 0 for _, fee in postings)
+    assert sum(values[1] for (fund, _), values in rollups(session).items() if fund == toll) == sum(
+        values[3] for (fund, _), values in rollups(session).items() if fund != toll
+    )
+
+    incremental = rollups(session)
+    assert rebuild_rollups(session, settle=0, batch_size=1000) == session.scalar(sa.select(sa.func.count(Posting.id)))
+    assert rollups(session) == incremental
+
+
+def test_statements_and_balance_series_read_the_rollups(session) -> None:
+    """
+    Tests that statements page through a fund's days newest first and that balance series carry the closing of
+    the last day with activity over days without any.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    fund, other = uuid.uuid4(), uuid.uuid4()
+    for day in (0, 1, 3, 4, 8):
+        post(session, START + timedelta(days=day), other, fund, 10 + day)
+    post(session, START + timedelta(days=4, hours=1), fund, other, 5, "0.1", other)
+    session.commit()
+    update_rollups(session, settle=0)
+
+    days, cursor = [], None
+    while True:
+        page = statement(fund, limit=2, cursor=cursor, session=session)
+        days.extend(row.day for row in page.items)
+        if (cursor := page.next_cursor) is None:
+            break
+    assert days == [(START + timedelta(days=day)).date() for day in (8, 4, 3, 1, 0)]
+    row = statement(fund, since=date(2026, 3, 5), until=date(2026, 3, 5), session=session).items[0]
+    assert (row.opening, row.credits, row.debits, row.fees, row.closing, row.postings) == (
+        Decimal(34), Decimal(14), Decimal(5), Decimal("0.1"), Decimal("42.9"), 2,
+    )
+
+    series = balance_series(fund, date(2026, 2, 28), date(2026, 3, 10), session)
+    assert [balance for _, balance in series] == [
+        Decimal(0), Decimal(10), Decimal(21), Decimal(21), Decimal(34), Decimal("42.9"), Decimal("42.9"),
+        Decimal("42.9"), Decimal("42.9"), Decimal("60.9"), Decimal("60.9"),
+    ]
+    assert balance_series(fund, date(2026, 3, 6), date(2026, 3, 6), session) == [(date(2026, 3, 6), Decimal("42.9"))]
@@ -0,0 +1,130 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.ledger import Posting, BalanceSnapshot, FundShard
+from app.utils.ledger import RunningTotals, compact_shards, shard_fund, verify_ledger
+from app.utils.transfers import (
+    TRANSFER_APPLIED, TRANSFER_FAILED, TRANSFER_REJECTED, Transfer, TransferExecutor,
+)
+
+
+LEDGER = uuid.uuid4()
+
+
+@pytest.fixture
+def session(tmp_path):
+    """
+    Fixture that provides a session on a SQLite file database holding a funds table and the ledger tables.
+
+    :param tmp_path: Temporary directory fixture.
+    :return: The session.
+    """
+    for name in ("ledgers", "funds", "transactions"):
+        if name not in db.metadata.tables:
+            sa.Table(name, db.metadata, sa.Column("id", sa.Uuid, primary_key=True))
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'transfers.db'}")
+    funds = sa.Table("funds", sa.MetaData(), sa.Column("id", sa.Uuid, primary_key=True))
+    funds.create(engine)
+    Posting.__table__.create(engine)
+    BalanceSnapshot.__table__.create(engine)
+    FundShard.__table__.create(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def add_funds(session, count: int) -> list[uuid.UUID]:
+    ids = [uuid.uuid4() for _ in range(count)]
+    session.execute(sa.text("INSERT INTO funds (id) VALUES (:id)"), [{"id": fund_id.hex} for fund_id in ids])
+    session.commit()
+    return ids
+
+
+def test_batch_applies_transfers_in_order(session) -> None:
+    """
+    Tests that a batch applies its transfers in order against running balances, rejects invalid transfers and
+    overdrafts without affecting the others, and credits fees to the toll fund.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    mint, alice, bob, toll = add_funds(session, 4)
+    results = TransferExecutor(session, batch_size=3).execute([
+        Transfer(LEDGER, mint, alice, Decimal(100), allow_overdraft=True),
+        Transfer(LEDGER, alice, bob, Decimal(60), Decimal(1), toll),
+        Transfer(LEDGER, bob, alice, Decimal(30)),
+        Transfer(LEDGER, alice, bob, Decimal(80)),
+        Transfer(LEDGER, alice, uuid.uuid4(), Decimal(1)),
+        Transfer(LEDGER, alice, bob, Decimal(1), Decimal(1)),
+        Transfer(LEDGER, alice, alice, Decimal(1)),
+    ])
+    assert [(r.status, r.error) for r in results] == [
+        (TRANSFER_APPLIED, None),
+        (TRANSFER_APPLIED, None),
+        (TRANSFER_APPLIED, None),
+        (TRANSFER_REJECTED, "Insufficient funds"),
+        (TRANSFER_REJECTED, "Unknown fund"),
+        (TRANSFER_REJECTED, "A fee needs a toll fund"),
+        (TRANSFER_REJECTED, "Source and destination are the same fund"),
+    ]
+    assert RunningTotals(settle=0).balances([mint, alice, bob, toll], session) == {
+        mint: Decimal(-100), alice: Decimal(69), bob: Decimal(30), toll: Decimal(1),
+    }
+    assert verify_ledger(session) == []
+
+
+def test_refused_batch_is_split_to_find_the_failing_transfer(session) -> None:
+    """
+    Tests that when the database refuses a batch, its other transfers are still applied one by one and only
+    the refused transfer fails.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    mint, alice, frozen = add_funds(session, 3)
+    session.execute(sa.text(
+        "CREATE TRIGGER frozen_fund BEFORE INSERT ON ledger_postings WHEN NEW.fund_id = :fund "
+        "BEGIN SELECT RAISE(ABORT, 'fund is frozen'); END".replace(":fund", f"'{frozen.hex}'")
+    ))
+    session.commit()
+    results = TransferExecutor(session).execute([
+        Transfer(LEDGER, mint, alice, Decimal(5), allow_overdraft=True),
+        Transfer(LEDGER, mint, frozen, Decimal(5), allow_overdraft=True),
+        Transfer(LEDGER, mint, alice, Decimal(7), allow_overdraft=True),
+    ])
+    assert [r.status for r in results] == [TRANSFER_APPLIED, TRANSFER_FAILED, TRANSFER_APPLIED]
+    assert "frozen" in results[1].error
+    assert RunningTotals(settle=0).balance(alice, session) == Decimal(12)
+
+
+def test_hot_fund_debits_draw_from_shards(session) -> None:
+    """
+    Tests that transfers from a hot fund debit the shard picked for them, that debits larger than that shard
+    are applied after the batch from several shards, and that the fund as a whole still cannot be overdrawn.
+
+    :param session: The session fixture.
+    :return: None
+    """
+    mint, treasury, alice = add_funds(session, 3)
+    shard_fund(treasury, 4, session)
+    funding = Transfer(LEDGER, mint, treasury, Decimal(100), allow_overdraft=True)
+    assert TransferExecutor(session).execute([funding])[0].applied
+    compact_shards(session, settle=0)
+
+    results = TransferExecutor(session).execute([
+        Transfer(LEDGER, treasury, alice, Decimal(20)),
+        Transfer(LEDGER, treasury, alice, Decimal(30)),
+        Transfer(LEDGER, treasury, alice, Decimal(20)),
+    ])
+    assert [result.status for result in results] == [TRANSFER_APPLIED] * 3
+    overdraft, = TransferExecutor(session).execute([Transfer(LEDGER, treasury, alice, Decimal(40))])
+    assert overdraft.status == TRANSFER_REJECTED and overdraft.error == "Insufficient funds"
+    shards = session.execute(sa.select(FundShard.balance)).scalars().all()
+    assert sum(shards) == Decimal(30) and min(shards) >= 0
+    assert session.scalar(sa.select(sa.func.count()).where(Posting.fund_id == treasury, Posting.shard.is_(None))) == 0
+    assert RunningTotals(settle=0).balances([treasury, alice], session) == {treasury: Decimal(30), alice: Decimal(70)}
+    assert verify_ledger(session) == []